@@ -17,6 +17,7 @@ import logging
 from datetime import datetime
 import wp_queueing
 import iot_msg_actor
+import iot_msg_registry
 import iot_handler_base
 import iot_actor_base
 
@@ -42,6 +43,9 @@ class IotActorHandler(iot_handler_base.IotHandlerBase):
         polling_timer_event : None
             Indicates that the polling timer has expired and the MQTT broker must be queried for new
             messages.
+        wakeup_event : None
+            Indicates that a wakeup has been requested (e.g. by the MQTT client on arrival of a
+            message); queries the MQTT broker for new messages outside of the polling cycle.
         message : None
             Handle an incoming message containing an actor command.
     """
@@ -55,7 +59,6 @@ class IotActorHandler(iot_handler_base.IotHandlerBase):
         super().__init__(1, health_check_interval if health_check_interval > 0 else 900,
                          mqtt_data = mqtt_data, mqtt_input = mqtt_input, mqtt_health = mqtt_health)
         if self.mqtt_input is not None:
-            self.mqtt_input[0].owner = self
             self.mqtt_input[0].topics = [(self.mqtt_input, 0)]
 
     @property
@@ -78,13 +81,20 @@ class IotActorHandler(iot_handler_base.IotHandlerBase):
             messages.
         """
         super().polling_timer_event()
-        self.mqtt_input[0].receive()
+        self.receive_messages()
         out_data_list = self._actor.timer_tick()
         for out_data in out_data_list:
             out_msg = wp_queueing.QueueMessage(self.mqtt_data[1])
             out_msg.msg_payload = out_data
             self.mqtt_data[0].publish_single(out_msg)
 
+    def wakeup_event(self):
+        """ Indicates that a wakeup has been requested (e.g. by the MQTT client on arrival of a
+            message); queries the MQTT broker for new messages outside of the polling cycle.
+        """
+        super().wakeup_event()
+        self.receive_messages()
+
     def message(self, msg: wp_queueing.QueueMessage) -> None:
         """ Handle an incoming message containing an actor command.
 
@@ -99,9 +109,8 @@ class IotActorHandler(iot_handler_base.IotHandlerBase):
         if msg.msg_topic != self.mqtt_input[1]:
             self.logger.debug(f'{mth_name}: unexpected topic "{msg.msg_topic}"; expected "{self.mqtt_input[1]}"')
             return
-        actor_cmd = iot_msg_actor.ActorCommand()
         try:
-            actor_cmd.from_dict(msg.msg_payload)
+            actor_cmd = iot_msg_registry.IotMessageRegistry.decode(msg.msg_payload, iot_msg_actor.ActorCommand)
         except TypeError as except_:
             self.logger.error(f'{mth_name}: {str(except_)}')
             return
@@ -24,7 +24,17 @@ if current_dir not in sys.path:
     sys.path.append(current_dir)
 
 from iot_handler_base import IotHandlerBase
+from iot_handler_base import IotMessageRelay
+from iot_msg_binary import IotBinaryCodec
+from iot_msg_bulk import IotBulkDecoder
+from iot_msg_registry import IotMessageRegistry
+from iot_msg_schema import IotMessageField
+from iot_msg_schema import IotMessageSchema
+from iot_msg_view import IotMessageView
+from iot_time_codec import IotTimeCodec
 from iot_msg_input import InputProbe
+from iot_msg_input import InputProbeBatch
+from iot_msg_input import InputBurst
 from iot_msg_input import InputHealth
 from iot_msg_output import OutputData
 from iot_msg_sensor import SensorMsmt
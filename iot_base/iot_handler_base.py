@@ -12,42 +12,184 @@
     either express or implied. See the LICENSE for the specific language governing permissions
     and limitations under the LICENSE.
 """
+from typing import Callable
+import collections
+import time
+import zlib
 from datetime import datetime
 from datetime import timedelta
+import iot_time_codec
+
+class IotMessageRelay:
+    """ Owner of the MQTT consumer of a handler. The consumer calls message() for every received
+        message, possibly from its network thread; the relay hands the message over to the handler
+        (IotHandlerBase.message_arrived()), which requests a wakeup and processes the message in the
+        thread executing the handler.
+
+    Attributes:
+        _handler : IotHandlerBase
+            Handler receiving the messages.
+
+    Methods:
+        IotMessageRelay():
+            Constructor.
+        message : None
+            Hands a received message over to the handler.
+    """
+    __slots__ = ['_handler']
+
+    def __init__(self, handler):
+        """ Constructor.
+
+        Parameters:
+            handler : IotHandlerBase
+                Handler receiving the messages.
+        """
+        self._handler = handler
+
+    def message(self, msg) -> None:
+        """ Hands a received message over to the handler. May be called from any thread.
+
+        Parameters:
+            msg : wp_queueing.QueueMessage
+                Received message.
+        """
+        self._handler.message_arrived(msg)
+
 
 class IotHandlerBase:
     """ A 'handler' is a controlling element for a hardware element, a sensor or an actor.
 
+        The polling and health check events are scheduled on absolute deadlines of a monotonic clock
+        (nanoseconds). When an event is fired, its deadline is advanced by whole intervals, so the
+        time between two ticks does not accumulate as drift and wall clock adjustments do not distort
+        the intervals. Intervals may be fractions of a second.
+
+        The first events are placed according to the phase strategy (see set_phase()):
+            "minute" .. at the next full minute (all handlers fire at the same time);
+            "hash" .... at a phase within the interval derived from the element_id, so the events of many
+                        handlers are spread evenly over the interval (on all hosts alike);
+            "offset" .. at an explicit offset in seconds within the interval.
+        For "hash" and "offset", the phase is relative to the wall clock (epoch time modulo interval).
+
+        If a tick comes later than one polling interval after a deadline (e.g. because the previous
+        polling event took too long), the catch-up policy (see set_catch_up()) decides about the
+        overdue deadlines:
+            "skip" ....... one polling event is fired; the older overdue deadlines are counted as missed;
+            "coalesce" ... one polling event is fired on behalf of all overdue deadlines (coalesced_events
+                           tells how many);
+            "backfill" ... one polling event is fired per overdue deadline, at most max_backfill per tick;
+                           older overdue deadlines are counted as missed.
+
     Attributes:
-        _polling_interval : int
+        phase_strategies : list
+            Supported strategies for placing the first events (see set_phase()).
+        catch_up_policies : list
+            Supported policies for overdue polling deadlines (see set_catch_up()).
+        duration_buckets : list
+            Upper bounds in seconds of the buckets of the event duration histogram (the last bucket of
+            the histogram counts the longer events).
+        blocking : bool
+            Indicates whether or not time_tick() may block the calling thread (device I/O, database
+            accesses, receiving from a MQTT consumer). The async runtime (iot_async_runtime) executes
+            blocking handlers by its worker threads and runs the others inline on its event loop.
+        _polling_interval : float
             Interval in seconds for firing the polling event.
-        _polling_timer : int
-            Number of seconds to wait for the next polling event to be fired.
-        _last_tick_tm : datetime
-            Timestamp of last 'time_tick' received.
+        _polling_interval_ns : int
+            Interval in nanoseconds for firing the polling event.
+        _health_check_int : float
+            Interval in seconds for firing the health check event (0: no health check events).
+        _health_check_int_ns : int
+            Interval in nanoseconds for firing the health check event (0: no health check events).
+        _next_polling_ns : int
+            Monotonic clock time of the next polling event (None before init_time()).
+        _next_health_ns : int
+            Monotonic clock time of the next health check event (None before init_time()).
+        _clock : Callable
+            Monotonic clock returning nanoseconds (time.monotonic_ns by default).
+        _timing : dict
+            Timing statistics (see timing_statistics).
+        _wakeup_requested : bool
+            Indicates that request_wakeup() has been called since the last time_tick().
+        _wakeup_callback : Callable
+            Function called by request_wakeup() to wake up the thread calling time_tick().
+        _phase_strategy : str
+            Placement of the first events (one of phase_strategies).
+        _phase_offset : float
+            Offset in seconds within the interval (phase strategy "offset").
+        _catch_up : str
+            Catch-up policy for overdue polling deadlines (one of catch_up_policies).
+        _max_backfill : int
+            Maximum number of polling events fired per tick (catch-up policy "backfill").
+        _event_lateness_ns : int
+            Delay of the current polling event after its deadline.
+        _coalesced_events : int
+            Number of deadlines the current polling event stands for.
+        _stopped : bool
+            Indicates that stop() has been called; no more events are fired and no deadlines are reported.
+        _inbox : collections.deque
+            Messages received by the MQTT consumer and not yet processed by the handler.
+
+    Properties:
+        timing_statistics : dict
+            Getter for the timing statistics of the polling and health check events.
+        event_lateness : float
+            Getter for the delay in seconds of the current polling event after its deadline.
+        coalesced_events : int
+            Getter for the number of polling deadlines the current polling event stands for.
 
     Methods:
         IotHandlerBase():
             Constructor.
+        set_phase : None
+            Sets the strategy for placing the first events within the intervals.
+        set_catch_up : None
+            Sets the policy for polling deadlines that are overdue by more than one interval.
         init_time : None
             Initializes the internal time information and the polling timer.
         time_tick : None
-            To be called (in regular intervals) to adjust the internal time information and the polling timer.
+            To be called (in regular intervals) to fire the events whose deadlines have expired.
+        next_deadline_ns : int
+            Returns the monotonic clock time of the next polling or health check event.
+        time_until_next_event : float
+            Returns the time in seconds until the next event is due.
+        set_wakeup_callback : None
+            Sets the function to be called by request_wakeup().
+        request_wakeup : None
+            Requests an immediate time_tick(), e.g. because an MQTT message has arrived.
+        message_arrived : None
+            Queues a message received by the MQTT consumer and requests a wakeup.
+        receive_messages : int
+            Queries the MQTT consumer and processes the received messages.
+        scheduled_events : list
+            Returns the times of the events due within a time horizon.
         stop : None
             Stops the handler. To clean up internal components, this method must be overloaded in sub-classes.
         polling_timer_event : None
             Indicates that the polling timer has expired. Must be overloaded by sub-classes.
         health_timer_event : None
             Indicates that the health check timer has expird. Must be overloaded in sub-classes.
+        wakeup_event : None
+            Indicates that a wakeup has been requested. May be overloaded in sub-classes.
+        message : None
+            Processes a message received by the MQTT consumer. Must be overloaded by sub-classes with MQTT input.
     """
     # pylint: disable=too-many-instance-attributes
-    def __init__(self, polling_interval: int, health_check_interval: int,
-                 mqtt_data: tuple = None, mqtt_input: tuple = None, mqtt_health: tuple = None):
+    phase_strategies = ['minute', 'hash', 'offset']
+    catch_up_policies = ['skip', 'coalesce', 'backfill']
+    duration_buckets = [0.001, 0.01, 0.1, 1.0, 10.0]
+    blocking = True
+
+    def __init__(self, polling_interval: float, health_check_interval: float,
+                 mqtt_data: tuple = None, mqtt_input: tuple = None, mqtt_health: tuple = None,
+                 clock: Callable[[], int] = None):
         """ Constructor.
 
         Parameters:
-            polling_interval: int
+            polling_interval: float
                 Interval in seconds for the invocation of the polling timer event.
+            health_check_interval: float
+                Interval in seconds for the invocation of the health check timer event (0: none).
             mqtt_data : tuple
                 Tuple containing two elements (<broker>, <prefix>), where:
                     <broker>: wp_queueing.MqttProducer
@@ -66,45 +208,295 @@ class IotHandlerBase:
                         Session to a broker for publishing health check messages.
                     <prefix>: str
                         Prefix for constructing the topic to which health check messages shall be published.
+            clock : Callable, optional
+                Monotonic clock returning nanoseconds; defaults to time.monotonic_ns.
         """
         self._polling_interval = polling_interval
-        self._polling_timer = -1
+        self._polling_interval_ns = max(int(round(polling_interval * 1000000000)), 1)
         self._health_check_int = health_check_interval
-        self._health_check_timer = -1
-        self._last_tick_tm = None
+        self._health_check_int_ns = max(int(round(health_check_interval * 1000000000)), 0)
+        self._next_polling_ns = None
+        self._next_health_ns = None
+        self._clock = time.monotonic_ns if clock is None else clock
+        self._timing = None
+        self._wakeup_requested = False
+        self._wakeup_callback = None
+        self._phase_strategy = 'minute'
+        self._phase_offset = None
+        self._catch_up = 'skip'
+        self._max_backfill = 1
+        self._event_lateness_ns = 0
+        self._coalesced_events = 1
         self._stopped = False
         self.mqtt_data = mqtt_data
         self.mqtt_health = mqtt_health
         self.mqtt_input = mqtt_input
+        self._inbox = collections.deque()
+        if self.mqtt_input is not None:
+            self.mqtt_input[0].owner = IotMessageRelay(self)
+
+    @property
+    def timing_statistics(self) -> dict:
+        """ Getter for the timing statistics of the polling and health check events.
+
+        Returns:
+            dict : Statistics with the members
+                "num_polling_events" .. number of polling events fired,
+                "num_health_events" ... number of health check events fired,
+                "num_missed_polls" .... number of polling deadlines without polling event because a tick
+                                        came too late,
+                "num_coalesced" ....... number of polling deadlines covered by a coalesced polling event,
+                "num_backfilled" ...... number of polling events fired for overdue deadlines in addition to
+                                        the first one of a tick,
+                "last_lateness" ....... delay in seconds of the last tick firing polling events after the
+                                        oldest deadline it found overdue (independent of the catch-up policy),
+                "max_lateness" ........ maximum delay in seconds of a tick after its oldest overdue deadline,
+                "mean_lateness" ....... mean delay in seconds of the ticks after their oldest overdue deadlines,
+                "drift" ............... time in seconds between the last polling event and its ideal time
+                                        (time of the first polling event plus a whole number of intervals),
+                "max_duration" ........ maximum duration in seconds of a polling or health check event,
+                "duration_histogram" .. number of polling and health check events per duration bucket
+                                        (up to 1 ms, 10 ms, 100 ms, 1 s, 10 s, longer; see duration_buckets).
+        """
+        timing = dict() if self._timing is None else self._timing
+        num_ticks = timing.get('num_polling_ticks', 0)
+        return {
+            'num_polling_events': timing.get('num_polling_events', 0),
+            'num_health_events': timing.get('num_health_events', 0),
+            'num_missed_polls': timing.get('num_missed_polls', 0),
+            'num_coalesced': timing.get('num_coalesced', 0),
+            'num_backfilled': timing.get('num_backfilled', 0),
+            'last_lateness': timing.get('last_lateness_ns', 0) / 1000000000,
+            'max_lateness': timing.get('max_lateness_ns', 0) / 1000000000,
+            'mean_lateness': timing.get('sum_lateness_ns', 0) / num_ticks / 1000000000 if num_ticks > 0 else 0.0,
+            'drift': timing.get('drift_ns', 0) / 1000000000,
+            'max_duration': timing.get('max_duration_ns', 0) / 1000000000,
+            'duration_histogram': list(timing.get('duration_histogram', [0] * (len(self.duration_buckets) + 1)))
+        }
+
+    @property
+    def event_lateness(self) -> float:
+        """ Getter for the delay in seconds of the current polling event after its deadline (a coalesced
+            event: after the oldest deadline it stands for). Backfilled events can use it to determine the
+            point in time they stand for. """
+        return self._event_lateness_ns / 1000000000
+
+    @property
+    def coalesced_events(self) -> int:
+        """ Getter for the number of polling deadlines the current polling event stands for (greater than
+            1 only for coalesced events). """
+        return self._coalesced_events
 
-    def init_time(self) -> None:
-        """ Initializes the internal time information and the polling timer.
+    def set_catch_up(self, catch_up: str, max_backfill: int = 3) -> None:
+        """ Sets the policy for polling deadlines that are overdue by more than one interval.
+
+        Parameters:
+            catch_up : str
+                "skip", "coalesce" or "backfill" (see class description).
+            max_backfill : int, optional
+                Maximum number of polling events fired per tick for the policy "backfill".
+        """
+        if catch_up not in IotHandlerBase.catch_up_policies:
+            raise ValueError(f'IotHandlerBase.set_catch_up(): invalid catch-up policy "{catch_up}"')
+        self._catch_up = catch_up
+        self._max_backfill = max(max_backfill, 1) if catch_up == 'backfill' else 1
+
+    def set_phase(self, phase_strategy: str, phase_offset: float = None) -> None:
+        """ Sets the strategy for placing the first events within the intervals. Takes effect with the
+            next init_time().
+
+        Parameters:
+            phase_strategy : str
+                "minute", "hash" or "offset" (see class description).
+            phase_offset : float, optional
+                Offset in seconds within the interval; mandatory for the strategy "offset".
+        """
+        if phase_strategy not in IotHandlerBase.phase_strategies:
+            raise ValueError(f'IotHandlerBase.set_phase(): invalid phase strategy "{phase_strategy}"')
+        if phase_strategy == 'offset' and phase_offset is None:
+            raise ValueError('IotHandlerBase.set_phase(): phase strategy "offset" requires a phase_offset')
+        self._phase_strategy = phase_strategy
+        self._phase_offset = phase_offset
+
+    def init_time(self, now: datetime = None) -> None:
+        """ Initializes the internal time information and the polling timer. The first polling and health
+            check events are placed according to the phase strategy.
+
+        Parameters:
+            now : datetime, optional
+                Current wall clock time the phases refer to; defaults to datetime.now().
         """
         if self._stopped:
             return
-        self._last_tick_tm = datetime.now()
-        first_ev_time = datetime(self._last_tick_tm.year, self._last_tick_tm.month, self._last_tick_tm.day,
-                                 self._last_tick_tm.hour, self._last_tick_tm.minute, 0) + timedelta(seconds = 60)
-        self._polling_timer = (first_ev_time - self._last_tick_tm).seconds
-        if self._health_check_int > 0:
-            self._health_check_timer = self._polling_timer
+        if now is None:
+            now = datetime.now()
+        now_ns = self._clock()
+        if self._phase_strategy == 'minute' or getattr(self, 'element_id', None) is None and \
+                self._phase_strategy == 'hash':
+            first_ev_time = datetime(now.year, now.month, now.day, now.hour, now.minute, 0) + timedelta(seconds = 60)
+            delay_ns = (first_ev_time - now) // timedelta(microseconds = 1) * 1000
+            self._next_polling_ns = now_ns + delay_ns
+            self._next_health_ns = now_ns + delay_ns if self._health_check_int_ns > 0 else None
+        else:
+            wall_ns = iot_time_codec.IotTimeCodec.to_epoch_us(now) * 1000
+            self._next_polling_ns = now_ns + self._phase_delay_ns(wall_ns, self._polling_interval_ns)
+            self._next_health_ns = now_ns + self._phase_delay_ns(wall_ns, self._health_check_int_ns) \
+                if self._health_check_int_ns > 0 else None
+        self._timing = {
+            'first_polling_ns': None,
+            'num_polling_ticks': 0,
+            'num_polling_events': 0,
+            'num_health_events': 0,
+            'num_missed_polls': 0,
+            'num_coalesced': 0,
+            'num_backfilled': 0,
+            'last_lateness_ns': 0,
+            'max_lateness_ns': 0,
+            'sum_lateness_ns': 0,
+            'drift_ns': 0,
+            'max_duration_ns': 0,
+            'duration_histogram': [0] * (len(self.duration_buckets) + 1)
+        }
 
     def time_tick(self) -> None:
-        """ To be called (in regular intervals) to adjust the internal time information and the polling timer.
+        """ To be called (in regular intervals) to fire the events whose deadlines have expired.
         """
-        if self._stopped:
+        if self._stopped or self._next_polling_ns is None:
             return
-        cur_tm = datetime.now()
-        tick_delta = cur_tm - self._last_tick_tm
-        num_sec = tick_delta.seconds
-        self._polling_timer -= num_sec
-        self._last_tick_tm = cur_tm
-        if self._polling_timer <= 0:
-            self.polling_timer_event()
-        if self._health_check_int > 0:
-            self._health_check_timer -= num_sec
-            if self._health_check_timer <= 0:
-                self.health_timer_event()
+        if self._wakeup_requested:
+            self._wakeup_requested = False
+            self._deliver_messages()
+            self.wakeup_event()
+        now_ns = self._clock()
+        if now_ns >= self._next_polling_ns:
+            timing = self._timing
+            oldest_deadline_ns = self._next_polling_ns
+            num_overdue = (now_ns - oldest_deadline_ns) // self._polling_interval_ns + 1
+            num_events = min(num_overdue, self._max_backfill)
+            self._next_polling_ns += num_overdue * self._polling_interval_ns
+            if self._catch_up == 'coalesce':
+                timing['num_coalesced'] += num_overdue - 1
+                self._coalesced_events = num_overdue
+                first_deadline_ns = oldest_deadline_ns
+            else:
+                timing['num_missed_polls'] += num_overdue - num_events
+                timing['num_backfilled'] += num_events - 1
+                self._coalesced_events = 1
+                first_deadline_ns = oldest_deadline_ns + (num_overdue - num_events) * self._polling_interval_ns
+            lateness_ns = now_ns - oldest_deadline_ns
+            timing['num_polling_ticks'] += 1
+            timing['num_polling_events'] += num_events
+            timing['last_lateness_ns'] = lateness_ns
+            timing['max_lateness_ns'] = max(timing['max_lateness_ns'], lateness_ns)
+            timing['sum_lateness_ns'] += lateness_ns
+            if timing['first_polling_ns'] is None:
+                timing['first_polling_ns'] = now_ns
+            drift_ns = (now_ns - timing['first_polling_ns']) % self._polling_interval_ns
+            timing['drift_ns'] = drift_ns if 2 * drift_ns <= self._polling_interval_ns else \
+                drift_ns - self._polling_interval_ns
+            for event_no in range(num_events):
+                self._event_lateness_ns = now_ns - first_deadline_ns - event_no * self._polling_interval_ns
+                self._timed_event(self.polling_timer_event)
+                if self._stopped:
+                    return
+        if self._next_health_ns is not None and now_ns >= self._next_health_ns:
+            self._next_health_ns += ((now_ns - self._next_health_ns) // self._health_check_int_ns + 1) * \
+                self._health_check_int_ns
+            self._timing['num_health_events'] += 1
+            self._timed_event(self.health_timer_event)
+
+    def next_deadline_ns(self) -> int:
+        """ Returns the monotonic clock time of the next polling or health check event.
+
+        Returns:
+            int : Clock time in nanoseconds (None if the handler is stopped or init_time() has not been called).
+        """
+        if self._stopped or self._next_polling_ns is None:
+            return None
+        if self._wakeup_requested:
+            return self._clock()
+        if self._next_health_ns is None:
+            return self._next_polling_ns
+        return min(self._next_polling_ns, self._next_health_ns)
+
+    def time_until_next_event(self) -> float:
+        """ Returns the time in seconds until the next event is due.
+
+        Returns:
+            float : Time in seconds (0.0 if an event is due; None if no event is scheduled).
+        """
+        deadline_ns = self.next_deadline_ns()
+        if deadline_ns is None:
+            return None
+        return max(deadline_ns - self._clock(), 0) / 1000000000
+
+    def set_wakeup_callback(self, wakeup_callback: Callable[[], None]) -> None:
+        """ Sets the function to be called by request_wakeup(). Called by the agent or scheduler
+            executing the handler.
+
+        Parameters:
+            wakeup_callback : Callable
+                Function waking up the thread calling time_tick() (None to remove the callback).
+        """
+        self._wakeup_callback = wakeup_callback
+
+    def request_wakeup(self) -> None:
+        """ Requests an immediate time_tick(), which calls wakeup_event() before firing the expired
+            timer events. May be called from any thread, e.g. from an MQTT client callback.
+        """
+        self._wakeup_requested = True
+        wakeup_callback = self._wakeup_callback
+        if wakeup_callback is not None:
+            wakeup_callback()
+
+    def message_arrived(self, msg) -> None:
+        """ Queues a message received by the MQTT consumer and requests a wakeup, so the message is
+            processed by the thread executing the handler before the next deadline. May be called from any
+            thread, e.g. from the network thread of the MQTT client.
+
+        Parameters:
+            msg : wp_queueing.QueueMessage
+                Received message.
+        """
+        self._inbox.append(msg)
+        self.request_wakeup()
+
+    def receive_messages(self) -> int:
+        """ Queries the MQTT consumer and processes the received messages (including the messages
+            queued by message_arrived() since the last time_tick()).
+
+        Returns:
+            int : Number of processed messages.
+        """
+        if self.mqtt_input is not None:
+            self.mqtt_input[0].receive()
+        return self._deliver_messages()
+
+    def scheduled_events(self, horizon: float) -> list:
+        """ Returns the times of the polling and health check events due within a time horizon, assuming
+            that every event is fired at its deadline.
+
+        Parameters:
+            horizon : float
+                Time horizon in seconds.
+
+        Returns:
+            list : Times in seconds from now, in ascending order.
+        """
+        if self._stopped or self._next_polling_ns is None:
+            return []
+        now_ns = self._clock()
+        end_ns = now_ns + int(horizon * 1000000000)
+        event_times = []
+        for deadline_ns, interval_ns in [(self._next_polling_ns, self._polling_interval_ns),
+                                         (self._next_health_ns, self._health_check_int_ns)]:
+            if deadline_ns is None:
+                continue
+            while deadline_ns < end_ns:
+                event_times.append(max(deadline_ns - now_ns, 0) / 1000000000)
+                deadline_ns += interval_ns
+        event_times.sort()
+        return event_times
 
     def stop(self) -> None:
         """ Stops the handler. To clean up internal components, this method must be overloaded in sub-classes.
@@ -114,9 +506,49 @@ class IotHandlerBase:
     def polling_timer_event(self):
         """ Indicates that the polling timer has expired. Must be overloaded by sub-classes.
         """
-        self._polling_timer = self._polling_interval
 
     def health_timer_event(self):
         """ Indicates that the health check timer has expird. Must be overloaded in sub-classes.
         """
-        self._health_check_timer = self._health_check_int
+
+    def wakeup_event(self):
+        """ Indicates that a wakeup has been requested. May be overloaded in sub-classes, e.g. to
+            process received messages outside of the polling cycle.
+        """
+
+    def message(self, msg) -> None:
+        """ Processes a message received by the MQTT consumer. Must be overloaded by sub-classes with MQTT input.
+
+        Parameters:
+            msg : wp_queueing.QueueMessage
+                Received message.
+        """
+
+    def _deliver_messages(self) -> int:
+        """ Processes the messages queued by message_arrived(), in the order of their arrival. """
+        num_messages = 0
+        while self._inbox:
+            self.message(self._inbox.popleft())
+            num_messages += 1
+        return num_messages
+
+    def _timed_event(self, event: Callable[[], None]) -> None:
+        """ Fires an event and adds its duration to the timing statistics. """
+        start_ns = self._clock()
+        event()
+        duration_ns = self._clock() - start_ns
+        timing = self._timing
+        timing['max_duration_ns'] = max(timing['max_duration_ns'], duration_ns)
+        bucket_no = 0
+        while bucket_no < len(self.duration_buckets) and duration_ns > self.duration_buckets[bucket_no] * 1000000000:
+            bucket_no += 1
+        timing['duration_histogram'][bucket_no] += 1
+
+    def _phase_delay_ns(self, wall_ns: int, interval_ns: int) -> int:
+        """ Returns the time in nanoseconds from a wall clock time (epoch nanoseconds) to the next event
+            of an interval, according to the phase strategy "hash" or "offset". """
+        if self._phase_strategy == 'offset':
+            phase_ns = int(round(self._phase_offset * 1000000000)) % interval_ns
+        else:
+            phase_ns = zlib.crc32(str(self.element_id).encode('utf-8')) * interval_ns >> 32
+        return (phase_ns - wall_ns) % interval_ns
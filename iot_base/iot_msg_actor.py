@@ -15,6 +15,7 @@
 from typing import Any
 from datetime import datetime
 import wp_queueing
+import iot_msg_schema
 
 class ActorCommand(wp_queueing.IConvertToDict):
     """ IOT message to be sent to an Actor to initiate an action.
@@ -35,11 +36,9 @@ class ActorCommand(wp_queueing.IConvertToDict):
     Methods:
         ActorCommand:
             Constructor.
-        to_dict : dict
-            Converts an ActorCommand instance to a dictionary.
-        from_dict : None
-            Initializes the instance attributes from a dictionary.
     """
+    __slots__ = ('sender_id', 'sender_type', 'cmd_time', 'cmd_detail', 'cmd_duration')
+
     def __init__(self, sender_id: str = "", sender_type: str = "", cmd_time: datetime = None,
                  cmd_detail: Any = "", cmd_duration: int = 0):
         """ Constructor.
@@ -63,41 +62,12 @@ class ActorCommand(wp_queueing.IConvertToDict):
         self.cmd_detail = cmd_detail
         self.cmd_duration = cmd_duration
 
-    def to_dict(self) -> dict:
-        """ Converts an ActorCommand instance to a dictionary.
-
-        Returns:
-            dict : ActorCommand instance represented as a dictionary.
-        """
-        return {
-            'class': 'ActorCommand',
-            'sender_id': self.sender_id,
-            'sender_type': self.sender_type,
-            'cmd_time': self.cmd_time,
-            'cmd_detail': self.cmd_detail,
-            'cmd_duration': self.cmd_duration
-        }
 
-    def from_dict(self, msg_dict: dict) -> None:
-        """ Initializes the instance attributes from a dictionary.
-
-        Returns:
-            dict : Dictionary to initialize the instance attributes with.
-        """
-        if not isinstance(msg_dict, dict):
-            raise TypeError(f'ActorCommand.from_dict(): invalid parameter type "{type(msg_dict)}"')
-        mandatory_attr = ['class', 'sender_type', 'sender_id', 'cmd_time', 'cmd_detail', 'cmd_duration']
-        for attr in mandatory_attr:
-            if attr not in msg_dict:
-                raise ValueError(f'ActorCommand.from_dict(): missing mandatory element "{attr}"')
-        if msg_dict['class'] != 'ActorCommand':
-            raise ValueError(f'ActorCommand.from_dict(): invalid dict class "{msg_dict["class"]}"')
-        self.sender_id = msg_dict['sender_id']
-        self.sender_type = msg_dict['sender_type']
-        c_time = msg_dict['cmd_time']
-        if c_time.find('.') < 0:
-            self.cmd_time = datetime.strptime(c_time, "%Y-%m-%d %H:%M:%S")
-        else:
-            self.cmd_time = datetime.strptime(c_time, "%Y-%m-%d %H:%M:%S.%f")
-        self.cmd_detail = msg_dict['cmd_detail']
-        self.cmd_duration = int(msg_dict['cmd_duration'])
+# Field declarations; iot_msg_schema.IotMessageSchema.register() builds to_dict(), from_dict() and
+# validate() of the types from them and registers the types.
+iot_msg_schema.IotMessageSchema.register(ActorCommand, 'ActorCommand', (
+    iot_msg_schema.IotMessageField('sender_id', 'str', nullable = True),
+    iot_msg_schema.IotMessageField('sender_type', 'str', nullable = True),
+    iot_msg_schema.IotMessageField('cmd_time', 'time'),
+    iot_msg_schema.IotMessageField('cmd_detail', 'any'),
+    iot_msg_schema.IotMessageField('cmd_duration', 'int', coerce = True)), type_code = 6)
@@ -0,0 +1,270 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+import json
+import struct
+import iot_time_codec
+
+class IotBinaryCodec:
+    """ Compact binary representation of IOT messages, as an alternative to the JSON dictionaries built by
+        to_dict(). A binary payload starts with a 5 byte header:
+
+            magic (0xA5) | codec version | type code | None mask (uint16)
+
+        Bit n of the None mask is set if the n-th registered field of the message is None; such fields
+        are omitted. The registered fields must cover all attributes of the message type, as decoding
+        does not call the constructor. The header is followed by the fixed size fields ("time", "int",
+        "float") packed in their registered order, followed by the variable size fields in their
+        registered order:
+
+            "time" ........ int64 epoch microseconds
+            "int" ......... int64
+            "float" ....... float64
+            "str" ......... uint16 length + UTF-8 bytes
+            "json" ........ uint32 length + JSON text (for values of arbitrary type)
+            "int_list" .... uint16 count + int64 values
+            "float_list" .. uint16 count + float64 values
+
+        All numbers are little endian. The magic byte is not valid as first byte of UTF-8 encoded JSON
+        text, so receivers can accept JSON and binary payloads on the same topic. Message modules register
+        their types together with a unique type code and the field layout.
+
+    Attributes:
+        magic : int
+            First byte of every binary payload.
+        version : int
+            Codec version written by encode(); decode() accepts all versions up to this one.
+        field_kinds : list
+            Supported field kinds.
+        _layouts_by_name : dict
+            Layout (type_code, class_name, message_type, fields, plans) per class name.
+        _layouts_by_code : dict
+            Layout (type_code, class_name, message_type, fields, plans) per type code.
+
+    Methods:
+        register : None, static
+            Registers the binary layout of a message type.
+        is_binary : bool, static
+            Indicates whether or not a payload is a binary encoded message.
+        class_name : str, static
+            Returns the class name of a binary encoded message.
+        encode : bytes, static
+            Converts a message into its binary representation.
+        decode : object, static
+            Converts a binary representation into an instance of the registered message type.
+    """
+    magic = 0xA5
+    version = 1
+    field_kinds = ['time', 'int', 'float', 'str', 'json', 'int_list', 'float_list']
+    _fixed_formats = {'time': 'q', 'int': 'q', 'float': 'd'}
+    _layouts_by_name = dict()
+    _layouts_by_code = dict()
+    _header = struct.Struct('<BBBH')
+    _uint16 = struct.Struct('<H')
+    _uint32 = struct.Struct('<I')
+
+    @staticmethod
+    def register(type_code: int, class_name: str, message_type: type, fields: tuple) -> None:
+        """ Registers the binary layout of a message type.
+
+        Parameters:
+            type_code : int
+                Unique code of the message type (1 .. 255).
+            class_name : str
+                Class name used in the dictionary representation of the message.
+            message_type : type
+                Message type.
+            fields : tuple
+                Tuples (attribute_name, field_kind) covering all attributes of the message type
+                (at most 16 fields).
+        """
+        if not 0 < type_code < 256:
+            raise ValueError(f'IotBinaryCodec.register(): invalid type code {type_code}')
+        if len(fields) > 16:
+            raise ValueError(f'IotBinaryCodec.register(): too many fields for "{class_name}"')
+        for _, field_kind in fields:
+            if field_kind not in IotBinaryCodec.field_kinds:
+                raise ValueError(f'IotBinaryCodec.register(): invalid field kind "{field_kind}"')
+        registered = IotBinaryCodec._layouts_by_code.get(type_code)
+        if registered is not None and registered[1] != class_name:
+            raise ValueError(f'IotBinaryCodec.register(): type code {type_code} already used by "{registered[1]}"')
+        layout = (type_code, class_name, message_type, tuple(fields), dict())
+        IotBinaryCodec._layouts_by_name[class_name] = layout
+        IotBinaryCodec._layouts_by_code[type_code] = layout
+
+    @staticmethod
+    def is_binary(msg_payload: object) -> bool:
+        """ Indicates whether or not a payload is a binary encoded message.
+
+        Parameters:
+            msg_payload : Any
+                Received message payload.
+
+        Returns:
+            bool : True if the payload is a bytes-like object starting with the magic byte.
+        """
+        return isinstance(msg_payload, (bytes, bytearray, memoryview)) and len(msg_payload) > 0 and \
+            msg_payload[0] == IotBinaryCodec.magic
+
+    @staticmethod
+    def class_name(msg_payload: bytes) -> str:
+        """ Returns the class name of a binary encoded message.
+
+        Parameters:
+            msg_payload : bytes
+                Binary representation of the message.
+
+        Returns:
+            str : Registered class name (None if the payload is not binary or the type code is unknown).
+        """
+        if not IotBinaryCodec.is_binary(msg_payload) or len(msg_payload) < IotBinaryCodec._header.size:
+            return None
+        layout = IotBinaryCodec._layouts_by_code.get(msg_payload[2])
+        return None if layout is None else layout[1]
+
+    @staticmethod
+    def _plan(layout: tuple, none_mask: int) -> tuple:
+        """ Returns the packing plan of a layout for a None mask: the struct for the fixed size fields, the
+            fixed size fields and the variable size fields that are present. Plans are built once per
+            None mask and cached in the layout.
+        """
+        plan = layout[4].get(none_mask)
+        if plan is None:
+            present = [field_no for field_no in range(len(layout[3])) if not none_mask & (1 << field_no)]
+            fixed_pos = tuple(field_no for field_no in present
+                              if layout[3][field_no][1] in IotBinaryCodec._fixed_formats)
+            var_pos = tuple(field_no for field_no in present if field_no not in fixed_pos)
+            fixed_fields = tuple(layout[3][field_no] for field_no in fixed_pos)
+            var_fields = tuple(layout[3][field_no] for field_no in var_pos)
+            fixed_struct = struct.Struct('<' + ''.join(IotBinaryCodec._fixed_formats[field_kind]
+                                                       for _, field_kind in fixed_fields))
+            none_attrs = tuple(attr_name for field_no, (attr_name, _) in enumerate(layout[3])
+                               if none_mask & (1 << field_no))
+            time_idx = tuple(idx for idx, (_, field_kind) in enumerate(fixed_fields) if field_kind == 'time')
+            plan = (fixed_struct, fixed_fields, var_fields, tuple(attr_name for attr_name, _ in fixed_fields),
+                    time_idx, none_attrs, fixed_pos, var_pos)
+            layout[4][none_mask] = plan
+        return plan
+
+    @staticmethod
+    def encode(message: object) -> bytes:
+        """ Converts a message into its binary representation.
+
+        Parameters:
+            message : object
+                Message of a registered type.
+
+        Returns:
+            bytes : Binary representation of the message.
+        """
+        layout = IotBinaryCodec._layouts_by_name.get(type(message).__name__)
+        if layout is None or not isinstance(message, layout[2]):
+            raise ValueError(f'IotBinaryCodec.encode(): message type "{type(message).__name__}" not registered')
+        values = [getattr(message, attr_name, None) for attr_name, _ in layout[3]]
+        none_mask = 0
+        for field_no, value in enumerate(values):
+            if value is None:
+                none_mask |= 1 << field_no
+        plan = IotBinaryCodec._plan(layout, none_mask)
+        try:
+            fixed_values = [values[field_no] for field_no in plan[6]]
+            for idx in plan[4]:
+                fixed_values[idx] = iot_time_codec.IotTimeCodec.to_epoch_us(fixed_values[idx])
+            parts = [IotBinaryCodec._header.pack(IotBinaryCodec.magic, IotBinaryCodec.version, layout[0], none_mask),
+                     plan[0].pack(*fixed_values)]
+            for field_no in plan[7]:
+                value = values[field_no]
+                field_kind = layout[3][field_no][1]
+                if field_kind == 'str':
+                    encoded = value.encode('utf-8')
+                    parts.append(IotBinaryCodec._uint16.pack(len(encoded)))
+                    parts.append(encoded)
+                elif field_kind == 'json':
+                    encoded = json.dumps(value).encode('utf-8')
+                    parts.append(IotBinaryCodec._uint32.pack(len(encoded)))
+                    parts.append(encoded)
+                else:
+                    parts.append(IotBinaryCodec._uint16.pack(len(value)))
+                    parts.append(struct.pack(f'<{len(value)}{"q" if field_kind == "int_list" else "d"}', *value))
+        except (AttributeError, TypeError, struct.error) as except_:
+            raise ValueError(f'IotBinaryCodec.encode(): invalid value in "{layout[1]}": {str(except_)}') from except_
+        return b''.join(parts)
+
+    @staticmethod
+    def decode(msg_payload: bytes, expected_type: type = None) -> object:
+        """ Converts a binary representation into an instance of the registered message type.
+
+        Parameters:
+            msg_payload : bytes
+                Binary representation of the message.
+            expected_type : type, optional
+                If given, the payload must represent a message of this type.
+
+        Returns:
+            object : The decoded message.
+        """
+        if isinstance(msg_payload, memoryview):
+            msg_payload = msg_payload.tobytes()
+        elif not isinstance(msg_payload, (bytes, bytearray)):
+            raise TypeError(f'IotBinaryCodec.decode(): invalid parameter type "{type(msg_payload)}"')
+        try:
+            magic, version, type_code, none_mask = IotBinaryCodec._header.unpack_from(msg_payload, 0)
+        except struct.error as except_:
+            raise ValueError('IotBinaryCodec.decode(): truncated header') from except_
+        if magic != IotBinaryCodec.magic:
+            raise ValueError('IotBinaryCodec.decode(): payload is not binary encoded')
+        if not 0 < version <= IotBinaryCodec.version:
+            raise ValueError(f'IotBinaryCodec.decode(): unsupported codec version {version}')
+        layout = IotBinaryCodec._layouts_by_code.get(type_code)
+        if layout is None:
+            raise ValueError(f'IotBinaryCodec.decode(): unknown type code {type_code}')
+        if expected_type is not None and layout[2] is not expected_type:
+            raise ValueError(f'IotBinaryCodec.decode(): unexpected message class "{layout[1]}"')
+        fixed_struct, _, var_fields, fixed_attrs, time_idx, none_attrs, _, _ = IotBinaryCodec._plan(layout, none_mask)
+        message = layout[2].__new__(layout[2])
+        for attr_name in none_attrs:
+            setattr(message, attr_name, None)
+        try:
+            offset = IotBinaryCodec._header.size
+            values = fixed_struct.unpack_from(msg_payload, offset)
+            if len(time_idx) > 0:
+                values = list(values)
+                for idx in time_idx:
+                    values[idx] = iot_time_codec.IotTimeCodec.from_epoch_us(values[idx])
+            for attr_name, value in zip(fixed_attrs, values):
+                setattr(message, attr_name, value)
+            offset += fixed_struct.size
+            for attr_name, field_kind in var_fields:
+                if field_kind == 'str':
+                    length = IotBinaryCodec._uint16.unpack_from(msg_payload, offset)[0]
+                    offset += 2
+                    value = msg_payload[offset:offset + length].decode('utf-8')
+                    offset += length
+                elif field_kind == 'json':
+                    length = IotBinaryCodec._uint32.unpack_from(msg_payload, offset)[0]
+                    offset += 4
+                    value = json.loads(msg_payload[offset:offset + length])
+                    offset += length
+                else:
+                    count = IotBinaryCodec._uint16.unpack_from(msg_payload, offset)[0]
+                    offset += 2
+                    value = list(struct.unpack_from(
+                        f'<{count}{"q" if field_kind == "int_list" else "d"}', msg_payload, offset))
+                    offset += 8 * count
+                setattr(message, attr_name, value)
+        except (struct.error, UnicodeDecodeError) as except_:
+            raise ValueError(f'IotBinaryCodec.decode(): invalid payload for "{layout[1]}": {str(except_)}') from except_
+        if offset != len(msg_payload):
+            raise ValueError(f'IotBinaryCodec.decode(): invalid payload length for "{layout[1]}"')
+        return message
@@ -0,0 +1,249 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+from typing import Iterable
+import json
+from datetime import datetime, timezone
+import iot_msg_registry
+import iot_msg_schema
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class IotBulkDecoder:
+    """ Decodes lists of message payloads of one class (e.g. replayed MQTT messages or recorder exports)
+        into a NumPy structured array with one field per declared message field (iot_msg_schema),
+        without constructing message objects. The values are collected column by column with one list
+        comprehension per field (rows with an unexpected class or missing members are filtered out before,
+        only if there are such rows); the columns are then converted in vectorized form:
+            "str" ........ unicode string (None becomes ""),
+            "int" ........ int64,
+            "float" ...... float64 (None becomes NaN if the field is nullable),
+            "time" ....... datetime64[us], local time as returned by IotTimeCodec.decode() (None becomes NaT),
+            other kinds .. object (lists and arbitrary values are taken as they are).
+        Rows that cannot be decoded are not included in the array; their errors are collected as tuples
+        (row_no, error_text), where row_no is the index of the payload in the input.
+
+    Attributes:
+        _numpy_kinds : dict
+            NumPy data type per field kind (None: determined from the values).
+
+    Methods:
+        decode : tuple, static
+            Decodes a list of payload dictionaries.
+        decode_json_lines : tuple, static
+            Decodes JSON lines (one payload per line).
+    """
+    _numpy_kinds = {'str': None, 'int': 'int64', 'float': 'float64', 'time': 'datetime64[us]'}
+
+    @staticmethod
+    def decode(payloads: Iterable[dict], class_name: str) -> tuple:
+        """ Decodes a list of payload dictionaries. A dictionary containing the member "msg_payload"
+            instead of "class" (e.g. a spill file entry) is replaced by that member.
+
+        Parameters:
+            payloads : Iterable[dict]
+                Dictionary representations of the messages.
+            class_name : str
+                Class name of the messages; payloads of other classes are reported as errors.
+
+        Returns:
+            tuple : (numpy.ndarray, list) The structured array of the decoded rows and the errors
+                    (row_no, error_text) of the rejected rows.
+        """
+        if np is None:
+            raise ImportError('IotBulkDecoder.decode(): package "numpy" is not installed')
+        fields = iot_msg_schema.IotMessageSchema.fields(class_name)
+        if fields is None:
+            raise ValueError(f'IotBulkDecoder.decode(): unknown message class "{class_name}"')
+        template = iot_msg_registry.IotMessageRegistry.message_type(class_name)()
+        defaults = [field.default if field.has_default() else getattr(template, field.name) for field in fields]
+        payloads = payloads if isinstance(payloads, list) else list(payloads)
+        try:
+            # fast path: all payloads are complete dictionaries of the expected class
+            if {payload['class'] for payload in payloads} != {class_name}:
+                raise ValueError(class_name)
+            columns = IotBulkDecoder._columns(payloads, fields, defaults)
+            row_nos = range(len(payloads))
+            errors = []
+        except (KeyError, TypeError, ValueError):
+            payloads, row_nos, errors = IotBulkDecoder._select(payloads, class_name, fields)
+            columns = IotBulkDecoder._columns(payloads, fields, defaults)
+        valid = np.ones(len(row_nos), dtype = bool)
+        arrays = [IotBulkDecoder._convert(field, column, row_nos, valid, errors)
+                  for field, column in zip(fields, columns)]
+        result = np.empty(int(valid.sum()), dtype = [(field.name, array.dtype) for field, array in zip(fields, arrays)])
+        for field, array in zip(fields, arrays):
+            result[field.name] = array[valid]
+        errors.sort(key = lambda error: error[0])
+        return result, errors
+
+    @staticmethod
+    def decode_json_lines(lines: Iterable[str], class_name: str) -> tuple:
+        """ Decodes JSON lines (one payload dictionary or spill file entry per line). Empty lines are
+            skipped, but counted as rows.
+
+        Parameters:
+            lines : Iterable[str]
+                JSON lines, e.g. an open text file.
+            class_name : str
+                Class name of the messages; payloads of other classes are reported as errors.
+
+        Returns:
+            tuple : (numpy.ndarray, list) The structured array of the decoded rows and the errors
+                    (row_no, error_text) of the rejected rows.
+        """
+        lines = [line.strip() for line in lines]
+        row_nos = [row_no for row_no, line in enumerate(lines) if len(line) > 0]
+        payloads = None
+        json_errors = []
+        if all(lines[row_no][0] == '{' and lines[row_no][-1] == '}' for row_no in row_nos):
+            # fast path: parse all lines at once as one JSON array
+            try:
+                payloads = json.loads('[' + ','.join([lines[row_no] for row_no in row_nos]) + ']')
+            except ValueError:
+                payloads = None
+            if payloads is not None and len(payloads) != len(row_nos):
+                payloads = None
+        if payloads is None:
+            payloads = []
+            for row_no in row_nos:
+                try:
+                    payloads.append(json.loads(lines[row_no]))
+                except ValueError as except_:
+                    payloads.append(None)
+                    json_errors.append((row_no, f'invalid JSON: {str(except_)}'))
+        result, errors = IotBulkDecoder.decode(payloads, class_name)
+        errors = [(row_nos[payload_no], error_text) for payload_no, error_text in errors
+                  if payloads[payload_no] is not None]
+        errors.extend(json_errors)
+        errors.sort(key = lambda error: error[0])
+        return result, errors
+
+    @staticmethod
+    def _select(payloads: list, class_name: str, fields: tuple) -> tuple:
+        """ Selects the payloads of the expected class containing all mandatory members.
+
+        Returns:
+            tuple : (list, list, list) The selected payloads, their row numbers and the errors of the other rows.
+        """
+        mandatory = [field.name for field in fields if field.mandatory]
+        selected = []
+        row_nos = []
+        errors = []
+        for row_no, payload in enumerate(payloads):
+            if isinstance(payload, dict) and 'class' not in payload and 'msg_payload' in payload:
+                payload = payload['msg_payload']
+            if not isinstance(payload, dict):
+                errors.append((row_no, f'invalid payload type "{type(payload)}"'))
+                continue
+            if payload.get('class') != class_name:
+                errors.append((row_no, f'invalid dict class "{payload.get("class")}"'))
+                continue
+            missing = [name for name in mandatory if name not in payload]
+            if len(missing) > 0:
+                errors.append((row_no, f'missing mandatory element "{missing[0]}"'))
+                continue
+            selected.append(payload)
+            row_nos.append(row_no)
+        return selected, row_nos, errors
+
+    @staticmethod
+    def _columns(payloads: list, fields: tuple, defaults: list) -> list:
+        """ Collects the values of each field from the payloads, one column at a time. """
+        columns = []
+        for field, default in zip(fields, defaults):
+            name = field.name
+            if field.mandatory:
+                columns.append([payload[name] for payload in payloads])
+            else:
+                columns.append([payload.get(name, default) for payload in payloads])
+        return columns
+
+    @staticmethod
+    def _convert(field: iot_msg_schema.IotMessageField, column: list, row_nos: list, valid: object,
+                 errors: list) -> object:
+        """ Converts the values of a field to an array. Invalid values are reported in errors and their
+            rows are marked in valid. """
+        if field.kind not in IotBulkDecoder._numpy_kinds:
+            array = np.empty(len(column), dtype = object)
+            for row_idx, value in enumerate(column):
+                array[row_idx] = value
+            return array
+        if not field.nullable and None in column:
+            for row_idx, value in enumerate(column):
+                if value is None:
+                    IotBulkDecoder._reject(field, row_idx, row_nos, valid, errors)
+                    column[row_idx] = IotBulkDecoder._placeholder(field)
+        try:
+            return IotBulkDecoder._to_array(field, column)
+        except (ValueError, TypeError, OverflowError):
+            pass
+        # slow path: convert the values one by one to find the invalid ones
+        parts = []
+        for row_idx, value in enumerate(column):
+            try:
+                parts.append(IotBulkDecoder._to_array(field, [value]))
+            except (ValueError, TypeError, OverflowError):
+                IotBulkDecoder._reject(field, row_idx, row_nos, valid, errors)
+                parts.append(IotBulkDecoder._to_array(field, [IotBulkDecoder._placeholder(field)]))
+        return np.concatenate(parts)
+
+    @staticmethod
+    def _to_array(field: iot_msg_schema.IotMessageField, column: list) -> object:
+        """ Converts the values of a field to an array in vectorized form. """
+        if field.kind == 'int' or field.kind == 'float':
+            return np.array(column, dtype = IotBulkDecoder._numpy_kinds[field.kind])
+        value_types = set(map(type, column))
+        value_types.discard(type(None))
+        if field.kind == 'str':
+            if not value_types <= {str}:
+                raise TypeError('IotBulkDecoder._to_array(): str expected')
+            if None in column:
+                column = ['' if value is None else value for value in column]
+            return np.array(column, dtype = str)
+        if value_types <= {str}:
+            return np.array(column, dtype = 'datetime64[us]')
+        if not value_types <= {int, float}:
+            raise TypeError('IotBulkDecoder._to_array(): str or epoch seconds expected')
+        epoch_us = np.round(np.array(column, dtype = np.float64) * 1000000.0)
+        is_nat = np.isnan(epoch_us)
+        epoch_us = np.where(is_nat, 0, epoch_us).astype(np.int64)
+        # offset of the local time per hour, as offsets change at full hours only
+        hours, hour_idx = np.unique(epoch_us // 3600000000, return_inverse = True)
+        offsets = np.array([IotBulkDecoder._utc_offset_us(int(hour) * 3600) for hour in hours], dtype = np.int64)
+        local_time = (epoch_us + offsets[hour_idx.reshape(-1)]).view('datetime64[us]')
+        local_time[is_nat] = np.datetime64('NaT')
+        return local_time
+
+    @staticmethod
+    def _utc_offset_us(epoch_sec: int) -> int:
+        """ Returns the offset of the local time to UTC at a point in time, in microseconds. """
+        local_time = datetime.fromtimestamp(epoch_sec)
+        utc_time = datetime.fromtimestamp(epoch_sec, timezone.utc).replace(tzinfo = None)
+        return int((local_time - utc_time).total_seconds()) * 1000000
+
+    @staticmethod
+    def _placeholder(field: iot_msg_schema.IotMessageField) -> object:
+        """ Returns a valid value for a field, used in place of an invalid value. """
+        return {'str': '', 'int': 0, 'float': 0.0}.get(field.kind)      # None for "time": NaT
+
+    @staticmethod
+    def _reject(field: iot_msg_schema.IotMessageField, row_idx: int, row_nos: list, valid: object,
+                errors: list) -> None:
+        """ Marks a row as invalid because of an invalid field value. """
+        if valid[row_idx]:
+            valid[row_idx] = False
+            errors.append((row_nos[row_idx], f'invalid value for "{field.name}"'))
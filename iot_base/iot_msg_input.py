@@ -12,8 +12,15 @@
     either express or implied. See the LICENSE for the specific language governing permissions
     and limitations under the LICENSE.
 """
+from array import array
 from datetime import datetime
+import base64
+import itertools
+import math
+import operator
+import zlib
 import wp_queueing
+import iot_msg_schema
 
 class InputProbe(wp_queueing.IConvertToDict):
     """ Result of reading an input channel of an Input device.
@@ -35,9 +42,9 @@ class InputProbe(wp_queueing.IConvertToDict):
     Methods:
         InputProbe()
             Constructor.
-        to_dict : dict
-            Converts the Digital Input probe into a dictionary.
     """
+    __slots__ = ('device_id', 'device_type', 'probe_time', 'channel_no', 'value', 'voltage')
+
     def __init__(self, device_type = None, device_id = None, probe_time = None, channel_no = -1,
                  value = 0, voltage = 0.0):
         """ Constructor.
@@ -66,48 +73,304 @@ class InputProbe(wp_queueing.IConvertToDict):
         self.value = value
         self.voltage = voltage
 
-    def to_dict(self) -> dict:
-        """ Converts the input probe into a dictionary.
 
-        returns:
-            dict : The attributes of the object as members of a dictionary.
+class InputProbeBatch(wp_queueing.IConvertToDict):
+    """ Results of reading all channels of an Input device in one probe() call, in columnar form.
+        Device type, device identifier and probe time are transferred once per batch instead of once
+        per channel.
+
+    Attributes:
+        device_id : str
+            Unique name or identifier of the Digital Input device.
+        device_type : str
+            Type of the digital input device.
+        probe_time : datetime
+            Timestamp of the probe.
+        channel_nos : list
+            Numbers of the Digital Input channels read.
+        values : list
+            Read Digital Input values (one per channel in channel_nos).
+        voltages : list
+            Read input voltages (one per channel in channel_nos).
+
+    Methods:
+        InputProbeBatch()
+            Constructor.
+        from_probes : InputProbeBatch, static
+            Combines the results of one probe() call into a batch.
+        probes : list
+            Splits the batch into InputProbe objects.
+        probe : InputProbe
+            Returns the InputProbe for one channel.
+    """
+    __slots__ = ('device_id', 'device_type', 'probe_time', 'channel_nos', 'values', 'voltages')
+
+    def __init__(self, device_type = None, device_id = None, probe_time = None, channel_nos = None,
+                 values = None, voltages = None):
+        """ Constructor.
+
+        Parameters:
+            device_type : str, optional
+                Type of the digital input device.
+            device_id : str, optional
+                Unique name or identifier of the Digital Input device.
+            probe_time : datetime, optional
+                Timestamp of the probe.
+            channel_nos : list, optional
+                Numbers of the Digital Input channels read.
+            values : list, optional
+                Read Digital Input values.
+            voltages : list, optional
+                Read input voltages.
         """
-        return {
-            'class': 'InputProbe',
-            'device_type': self.device_type,
-            'device_id': self.device_id,
-            'probe_time': self.probe_time.strftime("%Y-%m-%d %H:%M:%S.%f"),
-            'channel_no': self.channel_no,
-            'value': self.value,
-            'voltage': self.voltage
-        }
-
-    def from_dict(self, msg_dict: dict) -> None:
-        """ Converts a dictionary into an InputProbe instance, if possible.
+        self.device_id = device_id
+        self.device_type = device_type
+        if probe_time is None:
+            self.probe_time = datetime.now()
+        else:
+            self.probe_time = probe_time
+        self.channel_nos = [] if channel_nos is None else channel_nos
+        self.values = [] if values is None else values
+        self.voltages = [] if voltages is None else voltages
+
+    @staticmethod
+    def from_probes(probes: list):
+        """ Combines the results of one probe() call into a batch. Device and probe time are taken from
+            the first probe.
 
         Parameters:
-            msg_dict : dict
-                Dictionary to be converted.
+            probes : list
+                List of InputProbe objects of the same device.
+
+        Returns:
+            InputProbeBatch : The batch (None if probes is empty).
         """
-        if not isinstance(msg_dict, dict):
-            raise TypeError('InputProbe.from_dict(): invalid parameter type "{}"'.format(type(msg_dict)))
-        mandatory_attr = ['class', 'device_type', 'device_id', 'probe_time', 'channel_no', 'value']
-        for attr in mandatory_attr:
-            if attr not in msg_dict:
-                raise ValueError('InputProbe.from_dict(): missing mandatory element "{}"'.format(attr))
-        if msg_dict['class'] != 'InputProbe':
-            raise ValueError('InputProbe.from_dict(): invalid dict class "{}"'.format(msg_dict['class']))
-        self.device_id = msg_dict['device_id']
-        self.device_type = msg_dict['device_type']
-        probe_time = msg_dict['probe_time']
-        if probe_time.find('.') < 0:
-            self.probe_time = datetime.strptime(probe_time, "%Y-%m-%d %H:%M:%S")
+        if len(probes) == 0:
+            return None
+        return InputProbeBatch(probes[0].device_type, probes[0].device_id, probes[0].probe_time,
+                               [probe.channel_no for probe in probes],
+                               [probe.value for probe in probes],
+                               [probe.voltage for probe in probes])
+
+    def probes(self) -> list:
+        """ Splits the batch into InputProbe objects.
+
+        Returns:
+            list : One InputProbe per channel, in the order of channel_nos.
+        """
+        return [InputProbe(self.device_type, self.device_id, self.probe_time, channel_no, value, voltage)
+                for channel_no, value, voltage in zip(self.channel_nos, self.values, self.voltages)]
+
+    def probe(self, channel_no: int) -> InputProbe:
+        """ Returns the InputProbe for one channel.
+
+        Parameters:
+            channel_no : int
+                Number of the Digital Input channel.
+
+        Returns:
+            InputProbe : Probe result of the channel (None if the channel is not contained in the batch).
+        """
+        if channel_no not in self.channel_nos:
+            return None
+        idx = self.channel_nos.index(channel_no)
+        return InputProbe(self.device_type, self.device_id, self.probe_time, channel_no,
+                          self.values[idx], self.voltages[idx])
+
+    def _check_columns(self) -> None:
+        """ Checks the lengths of the columns after from_dict(). Missing voltages are set to 0.0. """
+        if len(self.values) != len(self.channel_nos):
+            raise ValueError('InputProbeBatch.from_dict(): number of values does not match number of channels')
+        if self.voltages is not None:
+            self.voltages = list(self.voltages)
+            if len(self.voltages) != len(self.channel_nos):
+                raise ValueError('InputProbeBatch.from_dict(): number of voltages does not match number of channels')
         else:
-            self.probe_time = datetime.strptime(probe_time, "%Y-%m-%d %H:%M:%S.%f")
-        self.channel_no = msg_dict['channel_no']
-        self.value = msg_dict['value']
-        if 'voltage' in msg_dict:
-            self.voltage = msg_dict['voltage']
+            self.voltages = [0.0] * len(self.channel_nos)
+
+
+class InputBurst(wp_queueing.IConvertToDict):
+    """ Summary of the samples read from the channels of an Input device in burst mode during one polling
+        interval, optionally including the raw samples in compressed form. The samples of a channel are
+        equally spaced between start_time and end_time.
+
+    Attributes:
+        device_id : str
+            Unique name or identifier of the Digital Input device.
+        device_type : str
+            Type of the digital input device.
+        start_time : datetime
+            Timestamp of the first sample.
+        end_time : datetime
+            Timestamp of the last sample.
+        data_rate : int
+            Conversions per second of the device (shared by all sampled channels).
+        channel_nos : list
+            Numbers of the sampled Digital Input channels.
+        num_samples : list
+            Number of samples per channel.
+        min_values : list
+            Minimum value per channel.
+        max_values : list
+            Maximum value per channel.
+        mean_values : list
+            Arithmetic mean per channel.
+        stddev_values : list
+            Standard deviation per channel.
+        num_dropped : int
+            Number of sampling rounds lost because the sample buffer was full.
+        samples : list
+            Raw samples per channel, encoded by encode_samples() (None if not transferred).
+
+    Methods:
+        InputBurst()
+            Constructor.
+        from_samples : InputBurst, static
+            Creates the summary of the samples read in burst mode.
+        encode_samples : str, static
+            Compresses a sequence of samples (delta encoding, zlib, base64).
+        decode_samples : array, static
+            Restores samples compressed by encode_samples().
+        channel_samples : array
+            Returns the raw samples of one channel.
+    """
+    __slots__ = ('device_id', 'device_type', 'start_time', 'end_time', 'data_rate', 'channel_nos', 'num_samples',
+                 'min_values', 'max_values', 'mean_values', 'stddev_values', 'num_dropped', 'samples')
+
+    def __init__(self, device_type = None, device_id = None, start_time = None, end_time = None, data_rate = 0):
+        """ Constructor.
+
+        Parameters:
+            device_type : str, optional
+                Type of the digital input device.
+            device_id : str, optional
+                Unique name or identifier of the Digital Input device.
+            start_time : datetime, optional
+                Timestamp of the first sample.
+            end_time : datetime, optional
+                Timestamp of the last sample.
+            data_rate : int, optional
+                Conversions per second of the device.
+        """
+        self.device_id = device_id
+        self.device_type = device_type
+        self.start_time = datetime.now() if start_time is None else start_time
+        self.end_time = self.start_time if end_time is None else end_time
+        self.data_rate = data_rate
+        self.channel_nos = []
+        self.num_samples = []
+        self.min_values = []
+        self.max_values = []
+        self.mean_values = []
+        self.stddev_values = []
+        self.num_dropped = 0
+        self.samples = None
+
+    @staticmethod
+    def from_samples(device_type: str, device_id: str, start_time: datetime, end_time: datetime, data_rate: int,
+                     channel_nos: list, columns: list, num_dropped: int = 0, raw_samples: bool = False):
+        """ Creates the summary of the samples read in burst mode.
+
+        Parameters:
+            device_type : str
+                Type of the digital input device.
+            device_id : str
+                Unique name or identifier of the Digital Input device.
+            start_time : datetime
+                Timestamp of the first sample.
+            end_time : datetime
+                Timestamp of the last sample.
+            data_rate : int
+                Conversions per second of the device.
+            channel_nos : list
+                Numbers of the sampled channels.
+            columns : list
+                Samples per channel (sequences of int, in the order of channel_nos).
+            num_dropped : int, optional
+                Number of sampling rounds lost because the sample buffer was full.
+            raw_samples : bool, optional
+                If True, the compressed raw samples are included.
+
+        Returns:
+            InputBurst : The burst summary.
+        """
+        # pylint: disable=too-many-arguments
+        burst = InputBurst(device_type, device_id, start_time, end_time, data_rate)
+        burst.channel_nos = list(channel_nos)
+        burst.num_dropped = num_dropped
+        for column in columns:
+            num_samples = len(column)
+            burst.num_samples.append(num_samples)
+            if num_samples == 0:
+                burst.min_values.append(0)
+                burst.max_values.append(0)
+                burst.mean_values.append(0.0)
+                burst.stddev_values.append(0.0)
+                continue
+            sum_values = sum(column)
+            sum_squares = sum(map(operator.mul, column, column))
+            mean_value = sum_values / num_samples
+            burst.min_values.append(min(column))
+            burst.max_values.append(max(column))
+            burst.mean_values.append(mean_value)
+            burst.stddev_values.append(math.sqrt(max(sum_squares / num_samples - mean_value * mean_value, 0.0)))
+        if raw_samples:
+            burst.samples = [InputBurst.encode_samples(column) for column in columns]
+        return burst
+
+    @staticmethod
+    def encode_samples(values) -> str:
+        """ Compresses a sequence of samples. Consecutive samples of an analog signal differ little, so the
+            differences are stored (as 32 bit integers), compressed with zlib and encoded in base64.
+
+        Parameters:
+            values : sequence of int
+                The samples.
+
+        Returns:
+            str : The compressed samples.
+        """
+        deltas = array('i', values[:1])
+        deltas.extend(map(operator.sub, values[1:], values[:-1]))
+        return base64.b64encode(zlib.compress(deltas.tobytes())).decode('ascii')
+
+    @staticmethod
+    def decode_samples(encoded: str) -> array:
+        """ Restores samples compressed by encode_samples().
+
+        Parameters:
+            encoded : str
+                The compressed samples.
+
+        Returns:
+            array : The samples (array of type "i").
+        """
+        deltas = array('i')
+        deltas.frombytes(zlib.decompress(base64.b64decode(encoded)))
+        return array('i', itertools.accumulate(deltas))
+
+    def channel_samples(self, channel_no: int) -> array:
+        """ Returns the raw samples of one channel.
+
+        Parameters:
+            channel_no : int
+                Number of the Digital Input channel.
+
+        Returns:
+            array : The samples (None if the channel was not sampled or the raw samples were not transferred).
+        """
+        if self.samples is None or channel_no not in self.channel_nos:
+            return None
+        return InputBurst.decode_samples(self.samples[self.channel_nos.index(channel_no)])
+
+    def _check_columns(self) -> None:
+        """ Checks the lengths of the columns after from_dict(). """
+        columns = [self.num_samples, self.min_values, self.max_values, self.mean_values, self.stddev_values]
+        if self.samples is not None:
+            columns.append(self.samples)
+        for column in columns:
+            if len(column) != len(self.channel_nos):
+                raise ValueError('InputBurst.from_dict(): number of values does not match number of channels')
 
 
 class InputHealth(wp_queueing.IConvertToDict):
@@ -128,15 +391,17 @@ class InputHealth(wp_queueing.IConvertToDict):
             Number of probe requests.
         num_probe_detail : list
             List containing the number of successfully created probe results per input channel.
+        timing : dict
+            Timing statistics of the handler (iot_handler_base.IotHandlerBase.timing_statistics: missed
+            deadlines, lateness, event duration histogram); None if not reported.
 
     Methods:
         InputHealth():
             Constructor
-        to_dict : dict
-            Converts the object to a dictionary.
-        from_dict : None
-            Converts a dictionary into an InputHealth instance, if possible.
     """
+    __slots__ = ('device_type', 'device_id', 'health_time', 'health_status', 'last_probe_time',
+                 'num_probe_total', 'num_probe_detail', 'timing')
+
     def __init__(self, device_type = None, device_id = None, health_status = 0, health_time = None):
         """ Constructor.
 
@@ -160,53 +425,49 @@ class InputHealth(wp_queueing.IConvertToDict):
         self.last_probe_time = None
         self.num_probe_total = 0
         self.num_probe_detail = None
+        self.timing = None
 
-    def to_dict(self) -> dict:
-        """ Converts the object to a dictionary.
-
-        Returns:
-            Contents of the object as dictionary.
-        """
-        return {
-            'class': 'InputHealth',
-            'device_type': self.device_type,
-            'device_id': self.device_id,
-            'health_time': self.health_time.strftime("%Y-%m-%d %H:%M:%S.%f"),
-            'health_status': self.health_status,
-            'last_probe_time': self.last_probe_time.strftime("%Y-%m-%d %H:%M:%S.%f"),
-            'num_probe_total': self.num_probe_total,
-            'num_probe_detail': self.num_probe_detail
-        }
-
-    def from_dict(self, msg_dict: dict) -> None:
-        """ Converts a dictionary into an InputHealth instance, if possible.
 
-        Parameters:
-            msg_dict : dict
-                Dictionary to be converted.
-        """
-        if not isinstance(msg_dict, dict):
-            raise TypeError('InputHealth.from_dict(): invalid parameter type "{}"'.format(type(msg_dict)))
-        mandatory_attr = ['class', 'device_type', 'device_id', 'health_time',
-                          'health_status', 'last_probe_time', 'num_probe_total']
-        for attr in mandatory_attr:
-            if attr not in msg_dict:
-                raise ValueError('InputHealth.from_dict(): missing mandatory element "{}"'.format(attr))
-        if msg_dict['class'] != 'InputHealth':
-            raise ValueError('InputHealth.from_dict(): invalid dict class "{}"'.format(msg_dict['class']))
-        self.device_type = msg_dict['device_type']
-        self.device_id = msg_dict['device_id']
-        temp_time = msg_dict['health_time']
-        if temp_time.find('.') < 0:
-            self.health_time = datetime.strptime(temp_time, "%Y-%m-%d %H:%M:%S")
-        else:
-            self.health_time = datetime.strptime(temp_time, "%Y-%m-%d %H:%M:%S.%f")
-        self.health_status = msg_dict['health_status']
-        temp_time = msg_dict['last_probe_time']
-        if temp_time.find('.') < 0:
-            self.last_probe_time = datetime.strptime(temp_time, "%Y-%m-%d %H:%M:%S")
-        else:
-            self.last_probe_time = datetime.strptime(temp_time, "%Y-%m-%d %H:%M:%S.%f")
-        self.num_probe_total = msg_dict['num_probe_total']
-        if 'num_probe_detail' in msg_dict:
-            self.num_probe_detail = msg_dict['num_probe_detail']
+# Field declarations; iot_msg_schema.IotMessageSchema.register() builds to_dict(), from_dict() and
+# validate() of the types from them and registers the types.
+iot_msg_schema.IotMessageSchema.register(InputProbe, 'InputProbe', (
+    iot_msg_schema.IotMessageField('device_type', 'str', nullable = True),
+    iot_msg_schema.IotMessageField('device_id', 'str', nullable = True),
+    iot_msg_schema.IotMessageField('probe_time', 'time'),
+    iot_msg_schema.IotMessageField('channel_no', 'int'),
+    iot_msg_schema.IotMessageField('value', 'int'),
+    iot_msg_schema.IotMessageField('voltage', 'float', mandatory = False)), type_code = 1)
+iot_msg_schema.IotMessageSchema.register(InputProbeBatch, 'InputProbeBatch', (
+    iot_msg_schema.IotMessageField('device_type', 'str', nullable = True),
+    iot_msg_schema.IotMessageField('device_id', 'str', nullable = True),
+    iot_msg_schema.IotMessageField('probe_time', 'time'),
+    iot_msg_schema.IotMessageField('channel_nos', 'int_list', coerce = True),
+    iot_msg_schema.IotMessageField('values', 'int_list', coerce = True),
+    iot_msg_schema.IotMessageField('voltages', 'float_list', mandatory = False, nullable = True,
+                                   default = None)), type_code = 2,
+    after_decode = '_check_columns')
+iot_msg_schema.IotMessageSchema.register(InputHealth, 'InputHealth', (
+    iot_msg_schema.IotMessageField('device_type', 'str', nullable = True),
+    iot_msg_schema.IotMessageField('device_id', 'str', nullable = True),
+    iot_msg_schema.IotMessageField('health_time', 'time'),
+    iot_msg_schema.IotMessageField('health_status', 'int'),
+    iot_msg_schema.IotMessageField('last_probe_time', 'time', nullable = True),
+    iot_msg_schema.IotMessageField('num_probe_total', 'int'),
+    iot_msg_schema.IotMessageField('num_probe_detail', 'int_list', mandatory = False, nullable = True),
+    iot_msg_schema.IotMessageField('timing', 'any', mandatory = False, nullable = True, default = None)),
+    type_code = 3)
+iot_msg_schema.IotMessageSchema.register(InputBurst, 'InputBurst', (
+    iot_msg_schema.IotMessageField('device_type', 'str', nullable = True),
+    iot_msg_schema.IotMessageField('device_id', 'str', nullable = True),
+    iot_msg_schema.IotMessageField('start_time', 'time'),
+    iot_msg_schema.IotMessageField('end_time', 'time'),
+    iot_msg_schema.IotMessageField('data_rate', 'int', coerce = True),
+    iot_msg_schema.IotMessageField('channel_nos', 'int_list', coerce = True),
+    iot_msg_schema.IotMessageField('num_samples', 'int_list', coerce = True),
+    iot_msg_schema.IotMessageField('min_values', 'int_list', coerce = True),
+    iot_msg_schema.IotMessageField('max_values', 'int_list', coerce = True),
+    iot_msg_schema.IotMessageField('mean_values', 'float_list', coerce = True),
+    iot_msg_schema.IotMessageField('stddev_values', 'float_list', coerce = True),
+    iot_msg_schema.IotMessageField('num_dropped', 'int', mandatory = False, default = 0),
+    iot_msg_schema.IotMessageField('samples', 'any', mandatory = False, nullable = True, default = None)),
+    type_code = 7, after_decode = '_check_columns')
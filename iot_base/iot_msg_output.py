@@ -15,6 +15,7 @@
 from typing import Any
 from datetime import datetime
 import wp_queueing
+import iot_msg_schema
 
 class OutputData(wp_queueing.IConvertToDict):
     """ IOT Messages to be sent to an output device.
@@ -34,11 +35,9 @@ class OutputData(wp_queueing.IConvertToDict):
     Methods:
         OutputData : None
             Constructor.
-        to_dict : dict
-            Converts the output data message to a dictionary.
-        from_dict : None
-            Converts a dictionary to an OutputData instance, if possible.
     """
+    __slots__ = ('component_id', 'component_type', 'output_port', 'output_data', 'output_time')
+
     def __init__(self, component_id: str = "", component_type: str = "", output_port: str = "",
                  output_time: datetime = None, output_data: Any = None):
         self.component_id = component_id
@@ -47,42 +46,12 @@ class OutputData(wp_queueing.IConvertToDict):
         self.output_data = output_data
         self.output_time = datetime.now() if output_time is None else output_time
 
-    def to_dict(self) -> dict:
-        """ Converts the OutputData message to a dictionary.
-
-        returns:
-            dict : The attributes of the object as members of a dictionary.
-        """
-        return {
-            'class': 'OutputData',
-            'component_type': self.component_type,
-            'component_id': self.component_id,
-            'output_time': self.output_time.strftime("%Y-%m-%d %H:%M:%S.%f"),
-            'output_port': self.output_port,
-            'output_data' : str(self.output_data)
-        }
-
-    def from_dict(self, msg_dict: dict) -> None:
-        """ Converts a dictionary to an OutputState instance, if possible.
 
-        Parameters:
-            msg_dict : dict
-                Dictionary to be converted.
-        """
-        if not isinstance(msg_dict, dict):
-            raise TypeError(f'OutputData.from_dict(): invalid parameter type "{type(msg_dict)}"')
-        mandatory_attr = ['class', 'component_type', 'component_id', 'output_time', 'output_data']
-        for attr in mandatory_attr:
-            if attr not in msg_dict:
-                raise ValueError(f'OutputData.from_dict(): missing mandatory element "{attr}"')
-        if msg_dict['class'] != 'OutputData':
-            raise ValueError(f'OutputData.from_dict(): invalid dict class "{msg_dict["class"]}"')
-        self.component_id = msg_dict['component_id']
-        self.component_type = msg_dict['component_type']
-        st_time = msg_dict['output_time']
-        if st_time.find('.') < 0:
-            self.output_time = datetime.strptime(st_time, "%Y-%m-%d %H:%M:%S")
-        else:
-            self.output_time = datetime.strptime(st_time, "%Y-%m-%d %H:%M:%S.f")
-        self.output_port = None if 'output_port' not in msg_dict else msg_dict['output_port']
-        self.output_data = msg_dict['output_data']
+# Field declarations; iot_msg_schema.IotMessageSchema.register() builds to_dict(), from_dict() and
+# validate() of the types from them and registers the types.
+iot_msg_schema.IotMessageSchema.register(OutputData, 'OutputData', (
+    iot_msg_schema.IotMessageField('component_type', 'str', nullable = True),
+    iot_msg_schema.IotMessageField('component_id', 'str', nullable = True),
+    iot_msg_schema.IotMessageField('output_time', 'time'),
+    iot_msg_schema.IotMessageField('output_port', 'str', mandatory = False, nullable = True, default = None),
+    iot_msg_schema.IotMessageField('output_data', 'any', stringify = True)), type_code = 5)
@@ -0,0 +1,105 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+from typing import Any
+import iot_msg_binary
+
+class IotMessageRegistry:
+    """ Central registry mapping the class names of message payloads (the "class" member of the dictionary
+        representation) to the message types and to the recorder row types. Message modules register
+        their types when they are imported, so that decoding a payload is a single dictionary lookup and
+        new message types do not require changes in the handlers or in the recorder.
+
+    Attributes:
+        _message_types : dict
+            Message type per class name.
+        _recorder_types : dict
+            Recorder row type per class name.
+
+    Methods:
+        register : None, static
+            Registers a message type.
+        register_recorder_type : None, static
+            Registers the recorder row type for a message class.
+        message_type : type, static
+            Returns the message type registered for a class name.
+        recorder_type : type, static
+            Returns the recorder row type registered for a class name.
+        decode : object, static
+            Converts a message payload (dictionary or binary representation) into an instance of the
+            registered message type.
+    """
+    _message_types = dict()
+    _recorder_types = dict()
+
+    @staticmethod
+    def register(class_name: str, message_type: type) -> None:
+        """ Registers a message type.
+
+        Parameters:
+            class_name : str
+                Class name used in the dictionary representation of the message.
+            message_type : type
+                Message type; must be constructible without arguments and implement from_dict().
+        """
+        IotMessageRegistry._message_types[class_name] = message_type
+
+    @staticmethod
+    def register_recorder_type(class_name: str, recorder_type: type) -> None:
+        """ Registers the recorder row type for a message class.
+
+        Parameters:
+            class_name : str
+                Class name used in the dictionary representation of the message.
+            recorder_type : type
+                Recorder row type; constructed with the message id and the decoded message.
+        """
+        IotMessageRegistry._recorder_types[class_name] = recorder_type
+
+    @staticmethod
+    def message_type(class_name: str) -> type:
+        """ Returns the message type registered for a class name (None if not registered). """
+        return IotMessageRegistry._message_types.get(class_name)
+
+    @staticmethod
+    def recorder_type(class_name: str) -> type:
+        """ Returns the recorder row type registered for a class name (None if not registered). """
+        return IotMessageRegistry._recorder_types.get(class_name)
+
+    @staticmethod
+    def decode(msg_payload: Any, expected_type: type = None) -> object:
+        """ Converts a message payload into an instance of the registered message type.
+
+        Parameters:
+            msg_payload : Any (dict or bytes)
+                Dictionary representation or binary representation (iot_msg_binary) of the message.
+            expected_type : type, optional
+                If given, the payload must represent a message of this type.
+
+        Returns:
+            object : The decoded message.
+        """
+        if isinstance(msg_payload, (bytes, bytearray, memoryview)):
+            return iot_msg_binary.IotBinaryCodec.decode(msg_payload, expected_type)
+        if not isinstance(msg_payload, dict):
+            raise TypeError(f'IotMessageRegistry.decode(): invalid parameter type "{type(msg_payload)}"')
+        class_name = msg_payload.get('class')
+        message_type = IotMessageRegistry._message_types.get(class_name)
+        if message_type is None:
+            raise ValueError(f'IotMessageRegistry.decode(): unknown message class "{class_name}"')
+        if expected_type is not None and message_type is not expected_type:
+            raise ValueError(f'IotMessageRegistry.decode(): unexpected message class "{class_name}"')
+        message = message_type()
+        message.from_dict(msg_payload)
+        return message
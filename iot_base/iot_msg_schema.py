@@ -0,0 +1,281 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+import keyword
+import linecache
+from datetime import datetime
+import iot_msg_binary
+import iot_msg_registry
+import iot_time_codec
+
+class IotMessageField:
+    """ Declaration of one attribute of a message type. The attribute name is also used as member name
+        in the dictionary representation of the message.
+
+    Attributes:
+        name : str
+            Name of the attribute.
+        kind : str
+            Field kind (one of IotMessageSchema.field_kinds).
+        mandatory : bool
+            Indicates whether or not the member must be present in the dictionary representation.
+        nullable : bool
+            Indicates whether or not the attribute may be None.
+        coerce : bool
+            If True, from_dict() converts the member to the Python type of the field kind.
+        stringify : bool
+            If True, to_dict() converts the attribute into its string representation.
+        default : Any
+            Value assigned by from_dict() if an optional member is missing. If unset, the attribute keeps
+            the value assigned by the constructor.
+
+    Methods:
+        IotMessageField : None
+            Constructor.
+        has_default : bool
+            Indicates whether or not a default value has been declared.
+    """
+    __slots__ = ('name', 'kind', 'mandatory', 'nullable', 'coerce', 'stringify', 'default')
+    unset = object()
+
+    def __init__(self, name: str, kind: str, mandatory: bool = True, nullable: bool = False,
+                 coerce: bool = False, stringify: bool = False, default: object = unset):
+        """ Constructor.
+
+        Parameters:
+            name : str
+                Name of the attribute; must be a Python identifier.
+            kind : str
+                Field kind (one of IotMessageSchema.field_kinds).
+            mandatory : bool, optional
+                Indicates whether or not the member must be present in the dictionary representation.
+            nullable : bool, optional
+                Indicates whether or not the attribute may be None.
+            coerce : bool, optional
+                If True, from_dict() converts the member to the Python type of the field kind.
+            stringify : bool, optional
+                If True, to_dict() converts the attribute into its string representation.
+            default : Any, optional
+                Value assigned by from_dict() if an optional member is missing.
+        """
+        if not IotMessageSchema.is_name(name):
+            raise ValueError(f'IotMessageField(): invalid field name "{name}"')
+        if kind not in IotMessageSchema.field_kinds:
+            raise ValueError(f'IotMessageField(): invalid field kind "{kind}"')
+        self.name = name
+        self.kind = kind
+        self.mandatory = mandatory
+        self.nullable = nullable
+        self.coerce = coerce
+        self.stringify = stringify
+        self.default = default
+
+    def has_default(self) -> bool:
+        """ Indicates whether or not a default value has been declared. """
+        return self.default is not IotMessageField.unset
+
+
+class IotMessageSchema:
+    """ Generates the dictionary conversion and validation methods of a message type from a declarative
+        list of fields. The methods are generated as specialized source code once, when the message
+        module is imported, so that converting a message involves no loops over attribute lists and no
+        membership tests for mandatory members. The generated to_dict() produces the members in the
+        declared order, preceded by the member "class".
+
+        The source code is built from fixed templates; the only names inserted are the class name, the
+        field names and the after_decode method name, which must be Python identifiers (is_name()).
+        Values such as default values are passed in the namespace of the generated code. The source is
+        registered with linecache under the file name "<IotMessageSchema class_name>", so that
+        tracebacks and debuggers show the generated lines; source() returns it for inspection.
+
+        register() installs to_dict(), from_dict() and validate() on the message type and registers the
+        type with IotMessageRegistry and (if a type code is given) with IotBinaryCodec, so that the field
+        declaration is the single place describing a message type.
+
+    Attributes:
+        field_kinds : dict
+            Binary field kind (iot_msg_binary) and Python type per field kind.
+        _schemas : dict
+            Declared fields per class name.
+
+    Methods:
+        register : None, static
+            Generates the conversion methods of a message type and registers the type.
+        fields : tuple, static
+            Returns the declared fields of a message class.
+        is_name : bool, static
+            Indicates whether or not a name may be inserted into the generated source code.
+        source : str, static
+            Returns the generated source code of the conversion methods of a message type.
+    """
+    field_kinds = {
+        'str': ('str', 'str'),
+        'int': ('int', 'int'),
+        'float': ('float', 'float'),
+        'time': ('time', 'datetime'),
+        'int_list': ('int_list', 'list'),
+        'float_list': ('float_list', 'list'),
+        'any': ('json', None)
+    }
+    _type_checks = {
+        'str': 'isinstance({v}, str)',
+        'int': 'isinstance({v}, int)',
+        'float': 'isinstance({v}, (int, float))',
+        'time': 'isinstance({v}, datetime)',
+        'int_list': 'isinstance({v}, list) and all(isinstance(_e, int) for _e in {v})',
+        'float_list': 'isinstance({v}, list) and all(isinstance(_e, (int, float)) for _e in {v})'
+    }
+    _schemas = dict()
+
+    @staticmethod
+    def register(message_type: type, class_name: str, fields: tuple, type_code: int = None,
+                 after_decode: str = None) -> None:
+        """ Generates the conversion methods of a message type and registers the type.
+
+        Parameters:
+            message_type : type
+                Message type; must be constructible without arguments.
+            class_name : str
+                Class name used in the dictionary representation of the message.
+            fields : tuple
+                IotMessageField objects covering all attributes of the message type.
+            type_code : int, optional
+                Unique code of the message type in the binary representation (iot_msg_binary).
+            after_decode : str, optional
+                Name of a method of the message type called at the end of from_dict(), e.g. to check
+                dependencies between attributes.
+        """
+        for name in [class_name, after_decode]:
+            if name is not None and not IotMessageSchema.is_name(name):
+                raise ValueError(f'IotMessageSchema.register(): invalid name "{name}"')
+        namespace = {
+            'datetime': datetime,
+            '_encode_time': iot_time_codec.IotTimeCodec.encode,
+            '_decode_time': iot_time_codec.IotTimeCodec.decode
+        }
+        for field in fields:
+            if field.has_default():
+                namespace[f'_default_{field.name}'] = field.default
+        source = IotMessageSchema.source(class_name, fields, after_decode)
+        file_name = f'<IotMessageSchema {class_name}>'
+        linecache.cache[file_name] = (len(source), None, source.splitlines(True), file_name)
+        exec(compile(source, file_name, 'exec'), namespace)     # pylint: disable=exec-used
+        for method_name in ['to_dict', 'from_dict', 'validate']:
+            method = namespace[method_name]
+            method.__qualname__ = f'{message_type.__name__}.{method_name}'
+            setattr(message_type, method_name, method)
+        if getattr(message_type, '__abstractmethods__', None):
+            message_type.__abstractmethods__ = frozenset(
+                name for name in message_type.__abstractmethods__
+                if getattr(getattr(message_type, name, None), '__isabstractmethod__', False))
+        IotMessageSchema._schemas[class_name] = tuple(fields)
+        iot_msg_registry.IotMessageRegistry.register(class_name, message_type)
+        if type_code is not None:
+            iot_msg_binary.IotBinaryCodec.register(type_code, class_name, message_type, tuple(
+                (field.name, IotMessageSchema.field_kinds[field.kind][0]) for field in fields))
+
+    @staticmethod
+    def fields(class_name: str) -> tuple:
+        """ Returns the declared fields of a message class (None if not registered). """
+        return IotMessageSchema._schemas.get(class_name)
+
+    @staticmethod
+    def is_name(name: object) -> bool:
+        """ Indicates whether or not a name may be inserted into the generated source code (a Python
+            identifier that is not a keyword). """
+        return isinstance(name, str) and name.isidentifier() and not keyword.iskeyword(name)
+
+    @staticmethod
+    def source(class_name: str, fields: tuple, after_decode: str = None) -> str:
+        """ Returns the generated source code of the conversion methods of a message type.
+
+        Parameters:
+            class_name : str
+                Class name used in the dictionary representation of the message.
+            fields : tuple
+                IotMessageField objects covering all attributes of the message type.
+            after_decode : str, optional
+                Name of a method of the message type called at the end of from_dict().
+
+        Returns:
+            str : Source code defining the functions to_dict, from_dict and validate. Default values of
+                  optional fields are referenced as "_default_<name>".
+        """
+        to_dict = [
+            'def to_dict(self):',
+            f'    """ Converts the {class_name} instance into a dictionary. """',
+            f'    return {{{repr("class")}: {repr(class_name)},']
+        for field in fields:
+            value = f'self.{field.name}'
+            if field.kind == 'time':
+                value = f'_encode_time({value})'
+            elif field.stringify:
+                value = f'str({value})'
+            to_dict.append(f'            {repr(field.name)}: {value},')
+        to_dict.append('           }')
+
+        from_dict = [
+            'def from_dict(self, msg_dict):',
+            f'    """ Converts a dictionary into an {class_name} instance, if possible. """',
+            '    if not isinstance(msg_dict, dict):',
+            f'        raise TypeError(f\'{class_name}.from_dict(): invalid parameter type "{{type(msg_dict)}}"\')',
+            '    try:',
+            "        _class = msg_dict['class']"]
+        for field in fields:
+            if field.mandatory:
+                from_dict.append(f'        _{field.name} = msg_dict[{repr(field.name)}]')
+        from_dict.extend([
+            '    except KeyError as except_:',
+            f'        raise ValueError(f\'{class_name}.from_dict(): missing mandatory element '
+            '"{except_.args[0]}"\') from None',
+            f'    if _class != {repr(class_name)}:',
+            f'        raise ValueError(f\'{class_name}.from_dict(): invalid dict class "{{_class}}"\')'])
+        for field in fields:
+            indent = '    '
+            if field.mandatory:
+                value = f'_{field.name}'
+            else:
+                value = f'msg_dict[{repr(field.name)}]'
+                from_dict.append(f'    if {repr(field.name)} in msg_dict:')
+                indent = '        '
+            if field.kind == 'time':
+                value = f'_decode_time({value})'
+            elif field.coerce:
+                python_type = IotMessageSchema.field_kinds[field.kind][1]
+                value = f'{python_type}({value})' if not field.nullable else \
+                    f'None if {value} is None else {python_type}({value})'
+            from_dict.append(f'{indent}self.{field.name} = {value}')
+            if not field.mandatory and field.has_default():
+                from_dict.append('    else:')
+                from_dict.append(f'        self.{field.name} = _default_{field.name}')
+        if after_decode is not None:
+            from_dict.append(f'    self.{after_decode}()')
+
+        validate = [
+            'def validate(self):',
+            f'    """ Checks the types of the attributes of the {class_name} instance. """']
+        for field in fields:
+            type_check = IotMessageSchema._type_checks.get(field.kind)
+            value = f'self.{field.name}'
+            if type_check is None:
+                continue
+            if field.nullable:
+                condition = f'{value} is not None and not ({type_check.format(v = value)})'
+            else:
+                condition = f'{value} is None or not ({type_check.format(v = value)})'
+            validate.append(f'    if {condition}:')
+            validate.append(f'        raise ValueError(f\'{class_name}.validate(): invalid value "{{{value}!r}}" '
+                            f'for attribute "{field.name}"\')')
+        validate.append('    return None')
+        return "\n".join(to_dict + [''] + from_dict + [''] + validate) + "\n"
@@ -14,6 +14,7 @@
 """
 from datetime import datetime
 import wp_queueing
+import iot_msg_schema
 
 class SensorMsmt(wp_queueing.IConvertToDict):
     """ Class for grouping the result of a sensor measurement.
@@ -37,9 +38,10 @@ class SensorMsmt(wp_queueing.IConvertToDict):
     Methods:
         SensorMsmt()
             Constructor
-        to_dict : dict
-            Converts a sensor measurement object into a dictionary representation.
     """
+    __slots__ = ('sensor_id', 'sensor_type', 'msmt_time', 'hw_value', 'hw_voltage',
+                 'msmt_unit', 'msmt_value')
+
     def __init__(self, sensor_id = None, sensor_type = None, msmt_time: datetime = None):
         """ Constructor
 
@@ -62,47 +64,14 @@ class SensorMsmt(wp_queueing.IConvertToDict):
         self.msmt_unit = None
         self.msmt_value = 0.0
 
-    def to_dict(self) -> dict:
-        """ Converts a sensor measurement object into a dictionary representation.
-
-        Returns:
-            dict : dictionary representation of the object.
-        """
-        return {
-            'class': 'SensorMsmt',
-            'sensor_id': self.sensor_id,
-            'sensor_type': self.sensor_type,
-            'msmt_time': self.msmt_time.strftime("%Y-%m-%d %H:%M:%S.%f"),
-            'hw_value': self.hw_value,
-            'hw_voltage': self.hw_voltage,
-            'msmt_unit': self.msmt_unit,
-            'msmt_value': self.msmt_value
-        }
-
-    def from_dict(self, msg_dict: dict) -> None:
-        """ Converts a dictionary into a SensorMeasurement instance, if possible.
 
-        Parameters:
-            msg_dict : dict
-                Dictionary to be converted.
-        """
-        if not isinstance(msg_dict, dict):
-            raise TypeError('SensorMsmt.from_dict(): invalid parameter type "{}"'.format(type(msg_dict)))
-        mandatory_attr = ['class', 'sensor_type', 'sensor_id', 'msmt_time', 'hw_value', 'msmt_unit', 'msmt_value']
-        for attr in mandatory_attr:
-            if attr not in msg_dict:
-                raise ValueError('SensorMsmt.from_dict(): missing mandatory element "{}"'.format(attr))
-        if msg_dict['class'] != 'SensorMsmt':
-            raise ValueError('SensorMsmt.from_dict(): invalid dict class "{}"'.format(msg_dict['class']))
-        self.sensor_id = msg_dict['sensor_id']
-        self.sensor_type = msg_dict['sensor_type']
-        msmt_time = msg_dict['msmt_time']
-        if msmt_time.find('.') < 0:
-            self.msmt_time = datetime.strptime(msmt_time, "%Y-%m-%d %H:%M:%S")
-        else:
-            self.msmt_time = datetime.strptime(msmt_time, "%Y-%m-%d %H:%M:%S.%f")
-        self.hw_value = msg_dict['hw_value']
-        self.msmt_unit = msg_dict['msmt_unit']
-        self.msmt_value = msg_dict['msmt_value']
-        if 'hw_voltage' in msg_dict:
-            self.hw_voltage = msg_dict['hw_voltage']
+# Field declarations; iot_msg_schema.IotMessageSchema.register() builds to_dict(), from_dict() and
+# validate() of the types from them and registers the types.
+iot_msg_schema.IotMessageSchema.register(SensorMsmt, 'SensorMsmt', (
+    iot_msg_schema.IotMessageField('sensor_id', 'str', nullable = True),
+    iot_msg_schema.IotMessageField('sensor_type', 'str', nullable = True),
+    iot_msg_schema.IotMessageField('msmt_time', 'time'),
+    iot_msg_schema.IotMessageField('hw_value', 'int'),
+    iot_msg_schema.IotMessageField('hw_voltage', 'float', mandatory = False),
+    iot_msg_schema.IotMessageField('msmt_unit', 'str', nullable = True),
+    iot_msg_schema.IotMessageField('msmt_value', 'float')), type_code = 4)
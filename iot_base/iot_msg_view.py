@@ -0,0 +1,175 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+import json
+import re
+from datetime import datetime
+import iot_msg_registry
+import iot_time_codec
+
+class IotMessageView:
+    """ Read-only view of the dictionary representation of a message. The constructor only checks that the
+        "class" member names a registered message type; the members are converted when they are accessed,
+        so that consumers that only copy some members (like the recorder) neither parse all points in time
+        nor construct the message object.
+
+    Attributes:
+        column_kinds : list
+            Conversions supported by row(): "value" (unchanged), "time" (point in time, see time_column),
+            "json" (JSON text).
+        fixed_time_layout : re.Pattern
+            Layout "YYYY-mm-dd HH:MM:SS.ffffff" of the strings time_column() passes through unparsed.
+        _payload : dict
+            The viewed message payload.
+        _msg_class : str
+            Class name of the message.
+        _times : dict
+            Points in time already parsed, per member name.
+
+    Properties:
+        msg_class : str
+            Getter for the class name of the message.
+        payload : dict
+            Getter for the viewed message payload.
+
+    Methods:
+        IotMessageView : None
+            Constructor.
+        value : Any
+            Returns the unconverted value of a member.
+        time : datetime
+            Returns a member converted to a point in time; parsed on first access.
+        time_column : Any
+            Returns a point in time in a form that can be stored by the recorder, without parsing if possible.
+        row : tuple
+            Maps the members of the payload to the column values of a recorder table.
+        decode : object
+            Converts the payload into an instance of the registered message type.
+    """
+    __slots__ = ('_payload', '_msg_class', '_times')
+    column_kinds = ['value', 'time', 'json']
+    fixed_time_layout = re.compile(r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\.\d{6}", re.ASCII)
+
+    def __init__(self, msg_payload: dict):
+        """ Constructor.
+
+        Parameters:
+            msg_payload : dict
+                Dictionary representation of a message of a registered type.
+        """
+        if not isinstance(msg_payload, dict):
+            raise TypeError(f'IotMessageView(): invalid parameter type "{type(msg_payload)}"')
+        msg_class = msg_payload.get('class')
+        if iot_msg_registry.IotMessageRegistry.message_type(msg_class) is None:
+            raise ValueError(f'IotMessageView(): unknown message class "{msg_class}"')
+        self._payload = msg_payload
+        self._msg_class = msg_class
+        self._times = dict()
+
+    @property
+    def msg_class(self) -> str:
+        """ Getter for the class name of the message. """
+        return self._msg_class
+
+    @property
+    def payload(self) -> dict:
+        """ Getter for the viewed message payload. """
+        return self._payload
+
+    def value(self, name: str, mandatory: bool = True, default: object = None) -> object:
+        """ Returns the unconverted value of a member.
+
+        Parameters:
+            name : str
+                Name of the member.
+            mandatory : bool, optional
+                If True, a missing member raises ValueError; otherwise default is returned.
+            default : Any, optional
+                Value returned for a missing optional member.
+
+        Returns:
+            Any : Value of the member.
+        """
+        if name in self._payload:
+            return self._payload[name]
+        if mandatory:
+            raise ValueError(f'IotMessageView.value(): "{self._msg_class}": missing mandatory element "{name}"')
+        return default
+
+    def time(self, name: str, mandatory: bool = True) -> datetime:
+        """ Returns a member converted to a point in time. The member is parsed on first access.
+
+        Parameters:
+            name : str
+                Name of the member.
+            mandatory : bool, optional
+                If True, a missing member raises ValueError; otherwise None is returned.
+
+        Returns:
+            datetime : The point in time (None if the member is None or missing).
+        """
+        if name not in self._times:
+            self._times[name] = iot_time_codec.IotTimeCodec.decode(self.value(name, mandatory))
+        return self._times[name]
+
+    def time_column(self, name: str, mandatory: bool = True) -> object:
+        """ Returns a point in time in a form that can be stored by the recorder. Strings in the fixed
+            layout "YYYY-mm-dd HH:MM:SS.ffffff" (as written by IotTimeCodec) are returned unchanged
+            after checking the digits and separators against the layout (fixed_time_layout), without
+            parsing them; the ranges of the fields are validated by the recorder's epoch conversion
+            (iot_rec_schema.IotRecorderSchema.to_epoch_us()). All other representations are parsed,
+            which raises ValueError for strings that are not points in time.
+
+        Parameters:
+            name : str
+                Name of the member.
+            mandatory : bool, optional
+                If True, a missing member raises ValueError; otherwise None is returned.
+
+        Returns:
+            Any : Fixed layout string or datetime (None if the member is None or missing).
+        """
+        value = self.value(name, mandatory)
+        if isinstance(value, str) and IotMessageView.fixed_time_layout.fullmatch(value) is not None:
+            return value
+        return self.time(name, mandatory)
+
+    def row(self, columns: tuple) -> tuple:
+        """ Maps the members of the payload to the column values of a recorder table.
+
+        Parameters:
+            columns : tuple
+                Column specifications (member_name, column_kind, mandatory, default), with column_kind
+                one of column_kinds.
+
+        Returns:
+            tuple : Column values, in the order of columns.
+        """
+        values = []
+        for name, column_kind, mandatory, default in columns:
+            if column_kind == 'time':
+                values.append(self.time_column(name, mandatory))
+            elif column_kind == 'json':
+                values.append(json.dumps(self.value(name, mandatory, default)))
+            else:
+                values.append(self.value(name, mandatory, default))
+        return tuple(values)
+
+    def decode(self) -> object:
+        """ Converts the payload into an instance of the registered message type.
+
+        Returns:
+            object : The decoded message.
+        """
+        return iot_msg_registry.IotMessageRegistry.decode(self._payload)
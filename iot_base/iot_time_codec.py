@@ -0,0 +1,172 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+from datetime import datetime
+
+class IotTimeCodec:
+    """ Conversion of points in time to and from their representation in message payloads.
+
+        The default wire representation is the fixed layout "YYYY-mm-dd HH:MM:SS.ffffff" (local time).
+        Optionally, points in time are sent as epoch seconds (float); decoding always accepts both
+        representations, so senders can be switched one by one. Parsing avoids datetime.strptime():
+        the fixed layout is handled by datetime.fromisoformat(), other fraction lengths ("…:SS.123")
+        and layouts without a fraction by slicing.
+
+    Attributes:
+        wire_formats : list
+            Supported wire representations ("str", "epoch").
+        _wire_format : str
+            Wire representation used by encode().
+
+    Methods:
+        set_wire_format : None, static
+            Sets the wire representation used by encode().
+        wire_format : str, static
+            Returns the wire representation used by encode().
+        format : str, static
+            Converts a point in time to the fixed layout string.
+        parse : datetime, static
+            Converts a fixed layout string to a point in time.
+        encode : Any, static
+            Converts a point in time to its wire representation.
+        decode : datetime, static
+            Converts a wire representation (string, epoch seconds or datetime) to a point in time.
+        to_epoch_us : int, static
+            Converts a point in time to epoch microseconds.
+        from_epoch_us : datetime, static
+            Converts epoch microseconds to a point in time (local time).
+    """
+    wire_formats = ['str', 'epoch']
+    _wire_format = 'str'
+
+    @staticmethod
+    def set_wire_format(wire_format: str) -> None:
+        """ Sets the wire representation used by encode().
+
+        Parameters:
+            wire_format : str
+                "str" (fixed layout string) or "epoch" (epoch seconds as float).
+        """
+        if wire_format not in IotTimeCodec.wire_formats:
+            raise ValueError(f'IotTimeCodec.set_wire_format(): invalid wire format "{wire_format}"')
+        IotTimeCodec._wire_format = wire_format
+
+    @staticmethod
+    def wire_format() -> str:
+        """ Returns the wire representation used by encode(). """
+        return IotTimeCodec._wire_format
+
+    @staticmethod
+    def format(value: datetime) -> str:
+        """ Converts a point in time to the fixed layout string "YYYY-mm-dd HH:MM:SS.ffffff".
+
+        Parameters:
+            value : datetime
+                Point in time to be converted.
+
+        Returns:
+            str : Formatted point in time.
+        """
+        return value.isoformat(' ', 'microseconds')
+
+    @staticmethod
+    def parse(value: str) -> datetime:
+        """ Converts a string "YYYY-mm-dd HH:MM:SS[.f…]" (1 to 6 fraction digits) to a point in time.
+
+        Parameters:
+            value : str
+                String to be converted.
+
+        Returns:
+            datetime : The point in time.
+        """
+        if len(value) in (19, 23, 26):
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                pass
+        if len(value) < 19 or value[4] != '-' or value[7] != '-' or value[13] != ':' or value[16] != ':':
+            raise ValueError(f'IotTimeCodec.parse(): invalid point in time "{value}"')
+        microsecond = 0
+        if len(value) > 19:
+            fraction = value[20:]
+            if value[19] != '.' or not 1 <= len(fraction) <= 6 or not fraction.isdigit():
+                raise ValueError(f'IotTimeCodec.parse(): invalid point in time "{value}"')
+            microsecond = int(fraction.ljust(6, '0'))
+        return datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                        int(value[11:13]), int(value[14:16]), int(value[17:19]), microsecond)
+
+    @staticmethod
+    def encode(value: datetime) -> object:
+        """ Converts a point in time to its wire representation.
+
+        Parameters:
+            value : datetime
+                Point in time to be converted (None is passed through).
+
+        Returns:
+            Any : Fixed layout string or epoch seconds (float), according to the wire format.
+        """
+        if value is None:
+            return None
+        if IotTimeCodec._wire_format == 'epoch':
+            return value.timestamp()
+        return value.isoformat(' ', 'microseconds')
+
+    @staticmethod
+    def decode(value: object) -> datetime:
+        """ Converts a wire representation to a point in time.
+
+        Parameters:
+            value : Any
+                Fixed layout string, epoch seconds (int or float) or datetime (None is passed through).
+
+        Returns:
+            datetime : The point in time (local time).
+        """
+        if value is None or isinstance(value, datetime):
+            return value
+        if isinstance(value, str):
+            return IotTimeCodec.parse(value)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return datetime.fromtimestamp(value)
+        raise TypeError(f'IotTimeCodec.decode(): invalid point in time type "{type(value)}"')
+
+    @staticmethod
+    def to_epoch_us(value: datetime) -> int:
+        """ Converts a point in time to epoch microseconds. Unlike datetime.timestamp(), the conversion is
+            exact (no floating point rounding of the microseconds).
+
+        Parameters:
+            value : datetime
+                Point in time to be converted; naive values are interpreted as local time.
+
+        Returns:
+            int : Microseconds since 1970-01-01 00:00:00 UTC.
+        """
+        return int(value.replace(microsecond = 0).timestamp()) * 1000000 + value.microsecond
+
+    @staticmethod
+    def from_epoch_us(value: int) -> datetime:
+        """ Converts epoch microseconds to a point in time.
+
+        Parameters:
+            value : int
+                Microseconds since 1970-01-01 00:00:00 UTC.
+
+        Returns:
+            datetime : The point in time (naive, local time).
+        """
+        seconds, microsecond = divmod(value, 1000000)
+        return datetime.fromtimestamp(seconds).replace(microsecond = microsecond)
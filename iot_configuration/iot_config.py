@@ -33,6 +33,8 @@ class IotConfiguration:
             Getter for the last change date of the host configuration in the repository.
         process_group : int
             Getter for the current process group.
+        process_groups : list
+            Getter for all process groups of the components assigned to the current host.
         brokers : dict
             Getter for the configuration settings for all MQTT brokers defined in the IOT system.
         hardware_components : dict
@@ -78,6 +80,17 @@ class IotConfiguration:
         """ Getter for the current process group. """
         return self._process_group
 
+    @property
+    def process_groups(self) -> list:
+        """ Getter for all process groups of the components assigned to the current host.
+
+        Returns:
+            list : Distinct process group numbers in ascending order.
+        """
+        with SQLiteRepository(iot_repository_host.IotHostAssignedComponent, self._sqlite_db_path) as comp_repo:
+            db_assigned_comps = comp_repo.select_where([("host_id", "=", self.host_id)])
+        return sorted({db_assigned_comp.process_group for db_assigned_comp in db_assigned_comps})
+
     @property
     def brokers(self) -> dict:
         """ Getter for the configuration settings for all MQTT brokers defined in the IOT system.
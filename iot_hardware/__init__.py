@@ -30,6 +30,7 @@ iot_repository_path = f"{parent_dir}{DELIMITER}iot_repository"
 if iot_repository_path not in sys.path:
     sys.path.append(iot_repository_path)
 
+from iot_hardware_burst import IotBurstSampler
 from iot_hardware_device import IotHardwareDevice
 from iot_hardware_input import IotInputDevice
 from iot_hardware_input import DigitalInputADS1115
@@ -0,0 +1,264 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+from typing import Callable
+from array import array
+from datetime import datetime
+from datetime import timedelta
+import inspect
+import logging
+import threading
+import time
+import iot_msg_input
+
+# pylint: disable=logging-fstring-interpolation
+
+class IotBurstSampler:
+    """ Samples the channels of an input device continuously in a background thread. The samples are
+        stored in preallocated arrays (16 bit signed integers, one row per sampling round, channels
+        interleaved); two buffers are used alternately, so that drain() only swaps buffers and the sampling
+        thread never allocates memory. The sampler does not access the hardware itself; it calls a read
+        function for every sample and therefore works with real and simulated devices alike.
+
+    Attributes:
+        _read_sample : Callable
+            Function returning the current value of a channel (called with the channel number).
+        _channel_nos : list
+            Numbers of the sampled channels.
+        _data_rate : int
+            Conversions per second; the sampling thread paces its reads accordingly (0: as fast as
+            _read_sample returns).
+        _capacity : int
+            Number of sampling rounds a buffer can hold.
+        _buffers : list
+            The two preallocated sample buffers.
+        _active : int
+            Index of the buffer currently filled by the sampling thread.
+        _num_rows : int
+            Number of sampling rounds stored in the active buffer.
+        _num_dropped : int
+            Number of sampling rounds lost since the last drain() because the active buffer was full.
+        _start_time : datetime
+            Timestamp of the first sample in the active buffer.
+        _first_row_ns : int
+            Monotonic time of the first sampling round in the active buffer.
+        _last_row_ns : int
+            Monotonic time of the last sampling round in the active buffer.
+        _lock : threading.Lock
+            Synchronizes the sampling thread and drain().
+        _thread : threading.Thread
+            The sampling thread.
+
+    Properties:
+        channel_nos : list
+            Getter for the numbers of the sampled channels.
+        data_rate : int
+            Getter for the conversions per second.
+        is_running : bool
+            Indicates whether or not the sampling thread is running.
+        statistics : dict
+            Getter for the sampler counters.
+
+    Methods:
+        IotBurstSampler : None
+            Constructor.
+        start : None
+            Starts the sampling thread.
+        stop : bool
+            Stops the sampling thread.
+        drain : tuple
+            Returns the samples collected since the last call and continues with an empty buffer.
+        burst : iot_msg_input.InputBurst
+            Drains the buffer and returns the samples as InputBurst message.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, read_sample: Callable[[int], int], channel_nos: list, logger: logging.Logger,
+                 data_rate: int = 860, buffer_time: float = 120.0):
+        """ Constructor.
+
+        Parameters:
+            read_sample : Callable
+                Function returning the current value of a channel (called with the channel number).
+            channel_nos : list
+                Numbers of the channels to be sampled (in turn).
+            logger : logging.Logger
+                Logger to be used.
+            data_rate : int, optional
+                Conversions per second (all channels together); 0 samples as fast as possible.
+            buffer_time : float, optional
+                Time in seconds the buffers must be able to hold at data_rate; should exceed the
+                interval in which drain() is called.
+        """
+        # pylint: disable=too-many-arguments
+        if len(channel_nos) == 0:
+            raise ValueError('IotBurstSampler(): no channels to sample')
+        self._read_sample = read_sample
+        self._channel_nos = list(channel_nos)
+        self._logger = logger
+        self._data_rate = data_rate
+        rows_per_sec = data_rate / len(channel_nos) if data_rate > 0 else 1000
+        self._capacity = max(int(rows_per_sec * buffer_time) + 1, 1)
+        buffer_size = self._capacity * len(channel_nos)
+        self._buffers = [array('h', bytes(2 * buffer_size)), array('h', bytes(2 * buffer_size))]
+        self._active = 0
+        self._num_rows = 0
+        self._num_dropped = 0
+        self._num_samples_total = 0
+        self._num_errors = 0
+        self._start_time = None
+        self._first_row_ns = 0
+        self._last_row_ns = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def channel_nos(self) -> list:
+        """ Getter for the numbers of the sampled channels. """
+        return self._channel_nos
+
+    @property
+    def data_rate(self) -> int:
+        """ Getter for the conversions per second. """
+        return self._data_rate
+
+    @property
+    def is_running(self) -> bool:
+        """ Indicates whether or not the sampling thread is running. """
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def statistics(self) -> dict:
+        """ Getter for the sampler counters.
+
+        Returns:
+            dict : "num_samples_total" (samples read since start()), "num_errors" (failed reads),
+                   "num_rows" (sampling rounds in the active buffer), "num_dropped", "capacity".
+        """
+        with self._lock:
+            return {
+                'num_samples_total': self._num_samples_total,
+                'num_errors': self._num_errors,
+                'num_rows': self._num_rows,
+                'num_dropped': self._num_dropped,
+                'capacity': self._capacity
+            }
+
+    def start(self) -> None:
+        """ Starts the sampling thread. """
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target = self._sample_loop, name = 'burst_sampler', daemon = True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 3.0) -> bool:
+        """ Stops the sampling thread. Samples not yet drained remain available for drain().
+
+        Parameters:
+            timeout : float, optional
+                Maximum time in seconds to wait for the sampling thread.
+
+        Returns:
+            bool : True if the sampling thread has terminated, False otherwise.
+        """
+        self._stop_event.set()
+        if self._thread is None:
+            return True
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def drain(self) -> tuple:
+        """ Returns the samples collected since the last call and continues with the other (empty) buffer.
+
+        Returns:
+            tuple : (start_time, end_time, columns, num_dropped) with columns containing one array of
+                    samples per channel (in the order of channel_nos); start_time is None if no samples
+                    have been collected.
+        """
+        with self._lock:
+            samples = self._buffers[self._active]
+            num_rows = self._num_rows
+            start_time, num_dropped = self._start_time, self._num_dropped
+            elapsed_ns = self._last_row_ns - self._first_row_ns
+            self._active = 1 - self._active
+            self._num_rows = 0
+            self._num_dropped = 0
+            self._start_time = None
+        end_time = None if start_time is None else start_time + timedelta(microseconds = elapsed_ns // 1000)
+        num_channels = len(self._channel_nos)
+        used = samples[:num_rows * num_channels]
+        columns = [used[channel_idx::num_channels] for channel_idx in range(num_channels)]
+        return start_time, end_time, columns, num_dropped
+
+    def burst(self, device_type: str, device_id: str, raw_samples: bool = False) -> iot_msg_input.InputBurst:
+        """ Drains the buffer and returns the samples as InputBurst message.
+
+        Parameters:
+            device_type : str
+                Type of the sampled device.
+            device_id : str
+                Unique identifier of the sampled device.
+            raw_samples : bool, optional
+                If True, the compressed raw samples are included in the message.
+
+        Returns:
+            iot_msg_input.InputBurst : Summary of the samples (None if no samples have been collected).
+        """
+        start_time, end_time, columns, num_dropped = self.drain()
+        if start_time is None:
+            return None
+        return iot_msg_input.InputBurst.from_samples(device_type, device_id, start_time, end_time, self._data_rate,
+                                                     self._channel_nos, columns, num_dropped, raw_samples)
+
+    def _sample_loop(self) -> None:
+        """ Main loop of the sampling thread. """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        self._logger.debug(f'{mth_name}: sampling thread started, data_rate={self._data_rate}')
+        read_sample = self._read_sample
+        channel_nos = self._channel_nos
+        num_channels = len(channel_nos)
+        row_period_ns = num_channels * 1000000000 // self._data_rate if self._data_rate > 0 else 0
+        next_row_ns = time.monotonic_ns()
+        while not self._stop_event.is_set():
+            try:
+                row = array('h', [read_sample(channel_no) for channel_no in channel_nos])
+            except (OSError, ValueError, OverflowError) as except_:
+                self._logger.error(f'{mth_name}: {str(except_)}')
+                self._num_errors += 1
+                if self._stop_event.wait(0.1):
+                    break
+                next_row_ns = time.monotonic_ns()
+                continue
+            row_ns = time.monotonic_ns()
+            with self._lock:
+                if self._num_rows < self._capacity:
+                    base = self._num_rows * num_channels
+                    self._buffers[self._active][base:base + num_channels] = row
+                    if self._num_rows == 0:
+                        self._start_time = datetime.now()
+                        self._first_row_ns = row_ns
+                    self._last_row_ns = row_ns
+                    self._num_rows += 1
+                else:
+                    self._num_dropped += 1
+                self._num_samples_total += num_channels
+            if row_period_ns > 0:
+                next_row_ns += row_period_ns
+                wait_ns = next_row_ns - row_ns
+                if wait_ns > 0:
+                    time.sleep(wait_ns / 1000000000)
+                elif wait_ns < -row_period_ns:
+                    next_row_ns = row_ns
+        self._logger.debug(f'{mth_name}: sampling thread stopped')
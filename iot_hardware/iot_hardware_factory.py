@@ -69,7 +69,11 @@ class IotHardwareFactory:
     def create_hardware_handler(brokers: dict,
                                 hw_config: iot_repository_hardware.IotHardwareConfig,
                                 device: iot_hardware_device.IotHardwareDevice,
-                                logger: logging.Logger) -> iot_handler_base.IotHandlerBase:
+                                logger: logging.Logger,
+                                publish_batch: bool = False,
+                                binary_payload: bool = False,
+                                burst_rate: int = 0,
+                                burst_raw_samples: bool = False) -> iot_handler_base.IotHandlerBase:
         """ Creates a hardware handler using the given brokers and controlling the given device.
 
         Parameters:
@@ -85,11 +89,23 @@ class IotHardwareFactory:
                 The controlled hardware device.
             logger : logging.Logger
                 The logger to be used by the hardware handler.
+            publish_batch : bool, optional
+                If True, input device handlers publish one InputProbeBatch message per poll instead of
+                one InputProbe message per channel.
+            binary_payload : bool, optional
+                If True, input device handlers publish their probe messages in the compact binary
+                representation instead of as JSON dictionaries.
+            burst_rate : int, optional
+                If greater than 0, input devices supporting burst mode sample their channels continuously
+                at this data rate and the handlers publish one InputBurst message per poll.
+            burst_raw_samples : bool, optional
+                If True, the InputBurst messages include the compressed raw samples.
 
         Returns:
             iot_handler_base.IotHandlerBase
                 The new hardware handler.
         """
+        # pylint: disable=too-many-arguments
         if hw_config.device_type.find('Input') >= 0:
             mqtt_data = None
             mqtt_health = None
@@ -110,7 +126,11 @@ class IotHardwareFactory:
                                    hw_config.health_topic)
             new_handler = iot_hardware_handler.IotInputDeviceHandler(device, logger, hw_config.polling_interval,
                                                                      mqtt_data = mqtt_data, mqtt_health = mqtt_health,
-                                                                     health_check_interval = 15 * 60)
+                                                                     health_check_interval = 15 * 60,
+                                                                     publish_batch = publish_batch,
+                                                                     binary_payload = binary_payload,
+                                                                     burst_rate = burst_rate,
+                                                                     burst_raw_samples = burst_raw_samples)
         elif hw_config.device_type.find('Output') >= 0:
             mqtt_input = None
             mqtt_health = None
@@ -19,8 +19,10 @@ import json
 from datetime import datetime
 import wp_queueing
 import iot_handler_base
+import iot_msg_binary
 import iot_msg_input
 import iot_msg_output
+import iot_msg_registry
 import iot_hardware_device
 import iot_hardware_input
 
@@ -61,7 +63,6 @@ class IotOutputDeviceHandler(iot_handler_base.IotHandlerBase):
             mth_name, self.element_id, self.element_type, self.element_model))
         super().__init__(polling_interval, health_check_interval, mqtt_input = mqtt_input, mqtt_health = mqtt_health)
         if self.mqtt_input is not None:
-            self.mqtt_input[0].owner = self
             self.mqtt_input[0].topics = [(self.mqtt_input[1], 0)]
 
     @property
@@ -90,7 +91,7 @@ class IotOutputDeviceHandler(iot_handler_base.IotHandlerBase):
             messages.
         """
         super().polling_timer_event()
-        self.mqtt_input[0].receive()
+        self.receive_messages()
 
     def message(self, msg: wp_queueing.QueueMessage) -> None:
         """ Handle an incoming message containing an output command.
@@ -106,9 +107,8 @@ class IotOutputDeviceHandler(iot_handler_base.IotHandlerBase):
         # if msg.msg_topic != self.mqtt_input[1]:
         #     self.logger.debug(f'{mth_name}: unexpected topic "{msg.msg_topic}"; expected "{self.mqtt_input[1]}"')
         #     return
-        output_msg = iot_msg_output.OutputData()
         try:
-            output_msg.from_dict(msg.msg_payload)
+            output_msg = iot_msg_registry.IotMessageRegistry.decode(msg.msg_payload, iot_msg_output.OutputData)
         except TypeError as except_:
             self.logger.error(f'{mth_name}: {str(except_)}')
             return
@@ -183,6 +183,14 @@ class IotInputDeviceHandler(iot_handler_base.IotHandlerBase):
             Logger to be used.
         _device : iot_hardware_input.InputDevice
             Input device driver that handles the connected hardware component.
+        _publish_batch : bool
+            Indicates whether the probes of one poll are published as one InputProbeBatch message.
+        _binary_payload : bool
+            Indicates whether the probe messages are published in their binary representation.
+        _burst_rate : int
+            Data rate of the device in burst mode (0: one probe per poll).
+        _burst_raw_samples : bool
+            Indicates whether the raw samples are included in the published InputBurst messages.
 
     Properties:
         device_id : str
@@ -195,10 +203,16 @@ class IotInputDeviceHandler(iot_handler_base.IotHandlerBase):
     Methods:
         InputDeviceHandler
             Constructor.
+        init_time : None
+            Initializes the timers; starts burst sampling if configured.
+        stop : None
+            Stops the handler and burst sampling.
     """
+    # pylint: disable=too-many-instance-attributes
     def __init__(self, device: iot_hardware_input.IotInputDevice, logger: logging.Logger,
                  polling_interval: int, mqtt_data: tuple, mqtt_health: tuple = None,
-                 health_check_interval: int = 0):
+                 health_check_interval: int = 0, publish_batch: bool = False, binary_payload: bool = False,
+                 burst_rate: int = 0, burst_raw_samples: bool = False):
         """ Constructor.
 
         Parameters:
@@ -216,9 +230,27 @@ class IotInputDeviceHandler(iot_handler_base.IotHandlerBase):
                 messages.
             health_check_interval : int, optional
                 Interval in seconds for health checking of the input device.
+            publish_batch : bool, optional
+                If True, the results of all channels of one poll are published as one InputProbeBatch
+                message to the topic "<data_topic>/<device_id>"; otherwise one InputProbe message per
+                channel is published to the topic "<data_topic>/<device_id>/<channel_no>".
+            binary_payload : bool, optional
+                If True, probe messages are published in their compact binary representation
+                (iot_msg_binary) instead of as JSON dictionaries.
+            burst_rate : int, optional
+                If greater than 0, the device samples its channels continuously at this data rate
+                (conversions per second); every poll publishes one InputBurst message with the summary
+                of the samples to the topic "<data_topic>/<device_id>/burst".
+            burst_raw_samples : bool, optional
+                If True, the InputBurst messages include the compressed raw samples.
         """
+        # pylint: disable=too-many-arguments
         mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
         self._device = device
+        self._publish_batch = publish_batch
+        self._binary_payload = binary_payload
+        self._burst_rate = burst_rate
+        self._burst_raw_samples = burst_raw_samples
         self.logger = logger
         self.logger.debug('{}: device_id="{}", device_type="{}", model="{}"'.format(
             mth_name, self.element_id, self.element_type, self.element_model))
@@ -256,31 +288,83 @@ class IotInputDeviceHandler(iot_handler_base.IotHandlerBase):
         """
         return "{}/{}/{}".format(self.mqtt_data[1], self.element_id, probe.channel_no)
 
+    def _batch_topic(self) -> str:
+        """ Constructs the MQTT message topic for an InputProbeBatch message.
+
+        Returns:
+            str : MQTT topic.
+        """
+        return "{}/{}".format(self.mqtt_data[1], self.element_id)
+
+    def _burst_topic(self) -> str:
+        """ Constructs the MQTT message topic for an InputBurst message. Sensors subscribe to the probe and
+            batch topics of the device, so the bursts have a topic of their own.
+
+        Returns:
+            str : MQTT topic.
+        """
+        return "{}/{}/burst".format(self.mqtt_data[1], self.element_id)
+
     def _health_topic(self) -> str:
         return "{}/{}".format(self.mqtt_health[1], self.element_id)
 
+    def init_time(self, now: datetime = None) -> None:
+        """ Initializes the timers; starts burst sampling if configured. If the device does not support
+            burst mode, the handler probes the device once per poll. """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        super().init_time(now)
+        if self._burst_rate > 0 and self._device is not None and not self._stopped:
+            try:
+                self._device.start_burst(self._burst_rate, buffer_time = max(2 * self._polling_interval_ns / 1e9, 10))
+            except ValueError as except_:
+                self.logger.error(f'{mth_name}: {str(except_)}')
+                self._burst_rate = 0
+
+    def stop(self) -> None:
+        """ Stops the handler and burst sampling. """
+        if self._burst_rate > 0 and self._device is not None:
+            self._device.stop_burst()
+        super().stop()
+
     def polling_timer_event(self) -> None:
         """ Indicates that the polling timer has expired and the underlying device must be probed.
+            In burst mode, the summary of the samples collected since the last poll is published.
         """
         super().polling_timer_event()
         mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
         self.logger.debug(mth_name)
         if self._device is None or self.mqtt_data is None:
             return
+        if self._burst_rate > 0:
+            burst = self._device.burst(self._burst_raw_samples)
+            if burst is not None:
+                msg = wp_queueing.QueueMessage(self._burst_topic())
+                msg.msg_payload = iot_msg_binary.IotBinaryCodec.encode(burst) if self._binary_payload else burst
+                self.mqtt_data[0].publish_single(msg)
+            return
         poll_result = self._device.probe()
+        if self._publish_batch:
+            batch = iot_msg_input.InputProbeBatch.from_probes(poll_result)
+            if batch is not None:
+                msg = wp_queueing.QueueMessage(self._batch_topic())
+                msg.msg_payload = iot_msg_binary.IotBinaryCodec.encode(batch) if self._binary_payload else batch
+                self.mqtt_data[0].publish_single(msg)
+            return
         for probe in poll_result:
             msg = wp_queueing.QueueMessage(self._data_topic(probe))
-            msg.msg_payload = probe
+            msg.msg_payload = iot_msg_binary.IotBinaryCodec.encode(probe) if self._binary_payload else probe
             self.mqtt_data[0].publish_single(msg)
 
     def health_timer_event(self) -> None:
-        """ Indicates the the health check timer has expired and health check information must be published. """
+        """ Indicates the the health check timer has expired and health check information must be published.
+            The health message includes the timing statistics of the handler. """
         super().health_timer_event()
         mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
         self.logger.debug(mth_name)
         if self._device is None or self.mqtt_health is None:
             return
         health_result = self._device.check_health()
+        health_result.timing = self.timing_statistics
         msg = wp_queueing.QueueMessage(self._health_topic())
         msg.msg_payload = health_result
         self.mqtt_health[0].publish_single(msg)
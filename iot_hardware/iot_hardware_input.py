@@ -20,6 +20,8 @@ import board
 import busio
 import adafruit_ads1x15.ads1115 as ADS
 from adafruit_ads1x15.analog_in import AnalogIn
+from adafruit_ads1x15.ads1x15 import Mode
+import iot_hardware_burst
 import iot_hardware_device
 
 class IotInputDevice(iot_hardware_device.IotHardwareDevice):
@@ -50,6 +52,13 @@ class IotInputDevice(iot_hardware_device.IotHardwareDevice):
         check_health : InputHealth
             Hethod for checking the health of the input device. Must be overloaded in sub-classes for specific
             harware components.
+        start_burst : None
+            Starts sampling the active channels continuously. Must be overloaded in sub-classes supporting
+            burst mode.
+        stop_burst : None
+            Stops sampling the active channels continuously.
+        burst : InputBurst
+            Returns the summary of the samples collected since the last call.
     """
     def __init__(self, device_id: str, logger: logging.Logger):
         """ Constructor.
@@ -73,6 +82,18 @@ class IotInputDevice(iot_hardware_device.IotHardwareDevice):
         # pylint: disable=no-self-use
         return []
 
+    def start_burst(self, data_rate: int, buffer_time: float = 120.0) -> None:
+        """ Raises a ValueError, since burst mode is not supported by the generic input device. """
+        raise ValueError(f'{self.__class__.__name__}.start_burst(): burst mode not supported by "{self.model}"')
+
+    def stop_burst(self) -> None:
+        """ Does nothing. """
+
+    def burst(self, raw_samples: bool = False) -> iot_msg_input.InputBurst:
+        """ Returns None. """
+        # pylint: disable=no-self-use,unused-argument
+        return None
+
 
 
 class DigitalInputADS1115(IotInputDevice):
@@ -87,6 +108,12 @@ class DigitalInputADS1115(IotInputDevice):
             Address of the ADS1115 component on the I2C bus.
         active_ports : list
             List of active port numbers.
+        burst_data_rates : list
+            Data rates (conversions per second) supported by the ADS1115.
+        _sampler : iot_hardware_burst.IotBurstSampler
+            Sampler reading the active channels continuously in burst mode (None if not in burst mode).
+        _burst_bus : busio.I2C
+            I2C bus kept open while in burst mode.
 
     Methods:
         DigitalInputADS1115()
@@ -97,7 +124,15 @@ class DigitalInputADS1115(IotInputDevice):
         check_health : InputHealth
             Performs a health check and returns information about the current status of the ADS1115
             component.
+        start_burst : None
+            Starts sampling the active channels continuously at the data rate of the chip.
+        stop_burst : None
+            Stops sampling the active channels continuously.
+        burst : InputBurst
+            Returns the summary of the samples collected since the last call.
     """
+    burst_data_rates = [8, 16, 32, 64, 128, 250, 475, 860]
+
     def __init__(self, device_id: str, i2c_bus_id: int, i2c_bus_address: int,
                  active_ports: list, logger: logging.Logger):
         """ Constructor.
@@ -114,6 +149,8 @@ class DigitalInputADS1115(IotInputDevice):
         self.i2c_bus_address = i2c_bus_address
         self.active_ports = active_ports
         self.num_probe_list = [0, 0, 0, 0]
+        self._sampler = None
+        self._burst_bus = None
         self.logger.debug('{}: Initialized Hardware Device:'.format(mth_name))
         self.logger.debug('   deviceId:    {}'.format(self.device_id))
         self.logger.debug('   bus_id:      {}'.format(self.i2c_bus_id))
@@ -151,6 +188,65 @@ class DigitalInputADS1115(IotInputDevice):
         self.last_probe_time = probe_time
         return probe_result
 
+    def start_burst(self, data_rate: int, buffer_time: float = 120.0) -> None:
+        """ Starts sampling the active channels continuously at the data rate of the chip. The I2C bus
+            stays open until stop_burst(); with a single active channel, the ADS1115 is operated in
+            continuous conversion mode.
+
+        Parameters:
+            data_rate : int
+                Conversions per second (one of burst_data_rates), shared by the active channels.
+            buffer_time : float, optional
+                Time in seconds the sample buffers must be able to hold; should exceed the interval in
+                which burst() is called.
+        """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        if data_rate not in DigitalInputADS1115.burst_data_rates:
+            raise ValueError(f'{mth_name}: invalid data rate {data_rate}')
+        if self._sampler is not None:
+            return
+        self._burst_bus = busio.I2C(board.SCL, board.SDA)
+        ads_handle = ADS.ADS1115(self._burst_bus, address = self.i2c_bus_address, data_rate = data_rate,
+                                 mode = Mode.CONTINUOUS if len(self.active_ports) == 1 else Mode.SINGLE)
+        ads_channels = {channel_no: AnalogIn(ads_handle, channel_no) for channel_no in self.active_ports}
+        self._sampler = iot_hardware_burst.IotBurstSampler(
+            lambda channel_no: ads_channels[channel_no].value, self.active_ports, self.logger,
+            data_rate = data_rate, buffer_time = buffer_time)
+        self._sampler.start()
+        self.logger.debug(f'{mth_name}: data_rate = {data_rate}, channels = {self.active_ports}')
+
+    def stop_burst(self) -> None:
+        """ Stops sampling the active channels continuously and closes the I2C bus. """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        if self._sampler is None:
+            return
+        if not self._sampler.stop():
+            self.logger.warning(f'{mth_name}: sampling thread did not terminate')
+        self._burst_bus.deinit()
+        self._sampler = None
+        self._burst_bus = None
+
+    def burst(self, raw_samples: bool = False) -> iot_msg_input.InputBurst:
+        """ Returns the summary of the samples collected since the last call.
+
+        Parameters:
+            raw_samples : bool, optional
+                If True, the compressed raw samples are included.
+
+        Returns:
+            InputBurst : Summary of the samples (None if not in burst mode or no samples collected).
+        """
+        if self._sampler is None:
+            return None
+        burst_result = self._sampler.burst(self.model, self.device_id, raw_samples)
+        if burst_result is None:
+            return None
+        for channel_no, num_samples in zip(burst_result.channel_nos, burst_result.num_samples):
+            self.num_probe_list[channel_no] += num_samples
+        self.num_probes += 1
+        self.last_probe_time = burst_result.end_time
+        return burst_result
+
     def check_health(self) -> iot_msg_input.InputHealth:
         """ Performs a health check and returns information about the current status of the ADS1115
             component.
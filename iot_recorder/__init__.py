@@ -36,3 +36,11 @@ from iot_stat_msg import IotRecorderGenericMsg
 from iot_stat_msg import IotRecorderInputProbe
 from iot_stat_msg import IotRecorderInputHealth
 from iot_stat_msg import IotRecorderSensorMsg
+from iot_rec_schema import IotRecorderSchema
+from iot_rec_writer import IotRecorderWriter
+from iot_rec_pipeline import IotRecorderPipeline
+from iot_rec_partition import IotRecorderPartitions
+from iot_rec_migrate import IotRecorderMigration
+from iot_rec_rollup import IotRecorderRollup
+from iot_rec_query import IotRecorderQuery
+from iot_rec_export import IotRecorderExport
@@ -13,15 +13,23 @@
     and limitations under the LICENSE.
 """
 from typing import Any
+from datetime import datetime
+import inspect
 import uuid
 import logging
 import wp_queueing
-import wp_repository
 import iot_handler_base
+import iot_msg_binary
 import iot_msg_input
-import iot_msg_sensor
+import iot_msg_registry
+import iot_msg_view
 import iot_repository_broker
 import iot_stat_msg
+import iot_rec_writer
+import iot_rec_pipeline
+import iot_rec_partition
+
+# pylint: disable=logging-fstring-interpolation
 
 class IotMessageRecorder(iot_handler_base.IotHandlerBase):
     """ Handler (derived from IotHandlerBased) that subscribes to a MQTT broker and stores received
@@ -32,6 +40,13 @@ class IotMessageRecorder(iot_handler_base.IotHandlerBase):
             Open session to a MQTT broker.
         _sqlite_db_path : str
             Full path name of the SQLite database where the messages shall be stored.
+        _batch_size : int
+            Number of buffered rows that triggers writing to the database (0: write every message immediately).
+        _writer : iot_rec_writer.IotRecorderWriter
+            Writer holding the long-lived connection to the recorder database.
+        _pipeline : iot_rec_pipeline.IotRecorderPipeline
+            Bounded queue and writer thread decoupling receiving from storing (None if messages are
+            stored by the receiving thread).
 
     Properties:
         device_id : str
@@ -40,17 +55,34 @@ class IotMessageRecorder(iot_handler_base.IotHandlerBase):
             Getter for the "device type". Implemented for compatibility reasons.
         device_model : str
             Getter for the "device model". Implemented for compatibility reasons.
+        writer_statistics : dict
+            Getter for the flush statistics of the buffered writer.
+        pipeline_statistics : dict
+            Getter for the queue depth and drop counters of the pipeline.
 
     Methods:
         IotMessageRecorder : None
             Constructor.
+        init_time : None
+            Function (overloaded from super() class) that initializes the timers; starts the writer thread.
         polling_timer_interval : None
             Function (overloaded from super() class) that will be called when the polling timer expires.
+        health_timer_event : None
+            Function (overloaded from super() class) that will be called when the health check timer expires.
+        stop : None
+            Stops the recorder; buffered messages are written to the database.
         message : None
             Function called by the MQTT broker session handler when a message is received.
+        record_batch : None
+            Decodes a list of received messages and writes them to the database.
     """
+    # pylint: disable=too-many-instance-attributes
     def __init__(self, broker_config: iot_repository_broker.IotMqttBrokerConfig,
-                 topics: Any, sqlite_db_path: str, logger: logging.Logger):
+                 topics: Any, sqlite_db_path: str, logger: logging.Logger, batch_size: int = 0,
+                 synchronous: str = "NORMAL", cache_size: int = -2000, pipeline_queue_size: int = 0,
+                 backpressure: str = "block", spill_path: str = None, partition_period: str = None,
+                 partition_retention: int = 0, partition_template: str = None, schema_version: int = 1,
+                 rollups: bool = True):
         """ Constructor.
 
         Parameters:
@@ -60,7 +92,39 @@ class IotMessageRecorder(iot_handler_base.IotHandlerBase):
                 Topics to subscribe to.
             sqlite_db_path : str
                 Full path name of the target SQLite database.
+            logger : logging.Logger
+                Logger to be used.
+            batch_size : int, optional
+                If greater than 0, received messages are buffered and written to the database in batches
+                (one transaction per table) when the number of buffered rows reaches batch_size or when
+                the polling timer expires. If 0, every message is written immediately.
+            synchronous : str, optional
+                Value for "PRAGMA synchronous" of the recorder database connection (OFF, NORMAL, FULL, EXTRA).
+            cache_size : int, optional
+                Value for "PRAGMA cache_size" of the recorder database connection.
+            pipeline_queue_size : int, optional
+                If greater than 0, the receiving thread only enqueues the received messages into a bounded
+                queue of this size; a dedicated writer thread decodes and stores them in batches.
+            backpressure : str, optional
+                Policy applied when the pipeline queue is full ("block", "drop_oldest", "spill").
+            spill_path : str, optional
+                Full path name of the spill file for the backpressure policy "spill".
+            partition_period : str, optional
+                If given ("day" or "month"), the messages are stored in time-partitioned databases whose
+                names are derived from sqlite_db_path (e.g. "iot_rec.20210712.sl3").
+            partition_retention : int, optional
+                Number of partitions to be kept; older partitions are deleted. 0 keeps all partitions.
+            partition_template : str, optional
+                Empty recorder database (e.g. the iot_rec.sl3 template) to be copied for new partitions. By
+                default, new partitions are created from the table definitions in iot_rec_schema.
+            schema_version : int, optional
+                Schema version of the recorder database. With 2, points in time are stored as epoch
+                microseconds; databases in version 1 are migrated when they are opened.
+            rollups : bool, optional
+                If True, per-minute, per-hour and per-day aggregates (count, min, max, sum, sum of squares)
+                per sensor and per device channel are maintained while recording.
         """
+        # pylint: disable=too-many-arguments
         super().__init__(5, 600, None, None, None)
         self._logger = logger
         self._mqtt_consumer = wp_queueing.MQTTConsumer(
@@ -73,6 +137,19 @@ class IotMessageRecorder(iot_handler_base.IotHandlerBase):
         else:
             self._mqtt_consumer.topics = [topics]
         self._sqlite_db_path = sqlite_db_path
+        self._batch_size = batch_size
+        partitions = None
+        if partition_period is not None:
+            partitions = iot_rec_partition.IotRecorderPartitions(
+                sqlite_db_path, partition_period, partition_template, partition_retention)
+        self._writer = iot_rec_writer.IotRecorderWriter(
+            sqlite_db_path, self._logger, batch_size, synchronous = synchronous, cache_size = cache_size,
+            partitions = partitions, schema_version = schema_version, rollups = rollups)
+        self._pipeline = None
+        if pipeline_queue_size > 0:
+            self._pipeline = iot_rec_pipeline.IotRecorderPipeline(
+                self.record_batch, self._logger, pipeline_queue_size, backpressure, spill_path,
+                batch_size = batch_size if batch_size > 0 else 100)
         self._recorder_id = f'Rec.{broker_config.broker_id}.{str(uuid.uuid4()).replace("-","")}'
 
     @property
@@ -90,10 +167,58 @@ class IotMessageRecorder(iot_handler_base.IotHandlerBase):
         """ Getter for the "device model". Implemented for compatibility reasons. """
         return self.device_type
 
+    @property
+    def writer_statistics(self) -> dict:
+        """ Getter for the flush statistics (batch sizes, flush latency) of the buffered writer. """
+        return self._writer.statistics
+
+    @property
+    def pipeline_statistics(self) -> dict:
+        """ Getter for the queue depth and drop counters of the pipeline (None if not in pipeline mode). """
+        if self._pipeline is None:
+            return None
+        return self._pipeline.statistics
+
+    def init_time(self, now: datetime = None) -> None:
+        """ Function (overloaded from super() class) that initializes the timers; starts the writer thread. """
+        super().init_time(now)
+        if self._pipeline is not None and not self._stopped:
+            self._pipeline.start()
+
     def polling_timer_event(self) -> None:
         """ Function (overloaded from super() class) that will be called when the polling timer expires. """
         super().polling_timer_event()
         self._mqtt_consumer.receive()
+        if self._pipeline is None:
+            self._writer.flush()
+
+    def health_timer_event(self) -> None:
+        """ Function (overloaded from super() class) that will be called when the health check timer expires. """
+        super().health_timer_event()
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        stats = self._writer.statistics
+        self._logger.info(f'{mth_name}: flushes={stats["num_flushes"]}, rows={stats["num_rows"]}, '
+                          f'failed={stats["num_failed_rows"]}, skipped={stats["num_skipped_rows"]}, '
+                          f'batch_size(avg/max)={stats["avg_batch_size"]:.1f}/{stats["max_batch_size"]}, '
+                          f'flush_ms(avg/max)={stats["avg_flush_ms"]:.2f}/{stats["max_flush_ms"]:.2f}')
+        stats = self.timing_statistics
+        self._logger.info(f'{mth_name}: missed_polls={stats["num_missed_polls"]}, '
+                          f'max_lateness={stats["max_lateness"]:.3f}s, max_duration={stats["max_duration"]:.3f}s, '
+                          f'durations={stats["duration_histogram"]}')
+        if self._pipeline is not None:
+            stats = self._pipeline.statistics
+            self._logger.info(f'{mth_name}: queue_depth={stats["queue_depth"]}, '
+                              f'max_queue_depth={stats["max_queue_depth"]}, enqueued={stats["num_enqueued"]}, '
+                              f'dropped={stats["num_dropped"]}, spilled={stats["num_spilled"]}')
+
+    def stop(self) -> None:
+        """ Stops the recorder; buffered messages are written to the database and the database connection
+            is closed. """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        if self._pipeline is not None and not self._pipeline.stop():
+            self._logger.warning(f'{mth_name}: writer thread did not terminate')
+        self._writer.close()
+        super().stop()
 
     def message(self, msg: wp_queueing.QueueMessage) -> None:
         """ Function called by the MQTT broker session handler when a message is received.
@@ -102,33 +227,104 @@ class IotMessageRecorder(iot_handler_base.IotHandlerBase):
             msg : wp_queueing.QueueMessage
                 Message received from the MQTT broker.
         """
+        if self._pipeline is not None:
+            self._pipeline.put(msg)
+            return
+        self._record(msg)
+        if self._batch_size == 0:
+            self._writer.flush()
+
+    def record_batch(self, msg_list: list) -> None:
+        """ Decodes a list of received messages and writes them to the database. Called by the writer
+            thread in pipeline mode.
+
+        Parameters:
+            msg_list : list
+                List of wp_queueing.QueueMessage objects received from the MQTT broker.
+        """
+        for msg in msg_list:
+            self._record(msg)
+        self._writer.flush()
+
+    def _record(self, msg: wp_queueing.QueueMessage) -> None:
+        """ Decodes a received message and adds the resulting rows to the writer. Dictionary payloads of
+            message types whose recorder row type declares payload_columns are mapped to the row columns
+            directly, without constructing the message object.
+
+        Parameters:
+            msg : wp_queueing.QueueMessage
+                Message received from the MQTT broker.
+        """
+        if isinstance(msg.msg_payload, dict) and self._record_view(msg):
+            return
         msg_base = iot_stat_msg.IotRecorderMsg(msg)
         msg_payload = msg.msg_payload
-        try:
-            if 'class' in msg_payload:
-                msg_base.msg_class = msg_payload['class']
-                if msg_payload['class'] == 'InputProbe':
-                    conv_msg = iot_msg_input.InputProbe()
-                    conv_msg.from_dict(msg_payload)
-                    rec_msg = iot_stat_msg.IotRecorderInputProbe(msg_base.msg_id, conv_msg)
-                elif msg_payload['class'] == 'InputHealth':
-                    conv_msg = iot_msg_input.InputHealth()
-                    conv_msg.from_dict(msg_payload)
-                    rec_msg = iot_stat_msg.IotRecorderInputHealth(msg_base.msg_id, conv_msg)
-                elif msg_payload['class'] == 'SensorMsmt':
-                    conv_msg = iot_msg_sensor.SensorMsmt()
-                    conv_msg.from_dict(msg_payload)
-                    rec_msg = iot_stat_msg.IotRecorderSensorMsg(msg_base.msg_id, conv_msg)
-                else:
-                    rec_msg = iot_stat_msg.IotRecorderGenericMsg(msg_base.msg_id, msg_payload)
-            else:
-                rec_msg = iot_stat_msg.IotRecorderGenericMsg(msg_base.msg_id, msg_payload)
-        except TypeError:
-            rec_msg = iot_stat_msg.IotRecorderGenericMsg(msg_base.msg_id, msg_payload)
-        except ValueError:
+        rec_msg = None
+        class_name = None
+        if isinstance(msg_payload, dict):
+            class_name = msg_payload.get('class')
+        elif iot_msg_binary.IotBinaryCodec.is_binary(msg_payload):
+            class_name = iot_msg_binary.IotBinaryCodec.class_name(msg_payload)
+        if class_name is not None:
+            msg_base.msg_class = class_name
+            rec_type = iot_msg_registry.IotMessageRegistry.recorder_type(class_name)
+            if rec_type is not None:
+                try:
+                    conv_msg = iot_msg_registry.IotMessageRegistry.decode(msg_payload)
+                    if isinstance(conv_msg, iot_msg_input.InputProbeBatch):
+                        self._record_probe_batch(msg, conv_msg, rec_type)
+                        return
+                    rec_msg = rec_type(msg_base.msg_id, conv_msg)
+                except (TypeError, ValueError):
+                    rec_msg = None
+        if rec_msg is None:
             rec_msg = iot_stat_msg.IotRecorderGenericMsg(msg_base.msg_id, msg_payload)
 
-        with wp_repository.SQLiteRepository(iot_stat_msg.IotRecorderMsg, self._sqlite_db_path) as repository:
-            repository.insert(msg_base)
-        with wp_repository.SQLiteRepository(type(rec_msg), self._sqlite_db_path) as repository:
-            repository.insert(rec_msg)
+        self._writer.add(msg_base)
+        self._writer.add(rec_msg)
+
+    def _record_probe_batch(self, msg: wp_queueing.QueueMessage, batch: iot_msg_input.InputProbeBatch,
+                            rec_type: type) -> None:
+        """ Adds the rows of an InputProbeBatch message to the writer. The batch is stored like the
+            equivalent InputProbe messages, one per channel, with the message id "<msg_id>.<channel_no>".
+
+        Parameters:
+            msg : wp_queueing.QueueMessage
+                Message received from the MQTT broker.
+            batch : iot_msg_input.InputProbeBatch
+                The decoded batch.
+            rec_type : type
+                Recorder row type registered for InputProbeBatch.
+        """
+        for probe in batch.probes():
+            msg_base = iot_stat_msg.IotRecorderMsg(msg)
+            msg_base.msg_id = f'{msg.msg_id}.{probe.channel_no}'
+            msg_base.msg_class = 'InputProbeBatch'
+            self._writer.add(msg_base)
+            self._writer.add(rec_type(msg_base.msg_id, probe))
+
+    def _record_view(self, msg: wp_queueing.QueueMessage) -> bool:
+        """ Maps the members of a dictionary payload to the columns of the recorder tables and adds the
+            rows to the writer.
+
+        Parameters:
+            msg : wp_queueing.QueueMessage
+                Message received from the MQTT broker.
+
+        Returns:
+            bool : True if the rows were added, False if the message must be decoded.
+        """
+        rec_type = iot_msg_registry.IotMessageRegistry.recorder_type(msg.msg_payload.get('class'))
+        payload_columns = getattr(rec_type, 'payload_columns', None)
+        if payload_columns is None:
+            return False
+        try:
+            msg_view = iot_msg_view.IotMessageView(msg.msg_payload)
+            row = msg_view.row(payload_columns)
+        except (TypeError, ValueError):
+            return False
+        store_date = datetime.now()
+        self._writer.add_values('iot_recorder_msg',
+                                (msg.msg_id, msg.msg_topic, msg.msg_timestamp, msg_view.msg_class, store_date))
+        self._writer.add_values(iot_rec_writer.RECORDER_TABLES[rec_type], (msg.msg_id,) + row + (store_date,))
+        return True
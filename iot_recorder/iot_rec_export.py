@@ -0,0 +1,365 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+import iot_rec_schema
+import iot_rec_partition
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+class IotRecorderExport:
+    """ Exports the raw recorder tables to columnar files for off-device analytics. Each table is read
+        in chunks ordered by store_date and written to
+            <export_dir>/<table>/day=<YYYY-mm-dd>/[device=<device_id or sensor_id>/]part-<run>-<seq>.<ext>
+        as Parquet files (if pyarrow is installed) or as NumPy .npz files (one array per column).
+        Points in time are exported as microseconds since the epoch (timestamp[us, UTC] in Parquet,
+        datetime64[us] in .npz), independent of the schema version of the database.
+
+        Incremental exports only write rows whose store_date is newer than the watermark of the previous
+        export (kept per table in <export_dir>/_watermark.json). Rows stored within the last "lag"
+        seconds are left for the next export, so that rows committed late by the recorder are not missed.
+        The files of an export run are written to a staging directory (<export_dir>/_staging-<run>) and
+        only moved into place after the watermarks have been saved, so that a failed run leaves no
+        files behind that the next run would export again. If a run is interrupted while moving its
+        files, the next run completes the move (the saved watermarks name the staging directory).
+        The aggregate tables are not exported; they can be rebuilt from the raw data.
+
+        Usage: python iot_rec_export.py <database> <export_dir> [--full] [--format parquet|npz]
+                                        [--partition-period day|month]
+
+    Attributes:
+        _sqlite_db_path : str
+            Full path name of the recorder database (used if _partitions is None).
+        _export_dir : str
+            Root directory of the exported files.
+        _partitions : iot_rec_partition.IotRecorderPartitions
+            Time-partitioned recorder databases (None: single database).
+        _file_format : str
+            Format of the exported files ("parquet" or "npz").
+        _chunk_size : int
+            Number of rows read at once.
+        _lag : float
+            Age in seconds a row must have to be exported.
+        _staging_dir : str
+            Staging directory of the running export (files are moved to _export_dir when it completes).
+        _file_seq : int
+            Sequence number of the last file written by the running export.
+
+    Properties:
+        file_format : str
+            Getter for the format of the exported files.
+
+    Methods:
+        IotRecorderExport : None
+            Constructor.
+        read_watermarks : dict
+            Returns the watermarks of the previous export.
+        export : dict
+            Exports all raw recorder tables.
+        main : int, static
+            Command line entry point.
+    """
+    # pylint: disable=too-many-instance-attributes
+    export_tables = {
+        'iot_recorder_msg': None,
+        'iot_recorder_generic': None,
+        'iot_recorder_input_probe': 'device_id',
+        'iot_recorder_input_health': 'device_id',
+        'iot_recorder_sensor_msmt': 'sensor_id'
+    }
+
+    watermark_file = "_watermark.json"
+    staging_prefix = "_staging-"
+    staging_key = "_staging"
+
+    def __init__(self, sqlite_db_path: str, export_dir: str,
+                 partitions: iot_rec_partition.IotRecorderPartitions = None, file_format: str = None,
+                 chunk_size: int = 50000, lag: float = 60.0):
+        """ Constructor.
+
+        Parameters:
+            sqlite_db_path : str
+                Full path name of the recorder database (ignored if partitions are given).
+            export_dir : str
+                Root directory of the exported files.
+            partitions : iot_rec_partition.IotRecorderPartitions, optional
+                Time-partitioned recorder databases.
+            file_format : str, optional
+                "parquet" or "npz"; defaults to "parquet" if pyarrow is installed, "npz" otherwise.
+            chunk_size : int, optional
+                Number of rows read at once.
+            lag : float, optional
+                Age in seconds a row must have to be exported.
+        """
+        # pylint: disable=too-many-arguments
+        if file_format is None:
+            file_format = "parquet" if pyarrow is not None else "npz"
+        if file_format == "parquet" and pyarrow is None:
+            raise ImportError('IotRecorderExport(): package "pyarrow" is not installed')
+        if file_format == "npz" and np is None:
+            raise ImportError('IotRecorderExport(): package "numpy" is not installed')
+        if file_format not in ["parquet", "npz"]:
+            raise ValueError(f'IotRecorderExport(): invalid file format "{file_format}"')
+        self._sqlite_db_path = sqlite_db_path
+        self._export_dir = export_dir
+        self._partitions = partitions
+        self._file_format = file_format
+        self._chunk_size = chunk_size if chunk_size > 0 else 50000
+        self._lag = lag
+        self._staging_dir = None
+        self._file_seq = 0
+
+    @property
+    def file_format(self) -> str:
+        """ Getter for the format of the exported files. """
+        return self._file_format
+
+    def read_watermarks(self) -> dict:
+        """ Returns the watermarks of the previous export.
+
+        Returns:
+            dict : Highest exported store_date (microseconds since the epoch) per table.
+        """
+        watermarks = self._read_watermark_file()
+        watermarks.pop(IotRecorderExport.staging_key, None)
+        return watermarks
+
+    def _read_watermark_file(self) -> dict:
+        """ Returns the content of the watermark file (empty if there is none). """
+        watermark_path = os.path.join(self._export_dir, IotRecorderExport.watermark_file)
+        if not os.path.exists(watermark_path):
+            return dict()
+        with open(watermark_path, "r") as watermark_fh:
+            return json.load(watermark_fh)
+
+    def export(self, incremental: bool = True) -> dict:
+        """ Exports all raw recorder tables and updates the watermarks.
+
+        Parameters:
+            incremental : bool, optional
+                If True, only rows newer than the watermark of the previous export are written;
+                otherwise all rows are written.
+
+        Returns:
+            dict : Number of exported rows per table.
+        """
+        os.makedirs(self._export_dir, exist_ok = True)
+        self._recover_staging()
+        watermarks = self.read_watermarks()
+        export_to = datetime.now() - timedelta(seconds = self._lag)
+        export_to_us = iot_rec_schema.IotRecorderSchema.to_epoch_us(export_to)
+        run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+        staging_name = f"{IotRecorderExport.staging_prefix}{run_id}"
+        self._staging_dir = os.path.join(self._export_dir, staging_name)
+        self._file_seq = 0
+        num_rows = dict()
+        try:
+            for table_name, device_column in IotRecorderExport.export_tables.items():
+                export_from_us = watermarks.get(table_name) if incremental else None
+                num_rows[table_name] = 0
+                for db_path in self._db_paths(export_from_us, export_to):
+                    table_rows, max_store_us = self._export_table(
+                        db_path, table_name, device_column, export_from_us, export_to_us, run_id)
+                    num_rows[table_name] += table_rows
+                    if max_store_us is not None and max_store_us > watermarks.get(table_name, -1):
+                        watermarks[table_name] = max_store_us
+            watermarks[IotRecorderExport.staging_key] = staging_name
+            watermark_path = os.path.join(self._export_dir, IotRecorderExport.watermark_file)
+            with open(f"{watermark_path}.tmp", "w") as watermark_fh:
+                json.dump(watermarks, watermark_fh, indent = 2)
+            os.replace(f"{watermark_path}.tmp", watermark_path)
+        except BaseException:
+            shutil.rmtree(self._staging_dir, ignore_errors = True)
+            raise
+        self._publish_staging(self._staging_dir)
+        return num_rows
+
+    def _recover_staging(self) -> None:
+        """ Completes the move of the files of an interrupted export whose watermarks were saved and
+            removes the staging directories of failed exports. """
+        saved_staging = self._read_watermark_file().get(IotRecorderExport.staging_key)
+        for entry in os.listdir(self._export_dir):
+            entry_path = os.path.join(self._export_dir, entry)
+            if not entry.startswith(IotRecorderExport.staging_prefix) or not os.path.isdir(entry_path):
+                continue
+            if entry == saved_staging:
+                self._publish_staging(entry_path)
+            else:
+                shutil.rmtree(entry_path, ignore_errors = True)
+
+    def _publish_staging(self, staging_dir: str) -> None:
+        """ Moves the files of a staging directory to the same relative path in the export directory
+            and removes the staging directory. """
+        for dir_path, _, file_names in os.walk(staging_dir):
+            target_dir = os.path.join(self._export_dir, os.path.relpath(dir_path, staging_dir))
+            os.makedirs(target_dir, exist_ok = True)
+            for file_name in file_names:
+                os.replace(os.path.join(dir_path, file_name), os.path.join(target_dir, file_name))
+        shutil.rmtree(staging_dir, ignore_errors = True)
+
+    def _db_paths(self, export_from_us: int, export_to: datetime) -> list:
+        """ Returns the path names of the databases that may contain rows to be exported. """
+        if self._partitions is None:
+            return [self._sqlite_db_path]
+        if export_from_us is None:
+            return [db_path for _, db_path in self._partitions.list_partitions()]
+        return self._partitions.partitions_for_range(
+            iot_rec_schema.IotRecorderSchema.from_epoch_us(export_from_us), export_to)
+
+    def _export_table(self, db_path: str, table_name: str, device_column: str, export_from_us: int,
+                      export_to_us: int, run_id: str) -> tuple:
+        """ Exports the rows of one table of one database.
+
+        Returns:
+            tuple : Number of exported rows, highest exported store_date (None if no rows were exported).
+        """
+        # pylint: disable=too-many-arguments,too-many-locals
+        columns = iot_rec_schema.IotRecorderSchema.table_columns[table_name]
+        db_conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri = True)
+        try:
+            if db_conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?",
+                               (table_name,)).fetchone()[0] == 0:
+                return 0, None
+            schema_version = iot_rec_schema.IotRecorderSchema.schema_version(db_conn)
+            select_list = [iot_rec_schema.IotRecorderSchema.epoch_us_expr(col, schema_version)
+                           if col in iot_rec_schema.IotRecorderSchema.time_columns else col for col in columns]
+            if schema_version >= 2:
+                select_list.append("date(store_date / 1000000, 'unixepoch', 'localtime')")
+                to_bound = export_to_us
+                from_bound = export_from_us
+            else:
+                select_list.append("substr(store_date, 1, 10)")
+                to_bound = iot_rec_schema.IotRecorderSchema.from_epoch_us(export_to_us).strftime("%Y-%m-%d %H:%M:%S.%f")
+                from_bound = None
+                if export_from_us is not None:
+                    from_bound = iot_rec_schema.IotRecorderSchema.from_epoch_us(export_from_us).strftime(
+                        "%Y-%m-%d %H:%M:%S.%f")
+            sql = 'SELECT {} FROM {} WHERE store_date <= ?'.format(', '.join(select_list), table_name)
+            params = (to_bound,)
+            if from_bound is not None:
+                sql += ' AND store_date > ?'
+                params = (to_bound, from_bound)
+            cursor = db_conn.execute(sql + ' ORDER BY store_date', params)
+            device_idx = columns.index(device_column) if device_column is not None else None
+            store_idx = columns.index('store_date')
+            num_rows = 0
+            max_store_us = None
+            while True:
+                rows = cursor.fetchmany(self._chunk_size)
+                if len(rows) == 0:
+                    break
+                groups = dict()
+                for row in rows:
+                    group_key = (row[-1], row[device_idx] if device_idx is not None else None)
+                    groups.setdefault(group_key, []).append(row[:-1])
+                for (day, device_id), group_rows in groups.items():
+                    self._write_group(table_name, columns, day, device_id, group_rows, run_id)
+                num_rows += len(rows)
+                max_store_us = rows[-1][store_idx]
+            return num_rows, max_store_us
+        finally:
+            db_conn.close()
+
+    def _write_group(self, table_name: str, columns: tuple, day: str, device_id: str, rows: list,
+                     run_id: str) -> str:
+        """ Writes the rows of one day and device to a new columnar file in the staging directory.
+
+        Returns:
+            str : Full path name of the written file.
+        """
+        # pylint: disable=too-many-arguments
+        dir_path = os.path.join(self._staging_dir, table_name, f"day={day}")
+        if device_id is not None:
+            dir_path = os.path.join(dir_path, "device={}".format(str(device_id).replace("/", "_").replace("\\", "_")))
+        os.makedirs(dir_path, exist_ok = True)
+        self._file_seq += 1
+        file_path = os.path.join(dir_path, f"part-{run_id}-{self._file_seq:05d}.{self._file_format}")
+        values = list(zip(*rows))
+        if self._file_format == "parquet":
+            arrays = []
+            for col_no, column in enumerate(columns):
+                if column in iot_rec_schema.IotRecorderSchema.time_columns:
+                    arrays.append(pyarrow.array(values[col_no], type = pyarrow.timestamp('us', tz = 'UTC')))
+                else:
+                    arrays.append(pyarrow.array(values[col_no]))
+            pyarrow.parquet.write_table(pyarrow.Table.from_arrays(arrays, names = list(columns)), file_path)
+        else:
+            arrays = dict()
+            for col_no, column in enumerate(columns):
+                arrays[column] = IotRecorderExport._npz_array(values[col_no],
+                                                              column in iot_rec_schema.IotRecorderSchema.time_columns)
+            np.savez(file_path, **arrays)
+        return file_path
+
+    @staticmethod
+    def _npz_array(values: tuple, is_time: bool) -> object:
+        """ Converts the values of one column to a NumPy array (time columns: datetime64[us], NaT for
+            missing values; numeric columns: int64, or float64 with NaN for missing values; other
+            columns: str, with "" for missing values). """
+        if is_time:
+            nat = np.iinfo(np.int64).min
+            return np.array([nat if value is None else value for value in values],
+                            dtype = np.int64).view('datetime64[us]')
+        if all(isinstance(value, int) for value in values):
+            return np.array(values, dtype = np.int64)
+        if all(value is None or isinstance(value, (int, float)) for value in values):
+            return np.array(values, dtype = np.float64)
+        return np.array(["" if value is None else str(value) for value in values])
+
+    @staticmethod
+    def main(argv: list) -> int:
+        """ Command line entry point.
+
+        Parameters:
+            argv : list
+                Command line arguments (without the program name).
+
+        Returns:
+            int : Exit code (0: export completed, 1: export failed).
+        """
+        parser = argparse.ArgumentParser(description = "Exports recorder databases to columnar files")
+        parser.add_argument("database", help = "recorder database (base path if partitioned)")
+        parser.add_argument("export_dir", help = "root directory of the exported files")
+        parser.add_argument("--full", action = "store_true", help = "export all rows, ignoring the watermark")
+        parser.add_argument("--format", choices = ["parquet", "npz"], default = None, help = "file format")
+        parser.add_argument("--partition-period", choices = ["day", "month"], default = None,
+                            help = "partitioning period of the recorder databases")
+        args = parser.parse_args(argv)
+        partitions = None
+        if args.partition_period is not None:
+            partitions = iot_rec_partition.IotRecorderPartitions(args.database, args.partition_period)
+        try:
+            exporter = IotRecorderExport(args.database, args.export_dir, partitions, args.format)
+            for table_name, num_rows in exporter.export(not args.full).items():
+                print(f'{table_name}: {num_rows} rows exported')
+        except (ImportError, sqlite3.Error, ValueError, OSError) as except_:
+            print(f'export failed: {str(except_)}', file = sys.stderr)
+            return 1
+        return 0
+
+if __name__ == "__main__":
+    sys.exit(IotRecorderExport.main(sys.argv[1:]))
@@ -0,0 +1,83 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+import argparse
+import sqlite3
+import sys
+import iot_rec_schema
+
+class IotRecorderMigration:
+    """ Converts recorder databases (iot_rec.sl3 and its partitions) from schema version 1 (points in
+        time as formatted strings) to schema version 2 (points in time as epoch microseconds).
+
+        Usage: python iot_rec_migrate.py [--vacuum] <database> [<database> ...]
+
+    Methods:
+        migrate_file : int, static
+            Converts one recorder database.
+        main : int, static
+            Command line entry point.
+    """
+    @staticmethod
+    def migrate_file(sqlite_db_path: str, vacuum: bool = False, chunk_size: int = 10000) -> int:
+        """ Converts one recorder database to schema version 2.
+
+        Parameters:
+            sqlite_db_path : str
+                Full path name of the recorder database.
+            vacuum : bool, optional
+                If True, the database file is rebuilt after the conversion to release the space
+                of the former tables.
+            chunk_size : int, optional
+                Number of rows read and written at once.
+
+        Returns:
+            int : Number of rows converted.
+        """
+        db_conn = sqlite3.connect(sqlite_db_path)
+        try:
+            num_rows = iot_rec_schema.IotRecorderSchema.migrate(db_conn, chunk_size)
+            if vacuum:
+                db_conn.execute('VACUUM')
+        finally:
+            db_conn.close()
+        return num_rows
+
+    @staticmethod
+    def main(argv: list) -> int:
+        """ Command line entry point.
+
+        Parameters:
+            argv : list
+                Command line arguments (without the program name).
+
+        Returns:
+            int : Exit code (0: all databases converted, 1: at least one conversion failed).
+        """
+        parser = argparse.ArgumentParser(description = "Converts recorder databases to schema version 2")
+        parser.add_argument("databases", nargs = "+", help = "recorder databases to be converted")
+        parser.add_argument("--vacuum", action = "store_true", help = "rebuild the database files afterwards")
+        args = parser.parse_args(argv)
+        exit_code = 0
+        for db_path in args.databases:
+            try:
+                num_rows = IotRecorderMigration.migrate_file(db_path, args.vacuum)
+                print(f'{db_path}: {num_rows} rows converted')
+            except (sqlite3.Error, ValueError) as except_:
+                print(f'{db_path}: conversion failed: {str(except_)}', file = sys.stderr)
+                exit_code = 1
+        return exit_code
+
+if __name__ == "__main__":
+    sys.exit(IotRecorderMigration.main(sys.argv[1:]))
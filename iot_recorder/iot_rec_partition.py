@@ -0,0 +1,257 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+from typing import Iterator
+import os
+import re
+import shutil
+import sqlite3
+import uuid
+from datetime import datetime, timedelta
+import iot_rec_schema
+
+class IotRecorderPartitions:
+    """ Manages day- or month-partitioned recorder databases. For a base path "<dir>/<name>.sl3", the
+        partition for 2021-07-12 is stored in "<dir>/<name>.20210712.sl3" (period "day") or in
+        "<dir>/<name>.202107.sl3" (period "month"). New partitions are created as copies of an empty
+        template database (iot_rec.sl3) or from the table definitions in iot_rec_schema; expired partitions
+        are dropped by deleting their files.
+
+    Attributes:
+        _base_path : str
+            Path name from which the partition file names are derived.
+        _period : str
+            Partitioning period ("day" or "month").
+        _template_path : str
+            Recorder database to be copied for new partitions. If None or not existing, the partitions
+            are created from the table definitions in iot_rec_schema.
+        _retention : int
+            Number of periods to be kept (including the current one); 0 keeps all partitions.
+
+    Properties:
+        period : str
+            Getter for the partitioning period.
+
+    Methods:
+        IotRecorderPartitions : None
+            Constructor.
+        partition_key : str
+            Returns the key of the partition that covers a point in time.
+        partition_path : str
+            Returns the path name of the partition with the given key.
+        create_partition : str
+            Creates the partition covering a point in time, if it does not yet exist.
+        list_partitions : list
+            Returns the keys and path names of all existing partitions.
+        drop_expired : list
+            Deletes the files of all partitions older than the retention period.
+        partitions_for_range : list
+            Returns the path names of the existing partitions covering a time range.
+        query : Iterator
+            Executes a query on all partitions covering a time range.
+    """
+    periods = {'day': "%Y%m%d", 'month': "%Y%m"}
+
+    def __init__(self, base_path: str, period: str = "day", template_path: str = None, retention: int = 0):
+        """ Constructor.
+
+        Parameters:
+            base_path : str
+                Path name from which the partition file names are derived.
+            period : str, optional
+                Partitioning period ("day" or "month").
+            template_path : str, optional
+                Empty recorder database to be copied for new partitions (default: the partitions are created
+                from the table definitions in iot_rec_schema).
+            retention : int, optional
+                Number of periods to be kept (including the current one); 0 keeps all partitions.
+        """
+        if period not in IotRecorderPartitions.periods:
+            raise ValueError(f'IotRecorderPartitions(): invalid partitioning period "{period}"')
+        self._base_path = base_path
+        self._period = period
+        self._template_path = template_path
+        self._retention = retention
+        base_dir, base_name = os.path.split(base_path)
+        self._base_dir = base_dir if len(base_dir) > 0 else "."
+        self._stem, self._ext = os.path.splitext(base_name)
+        key_len = 8 if period == "day" else 6
+        self._name_pattern = re.compile(r'^{}\.(\d{{{}}}){}$'.format(
+            re.escape(self._stem), key_len, re.escape(self._ext)))
+
+    @property
+    def period(self) -> str:
+        """ Getter for the partitioning period. """
+        return self._period
+
+    def partition_key(self, point_in_time: datetime) -> str:
+        """ Returns the key of the partition that covers a point in time.
+
+        Parameters:
+            point_in_time : datetime
+                Point in time to be covered.
+
+        Returns:
+            str : Partition key ("YYYYMMDD" or "YYYYMM").
+        """
+        return point_in_time.strftime(IotRecorderPartitions.periods[self._period])
+
+    def partition_path(self, partition_key: str) -> str:
+        """ Returns the path name of the partition with the given key.
+
+        Parameters:
+            partition_key : str
+                Partition key ("YYYYMMDD" or "YYYYMM").
+
+        Returns:
+            str : Full path name of the partition database.
+        """
+        return os.path.join(self._base_dir, f"{self._stem}.{partition_key}{self._ext}")
+
+    def create_partition(self, point_in_time: datetime) -> str:
+        """ Creates the partition covering a point in time, if it does not yet exist. The partition is
+            built under a temporary name in the same directory and then linked to its final name, which
+            fails if another recorder or process has created the partition meanwhile; a partition is
+            therefore never seen half-copied and never replaced once it exists. On file systems without
+            hard links (e.g. vfat), the temporary file is renamed instead if the partition still does not
+            exist. The partition gets the permissions of the template, or the default permissions of a new
+            file (according to the umask) if there is no template.
+
+        Parameters:
+            point_in_time : datetime
+                Point in time to be covered.
+
+        Returns:
+            str : Full path name of the partition database.
+        """
+        db_path = self.partition_path(self.partition_key(point_in_time))
+        if os.path.exists(db_path):
+            return db_path
+        tmp_path = f"{db_path}.{uuid.uuid4().hex}.tmp"
+        os.close(os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+        try:
+            if self._template_path is not None and os.path.exists(self._template_path):
+                shutil.copyfile(self._template_path, tmp_path)
+                shutil.copymode(self._template_path, tmp_path)
+            db_conn = sqlite3.connect(tmp_path)
+            try:
+                iot_rec_schema.IotRecorderSchema.create_schema(db_conn)
+            finally:
+                db_conn.close()
+            try:
+                os.link(tmp_path, db_path)
+            except FileExistsError:
+                pass
+            except OSError:
+                if not os.path.exists(db_path):
+                    os.replace(tmp_path, db_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return db_path
+
+    def list_partitions(self) -> list:
+        """ Returns the keys and path names of all existing partitions.
+
+        Returns:
+            list : List of tuples (partition_key, path_name), sorted by partition key.
+        """
+        partitions = []
+        for file_name in os.listdir(self._base_dir):
+            name_match = self._name_pattern.match(file_name)
+            if name_match is not None:
+                partitions.append((name_match.group(1), os.path.join(self._base_dir, file_name)))
+        partitions.sort()
+        return partitions
+
+    def drop_expired(self, now: datetime = None) -> list:
+        """ Deletes the files of all partitions older than the retention period.
+
+        Parameters:
+            now : datetime, optional
+                Reference point in time; defaults to the current date and time.
+
+        Returns:
+            list : Path names of the deleted partitions.
+        """
+        if self._retention <= 0:
+            return []
+        if now is None:
+            now = datetime.now()
+        if self._period == "day":
+            oldest_kept = self.partition_key(now - timedelta(days = self._retention - 1))
+        else:
+            month_no = now.year * 12 + now.month - 1 - (self._retention - 1)
+            oldest_kept = f"{month_no // 12:04d}{month_no % 12 + 1:02d}"
+        dropped = []
+        for partition_key, db_path in self.list_partitions():
+            if partition_key >= oldest_kept:
+                break
+            for file_path in [db_path, f"{db_path}-wal", f"{db_path}-shm"]:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            dropped.append(db_path)
+        return dropped
+
+    def partitions_for_range(self, time_from: datetime, time_to: datetime) -> list:
+        """ Returns the path names of the existing partitions covering a time range. Rows are assigned to
+            partitions when they are stored, so the partition following the end of the range is included
+            as well (it may contain rows recorded shortly after the end of the range).
+
+        Parameters:
+            time_from : datetime
+                Start of the time range.
+            time_to : datetime
+                End of the time range.
+
+        Returns:
+            list : Path names of the partitions, sorted by partition key.
+        """
+        key_from = self.partition_key(time_from)
+        key_to = self.partition_key(time_to)
+        selected = []
+        following = None
+        for partition_key, db_path in self.list_partitions():
+            if key_from <= partition_key <= key_to:
+                selected.append(db_path)
+            elif partition_key > key_to and following is None:
+                following = db_path
+        if following is not None:
+            selected.append(following)
+        return selected
+
+    def query(self, sql: str, params: tuple, time_from: datetime, time_to: datetime) -> Iterator[tuple]:
+        """ Executes a query on all partitions covering a time range and returns the result rows of all
+            partitions, in the order of the partitions.
+
+        Parameters:
+            sql : str
+                SELECT statement to be executed on each partition.
+            params : tuple
+                Values for the parameters of the SELECT statement.
+            time_from : datetime
+                Start of the time range.
+            time_to : datetime
+                End of the time range.
+
+        Returns:
+            Iterator[tuple] : Result rows.
+        """
+        for db_path in self.partitions_for_range(time_from, time_to):
+            db_conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri = True)
+            try:
+                for row in db_conn.execute(sql, params):
+                    yield row
+            finally:
+                db_conn.close()
@@ -0,0 +1,344 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+from typing import Callable
+import base64
+import collections
+import inspect
+import json
+import logging
+import os
+import threading
+import wp_queueing
+
+# pylint: disable=logging-fstring-interpolation
+
+class IotRecorderPipeline:
+    """ Bounded queue between the thread receiving messages from the MQTT broker and a dedicated writer
+        thread that decodes and stores the messages in batches.
+
+        When the queue is full, the backpressure policy applies:
+            "block" ....... the receiving thread waits until the writer thread has made room in the queue;
+                            if the writer thread is not running, the message is spilled (if a spill_path
+                            is given) or a RuntimeError is raised;
+            "drop_oldest" . the oldest queued message is discarded;
+            "spill" ....... the new message is appended to a spill file (JSON lines) and processed by the
+                            writer thread as soon as the queue has been drained.
+
+        As long as spilled messages are pending, new messages are appended to the spill file as well, so
+        the messages are processed in the order of their arrival. A spill file is renamed to
+        "<spill_path>.work" while it is replayed. A work file left behind by a crash is replayed first,
+        before the spill file itself; the rows it has already stored are skipped by the writer
+        (iot_rec_writer.IotRecorderWriter).
+
+    Attributes:
+        _process_batch : Callable
+            Function called by the writer thread with a list of wp_queueing.QueueMessage objects.
+        _logger : logging.Logger
+            Logger to be used.
+        _queue_size : int
+            Maximum number of messages in the queue.
+        _backpressure : str
+            Policy applied when the queue is full ("block", "drop_oldest", "spill").
+        _spill_path : str
+            Full path name of the spill file (policy "spill" only).
+        _batch_size : int
+            Maximum number of messages passed to _process_batch at once.
+        _flush_interval : float
+            Maximum time in seconds the writer thread waits for new messages before it processes a
+            partial batch.
+        _queue : collections.deque
+            The queued messages.
+        _cond : threading.Condition
+            Synchronizes the access to the queue.
+        _thread : threading.Thread
+            The writer thread.
+        _stats : dict
+            Pipeline counters (enqueued, processed, dropped, spilled, maximum queue depth).
+
+    Properties:
+        queue_depth : int
+            Getter for the current number of queued messages.
+        num_dropped : int
+            Getter for the number of messages discarded because of a full queue.
+        num_spilled : int
+            Getter for the number of messages written to the spill file.
+        statistics : dict
+            Getter for the pipeline counters.
+        is_running : bool
+            Indicates whether or not the writer thread is running.
+
+    Methods:
+        IotRecorderPipeline : None
+            Constructor.
+        put : bool
+            Enqueues a received message. Called by the receiving thread.
+        start : None
+            Starts the writer thread.
+        stop : bool
+            Stops the writer thread after all queued messages have been processed.
+    """
+    # pylint: disable=too-many-instance-attributes
+    backpressure_policies = ['block', 'drop_oldest', 'spill']
+
+    def __init__(self, process_batch: Callable[[list], None], logger: logging.Logger, queue_size: int = 1000,
+                 backpressure: str = "block", spill_path: str = None, batch_size: int = 100,
+                 flush_interval: float = 1.0):
+        """ Constructor.
+
+        Parameters:
+            process_batch : Callable
+                Function called by the writer thread with a list of wp_queueing.QueueMessage objects.
+            logger : logging.Logger
+                Logger to be used.
+            queue_size : int, optional
+                Maximum number of messages in the queue.
+            backpressure : str, optional
+                Policy applied when the queue is full ("block", "drop_oldest", "spill").
+            spill_path : str, optional
+                Full path name of the spill file. Mandatory for the policy "spill"; used by the policy
+                "block" if the writer thread is not running.
+            batch_size : int, optional
+                Maximum number of messages passed to process_batch at once.
+            flush_interval : float, optional
+                Maximum time in seconds the writer thread waits for new messages before it processes
+                a partial batch.
+        """
+        if backpressure not in IotRecorderPipeline.backpressure_policies:
+            raise ValueError(f'IotRecorderPipeline(): invalid backpressure policy "{backpressure}"')
+        if backpressure == 'spill' and spill_path is None:
+            raise ValueError('IotRecorderPipeline(): backpressure policy "spill" requires a spill_path')
+        self._process_batch = process_batch
+        self._logger = logger
+        self._queue_size = queue_size if queue_size > 0 else 1
+        self._backpressure = backpressure
+        self._spill_path = spill_path
+        self._batch_size = batch_size if batch_size > 0 else 1
+        self._flush_interval = flush_interval
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._spill_pending = spill_path is not None and \
+            (os.path.exists(spill_path) or os.path.exists(f"{spill_path}.work"))
+        self._stats = {
+            'num_enqueued': 0,
+            'num_processed': 0,
+            'num_dropped': 0,
+            'num_spilled': 0,
+            'max_queue_depth': 0
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        """ Getter for the current number of queued messages. """
+        return len(self._queue)
+
+    @property
+    def num_dropped(self) -> int:
+        """ Getter for the number of messages discarded because of a full queue. """
+        return self._stats['num_dropped']
+
+    @property
+    def num_spilled(self) -> int:
+        """ Getter for the number of messages written to the spill file. """
+        return self._stats['num_spilled']
+
+    @property
+    def statistics(self) -> dict:
+        """ Getter for the pipeline counters.
+
+        Returns:
+            dict : Copy of the pipeline counters, extended by the current queue depth.
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats['queue_depth'] = len(self._queue)
+        return stats
+
+    @property
+    def is_running(self) -> bool:
+        """ Indicates whether or not the writer thread is running. """
+        return self._thread is not None and self._thread.is_alive()
+
+    def put(self, msg: wp_queueing.QueueMessage) -> bool:
+        """ Enqueues a received message. Called by the receiving thread.
+
+        Parameters:
+            msg : wp_queueing.QueueMessage
+                Message received from the MQTT broker.
+
+        Returns:
+            bool : True if the message was enqueued or spilled, False if it was discarded.
+
+        Raises:
+            RuntimeError : The queue is full, the policy is "block", the writer thread is not running
+                           and there is no spill file.
+        """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        with self._cond:
+            if self._spill_pending:
+                self._spill(msg)
+                return True
+            if len(self._queue) >= self._queue_size:
+                if self._backpressure == 'block':
+                    while len(self._queue) >= self._queue_size and not self._stopping and self.is_running:
+                        self._cond.wait(self._flush_interval)
+                    if len(self._queue) >= self._queue_size:
+                        if self._spill_path is None:
+                            raise RuntimeError(f'{mth_name}: queue full and writer thread not running')
+                        self._spill(msg)
+                        return True
+                elif self._backpressure == 'drop_oldest':
+                    self._queue.popleft()
+                    self._stats['num_dropped'] += 1
+                else:
+                    self._spill(msg)
+                    return True
+            self._queue.append(msg)
+            self._stats['num_enqueued'] += 1
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], len(self._queue))
+            self._cond.notify_all()
+        return True
+
+    def start(self) -> None:
+        """ Starts the writer thread. """
+        if self.is_running:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target = self._writer_loop, name = 'recorder_writer', daemon = True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> bool:
+        """ Stops the writer thread after all queued messages have been processed.
+
+        Parameters:
+            timeout : float, optional
+                Maximum time in seconds to wait for the writer thread.
+
+        Returns:
+            bool : True if the writer thread has terminated, False otherwise.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is None:
+            self._drain()
+            return True
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _writer_loop(self) -> None:
+        """ Main loop of the writer thread. """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        self._logger.debug(f'{mth_name}: writer thread started')
+        while True:
+            with self._cond:
+                if len(self._queue) < self._batch_size and not self._stopping:
+                    self._cond.wait(self._flush_interval)
+                if self._stopping and len(self._queue) == 0:
+                    break
+                batch = self._take_batch()
+            self._process(batch)
+            if len(batch) == 0 and self._spill_pending:
+                self._process_spill_file()
+        self._drain()
+        self._logger.debug(f'{mth_name}: writer thread stopped')
+
+    def _take_batch(self) -> list:
+        """ Removes up to _batch_size messages from the queue. Must be called while holding _cond. """
+        batch = []
+        while len(self._queue) > 0 and len(batch) < self._batch_size:
+            batch.append(self._queue.popleft())
+        if len(batch) > 0:
+            self._cond.notify_all()
+        return batch
+
+    def _drain(self) -> None:
+        """ Processes all remaining queued and spilled messages. """
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if len(batch) == 0:
+                break
+            self._process(batch)
+        if self._spill_pending:
+            self._process_spill_file()
+
+    def _process(self, batch: list) -> None:
+        """ Passes a batch of messages to the processing function. """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        if len(batch) == 0:
+            return
+        try:
+            self._process_batch(batch)
+        except Exception as except_:                    # pylint: disable=broad-except
+            self._logger.error(f'{mth_name}: {len(batch)} messages: {str(except_)}')
+        with self._cond:
+            self._stats['num_processed'] += len(batch)
+
+    def _spill(self, msg: wp_queueing.QueueMessage) -> None:
+        """ Appends a message to the spill file. Must be called while holding _cond. """
+        spill_entry = {
+            'msg_id': msg.msg_id,
+            'msg_topic': msg.msg_topic,
+            'msg_timestamp': str(msg.msg_timestamp),
+            'msg_payload': msg.msg_payload
+        }
+        if isinstance(msg.msg_payload, (bytes, bytearray, memoryview)):
+            spill_entry['msg_payload'] = base64.b64encode(msg.msg_payload).decode('ascii')
+            spill_entry['payload_encoding'] = 'base64'
+        with open(self._spill_path, "a") as spill_fh:
+            spill_fh.write(json.dumps(spill_entry, default = str))
+            spill_fh.write("\n")
+        self._spill_pending = True
+        self._stats['num_spilled'] += 1
+
+    def _process_spill_file(self) -> None:
+        """ Reads the spilled messages back and processes them in batches. A work file left behind by an
+            interrupted replay is processed before the current spill file. """
+        work_path = f"{self._spill_path}.work"
+        if os.path.exists(work_path):
+            self._replay_work_file(work_path)
+        with self._cond:
+            if not os.path.exists(self._spill_path):
+                self._spill_pending = False
+                return
+            os.replace(self._spill_path, work_path)
+            self._spill_pending = False
+        self._replay_work_file(work_path)
+
+    def _replay_work_file(self, work_path: str) -> None:
+        """ Processes the messages of a renamed spill file in batches and removes the file. """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        batch = []
+        with open(work_path, "r") as spill_fh:
+            for line in spill_fh:
+                try:
+                    spill_entry = json.loads(line)
+                except ValueError as except_:
+                    self._logger.error(f'{mth_name}: invalid spill entry: {str(except_)}')
+                    continue
+                msg = wp_queueing.QueueMessage(spill_entry['msg_topic'])
+                msg.msg_id = spill_entry['msg_id']
+                msg.msg_timestamp = spill_entry['msg_timestamp']
+                msg.msg_payload = spill_entry['msg_payload']
+                if spill_entry.get('payload_encoding') == 'base64':
+                    msg.msg_payload = base64.b64decode(msg.msg_payload)
+                batch.append(msg)
+                if len(batch) >= self._batch_size:
+                    self._process(batch)
+                    batch = []
+        self._process(batch)
+        os.remove(work_path)
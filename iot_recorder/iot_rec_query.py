@@ -0,0 +1,266 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+from typing import Iterator
+import sqlite3
+from datetime import datetime
+import iot_rec_schema
+import iot_rec_partition
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class IotRecorderQuery:
+    """ Read path for recorded sensor measurements and input probes. A query selects one sensor or one
+        device channel and a time range and returns the result as columnar NumPy arrays:
+            "time" ....... datetime64[us] (UTC),
+            "hw_value" ... int64 (raw value of the input device),
+            "voltage" .... float64 (NaN if not recorded),
+            "msmt_value" . float64 (sensor measurements only).
+        The rows are read in chunks of chunk_size rows directly from the cursor, so no row objects are
+        constructed. The time range is half-open [time_from, time_to) and uses the composite indexes of
+        schema version 2; databases in version 1 are supported as well (string comparison).
+
+    Attributes:
+        _sqlite_db_path : str
+            Full path name of the recorder database (used if _partitions is None).
+        _partitions : iot_rec_partition.IotRecorderPartitions
+            Time-partitioned recorder databases (None: single database).
+        _chunk_size : int
+            Number of rows fetched at once.
+
+    Methods:
+        IotRecorderQuery : None
+            Constructor.
+        sensor_chunks : Iterator[dict]
+            Returns the measurements of a sensor in a time range, chunk by chunk.
+        channel_chunks : Iterator[dict]
+            Returns the probes of a device channel in a time range, chunk by chunk.
+        sensor_series : dict
+            Returns the measurements of a sensor in a time range, optionally resampled.
+        channel_series : dict
+            Returns the probes of a device channel in a time range, optionally resampled.
+        resample : dict, static
+            Resamples a series to a fixed interval (mean per interval).
+    """
+    _sensor_columns = ['hw_value', 'voltage', 'msmt_value']
+    _channel_columns = ['hw_value', 'voltage']
+
+    def __init__(self, sqlite_db_path: str, partitions: iot_rec_partition.IotRecorderPartitions = None,
+                 chunk_size: int = 50000):
+        """ Constructor.
+
+        Parameters:
+            sqlite_db_path : str
+                Full path name of the recorder database (ignored if partitions are given).
+            partitions : iot_rec_partition.IotRecorderPartitions, optional
+                Time-partitioned recorder databases.
+            chunk_size : int, optional
+                Number of rows fetched at once.
+        """
+        if np is None:
+            raise ImportError('IotRecorderQuery(): package "numpy" is not installed')
+        self._sqlite_db_path = sqlite_db_path
+        self._partitions = partitions
+        self._chunk_size = chunk_size if chunk_size > 0 else 50000
+
+    def sensor_chunks(self, sensor_id: str, time_from: datetime, time_to: datetime) -> Iterator[dict]:
+        """ Returns the measurements of a sensor in a time range, chunk by chunk.
+
+        Parameters:
+            sensor_id : str
+                Unique identifier of the sensor.
+            time_from : datetime
+                Start of the time range (local time, inclusive).
+            time_to : datetime
+                End of the time range (local time, exclusive).
+
+        Returns:
+            Iterator[dict] : Dictionaries of arrays ("time", "hw_value", "voltage", "msmt_value").
+        """
+        sql = ('SELECT {}, hw_value, hw_voltage, msmt_value FROM iot_recorder_sensor_msmt '
+               'WHERE sensor_id = ? AND msmt_time >= ? AND msmt_time < ? ORDER BY msmt_time')
+        return self._chunks(sql, 'msmt_time', (sensor_id,), time_from, time_to, self._sensor_columns)
+
+    def channel_chunks(self, device_id: str, channel_no: int, time_from: datetime,
+                       time_to: datetime) -> Iterator[dict]:
+        """ Returns the probes of a device channel in a time range, chunk by chunk.
+
+        Parameters:
+            device_id : str
+                Unique identifier of the input device.
+            channel_no : int
+                Channel number.
+            time_from : datetime
+                Start of the time range (local time, inclusive).
+            time_to : datetime
+                End of the time range (local time, exclusive).
+
+        Returns:
+            Iterator[dict] : Dictionaries of arrays ("time", "hw_value", "voltage").
+        """
+        sql = ('SELECT {}, value, voltage FROM iot_recorder_input_probe '
+               'WHERE device_id = ? AND channel_no = ? AND probe_time >= ? AND probe_time < ? ORDER BY probe_time')
+        return self._chunks(sql, 'probe_time', (device_id, channel_no), time_from, time_to, self._channel_columns)
+
+    def sensor_series(self, sensor_id: str, time_from: datetime, time_to: datetime,
+                      resample_interval: float = None) -> dict:
+        """ Returns the measurements of a sensor in a time range.
+
+        Parameters:
+            sensor_id : str
+                Unique identifier of the sensor.
+            time_from : datetime
+                Start of the time range (local time, inclusive).
+            time_to : datetime
+                End of the time range (local time, exclusive).
+            resample_interval : float, optional
+                If given, the series is resampled to this interval (in seconds); see resample().
+
+        Returns:
+            dict : Arrays "time", "hw_value", "voltage", "msmt_value".
+        """
+        series = self._concat(self.sensor_chunks(sensor_id, time_from, time_to), self._sensor_columns)
+        if resample_interval is None:
+            return series
+        return IotRecorderQuery.resample(series, time_from, time_to, resample_interval)
+
+    def channel_series(self, device_id: str, channel_no: int, time_from: datetime, time_to: datetime,
+                       resample_interval: float = None) -> dict:
+        """ Returns the probes of a device channel in a time range.
+
+        Parameters:
+            device_id : str
+                Unique identifier of the input device.
+            channel_no : int
+                Channel number.
+            time_from : datetime
+                Start of the time range (local time, inclusive).
+            time_to : datetime
+                End of the time range (local time, exclusive).
+            resample_interval : float, optional
+                If given, the series is resampled to this interval (in seconds); see resample().
+
+        Returns:
+            dict : Arrays "time", "hw_value", "voltage".
+        """
+        series = self._concat(self.channel_chunks(device_id, channel_no, time_from, time_to), self._channel_columns)
+        if resample_interval is None:
+            return series
+        return IotRecorderQuery.resample(series, time_from, time_to, resample_interval)
+
+    @staticmethod
+    def resample(series: dict, time_from: datetime, time_to: datetime, interval: float) -> dict:
+        """ Resamples a series to a fixed interval. The result contains one entry per interval between
+            time_from and time_to: "time" is the start of the interval, "count" the number of values in
+            the interval and every value column holds the mean of the interval (NaN if empty).
+
+        Parameters:
+            series : dict
+                Series as returned by sensor_series() or channel_series().
+            time_from : datetime
+                Start of the time range (local time).
+            time_to : datetime
+                End of the time range (local time).
+            interval : float
+                Interval length in seconds.
+
+        Returns:
+            dict : Resampled arrays "time", "count" and the value columns of the series.
+        """
+        interval_us = int(interval * 1000000)
+        if interval_us <= 0:
+            raise ValueError(f'IotRecorderQuery.resample(): invalid interval {interval}')
+        from_us = iot_rec_schema.IotRecorderSchema.to_epoch_us(time_from)
+        to_us = iot_rec_schema.IotRecorderSchema.to_epoch_us(time_to)
+        num_bins = max(-(-(to_us - from_us) // interval_us), 0)
+        bin_idx = (series['time'].view(np.int64) - from_us) // interval_us
+        in_range = (bin_idx >= 0) & (bin_idx < num_bins)
+        bin_idx = bin_idx[in_range]
+        result = {
+            'time': (from_us + np.arange(num_bins, dtype = np.int64) * interval_us).view('datetime64[us]'),
+            'count': np.bincount(bin_idx, minlength = num_bins)
+        }
+        for column in series:
+            if column == 'time':
+                continue
+            values = series[column][in_range].astype(np.float64)
+            valid = ~np.isnan(values)
+            sums = np.bincount(bin_idx[valid], weights = values[valid], minlength = num_bins)
+            counts = np.bincount(bin_idx[valid], minlength = num_bins)
+            with np.errstate(invalid = 'ignore', divide = 'ignore'):
+                result[column] = np.where(counts > 0, sums / counts, np.nan)
+        return result
+
+    def _db_paths(self, time_from: datetime, time_to: datetime) -> list:
+        """ Returns the path names of the databases covering a time range. """
+        if self._partitions is None:
+            return [self._sqlite_db_path]
+        return self._partitions.partitions_for_range(time_from, time_to)
+
+    def _chunks(self, sql: str, time_column: str, key_values: tuple, time_from: datetime, time_to: datetime,
+                value_columns: list) -> Iterator[dict]:
+        """ Executes a range query on all databases covering the time range and converts the result rows
+            to arrays, chunk by chunk. """
+        # pylint: disable=too-many-arguments
+        for db_path in self._db_paths(time_from, time_to):
+            db_conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri = True)
+            try:
+                schema_version = iot_rec_schema.IotRecorderSchema.schema_version(db_conn)
+                time_expr = iot_rec_schema.IotRecorderSchema.epoch_us_expr(time_column, schema_version)
+                if schema_version >= 2:
+                    bounds = (iot_rec_schema.IotRecorderSchema.to_epoch_us(time_from),
+                              iot_rec_schema.IotRecorderSchema.to_epoch_us(time_to))
+                else:
+                    bounds = (time_from.strftime("%Y-%m-%d %H:%M:%S.%f"), time_to.strftime("%Y-%m-%d %H:%M:%S.%f"))
+                cursor = db_conn.execute(sql.format(time_expr), key_values + bounds)
+                while True:
+                    rows = cursor.fetchmany(self._chunk_size)
+                    if len(rows) == 0:
+                        break
+                    yield IotRecorderQuery._to_arrays(rows, value_columns)
+            finally:
+                db_conn.close()
+
+    @staticmethod
+    def _to_arrays(rows: list, value_columns: list) -> dict:
+        """ Converts a list of result rows (time, values...) to a dictionary of arrays. """
+        columns = list(zip(*rows))
+        arrays = {'time': np.array(columns[0], dtype = np.int64).view('datetime64[us]')}
+        for col_no, column in enumerate(value_columns):
+            if column == 'hw_value':
+                arrays[column] = np.array(columns[col_no + 1], dtype = np.int64)
+            else:
+                arrays[column] = np.array(columns[col_no + 1], dtype = np.float64)
+        return arrays
+
+    @staticmethod
+    def _concat(chunks: Iterator[dict], value_columns: list) -> dict:
+        """ Concatenates the chunks of a query to one series, sorted by time. """
+        chunk_list = list(chunks)
+        if len(chunk_list) == 0:
+            series = {'time': np.array([], dtype = 'datetime64[us]')}
+            for column in value_columns:
+                series[column] = np.array([], dtype = np.int64 if column == 'hw_value' else np.float64)
+            return series
+        series = dict()
+        for column in chunk_list[0]:
+            series[column] = np.concatenate([chunk[column] for chunk in chunk_list])
+        # Partitions are assigned by store date, so the rows of consecutive partitions may overlap in time.
+        if len(chunk_list) > 1 and np.any(np.diff(series['time'].view(np.int64)) < 0):
+            order = np.argsort(series['time'], kind = 'stable')
+            for column in series:
+                series[column] = series[column][order]
+        return series
@@ -0,0 +1,206 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+import argparse
+import sqlite3
+import sys
+from datetime import datetime
+import iot_rec_schema
+
+class IotRecorderRollup:
+    """ Maintains the aggregate tables of the recorder database: count, minimum, maximum, sum and sum of
+        squares per sensor (msmt_value of iot_recorder_sensor_msmt) and per device channel (value of
+        iot_recorder_input_probe), in buckets of one minute, one hour and one day (local time).
+
+        The aggregates of a batch of raw rows are merged into the aggregate tables by UPSERT statements,
+        in the same transaction as the raw rows. Mean and standard deviation of a bucket can be derived
+        from sum_value / num_values and sumsq_value / num_values - mean ** 2.
+
+        Usage (rebuild from raw data): python iot_rec_rollup.py <database> [<database> ...]
+
+    Attributes:
+        granularities : list
+            Bucket sizes maintained ("minute", "hour", "day").
+        rollup_sources : dict
+            Per raw table: aggregate table, key columns, time column and value column.
+
+    Methods:
+        aggregate : None, static
+            Adds the values of a list of raw rows to a dictionary of aggregates.
+        write : int, static
+            Merges a dictionary of aggregates into the aggregate tables.
+        rebuild : int, static
+            Regenerates the aggregate tables from the raw data.
+        main : int, static
+            Command line entry point.
+    """
+    granularities = ['minute', 'hour', 'day']
+
+    rollup_sources = {
+        'iot_recorder_sensor_msmt': ('iot_recorder_sensor_rollup', ('sensor_id',), 'msmt_time', 'msmt_value'),
+        'iot_recorder_input_probe': ('iot_recorder_channel_rollup', ('device_id', 'channel_no'), 'probe_time', 'value')
+    }
+
+    @staticmethod
+    def _bucket_start(point_in_time: datetime, granularity: str) -> datetime:
+        """ Returns the start of the bucket covering a point in time. """
+        if granularity == 'minute':
+            return point_in_time.replace(second = 0, microsecond = 0)
+        if granularity == 'hour':
+            return point_in_time.replace(minute = 0, second = 0, microsecond = 0)
+        return point_in_time.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+
+    @staticmethod
+    def aggregate(table_name: str, rows: list, aggregates: dict) -> None:
+        """ Adds the values of a list of raw rows to a dictionary of aggregates. The values are converted
+            to float; values that cannot be converted (e.g. a non-numeric string received from a JSON
+            producer) are not aggregated.
+
+        Parameters:
+            table_name : str
+                Name of the raw table (iot_recorder_sensor_msmt or iot_recorder_input_probe); rows of
+                other tables are ignored.
+            rows : list
+                Raw rows, with the column values in the order of IotRecorderSchema.table_columns.
+            aggregates : dict
+                Aggregates per (aggregate table, key values, granularity, bucket start); the values
+                are lists [num_values, min_value, max_value, sum_value, sumsq_value].
+        """
+        if table_name not in IotRecorderRollup.rollup_sources:
+            return
+        rollup_table, key_columns, time_column, value_column = IotRecorderRollup.rollup_sources[table_name]
+        columns = iot_rec_schema.IotRecorderSchema.table_columns[table_name]
+        key_idx = [columns.index(col) for col in key_columns]
+        time_idx = columns.index(time_column)
+        value_idx = columns.index(value_column)
+        for row in rows:
+            try:
+                value = float(row[value_idx])
+            except (TypeError, ValueError):
+                continue
+            point_in_time = iot_rec_schema.IotRecorderSchema.to_datetime(row[time_idx])
+            key_values = tuple(row[col_no] for col_no in key_idx)
+            for granularity in IotRecorderRollup.granularities:
+                agg_key = (rollup_table, key_values, granularity,
+                           IotRecorderRollup._bucket_start(point_in_time, granularity))
+                agg = aggregates.get(agg_key)
+                if agg is None:
+                    aggregates[agg_key] = [1, value, value, value, value * value]
+                else:
+                    agg[0] += 1
+                    agg[1] = min(agg[1], value)
+                    agg[2] = max(agg[2], value)
+                    agg[3] += value
+                    agg[4] += value * value
+
+    @staticmethod
+    def write(db_conn: sqlite3.Connection, aggregates: dict, schema_version: int) -> int:
+        """ Merges a dictionary of aggregates into the aggregate tables. Must be called within the
+            transaction writing the raw rows.
+
+        Parameters:
+            db_conn : sqlite3.Connection
+                Open connection to the recorder database.
+            aggregates : dict
+                Aggregates as built by aggregate().
+            schema_version : int
+                Schema version of the database (determines the representation of bucket_start).
+
+        Returns:
+            int : Number of aggregate rows merged.
+        """
+        rows_per_table = dict()
+        for (rollup_table, key_values, granularity, bucket_start), agg in aggregates.items():
+            if schema_version >= 2:
+                bucket_value = iot_rec_schema.IotRecorderSchema.to_epoch_us(bucket_start)
+            else:
+                bucket_value = bucket_start.strftime("%Y-%m-%d %H:%M:%S")
+            rows_per_table.setdefault(rollup_table, []).append(key_values + (granularity, bucket_value) + tuple(agg))
+        for rollup_table, rows in rows_per_table.items():
+            db_conn.executemany(IotRecorderRollup._upsert_sql(rollup_table), rows)
+        return len(aggregates)
+
+    @staticmethod
+    def _upsert_sql(rollup_table: str) -> str:
+        """ Returns the UPSERT statement merging aggregates into an aggregate table. """
+        columns = iot_rec_schema.IotRecorderSchema.table_columns[rollup_table]
+        conflict_columns = columns[:-5]
+        return ('INSERT INTO {0} ({1}) VALUES ({2}) ON CONFLICT ({3}) DO UPDATE SET '
+                'num_values = num_values + excluded.num_values, '
+                'min_value = MIN(min_value, excluded.min_value), '
+                'max_value = MAX(max_value, excluded.max_value), '
+                'sum_value = sum_value + excluded.sum_value, '
+                'sumsq_value = sumsq_value + excluded.sumsq_value').format(
+                    rollup_table, ', '.join(columns), ', '.join(['?'] * len(columns)), ', '.join(conflict_columns))
+
+    @staticmethod
+    def rebuild(db_conn: sqlite3.Connection, chunk_size: int = 10000) -> int:
+        """ Regenerates the aggregate tables from the raw data, in one transaction.
+
+        Parameters:
+            db_conn : sqlite3.Connection
+                Open connection to the recorder database.
+            chunk_size : int, optional
+                Number of raw rows aggregated at once.
+
+        Returns:
+            int : Number of raw rows aggregated.
+        """
+        iot_rec_schema.IotRecorderSchema.create_schema(db_conn)
+        schema_version = iot_rec_schema.IotRecorderSchema.schema_version(db_conn)
+        num_rows = 0
+        with db_conn:
+            for table_name, (rollup_table, _, _, _) in IotRecorderRollup.rollup_sources.items():
+                db_conn.execute(f'DELETE FROM {rollup_table}')
+                columns = iot_rec_schema.IotRecorderSchema.table_columns[table_name]
+                cursor = db_conn.execute('SELECT {} FROM {}'.format(', '.join(columns), table_name))
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if len(rows) == 0:
+                        break
+                    aggregates = dict()
+                    IotRecorderRollup.aggregate(table_name, rows, aggregates)
+                    IotRecorderRollup.write(db_conn, aggregates, schema_version)
+                    num_rows += len(rows)
+        return num_rows
+
+    @staticmethod
+    def main(argv: list) -> int:
+        """ Command line entry point: rebuilds the aggregate tables of the given recorder databases.
+
+        Parameters:
+            argv : list
+                Command line arguments (without the program name).
+
+        Returns:
+            int : Exit code (0: all aggregate tables rebuilt, 1: at least one rebuild failed).
+        """
+        parser = argparse.ArgumentParser(description = "Rebuilds the aggregate tables of recorder databases")
+        parser.add_argument("databases", nargs = "+", help = "recorder databases")
+        args = parser.parse_args(argv)
+        exit_code = 0
+        for db_path in args.databases:
+            db_conn = sqlite3.connect(db_path)
+            try:
+                num_rows = IotRecorderRollup.rebuild(db_conn)
+                print(f'{db_path}: {num_rows} rows aggregated')
+            except (sqlite3.Error, ValueError) as except_:
+                print(f'{db_path}: rebuild failed: {str(except_)}', file = sys.stderr)
+                exit_code = 1
+            finally:
+                db_conn.close()
+        return exit_code
+
+if __name__ == "__main__":
+    sys.exit(IotRecorderRollup.main(sys.argv[1:]))
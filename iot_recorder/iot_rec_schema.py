@@ -0,0 +1,347 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+import sqlite3
+from datetime import datetime
+import iot_time_codec
+
+class IotRecorderSchema:
+    """ Table definitions and connection settings for the recorder database.
+
+        Schema version 1 (the iot_rec.sl3 template) stores all points in time as formatted strings.
+        Schema version 2 stores them as INTEGER microseconds since the epoch (1970-01-01 00:00:00 UTC)
+        and adds composite indexes for range queries per device channel and per sensor. The version
+        of a database is kept in "PRAGMA user_version" (0 and 1 both denote version 1).
+
+    Attributes:
+        table_columns : dict
+            Column names per recorder table, in the order of the table definition.
+        time_columns : set
+            Names of the columns holding points in time.
+        recorder_ddl : list
+            CREATE TABLE statements for the recorder tables (schema version 1).
+        recorder_ddl_v2 : list
+            CREATE TABLE and CREATE INDEX statements for the recorder tables (schema version 2).
+        synchronous_levels : list
+            Valid values for "PRAGMA synchronous".
+
+    Methods:
+        schema_version : int, static
+            Returns the schema version of a recorder database.
+        create_schema : None, static
+            Creates the recorder tables that do not yet exist in the database.
+        migrate : int, static
+            Converts a recorder database from schema version 1 to schema version 2.
+        to_epoch_us : int, static
+            Converts a point in time to microseconds since the epoch.
+        to_datetime : datetime, static
+            Converts a stored point in time (string or epoch microseconds) to a datetime.
+        from_epoch_us : datetime, static
+            Converts microseconds since the epoch to a (local) point in time.
+        epoch_us_expr : str, static
+            Returns an SQL expression converting a time column to microseconds since the epoch.
+        open_database : sqlite3.Connection, static
+            Opens a long-lived connection to a recorder database and applies the connection settings.
+    """
+    latest_version = 2
+
+    table_columns = {
+        'iot_recorder_msg': (
+            "msg_id", "msg_topic", "msg_timestamp", "msg_class", "store_date"),
+        'iot_recorder_generic': (
+            "msg_id", "msg_payload", "store_date"),
+        'iot_recorder_input_probe': (
+            "msg_id", "device_type", "device_id", "probe_time", "channel_no", "value", "voltage", "store_date"),
+        'iot_recorder_input_health': (
+            "msg_id", "device_type", "device_id", "health_time", "health_status", "last_probe_time",
+            "num_probe_total", "num_probe_detail", "store_date"),
+        'iot_recorder_sensor_msmt': (
+            "msg_id", "sensor_type", "sensor_id", "msmt_time", "hw_value", "hw_voltage", "msmt_unit",
+            "msmt_value", "store_date"),
+        'iot_recorder_sensor_rollup': (
+            "sensor_id", "granularity", "bucket_start", "num_values", "min_value", "max_value", "sum_value",
+            "sumsq_value"),
+        'iot_recorder_channel_rollup': (
+            "device_id", "channel_no", "granularity", "bucket_start", "num_values", "min_value", "max_value",
+            "sum_value", "sumsq_value")
+    }
+
+    time_columns = {'msg_timestamp', 'store_date', 'probe_time', 'health_time', 'last_probe_time', 'msmt_time',
+                    'bucket_start'}
+
+    recorder_ddl = [
+        'CREATE TABLE IF NOT EXISTS iot_recorder_msg ('
+        'msg_id TEXT PRIMARY KEY NOT NULL, msg_topic TEXT NOT NULL, msg_timestamp TEXT NOT NULL, '
+        'msg_class TEXT NOT NULL, store_date TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS iot_recorder_generic ('
+        'msg_id TEXT PRIMARY KEY NOT NULL REFERENCES iot_recorder_msg (msg_id) ON DELETE CASCADE '
+        'ON UPDATE RESTRICT MATCH SIMPLE, msg_payload TEXT NOT NULL, store_date TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS iot_recorder_input_probe ('
+        'msg_id TEXT PRIMARY KEY NOT NULL REFERENCES iot_recorder_msg (msg_id) ON DELETE CASCADE '
+        'ON UPDATE RESTRICT MATCH SIMPLE, device_type TEXT NOT NULL, device_id TEXT NOT NULL, '
+        'probe_time TEXT NOT NULL, channel_no INTEGER NOT NULL, value INTEGER NOT NULL, voltage DECIMAL, '
+        'store_date TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS iot_recorder_input_health ('
+        'msg_id TEXT PRIMARY KEY REFERENCES iot_recorder_msg (msg_id) ON DELETE CASCADE '
+        'ON UPDATE RESTRICT MATCH SIMPLE NOT NULL, device_type TEXT NOT NULL, device_id TEXT NOT NULL, '
+        'health_time TEXT NOT NULL, health_status INTEGER NOT NULL, last_probe_time TEXT, '
+        'num_probe_total INTEGER NOT NULL, num_probe_detail TEXT, store_date TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS iot_recorder_sensor_msmt ('
+        'msg_id TEXT PRIMARY KEY NOT NULL REFERENCES iot_recorder_msg (msg_id) ON DELETE CASCADE '
+        'ON UPDATE RESTRICT MATCH SIMPLE, sensor_type TEXT NOT NULL, sensor_id TEXT NOT NULL, '
+        'msmt_time TEXT NOT NULL, hw_value INTEGER NOT NULL, hw_voltage DECIMAL, msmt_unit TEXT, '
+        'msmt_value DECIMAL NOT NULL, store_date TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS iot_recorder_sensor_rollup ('
+        'sensor_id TEXT NOT NULL, granularity TEXT NOT NULL, bucket_start TEXT NOT NULL, '
+        'num_values INTEGER NOT NULL, min_value DECIMAL, max_value DECIMAL, sum_value DECIMAL, '
+        'sumsq_value DECIMAL, PRIMARY KEY (sensor_id, granularity, bucket_start))',
+        'CREATE TABLE IF NOT EXISTS iot_recorder_channel_rollup ('
+        'device_id TEXT NOT NULL, channel_no INTEGER NOT NULL, granularity TEXT NOT NULL, '
+        'bucket_start TEXT NOT NULL, num_values INTEGER NOT NULL, min_value DECIMAL, max_value DECIMAL, '
+        'sum_value DECIMAL, sumsq_value DECIMAL, PRIMARY KEY (device_id, channel_no, granularity, bucket_start))'
+    ]
+
+    recorder_ddl_v2 = [
+        'CREATE TABLE IF NOT EXISTS iot_recorder_msg ('
+        'msg_id TEXT PRIMARY KEY NOT NULL, msg_topic TEXT NOT NULL, msg_timestamp INTEGER NOT NULL, '
+        'msg_class TEXT NOT NULL, store_date INTEGER NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS iot_recorder_generic ('
+        'msg_id TEXT PRIMARY KEY NOT NULL REFERENCES iot_recorder_msg (msg_id) ON DELETE CASCADE '
+        'ON UPDATE RESTRICT MATCH SIMPLE, msg_payload TEXT NOT NULL, store_date INTEGER NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS iot_recorder_input_probe ('
+        'msg_id TEXT PRIMARY KEY NOT NULL REFERENCES iot_recorder_msg (msg_id) ON DELETE CASCADE '
+        'ON UPDATE RESTRICT MATCH SIMPLE, device_type TEXT NOT NULL, device_id TEXT NOT NULL, '
+        'probe_time INTEGER NOT NULL, channel_no INTEGER NOT NULL, value INTEGER NOT NULL, voltage DECIMAL, '
+        'store_date INTEGER NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS iot_recorder_input_health ('
+        'msg_id TEXT PRIMARY KEY REFERENCES iot_recorder_msg (msg_id) ON DELETE CASCADE '
+        'ON UPDATE RESTRICT MATCH SIMPLE NOT NULL, device_type TEXT NOT NULL, device_id TEXT NOT NULL, '
+        'health_time INTEGER NOT NULL, health_status INTEGER NOT NULL, last_probe_time INTEGER, '
+        'num_probe_total INTEGER NOT NULL, num_probe_detail TEXT, store_date INTEGER NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS iot_recorder_sensor_msmt ('
+        'msg_id TEXT PRIMARY KEY NOT NULL REFERENCES iot_recorder_msg (msg_id) ON DELETE CASCADE '
+        'ON UPDATE RESTRICT MATCH SIMPLE, sensor_type TEXT NOT NULL, sensor_id TEXT NOT NULL, '
+        'msmt_time INTEGER NOT NULL, hw_value INTEGER NOT NULL, hw_voltage DECIMAL, msmt_unit TEXT, '
+        'msmt_value DECIMAL NOT NULL, store_date INTEGER NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS iot_recorder_sensor_rollup ('
+        'sensor_id TEXT NOT NULL, granularity TEXT NOT NULL, bucket_start INTEGER NOT NULL, '
+        'num_values INTEGER NOT NULL, min_value DECIMAL, max_value DECIMAL, sum_value DECIMAL, '
+        'sumsq_value DECIMAL, PRIMARY KEY (sensor_id, granularity, bucket_start))',
+        'CREATE TABLE IF NOT EXISTS iot_recorder_channel_rollup ('
+        'device_id TEXT NOT NULL, channel_no INTEGER NOT NULL, granularity TEXT NOT NULL, '
+        'bucket_start INTEGER NOT NULL, num_values INTEGER NOT NULL, min_value DECIMAL, max_value DECIMAL, '
+        'sum_value DECIMAL, sumsq_value DECIMAL, PRIMARY KEY (device_id, channel_no, granularity, bucket_start))',
+        'CREATE INDEX IF NOT EXISTS iot_recorder_input_probe_channel_time '
+        'ON iot_recorder_input_probe (device_id, channel_no, probe_time)',
+        'CREATE INDEX IF NOT EXISTS iot_recorder_sensor_msmt_sensor_time '
+        'ON iot_recorder_sensor_msmt (sensor_id, msmt_time)',
+        'CREATE INDEX IF NOT EXISTS iot_recorder_msg_store_date ON iot_recorder_msg (store_date)'
+    ]
+
+    synchronous_levels = ['OFF', 'NORMAL', 'FULL', 'EXTRA']
+
+    @staticmethod
+    def schema_version(db_conn: sqlite3.Connection) -> int:
+        """ Returns the schema version of a recorder database.
+
+        Parameters:
+            db_conn : sqlite3.Connection
+                Open connection to the recorder database.
+
+        Returns:
+            int : Schema version (1 or 2).
+        """
+        return max(db_conn.execute('PRAGMA user_version').fetchone()[0], 1)
+
+    @staticmethod
+    def create_schema(db_conn: sqlite3.Connection) -> None:
+        """ Creates the recorder tables that do not yet exist in the database (databases created from
+            older templates of iot_rec.sl3 do not contain all tables). The tables are created in the
+            schema version of the database.
+
+        Parameters:
+            db_conn : sqlite3.Connection
+                Open connection to the recorder database.
+        """
+        if IotRecorderSchema.schema_version(db_conn) >= 2:
+            ddl_stmts = IotRecorderSchema.recorder_ddl_v2
+        else:
+            ddl_stmts = IotRecorderSchema.recorder_ddl
+        with db_conn:
+            for ddl_stmt in ddl_stmts:
+                db_conn.execute(ddl_stmt)
+
+    @staticmethod
+    def migrate(db_conn: sqlite3.Connection, chunk_size: int = 10000) -> int:
+        """ Converts a recorder database from schema version 1 to schema version 2: every table is
+            re-created with INTEGER time columns, the rows are copied with the formatted points in time
+            converted to microseconds since the epoch, and the indexes are created. The conversion runs
+            in one transaction; databases already in version 2 are left unchanged.
+
+        Parameters:
+            db_conn : sqlite3.Connection
+                Open connection to the recorder database.
+            chunk_size : int, optional
+                Number of rows read and written at once.
+
+        Returns:
+            int : Number of rows converted.
+        """
+        if IotRecorderSchema.schema_version(db_conn) >= 2:
+            return 0
+        IotRecorderSchema.create_schema(db_conn)
+        num_rows = 0
+        # Table renames shall not rewrite the foreign key references of the other tables.
+        db_conn.execute('PRAGMA legacy_alter_table = ON')
+        try:
+            with db_conn:
+                db_conn.execute('BEGIN')
+                for table_name in IotRecorderSchema.table_columns:
+                    db_conn.execute(f'ALTER TABLE {table_name} RENAME TO {table_name}_v1')
+                ddl_tables = [ddl for ddl in IotRecorderSchema.recorder_ddl_v2 if ddl.startswith('CREATE TABLE')]
+                for ddl_stmt in ddl_tables:
+                    db_conn.execute(ddl_stmt)
+                for table_name, columns in IotRecorderSchema.table_columns.items():
+                    num_rows += IotRecorderSchema._copy_table(db_conn, table_name, columns, chunk_size)
+                    db_conn.execute(f'DROP TABLE {table_name}_v1')
+                for ddl_stmt in IotRecorderSchema.recorder_ddl_v2:
+                    db_conn.execute(ddl_stmt)
+                db_conn.execute(f'PRAGMA user_version = {IotRecorderSchema.latest_version}')
+        finally:
+            db_conn.execute('PRAGMA legacy_alter_table = OFF')
+        return num_rows
+
+    @staticmethod
+    def _copy_table(db_conn: sqlite3.Connection, table_name: str, columns: tuple, chunk_size: int) -> int:
+        """ Copies the rows of a version 1 table to the version 2 table, converting the time columns. """
+        time_idx = [col_no for col_no, col in enumerate(columns) if col in IotRecorderSchema.time_columns]
+        column_list = ', '.join(columns)
+        insert_sql = 'INSERT INTO {} ({}) VALUES ({})'.format(table_name, column_list, ', '.join(['?'] * len(columns)))
+        cursor = db_conn.execute(f'SELECT {column_list} FROM {table_name}_v1')
+        num_rows = 0
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if len(rows) == 0:
+                break
+            conv_rows = []
+            for row in rows:
+                conv_row = list(row)
+                for col_no in time_idx:
+                    conv_row[col_no] = IotRecorderSchema.to_epoch_us(conv_row[col_no])
+                conv_rows.append(conv_row)
+            db_conn.executemany(insert_sql, conv_rows)
+            num_rows += len(conv_rows)
+        return num_rows
+
+    @staticmethod
+    def to_epoch_us(value: object) -> int:
+        """ Converts a point in time to microseconds since the epoch.
+
+        Parameters:
+            value : object
+                datetime (naive values are taken as local time), formatted string
+                ("YYYY-mm-dd HH:MM:SS[.ffffff]") or number of microseconds.
+
+        Returns:
+            int : Microseconds since 1970-01-01 00:00:00 UTC; None if value is None.
+        """
+        if value is None or isinstance(value, int):
+            return value
+        if isinstance(value, str):
+            value = IotRecorderSchema.to_datetime(value)
+        return iot_time_codec.IotTimeCodec.to_epoch_us(value)
+
+    @staticmethod
+    def to_datetime(value: object) -> datetime:
+        """ Converts a stored point in time to a datetime.
+
+        Parameters:
+            value : object
+                Formatted string ("YYYY-mm-dd HH:MM:SS[.ffffff]"), number of microseconds since the epoch
+                or datetime.
+
+        Returns:
+            datetime : Naive point in time in local time; None if value is None.
+        """
+        if value is None or isinstance(value, datetime):
+            return value
+        if isinstance(value, int):
+            return IotRecorderSchema.from_epoch_us(value)
+        return iot_time_codec.IotTimeCodec.parse(value.strip().replace('T', ' '))
+
+    @staticmethod
+    def from_epoch_us(value: int) -> datetime:
+        """ Converts microseconds since the epoch to a point in time.
+
+        Parameters:
+            value : int
+                Microseconds since 1970-01-01 00:00:00 UTC.
+
+        Returns:
+            datetime : Naive point in time in local time; None if value is None.
+        """
+        if value is None:
+            return None
+        return iot_time_codec.IotTimeCodec.from_epoch_us(value)
+
+    @staticmethod
+    def epoch_us_expr(column: str, schema_version: int) -> str:
+        """ Returns an SQL expression converting a time column to microseconds since the epoch.
+
+        Parameters:
+            column : str
+                Name of the time column.
+            schema_version : int
+                Schema version of the database. In version 1, the column holds local time strings
+                ("YYYY-mm-dd HH:MM:SS[.ffffff]"), which are converted by SQLite.
+
+        Returns:
+            str : SQL expression.
+        """
+        if schema_version >= 2:
+            return column
+        return ("(CAST(strftime('%s', {0}, 'utc') AS INTEGER) * 1000000 + "
+                "CAST(substr({0} || '000000', 21, 6) AS INTEGER))").format(column)
+
+    @staticmethod
+    def open_database(sqlite_db_path: str, synchronous: str = "NORMAL", cache_size: int = -2000,
+                      journal_mode: str = "WAL", schema_version: int = 1) -> sqlite3.Connection:
+        """ Opens a long-lived connection to a recorder database and applies the connection settings.
+
+        Parameters:
+            sqlite_db_path : str
+                Full path name of the recorder database.
+            synchronous : str, optional
+                Value for "PRAGMA synchronous" (OFF, NORMAL, FULL, EXTRA).
+            cache_size : int, optional
+                Value for "PRAGMA cache_size" (positive: number of pages; negative: size in KiB).
+            journal_mode : str, optional
+                Value for "PRAGMA journal_mode". WAL allows readers to access the database while the
+                recorder is writing.
+            schema_version : int, optional
+                Minimum schema version; databases in an older version are migrated.
+
+        Returns:
+            sqlite3.Connection : The open database connection.
+        """
+        if synchronous.upper() not in IotRecorderSchema.synchronous_levels:
+            raise ValueError(f'IotRecorderSchema.open_database(): invalid synchronous level "{synchronous}"')
+        db_conn = sqlite3.connect(sqlite_db_path, check_same_thread = False, cached_statements = 32)
+        db_conn.execute(f'PRAGMA journal_mode = {journal_mode}')
+        db_conn.execute(f'PRAGMA synchronous = {synchronous.upper()}')
+        db_conn.execute(f'PRAGMA cache_size = {int(cache_size)}')
+        IotRecorderSchema.create_schema(db_conn)
+        if schema_version >= 2:
+            IotRecorderSchema.migrate(db_conn)
+        return db_conn
@@ -0,0 +1,354 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+import inspect
+import logging
+import sqlite3
+import time
+from datetime import datetime
+import iot_stat_msg
+import iot_rec_schema
+import iot_rec_partition
+import iot_rec_rollup
+
+# pylint: disable=logging-fstring-interpolation
+
+RECORDER_TABLES = {
+    iot_stat_msg.IotRecorderMsg: "iot_recorder_msg",
+    iot_stat_msg.IotRecorderGenericMsg: "iot_recorder_generic",
+    iot_stat_msg.IotRecorderInputProbe: "iot_recorder_input_probe",
+    iot_stat_msg.IotRecorderInputHealth: "iot_recorder_input_health",
+    iot_stat_msg.IotRecorderSensorMsg: "iot_recorder_sensor_msmt"
+}
+
+
+class IotRecorderWriter:
+    """ Collects recorder rows (IotRecorderMsg, IotRecorderInputProbe, ...) in memory and writes them to
+        the recorder database in batches, using one transaction per table. The writer keeps one long-lived
+        connection to the database (opened in WAL journal mode) and uses one fixed INSERT statement per
+        table, so that the compiled statements are re-used from the connection's statement cache.
+        Points in time are converted when the rows are written, according to the schema version of the
+        target database (formatted strings for version 1, epoch microseconds for version 2).
+        Optionally, the aggregate tables (see IotRecorderRollup) are updated in the same transaction as
+        the raw sensor measurements and input probes.
+
+    Attributes:
+        _sqlite_db_path : str
+            Full path name of the SQLite database where the rows shall be stored.
+        _logger : logging.Logger
+            Logger to be used.
+        _batch_size : int
+            Number of buffered rows that triggers a flush of the buffer (0: flush on request only).
+        _synchronous : str
+            Value for "PRAGMA synchronous" of the database connection.
+        _cache_size : int
+            Value for "PRAGMA cache_size" of the database connection.
+        _schema_version : int
+            Minimum schema version of the target databases; older databases are migrated when opened.
+        _rollups : bool
+            Indicates whether or not the aggregate tables are maintained.
+        _partitions : iot_rec_partition.IotRecorderPartitions
+            Time-partitioned target databases (None: all rows are written to _sqlite_db_path).
+        _db_conn : sqlite3.Connection
+            Long-lived connection to the database; opened on the first flush.
+        _db_key : str
+            Key of the partition _db_conn is connected to.
+        _db_version : int
+            Schema version of the database _db_conn is connected to.
+        _pending : dict
+            Buffered rows (as tuples of attribute values) per recorder table.
+        _insert_sql : dict
+            INSERT statement per recorder table.
+        _num_pending : int
+            Total number of buffered rows.
+        _stats : dict
+            Flush statistics (number of flushes, batch sizes, flush latency, failed and skipped rows).
+
+    Properties:
+        num_pending : int
+            Getter for the number of rows waiting to be written.
+        statistics : dict
+            Getter for the flush statistics.
+
+    Methods:
+        IotRecorderWriter : None
+            Constructor.
+        add : None
+            Adds a recorder row to the buffer; flushes the buffer if the batch size is reached.
+        add_values : None
+            Adds the column values of a row to the buffer; flushes the buffer if the batch size is reached.
+        flush : int
+            Writes all buffered rows to the database.
+        close : None
+            Writes all buffered rows to the database and closes the database connection.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, sqlite_db_path: str, logger: logging.Logger, batch_size: int = 100,
+                 synchronous: str = "NORMAL", cache_size: int = -2000,
+                 partitions: iot_rec_partition.IotRecorderPartitions = None, schema_version: int = 1,
+                 rollups: bool = False):
+        """ Constructor.
+
+        Parameters:
+            sqlite_db_path : str
+                Full path name of the target SQLite database.
+            logger : logging.Logger
+                Logger to be used.
+            batch_size : int, optional
+                Number of buffered rows that triggers a flush of the buffer. If 0, the buffer is only
+                written when flush() is called.
+            synchronous : str, optional
+                Value for "PRAGMA synchronous" (OFF, NORMAL, FULL, EXTRA). In WAL mode, NORMAL
+                syncs the database file only at checkpoints.
+            cache_size : int, optional
+                Value for "PRAGMA cache_size" (positive: number of pages; negative: size in KiB).
+            partitions : iot_rec_partition.IotRecorderPartitions, optional
+                If given, the rows are written to the partition covering the time of the flush; the
+                connection is switched to a new partition when the period changes, and expired partitions
+                are dropped.
+            schema_version : int, optional
+                Minimum schema version of the target databases (1: formatted strings, 2: epoch
+                microseconds); databases in an older version are migrated when they are opened.
+            rollups : bool, optional
+                If True, the per-minute, per-hour and per-day aggregates of sensor measurements and input
+                probes are updated whenever rows are written.
+        """
+        # pylint: disable=too-many-arguments
+        self._sqlite_db_path = sqlite_db_path
+        self._logger = logger
+        self._batch_size = batch_size
+        self._synchronous = synchronous
+        self._cache_size = cache_size
+        self._schema_version = schema_version
+        self._rollups = rollups
+        self._partitions = partitions
+        self._db_conn = None
+        self._db_key = None
+        self._db_version = 1
+        self._pending = dict()
+        self._insert_sql = dict()
+        self._time_idx = dict()
+        # The order of the tables determines the write order: message headers first.
+        for table_name in RECORDER_TABLES.values():
+            columns = iot_rec_schema.IotRecorderSchema.table_columns[table_name]
+            self._pending[table_name] = []
+            self._time_idx[table_name] = [col_no for col_no, col in enumerate(columns)
+                                          if col in iot_rec_schema.IotRecorderSchema.time_columns]
+            self._insert_sql[table_name] = 'INSERT INTO {} ({}) VALUES ({})'.format(
+                table_name, ', '.join(columns), ', '.join(['?'] * len(columns)))
+        self._num_pending = 0
+        self._stats = {
+            'num_flushes': 0,
+            'num_rows': 0,
+            'num_failed_rows': 0,
+            'num_skipped_rows': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0
+        }
+
+    @property
+    def num_pending(self) -> int:
+        """ Getter for the number of rows waiting to be written. """
+        return self._num_pending
+
+    @property
+    def statistics(self) -> dict:
+        """ Getter for the flush statistics.
+
+        Returns:
+            dict : Copy of the flush statistics, extended by the average batch size and flush latency.
+        """
+        stats = dict(self._stats)
+        num_flushes = stats['num_flushes']
+        stats['avg_batch_size'] = stats['num_rows'] / num_flushes if num_flushes > 0 else 0.0
+        stats['avg_flush_ms'] = stats['total_flush_ms'] / num_flushes if num_flushes > 0 else 0.0
+        return stats
+
+    def add(self, rec_row: object) -> None:
+        """ Adds a recorder row to the buffer; flushes the buffer if the batch size is reached.
+
+        Parameters:
+            rec_row : object
+                Recorder row (one of the classes defined in iot_stat_msg).
+        """
+        table_name = RECORDER_TABLES[type(rec_row)]
+        columns = iot_rec_schema.IotRecorderSchema.table_columns[table_name]
+        self.add_values(table_name, tuple(getattr(rec_row, col) for col in columns))
+
+    def add_values(self, table_name: str, values: tuple) -> None:
+        """ Adds the column values of a row to the buffer; flushes the buffer if the batch size is reached.
+
+        Parameters:
+            table_name : str
+                Name of the recorder table.
+            values : tuple
+                Column values in the order of IotRecorderSchema.table_columns; points in time as datetime
+                or as string "YYYY-mm-dd HH:MM:SS.ffffff".
+        """
+        self._pending[table_name].append(values)
+        self._num_pending += 1
+        if 0 < self._batch_size <= self._num_pending:
+            self.flush()
+
+    def flush(self) -> int:
+        """ Writes all buffered rows to the database, using one transaction per table. The rows of a table
+            that cannot be written are logged and discarded, so they do not block the following flushes.
+
+        Returns:
+            int : Number of rows written.
+        """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        if self._num_pending == 0:
+            return 0
+        start_time = time.perf_counter()
+        num_written = 0
+        self._open_connection()
+        batch_size = self._num_pending
+        self._num_pending = 0
+        for table_name, rows in self._pending.items():
+            if len(rows) == 0:
+                continue
+            try:
+                num_written += self._write_table(table_name, rows, self._db_rows(table_name, rows))
+            except (sqlite3.Error, ValueError, TypeError) as except_:
+                self._logger.error(f'{mth_name}: table "{table_name}": {len(rows)} rows lost: {str(except_)}')
+                self._stats['num_failed_rows'] += len(rows)
+            finally:
+                self._pending[table_name] = []
+        flush_ms = (time.perf_counter() - start_time) * 1000.0
+        self._stats['num_flushes'] += 1
+        self._stats['num_rows'] += batch_size
+        self._stats['last_batch_size'] = batch_size
+        self._stats['max_batch_size'] = max(self._stats['max_batch_size'], batch_size)
+        self._stats['last_flush_ms'] = flush_ms
+        self._stats['max_flush_ms'] = max(self._stats['max_flush_ms'], flush_ms)
+        self._stats['total_flush_ms'] += flush_ms
+        self._logger.debug(f'{mth_name}: batch_size={batch_size}, written={num_written}, flush_ms={flush_ms:.2f}')
+        return num_written
+
+    def close(self) -> None:
+        """ Writes all buffered rows to the database and closes the database connection. """
+        self.flush()
+        if self._db_conn is not None:
+            self._db_conn.close()
+            self._db_conn = None
+
+    def _open_connection(self) -> None:
+        """ Opens the database connection, or switches it to a new partition if the period has changed. """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        if self._partitions is None:
+            db_path = self._sqlite_db_path
+        else:
+            now = datetime.now()
+            partition_key = self._partitions.partition_key(now)
+            if self._db_conn is not None and partition_key == self._db_key:
+                return
+            if self._db_conn is not None:
+                self._db_conn.close()
+                self._db_conn = None
+            db_path = self._partitions.create_partition(now)
+            self._db_key = partition_key
+            self._logger.info(f'{mth_name}: writing to partition "{db_path}"')
+            for dropped_path in self._partitions.drop_expired(now):
+                self._logger.info(f'{mth_name}: expired partition "{dropped_path}" dropped')
+        if self._db_conn is None:
+            self._db_conn = iot_rec_schema.IotRecorderSchema.open_database(
+                db_path, self._synchronous, self._cache_size, schema_version = self._schema_version)
+            self._db_version = iot_rec_schema.IotRecorderSchema.schema_version(self._db_conn)
+
+    def _write_table(self, table_name: str, rows: list, db_rows: list) -> int:
+        """ Writes the rows of a table in one transaction. If a row violates a constraint (e.g. a message
+            delivered twice by the broker or replayed from a spill file), the rows are inserted one by one
+            in a new transaction and the violating rows are skipped.
+
+        Parameters:
+            table_name : str
+                Name of the recorder table.
+            rows : list
+                Buffered rows (tuples of attribute values).
+            db_rows : list
+                Rows converted by _db_rows().
+
+        Returns:
+            int : Number of rows written.
+        """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        insert_sql = self._insert_sql[table_name]
+        try:
+            with self._db_conn:
+                self._db_conn.executemany(insert_sql, db_rows)
+                self._write_rollups(table_name, rows)
+            return len(rows)
+        except sqlite3.IntegrityError:
+            pass
+        written_rows = []
+        with self._db_conn:
+            for row, db_row in zip(rows, db_rows):
+                try:
+                    self._db_conn.execute(insert_sql, db_row)
+                    written_rows.append(row)
+                except sqlite3.IntegrityError as except_:
+                    self._logger.warning(f'{mth_name}: table "{table_name}": row skipped: {str(except_)}')
+            self._write_rollups(table_name, written_rows)
+        self._stats['num_skipped_rows'] += len(rows) - len(written_rows)
+        return len(written_rows)
+
+    def _write_rollups(self, table_name: str, rows: list) -> None:
+        """ Updates the aggregate tables with written rows (within the transaction writing the rows). """
+        if self._rollups and table_name in iot_rec_rollup.IotRecorderRollup.rollup_sources:
+            aggregates = dict()
+            iot_rec_rollup.IotRecorderRollup.aggregate(table_name, rows, aggregates)
+            iot_rec_rollup.IotRecorderRollup.write(self._db_conn, aggregates, self._db_version)
+
+    def _db_rows(self, table_name: str, rows: list) -> list:
+        """ Converts buffered rows to the column values of the connected database.
+
+        Parameters:
+            table_name : str
+                Name of the recorder table.
+            rows : list
+                Buffered rows (tuples of attribute values).
+
+        Returns:
+            list : Rows with points in time converted according to the schema version.
+        """
+        if self._db_version < 2:
+            return [tuple(self._db_value(value) for value in row) for row in rows]
+        time_idx = self._time_idx[table_name]
+        to_epoch_us = iot_rec_schema.IotRecorderSchema.to_epoch_us
+        db_rows = []
+        for row in rows:
+            db_row = list(row)
+            for col_no in time_idx:
+                db_row[col_no] = to_epoch_us(db_row[col_no])
+            db_rows.append(db_row)
+        return db_rows
+
+    @staticmethod
+    def _db_value(value: object) -> object:
+        """ Converts an attribute value to a value that can be stored in the database.
+
+        Parameters:
+            value : object
+                Attribute value of a recorder row.
+
+        Returns:
+            object : datetime values converted to str; all other values unchanged.
+        """
+        if isinstance(value, datetime):
+            return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+        return value
@@ -18,6 +18,7 @@ import wp_repository
 import wp_queueing
 import iot_msg_input
 import iot_msg_sensor
+import iot_msg_registry
 
 class IotRecorderMsg(wp_repository.RepositoryElement):
     """ Model for the general part of received messages to be stored in a repository. Derived from
@@ -45,6 +46,7 @@ class IotRecorderMsg(wp_repository.RepositoryElement):
         __str__ : str
             Create printable character string from object.
     """
+    __slots__ = ('msg_id', 'msg_topic', 'msg_timestamp', 'msg_class', 'store_date')
     _attribute_map = wp_repository.AttributeMap(
         "iot_recorder_msg",
         [wp_repository.AttributeMapping(0, "msg_id", "msg_id", str, db_key = 1),
@@ -91,7 +93,7 @@ class IotRecorderGenericMsg(wp_repository.RepositoryElement):
         msg_id : str
             Unique identifier of a received queueing message.
         msg_payload : str
-            Payload of the received message.
+            Payload of the received message (JSON; binary payloads as hexadecimal string).
         store_date : datetime
             Date and time when the record was stored in the repository.
 
@@ -105,6 +107,7 @@ class IotRecorderGenericMsg(wp_repository.RepositoryElement):
         __str__ : str
             Create printable character string from object.
     """
+    __slots__ = ('msg_id', 'msg_payload', 'store_date')
     _attribute_map = wp_repository.AttributeMap(
         "iot_recorder_generic",
         [wp_repository.AttributeMapping(0, "msg_id", "msg_id", str, db_key = 1),
@@ -117,6 +120,8 @@ class IotRecorderGenericMsg(wp_repository.RepositoryElement):
         self.msg_id = msg_id
         if msg_payload is None:
             self.msg_payload = ""
+        elif isinstance(msg_payload, (bytes, bytearray, memoryview)):
+            self.msg_payload = bytes(msg_payload).hex()
         else:
             self.msg_payload = json.dumps(msg_payload)
         self.store_date = datetime.now()
@@ -157,6 +162,9 @@ class IotRecorderInputProbe(wp_repository.RepositoryElement):
             Voltage detected on the input channel.
         store_date : datetime
             Date and time when the record was stored in the repository.
+        payload_columns : tuple
+            Mapping of the members of an "InputProbe" payload to the columns between msg_id and store_date
+            (see iot_msg_view.IotMessageView.row).
 
     Properties:
         store_date_str : str
@@ -169,6 +177,8 @@ class IotRecorderInputProbe(wp_repository.RepositoryElement):
             Create printable character string from object.
     """
     # pylint: disable=too-many-instance-attributes
+    __slots__ = ('msg_id', 'device_type', 'device_id', 'probe_time', 'channel_no',
+                 'value', 'voltage', 'store_date')
     _attribute_map = wp_repository.AttributeMap(
         "iot_recorder_input_probe",
         [wp_repository.AttributeMapping(0, "msg_id", "msg_id", str, db_key = 1),
@@ -179,6 +189,10 @@ class IotRecorderInputProbe(wp_repository.RepositoryElement):
          wp_repository.AttributeMapping(5, "value", "value", int),
          wp_repository.AttributeMapping(6, "voltage", "voltage", float),
          wp_repository.AttributeMapping(7, "store_date", "store_date", datetime)])
+    payload_columns = (
+        ('device_type', 'value', True, None), ('device_id', 'value', True, None),
+        ('probe_time', 'time', True, None), ('channel_no', 'value', True, None),
+        ('value', 'value', True, None), ('voltage', 'value', False, 0.0))
 
     def __init__(self, msg_id: str, msg: iot_msg_input.InputProbe):
         """ Constructor. """
@@ -231,6 +245,9 @@ class IotRecorderSensorMsg(wp_repository.RepositoryElement):
             Calculated measurement value in the given unit.
         store_date : datetime
             Date and time when the record was stored in the repository.
+        payload_columns : tuple
+            Mapping of the members of a "SensorMsmt" payload to the columns between msg_id and store_date
+            (see iot_msg_view.IotMessageView.row).
 
     Properties:
         store_date_str : str
@@ -243,6 +260,8 @@ class IotRecorderSensorMsg(wp_repository.RepositoryElement):
             Create printable character string from object.
     """
     # pylint: disable=too-many-instance-attributes
+    __slots__ = ('msg_id', 'sensor_type', 'sensor_id', 'msmt_time', 'hw_value',
+                 'hw_voltage', 'msmt_unit', 'msmt_value', 'store_date')
     _attribute_map = wp_repository.AttributeMap(
         "iot_recorder_sensor_msmt",
         [wp_repository.AttributeMapping(0, "msg_id", "msg_id", str, db_key = 1),
@@ -254,6 +273,11 @@ class IotRecorderSensorMsg(wp_repository.RepositoryElement):
          wp_repository.AttributeMapping(6, "msmt_unit", "msmt_unit", str),
          wp_repository.AttributeMapping(7, "msmt_value", "msmt_value", float),
          wp_repository.AttributeMapping(8, "store_date", "store_date", datetime)])
+    payload_columns = (
+        ('sensor_type', 'value', True, None), ('sensor_id', 'value', True, None),
+        ('msmt_time', 'time', True, None), ('hw_value', 'value', True, None),
+        ('hw_voltage', 'value', False, 0.0), ('msmt_unit', 'value', True, None),
+        ('msmt_value', 'value', True, None))
 
     def __init__(self, msg_id: str, msg: iot_msg_sensor.SensorMsmt):
         """ Constructor.
@@ -315,6 +339,10 @@ class IotRecorderInputHealth(wp_repository.RepositoryElement):
             Number of input readings per input channel.
         store_date : datetime
             Date and time when the record was stored in the repository.
+        payload_columns : tuple
+            Mapping of the members of an "InputHealth" payload to the columns between msg_id and store_date
+            (see iot_msg_view.IotMessageView.row). The timing statistics of the handler (member "timing")
+            are not recorded; they describe the handler process, not the device.
 
     Properties:
         store_date_str : str
@@ -327,6 +355,8 @@ class IotRecorderInputHealth(wp_repository.RepositoryElement):
             Create printable character string from object.
     """
     # pylint: disable=too-many-instance-attributes
+    __slots__ = ('msg_id', 'device_type', 'device_id', 'health_time', 'health_status',
+                 'last_probe_time', 'num_probe_total', 'num_probe_detail', 'store_date')
     _attribute_map = wp_repository.AttributeMap(
         "iot_recorder_input_health",
         [wp_repository.AttributeMapping(0, "msg_id", "msg_id", str, db_key = 1),
@@ -338,6 +368,11 @@ class IotRecorderInputHealth(wp_repository.RepositoryElement):
          wp_repository.AttributeMapping(6, "num_probe_total", "num_probe_total", int),
          wp_repository.AttributeMapping(7, "num_probe_detail", "num_probe_detail", str),
          wp_repository.AttributeMapping(8, "store_date", "store_date", datetime)])
+    payload_columns = (
+        ('device_type', 'value', True, None), ('device_id', 'value', True, None),
+        ('health_time', 'time', True, None), ('health_status', 'value', True, None),
+        ('last_probe_time', 'time', True, None), ('num_probe_total', 'value', True, None),
+        ('num_probe_detail', 'json', False, None))
 
     def __init__(self, msg_id: str, msg: iot_msg_input.InputHealth):
         """ Constructor. """
@@ -350,6 +385,7 @@ class IotRecorderInputHealth(wp_repository.RepositoryElement):
         self.last_probe_time = msg.last_probe_time
         self.num_probe_total = msg.num_probe_total
         self.num_probe_detail = json.dumps(msg.num_probe_detail)
+        # msg.timing is not recorded (see payload_columns)
         self.store_date = datetime.now()
 
     @property
@@ -369,3 +405,9 @@ class IotRecorderInputHealth(wp_repository.RepositoryElement):
             f'health_status: "{self.health_status}"', f'last_probe_time: "{self.last_probe_time}"',
             f'num_probe_total: "{self.num_probe_total}"', f'num_probe_detail: "{self.num_probe_detail}"',
             f'store_date: "{self.store_date_str}"')
+
+
+iot_msg_registry.IotMessageRegistry.register_recorder_type('InputProbe', IotRecorderInputProbe)
+iot_msg_registry.IotMessageRegistry.register_recorder_type('InputProbeBatch', IotRecorderInputProbe)
+iot_msg_registry.IotMessageRegistry.register_recorder_type('InputHealth', IotRecorderInputHealth)
+iot_msg_registry.IotMessageRegistry.register_recorder_type('SensorMsmt', IotRecorderSensorMsg)
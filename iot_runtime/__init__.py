@@ -43,4 +43,12 @@ if iot_repository_path not in sys.path:
     sys.path.append(iot_repository_path)
 
 from iot_host import IotHost
+from iot_async_host import IotAsyncHost
+from iot_async_mqtt import IotAsyncMqttAdapter
+from iot_async_runtime import IotAsyncRuntime
+from iot_async_runtime import IotAsyncAgent
 from iot_agent import IotAgent
+from iot_agent_pool import IotAgentPool
+from iot_agent_pool import IotPooledAgent
+from iot_scheduler import IotScheduler
+from iot_supervisor import IotSupervisor
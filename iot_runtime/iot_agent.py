@@ -13,19 +13,24 @@
     and limitations under the LICENSE.
 """
 import logging
-import time
 import threading
 import uuid
 import iot_handler_base
 
 class IotAgent:
     """ Agent controlling the thread that hosts a handler for a hardware component, sensor or actor.
+        The thread sleeps until the next event of the handler is due, until the handler requests a
+        wakeup or until the agent is stopped, whatever comes first.
 
     Attributes:
+        max_wait_time : float
+            Maximum time in seconds the thread sleeps without calling the handler's time_tick().
 
     Properties:
         agent_id : str
             Getter for the unique identifier of the controlled element.
+        handler : iot_handler_base.IotHandlerBase
+            Getter for the controlled handler.
         is_running : bool
             Indicates whether or not the agent's worker thread is running.
 
@@ -33,11 +38,14 @@ class IotAgent:
         IotAgent:
             Constructor.
     """
+    max_wait_time = 60.0
+
     def __init__(self, iot_handler: iot_handler_base.IotHandlerBase, logger: logging.Logger):
         """ Constructor.
         """
         self._thread = None
         self._stop_event = None
+        self._wakeup_event = None
         self._handler = iot_handler
         self._logger = logger
         self._agent_id = f'A.{self._handler.element_id}.{str(uuid.uuid4()).replace("-","")}'
@@ -47,20 +55,35 @@ class IotAgent:
         """ Getter for the unique identifier of the controlled element. """
         return self._agent_id
 
+    @property
+    def handler(self) -> iot_handler_base.IotHandlerBase:
+        """ Getter for the controlled handler. """
+        return self._handler
+
     def do_processing(self) -> None:
         """ Does the work of the agent interacting with the controlled handler. """
         if self._handler is None or self._stop_event is None:
             return
         self._handler.init_time()
-        while not self._stop_event.wait(0.1):
-            time.sleep(0.9)
+        self._handler.set_wakeup_callback(self._wakeup_event.set)
+        while not self._stop_event.is_set():
+            wait_time = self._handler.time_until_next_event()
+            if wait_time is None or wait_time > IotAgent.max_wait_time:
+                wait_time = IotAgent.max_wait_time
+            if wait_time > 0:
+                self._wakeup_event.wait(wait_time)
+            self._wakeup_event.clear()
+            if self._stop_event.is_set():
+                break
             self._handler.time_tick()
-
+        self._handler.set_wakeup_callback(None)
+        self._handler.stop()
 
     def start(self) -> None:
         """ Starts the thread executing the do_processing() loop. """
         self._stop_event = threading.Event()
         self._stop_event.clear()
+        self._wakeup_event = threading.Event()
         self._thread = threading.Thread(target=self.do_processing, name='agent_{}'.format(self.agent_id), daemon=True)
         self._thread.start()
 
@@ -86,6 +109,7 @@ class IotAgent:
         if self._thread is None or self._stop_event is None:
             return True
         self._stop_event.set()
+        self._wakeup_event.set()
         self._thread.join(3)
         return not self._thread.is_alive()
 
@@ -0,0 +1,201 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+import logging
+import threading
+import uuid
+import iot_handler_base
+import iot_scheduler
+
+class IotAgentPool:
+    """ Runs the handlers of many IOT components on a fixed number of worker threads instead of one
+        IotAgent thread per handler. The timer events are dispatched by an iot_scheduler.IotScheduler:
+        a handler never runs concurrently with itself, and a slow handler occupies one worker thread
+        only, while the events of the other handlers are passed to the remaining workers in the order
+        of their deadlines.
+
+    Attributes:
+        _logger : logging.Logger
+            Logger to be used.
+        _max_workers : int
+            Number of worker threads executing the timer events.
+        _scheduler : iot_scheduler.IotScheduler
+            Scheduler dispatching the timer events to the worker threads.
+        _lock : threading.Lock
+            Synchronizes starting and stopping of the scheduler.
+
+    Properties:
+        max_workers : int
+            Getter for the number of worker threads.
+        scheduler : iot_scheduler.IotScheduler
+            Getter for the scheduler dispatching the timer events.
+        statistics : dict
+            Getter for the scheduler counters.
+        is_running : bool
+            Indicates whether or not the scheduler is running.
+
+    Methods:
+        IotAgentPool : None
+            Constructor.
+        create_agent : IotPooledAgent
+            Creates an agent running a handler on the pool.
+        stop : bool
+            Stops all handlers and the worker threads.
+    """
+    def __init__(self, logger: logging.Logger, max_workers: int = 4):
+        """ Constructor.
+
+        Parameters:
+            logger : logging.Logger
+                Logger to be used.
+            max_workers : int, optional
+                Number of worker threads executing the timer events.
+        """
+        self._logger = logger
+        self._max_workers = max_workers if max_workers > 0 else 1
+        self._scheduler = iot_scheduler.IotScheduler(logger, self._max_workers)
+        self._lock = threading.Lock()
+
+    @property
+    def max_workers(self) -> int:
+        """ Getter for the number of worker threads. """
+        return self._max_workers
+
+    @property
+    def scheduler(self) -> iot_scheduler.IotScheduler:
+        """ Getter for the scheduler dispatching the timer events. """
+        return self._scheduler
+
+    @property
+    def statistics(self) -> dict:
+        """ Getter for the scheduler counters (see iot_scheduler.IotScheduler.statistics). """
+        return self._scheduler.statistics
+
+    @property
+    def is_running(self) -> bool:
+        """ Indicates whether or not the scheduler is running. """
+        return self._scheduler.is_running
+
+    def create_agent(self, handler: iot_handler_base.IotHandlerBase, logger: logging.Logger):
+        """ Creates an agent running a handler on the pool.
+
+        Parameters:
+            handler : iot_handler_base.IotHandlerBase
+                Handler to be run.
+            logger : logging.Logger
+                Logger to be used by the agent.
+
+        Returns:
+            IotPooledAgent : The agent (not yet started).
+        """
+        return IotPooledAgent(handler, logger, self)
+
+    def stop(self, timeout: float = 3.0) -> bool:
+        """ Stops all handlers and the worker threads.
+
+        Parameters:
+            timeout : float, optional
+                Maximum time in seconds to wait for the dispatcher thread.
+
+        Returns:
+            bool : True if the dispatcher thread has terminated, False otherwise.
+        """
+        with self._lock:
+            return self._scheduler.stop(timeout)
+
+    def _start(self) -> None:
+        """ Starts the scheduler when the first agent is started. """
+        with self._lock:
+            self._scheduler.start()
+
+
+class IotPooledAgent:
+    """ Agent running a handler on the worker threads of an IotAgentPool, with the same interface as
+        iot_agent.IotAgent.
+
+    Properties:
+        agent_id : str
+            Getter for the unique identifier of the controlled element.
+        handler : iot_handler_base.IotHandlerBase
+            Getter for the controlled handler.
+        is_running : bool
+            Indicates whether or not the handler is registered with the pool.
+
+    Methods:
+        IotPooledAgent : None
+            Constructor.
+        start : None
+            Registers the handler with the pool.
+        stop : bool
+            Unregisters the handler and stops it.
+        kill : None
+            Unregisters the handler without waiting for its current timer event.
+    """
+    def __init__(self, iot_handler: iot_handler_base.IotHandlerBase, logger: logging.Logger, pool: IotAgentPool):
+        """ Constructor.
+
+        Parameters:
+            iot_handler : iot_handler_base.IotHandlerBase
+                Handler to be run.
+            logger : logging.Logger
+                Logger to be used.
+            pool : IotAgentPool
+                Pool providing the worker threads.
+        """
+        self._handler = iot_handler
+        self._logger = logger
+        self._pool = pool
+        self._started = False
+        self._agent_id = f'A.{self._handler.element_id}.{str(uuid.uuid4()).replace("-","")}'
+
+    @property
+    def agent_id(self) -> str:
+        """ Getter for the unique identifier of the controlled element. """
+        return self._agent_id
+
+    @property
+    def handler(self) -> iot_handler_base.IotHandlerBase:
+        """ Getter for the controlled handler. """
+        return self._handler
+
+    @property
+    def is_running(self) -> bool:
+        """ Indicates whether or not the handler is registered with the pool. """
+        return self._started and self._pool.is_running
+
+    def start(self) -> None:
+        """ Registers the handler with the pool; its first events are scheduled immediately. """
+        if self._started:
+            return
+        self._pool._start()                             # pylint: disable=protected-access
+        self._pool.scheduler.add(self._handler)
+        self._started = True
+
+    def stop(self) -> bool:
+        """ Unregisters the handler and stops it after its current timer event, if any, has returned.
+
+        Returns:
+            bool : True if the handler has been stopped, False if its timer event is still executed
+                   after 3 seconds (the handler is stopped as soon as the event returns).
+        """
+        if not self._started:
+            return True
+        self._started = False
+        return self._pool.scheduler.remove(self._handler, 3)
+
+    def kill(self) -> None:
+        """ Unregisters the handler without waiting for its current timer event. """
+        if self._started:
+            self._started = False
+            self._pool.scheduler.remove(self._handler, 0)
@@ -0,0 +1,84 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+import logging
+import iot_handler_base
+import iot_host
+import iot_async_runtime
+
+class IotAsyncHost(iot_host.IotHost):
+    """ Alternative to IotHost running the handlers of all IOT components of a process group (hardware
+        components, sensors, data recorders) as asyncio tasks on one event loop instead of one thread per
+        handler. The time_tick() of blocking handlers (with their I2C and SQLite accesses) is executed by a
+        bounded pool of worker threads, that of non-blocking handlers (iot_handler_base.IotHandlerBase.
+        blocking) inline on the event loop; MQTT messages are published through async adapters
+        (iot_async_mqtt.IotAsyncMqttAdapter). The number of threads and the memory therefore no longer
+        grow with the number of handlers. The hand-overs between the event loop and the worker and
+        publishing threads cost more context switches and CPU time than a thread per handler
+        (tests/bench_iot_async_host.py), so the host pays off for many handlers, not for low CPU load.
+
+    Attributes:
+        _runtime : iot_async_runtime.IotAsyncRuntime
+            Event loop and executor running the handlers.
+
+    Properties:
+        runtime : iot_async_runtime.IotAsyncRuntime
+            Getter for the event loop and executor running the handlers.
+
+    Methods:
+        IotAsyncHost
+            Constructor.
+        stop_agents : None
+            Stops all running handlers, the event loop and the worker threads.
+    """
+    def __init__(self, sqlite_db_path: str, process_group: int = 0, max_workers: int = 4, **host_settings):
+        """ Constructor.
+
+        Parameters:
+            sqlite_db_path : str
+                Path name of the SQLite database file containing the configuration settings.
+            process_group : int, optional
+                Allows for agents to be started on a specific hosts to be split into separate process
+                groups.
+            max_workers : int, optional
+                Number of worker threads executing the blocking calls of the handlers.
+            host_settings : dict
+                Further keyword arguments of iot_host.IotHost (phase_strategy, catch_up, max_backfill).
+        """
+        self._runtime = iot_async_runtime.IotAsyncRuntime(logging.getLogger(f'IOT.ASYNC.{process_group}'), max_workers)
+        super().__init__(sqlite_db_path, process_group, **host_settings)
+
+    @property
+    def runtime(self) -> iot_async_runtime.IotAsyncRuntime:
+        """ Getter for the event loop and executor running the handlers. """
+        return self._runtime
+
+    def stop_agents(self) -> None:
+        """ Stops all running handlers, the event loop and the worker threads. """
+        super().stop_agents()
+        self._runtime.stop()
+
+    def _create_agent(self, handler: iot_handler_base.IotHandlerBase, logger: logging.Logger):
+        """ Creates the agent running a handler as task on the event loop.
+
+        Parameters:
+            handler : iot_handler_base.IotHandlerBase
+                Handler to be run.
+            logger : logging.Logger
+                Logger to be used by the agent.
+
+        Returns:
+            iot_async_runtime.IotAsyncAgent : The agent (not yet started).
+        """
+        return self._runtime.create_agent(handler, logger)
@@ -0,0 +1,204 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+from typing import Any
+import collections
+import concurrent.futures
+import inspect
+import logging
+import threading
+import wp_queueing
+
+# pylint: disable=logging-fstring-interpolation
+
+class IotAsyncMqttAdapter:
+    """ Adapter decoupling the handlers from a blocking MQTT client (wp_queueing.MQTTProducer or
+        MQTTConsumer) on an asyncio event loop. publish_single() may be called from any thread; it only
+        appends the message to a bounded queue and returns immediately. The queued messages are passed to
+        the client by a drain job in the publishing executor of the runtime, which is separate from the
+        executor running the handlers, so a stalled broker delays the published messages, not the
+        handlers. At most one drain job per adapter is submitted at a time, so the messages are published
+        in the order they were queued. The event loop is not involved in publishing, so a message costs
+        one hand-over to the publishing thread. All other attributes and methods (e.g. owner, topics,
+        receive) are those of the wrapped client.
+
+    Attributes:
+        _client : Any
+            Wrapped MQTT client (wp_queueing.MQTTProducer or wp_queueing.MQTTConsumer).
+        _executor : concurrent.futures.Executor
+            Executor for the blocking publish calls of the client.
+        _logger : logging.Logger
+            Logger to be used.
+        _queue_size : int
+            Maximum number of queued messages; when the queue is full, the oldest message is discarded.
+        _queue : collections.deque
+            Messages waiting to be published.
+        _running : bool
+            Indicates whether or not messages are accepted (between start() and stop()).
+        _draining : bool
+            Indicates that a drain job has been submitted to the executor and has not yet finished.
+        _stats : dict
+            Adapter counters (queued, published, dropped, failed messages).
+        _lock : threading.Lock
+            Lock protecting the queue, the flags and the counters.
+        _idle : threading.Condition
+            Notified when the queue has been drained.
+
+    Properties:
+        client : Any
+            Getter for the wrapped MQTT client.
+        statistics : dict
+            Getter for the adapter counters.
+
+    Methods:
+        IotAsyncMqttAdapter : None
+            Constructor.
+        start : None
+            Starts accepting messages.
+        stop : bool
+            Stops accepting messages and waits until all queued messages have been published.
+        publish_single : None
+            Queues a message for publishing. May be called from any thread.
+        publish : None
+            Coroutine queueing a message for publishing.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, client: Any, executor: concurrent.futures.Executor, logger: logging.Logger,
+                 queue_size: int = 1000):
+        """ Constructor.
+
+        Parameters:
+            client : Any
+                MQTT client to be wrapped (wp_queueing.MQTTProducer or wp_queueing.MQTTConsumer).
+            executor : concurrent.futures.Executor
+                Executor for the blocking publish calls of the client.
+            logger : logging.Logger
+                Logger to be used.
+            queue_size : int, optional
+                Maximum number of queued messages.
+        """
+        self._client = client
+        self._executor = executor
+        self._logger = logger
+        self._queue_size = queue_size if queue_size > 0 else 1
+        self._queue = collections.deque()
+        self._running = False
+        self._draining = False
+        self._stats = {
+            'num_queued': 0,
+            'num_published': 0,
+            'num_dropped': 0,
+            'num_failed': 0
+        }
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def __getattr__(self, name: str) -> Any:
+        """ Delegates the access to all other attributes to the wrapped client. """
+        return getattr(self._client, name)
+
+    @property
+    def client(self) -> Any:
+        """ Getter for the wrapped MQTT client. """
+        return self._client
+
+    @property
+    def statistics(self) -> dict:
+        """ Getter for the adapter counters.
+
+        Returns:
+            dict : Copy of the counters ("num_queued", "num_published", "num_dropped", "num_failed"),
+                   extended by the current queue depth ("queue_depth").
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queue_depth'] = len(self._queue)
+        return stats
+
+    def start(self) -> None:
+        """ Starts accepting messages. May be called from any thread. """
+        with self._lock:
+            self._running = True
+
+    def stop(self, timeout: float = 3.0) -> bool:
+        """ Stops accepting messages and waits until all queued messages have been published. Must not be
+            called from the publishing executor.
+
+        Parameters:
+            timeout : float, optional
+                Maximum time in seconds to wait for the queued messages to be published.
+
+        Returns:
+            bool : True if all queued messages have been published, False otherwise.
+        """
+        with self._lock:
+            self._running = False
+            return self._idle.wait_for(lambda: not self._draining, timeout)
+
+    def publish_single(self, msg: wp_queueing.QueueMessage) -> None:
+        """ Queues a message for publishing; discards the oldest message if the queue is full. May be
+            called from any thread.
+
+        Parameters:
+            msg : wp_queueing.QueueMessage
+                Message to be published.
+        """
+        with self._lock:
+            if not self._running:
+                self._stats['num_dropped'] += 1
+                return
+            if len(self._queue) >= self._queue_size:
+                self._queue.popleft()
+                self._stats['num_dropped'] += 1
+            self._queue.append(msg)
+            self._stats['num_queued'] += 1
+            if self._draining:
+                return
+            self._draining = True
+        self._executor.submit(self._drain)
+
+    async def publish(self, msg: wp_queueing.QueueMessage) -> None:
+        """ Coroutine queueing a message for publishing.
+
+        Parameters:
+            msg : wp_queueing.QueueMessage
+                Message to be published.
+        """
+        self.publish_single(msg)
+
+    def _drain(self) -> None:
+        """ Drain job: passes the queued messages to the client until the queue is empty. Runs in the
+            executor. """
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._draining = False
+                    self._idle.notify_all()
+                    return
+                msg_list = list(self._queue)
+                self._queue.clear()
+            self._publish_batch(msg_list)
+
+    def _publish_batch(self, msg_list: list) -> None:
+        """ Passes a list of messages to the client. Runs in the executor. """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        for msg in msg_list:
+            try:
+                self._client.publish_single(msg)
+                stat_name = 'num_published'
+            except Exception as except_:                # pylint: disable=broad-except
+                self._logger.error(f'{mth_name}: topic="{msg.msg_topic}": {str(except_)}')
+                stat_name = 'num_failed'
+            with self._lock:
+                self._stats[stat_name] += 1
@@ -0,0 +1,328 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+import asyncio
+import concurrent.futures
+import inspect
+import logging
+import threading
+import uuid
+import iot_handler_base
+import iot_async_mqtt
+
+# pylint: disable=logging-fstring-interpolation
+
+class IotAsyncRuntime:
+    """ Event loop running the handlers as asyncio tasks in one thread. The time_tick() of blocking
+        handlers (iot_handler_base.IotHandlerBase.blocking, e.g. with I2C and SQLite calls) is executed by
+        a bounded pool of worker threads, so the number of threads does not grow with the number of
+        handlers; non-blocking handlers run inline on the event loop. Publishing to the MQTT brokers has
+        worker threads of its own, so a stalled broker does not occupy the workers of the handlers.
+
+        Every event of a blocking handler is handed over to a worker thread and back, and every published
+        message to the publishing thread. This costs more context switches and CPU time than a thread
+        per handler, even for inline handlers; the runtime saves threads and memory.
+
+    Attributes:
+        _logger : logging.Logger
+            Logger to be used.
+        _max_workers : int
+            Number of worker threads executing the blocking calls.
+        _loop : asyncio.AbstractEventLoop
+            The event loop.
+        _thread : threading.Thread
+            Thread running the event loop.
+        _executor : concurrent.futures.ThreadPoolExecutor
+            Worker threads executing the blocking calls.
+        _publish_workers : int
+            Number of worker threads publishing to the MQTT brokers.
+        _publish_executor : concurrent.futures.ThreadPoolExecutor
+            Worker threads publishing to the MQTT brokers (shared by all MQTT adapters).
+        _adapters : dict
+            Async MQTT adapters per wrapped MQTT client.
+
+    Properties:
+        loop : asyncio.AbstractEventLoop
+            Getter for the event loop.
+        executor : concurrent.futures.ThreadPoolExecutor
+            Getter for the bounded executor.
+        publish_executor : concurrent.futures.ThreadPoolExecutor
+            Getter for the executor publishing to the MQTT brokers.
+        is_running : bool
+            Indicates whether or not the event loop thread is running.
+
+    Methods:
+        IotAsyncRuntime : None
+            Constructor.
+        start : None
+            Starts the event loop thread and the worker threads.
+        stop : None
+            Stops the MQTT adapters, the event loop thread and the worker threads.
+        create_agent : IotAsyncAgent
+            Creates an agent running a handler as task on the event loop.
+        async_mqtt : tuple
+            Replaces the MQTT client of a (client, topic) tuple by its async adapter.
+    """
+    def __init__(self, logger: logging.Logger, max_workers: int = 4, publish_workers: int = 1):
+        """ Constructor.
+
+        Parameters:
+            logger : logging.Logger
+                Logger to be used.
+            max_workers : int, optional
+                Number of worker threads executing the blocking calls.
+            publish_workers : int, optional
+                Number of worker threads publishing to the MQTT brokers.
+        """
+        self._logger = logger
+        self._max_workers = max_workers if max_workers > 0 else 1
+        self._publish_workers = publish_workers if publish_workers > 0 else 1
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        self._publish_executor = None
+        self._adapters = dict()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """ Getter for the event loop (None before start()). """
+        return self._loop
+
+    @property
+    def executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """ Getter for the bounded executor (None before start()). """
+        return self._executor
+
+    @property
+    def publish_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """ Getter for the executor publishing to the MQTT brokers (None before start()). """
+        return self._publish_executor
+
+    @property
+    def is_running(self) -> bool:
+        """ Indicates whether or not the event loop thread is running. """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """ Starts the event loop thread and the worker threads. """
+        if self.is_running:
+            return
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers = self._max_workers, thread_name_prefix = 'async_worker')
+        self._publish_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers = self._publish_workers, thread_name_prefix = 'async_publisher')
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self._executor)
+        self._thread = threading.Thread(target = self._loop.run_forever, name = 'async_runtime', daemon = True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 3.0) -> None:
+        """ Stops the MQTT adapters (publishing the queued messages), the event loop thread and the worker
+            threads. The agents must have been stopped before.
+
+        Parameters:
+            timeout : float, optional
+                Maximum time in seconds to wait for the queued messages of each adapter.
+        """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        if not self.is_running:
+            return
+        for adapter in self._adapters.values():
+            if not adapter.stop(timeout):
+                self._logger.warning(f'{mth_name}: messages of a MQTT adapter not published')
+        self._adapters.clear()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._executor.shutdown(wait = True)
+        self._publish_executor.shutdown(wait = True)
+        if not self._thread.is_alive():
+            self._loop.close()
+
+    def create_agent(self, handler: iot_handler_base.IotHandlerBase, logger: logging.Logger):
+        """ Creates an agent running a handler as task on the event loop. The MQTT producers of the
+            handler (mqtt_data, mqtt_health) are replaced by async adapters.
+
+        Parameters:
+            handler : iot_handler_base.IotHandlerBase
+                Handler to be run.
+            logger : logging.Logger
+                Logger to be used by the agent.
+
+        Returns:
+            IotAsyncAgent : The agent (not yet started).
+        """
+        self.start()
+        handler.mqtt_data = self.async_mqtt(handler.mqtt_data)
+        handler.mqtt_health = self.async_mqtt(handler.mqtt_health)
+        return IotAsyncAgent(handler, logger, self)
+
+    def async_mqtt(self, mqtt_info: tuple) -> tuple:
+        """ Replaces the MQTT client of a (client, topic) tuple by its async adapter. Handlers sharing a
+            client share the adapter.
+
+        Parameters:
+            mqtt_info : tuple
+                MQTT client and topic (None allowed).
+
+        Returns:
+            tuple : Async adapter and topic (None if mqtt_info is None).
+        """
+        if mqtt_info is None or isinstance(mqtt_info[0], iot_async_mqtt.IotAsyncMqttAdapter):
+            return mqtt_info
+        client = mqtt_info[0]
+        adapter = self._adapters.get(id(client))
+        if adapter is None:
+            adapter = iot_async_mqtt.IotAsyncMqttAdapter(client, self._publish_executor, self._logger)
+            adapter.start()
+            self._adapters[id(client)] = adapter
+        return (adapter,) + tuple(mqtt_info[1:])
+
+
+class IotAsyncAgent:
+    """ Agent running a handler as asyncio task on the event loop of an IotAsyncRuntime, with the
+        interface of iot_agent.IotAgent. The task sleeps until the next event of the handler is due, until
+        the handler requests a wakeup or until the agent is stopped. The time_tick() of a blocking handler
+        (iot_handler_base.IotHandlerBase.blocking) is executed by the runtime's executor, so the event loop
+        is not blocked; that of a non-blocking handler is called inline on the event loop. A handler never
+        runs concurrently with itself.
+
+    Attributes:
+        max_wait_time : float
+            Maximum time in seconds the task sleeps without calling the handler's time_tick().
+
+    Properties:
+        agent_id : str
+            Getter for the unique identifier of the controlled element.
+        handler : iot_handler_base.IotHandlerBase
+            Getter for the controlled handler.
+        is_running : bool
+            Indicates whether or not the agent's task is running.
+
+    Methods:
+        IotAsyncAgent:
+            Constructor.
+        start : None
+            Starts the task on the event loop.
+        stop : bool
+            Stops the task and the handler.
+        kill : None
+            Cancels the task.
+    """
+    max_wait_time = 60.0
+
+    def __init__(self, iot_handler: iot_handler_base.IotHandlerBase, logger: logging.Logger,
+                 runtime: IotAsyncRuntime):
+        """ Constructor.
+
+        Parameters:
+            iot_handler : iot_handler_base.IotHandlerBase
+                Handler to be run.
+            logger : logging.Logger
+                Logger to be used.
+            runtime : IotAsyncRuntime
+                Runtime providing the event loop and the executor.
+        """
+        self._handler = iot_handler
+        self._logger = logger
+        self._runtime = runtime
+        self._future = None
+        self._stopping = False
+        self._wakeup_event = None
+        self._agent_id = f'A.{self._handler.element_id}.{str(uuid.uuid4()).replace("-","")}'
+
+    @property
+    def agent_id(self) -> str:
+        """ Getter for the unique identifier of the controlled element. """
+        return self._agent_id
+
+    @property
+    def handler(self) -> iot_handler_base.IotHandlerBase:
+        """ Getter for the controlled handler. """
+        return self._handler
+
+    @property
+    def is_running(self) -> bool:
+        """ Indicates whether or not the agent's task is running. """
+        return self._future is not None and not self._future.done()
+
+    def start(self) -> None:
+        """ Starts the task on the event loop. """
+        if self.is_running:
+            return
+        self._stopping = False
+        self._future = asyncio.run_coroutine_threadsafe(self.do_processing(), self._runtime.loop)
+
+    def stop(self) -> bool:
+        """ Stops the task; the handler is stopped when its current time_tick() has returned.
+
+        Returns:
+            bool : True if the task has terminated, False if it is still running.
+        """
+        if self._future is None:
+            return True
+        self._stopping = True
+        self._runtime.loop.call_soon_threadsafe(self._wakeup)
+        try:
+            self._future.result(3)
+        except concurrent.futures.TimeoutError:
+            return False
+        except concurrent.futures.CancelledError:
+            pass
+        return True
+
+    def kill(self) -> None:
+        """ Cancels the task. A time_tick() currently executed by the executor is not interrupted. """
+        if self._future is not None:
+            self._future.cancel()
+            self._handler.set_wakeup_callback(None)
+            self._handler.stop()
+
+    async def do_processing(self) -> None:
+        """ Coroutine doing the work of the agent interacting with the controlled handler. """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        loop = asyncio.get_running_loop()
+        self._wakeup_event = asyncio.Event()
+        await self._call(loop, self._handler.init_time)
+        self._handler.set_wakeup_callback(lambda: loop.call_soon_threadsafe(self._wakeup))
+        while not self._stopping:
+            wait_time = self._handler.time_until_next_event()
+            if wait_time is None or wait_time > IotAsyncAgent.max_wait_time:
+                wait_time = IotAsyncAgent.max_wait_time
+            if wait_time > 0:
+                # a timer handle is cheaper than asyncio.wait_for(), which creates a task per wait
+                timer_handle = loop.call_later(wait_time, self._wakeup_event.set)
+                await self._wakeup_event.wait()
+                timer_handle.cancel()
+            self._wakeup_event.clear()
+            if self._stopping:
+                break
+            try:
+                await self._call(loop, self._handler.time_tick)
+            except Exception as except_:                # pylint: disable=broad-except
+                self._logger.error(f'{mth_name}: {str(except_)}')
+        self._handler.set_wakeup_callback(None)
+        await self._call(loop, self._handler.stop)
+
+    async def _call(self, loop: asyncio.AbstractEventLoop, function) -> None:
+        """ Calls a method of the handler: by the runtime's executor if the handler is blocking, inline
+            on the event loop otherwise. """
+        if self._handler.blocking:
+            await loop.run_in_executor(self._runtime.executor, function)
+        else:
+            function()
+
+    def _wakeup(self) -> None:
+        """ Wakes up the task. Runs on the event loop. """
+        if self._wakeup_event is not None:
+            self._wakeup_event.set()
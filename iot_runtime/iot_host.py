@@ -16,22 +16,33 @@ import socket
 import logging
 import inspect
 import iot_config
+import iot_handler_base
 import iot_hardware_factory
 import iot_sensor_factory
 import iot_recorder
 import iot_agent
+import iot_agent_pool
+import iot_scheduler
 
 # pylint: disable=logging-fstring-interpolation
 
 class IotHost:
     """ Initiated once for every process group per host where IOT components are deployed.
-        Starts the controllers for these IOT components in seperate agent threads.
+        Starts the controllers for these IOT components in seperate agent threads, or on a fixed number
+        of worker threads (execution "pool").
 
     Attributes:
         _config : iot_config.IotConfiguration
             Configuration settings for the host controller and all its assigned components.
         _agents : dict
             Contains object references to all started IotAgent instances.
+        _phase_strategy : str
+            Strategy placing the first events of the handlers within their intervals (see
+            iot_handler_base.IotHandlerBase.set_phase()).
+        _catch_up : tuple
+            Catch-up policy and backfill cap of the handlers (see iot_handler_base.IotHandlerBase.set_catch_up()).
+        _pool : iot_agent_pool.IotAgentPool
+            Worker threads running the handlers (execution "pool" only, None otherwise).
 
     Properties:
         data_recording_started : bool
@@ -56,8 +67,15 @@ class IotHost:
             Starts the recorders for recording of messages published to data topics.
         stop_data_recording : None
             Stops the recorders for recording of messsages published to data topics.
+        load_distribution : list
+            Returns the number of handler events per second within a time horizon.
+        health_report : dict
+            Returns the state and the timing statistics of all agents.
+        host_ip_address : str
+            Determines the IP address identifying the host in the configuration database.
     """
-    def __init__(self, sqlite_db_path: str, process_group: int = 0):
+    def __init__(self, sqlite_db_path: str, process_group: int = 0, phase_strategy: str = 'minute',
+                 catch_up: str = 'skip', max_backfill: int = 3, execution: str = 'thread', pool_workers: int = 4):
         """ Constructor.
 
         Parameters:
@@ -66,14 +84,36 @@ class IotHost:
             process_group : int, optional
                 Allows for agents to be started on a specific hosts to be split into separate process
                 groups.
+            phase_strategy : str, optional
+                Strategy placing the first events of the handlers within their intervals ("minute"
+                or "hash"). "minute" starts the polling of all components at the top of the minute;
+                with "hash", it is spread evenly over the polling interval.
+            catch_up : str, optional
+                Policy of the handlers for polling deadlines that are overdue by more than one interval
+                ("skip", "coalesce", "backfill").
+            max_backfill : int, optional
+                Maximum number of polling events fired per tick for the catch-up policy "backfill".
+            execution : str, optional
+                "thread" runs every handler in an agent thread of its own; "pool" runs all handlers of
+                the process group on a fixed number of worker threads (iot_agent_pool.IotAgentPool).
+            pool_workers : int, optional
+                Number of worker threads for the execution "pool".
         """
-        ip_address = [l for l in ([ip for ip in socket.gethostbyname_ex(socket.gethostname())[2]
-                      if not ip.startswith("127.")][:1], [[(s.connect(('8.8.8.8', 53)),
-                      s.getsockname()[0], s.close()) for s in [socket.socket(socket.AF_INET,
-                      socket.SOCK_DGRAM)]][0][1]]) if l][0][0]
-        self._config = iot_config.IotConfiguration(ip_address, sqlite_db_path, process_group)
+        # pylint: disable=too-many-arguments
+        if phase_strategy not in ['minute', 'hash']:
+            raise ValueError(f'IotHost(): invalid phase strategy "{phase_strategy}"')
+        if catch_up not in iot_handler_base.IotHandlerBase.catch_up_policies:
+            raise ValueError(f'IotHost(): invalid catch-up policy "{catch_up}"')
+        if execution not in ['thread', 'pool']:
+            raise ValueError(f'IotHost(): invalid execution "{execution}"')
+        self._config = iot_config.IotConfiguration(IotHost.host_ip_address(), sqlite_db_path, process_group)
         self._agents = dict()
         self._logger = logging.getLogger(f'IOT.HOST.{process_group}')
+        self._phase_strategy = phase_strategy
+        self._catch_up = (catch_up, max_backfill)
+        self._pool = None
+        if execution == 'pool':
+            self._pool = iot_agent_pool.IotAgentPool(logging.getLogger(f'IOT.POOL.{process_group}'), pool_workers)
 
     def __del__(self):
         """ Destructor. """
@@ -84,18 +124,23 @@ class IotHost:
         """ Property that indicates whether or not at least one data recorder ist started. """
         return 'data_recorder' in self._agents and len(self._agents['data_recorder']) > 0
 
-    def start_data_recording(self, recorder_db_path: str) -> None:
+    def start_data_recording(self, recorder_db_path: str, recorder_settings: dict = None) -> None:
         """ Starts the recorders for recording of messages published to data topics.
 
         Parameters:
             recorder_db_path : str
                 Full path name of the SQLite database to store the recorded messages.
+            recorder_settings : dict, optional
+                Additional settings for the message recorders (e.g. {"batch_size": 200}), passed as
+                keyword arguments to iot_recorder.IotMessageRecorder.
         """
         # pylint: disable=too-many-locals
         mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
         if self.data_recording_started:
             self._logger.debug(f'{mth_name}: data recording already started')
             return
+        if recorder_settings is None:
+            recorder_settings = dict()
         brokers = self._config.brokers
         recorder_config = dict()
         for broker_id in brokers:
@@ -117,8 +162,9 @@ class IotHost:
             if len(recorder_config[broker_id]) > 0:
                 logger = logging.getLogger(f'IOT.REC.{broker_id}')
                 recorder = iot_recorder.IotMessageRecorder(
-                    brokers[broker_id], recorder_config[broker_id], recorder_db_path, logger)
-                rec_agent = iot_agent.IotAgent(recorder, logger)
+                    brokers[broker_id], recorder_config[broker_id], recorder_db_path, logger, **recorder_settings)
+                self._set_timing(recorder)
+                rec_agent = self._create_agent(recorder, logger)
                 recorder_agents.append(rec_agent)
                 rec_agent.start()
         self._agents['data_recorder'] = recorder_agents
@@ -132,8 +178,22 @@ class IotHost:
                     agent.kill()
             self._agents['data_recorder'] = []
 
-    def start_hardware_agents(self) -> None:
-        """ Starts the agent threads for the hardware components attached to the host. """
+    def start_hardware_agents(self, publish_batch: bool = False, binary_payload: bool = False,
+                              burst_rate: int = 0, burst_raw_samples: bool = False) -> None:
+        """ Starts the agent threads for the hardware components attached to the host.
+
+        Parameters:
+            publish_batch : bool, optional
+                If True, input devices publish one InputProbeBatch message per poll instead of one
+                InputProbe message per channel.
+            binary_payload : bool, optional
+                If True, input devices publish their probe messages in the compact binary representation.
+            burst_rate : int, optional
+                If greater than 0, input devices supporting burst mode sample their channels continuously
+                at this data rate and publish one InputBurst message per poll.
+            burst_raw_samples : bool, optional
+                If True, the InputBurst messages include the compressed raw samples.
+        """
         hw_agents = []
         brokers = self._config.brokers
         hw_components = self._config.hardware_components
@@ -143,8 +203,10 @@ class IotHost:
             device = iot_hardware_factory.IotHardwareFactory.create_hardware_device(
                 component_config, extra_info, logger)
             handler = iot_hardware_factory.IotHardwareFactory.create_hardware_handler(
-                brokers, component_config, device, logger)
-            hw_agent = iot_agent.IotAgent(handler, logger)
+                brokers, component_config, device, logger, publish_batch = publish_batch,
+                binary_payload = binary_payload, burst_rate = burst_rate, burst_raw_samples = burst_raw_samples)
+            self._set_timing(handler)
+            hw_agent = self._create_agent(handler, logger)
             hw_agents.append(hw_agent)
             hw_agent.start()
         self._agents['hardware'] = hw_agents
@@ -170,7 +232,8 @@ class IotHost:
             sensor = iot_sensor_factory.IotSensorFactory.create_sensor(sensor_config, logger)
             handler = iot_sensor_factory.IotSensorFactory.create_sensor_handler(
                 brokers, sensor_config, sensor, logger)
-            sensor_agent = iot_agent.IotAgent(handler, logger)
+            self._set_timing(handler)
+            sensor_agent = self._create_agent(handler, logger)
             sensor_agents.append(sensor_agent)
             sensor_agent.start()
         self._agents['sensors'] = sensor_agents
@@ -196,3 +259,83 @@ class IotHost:
         self.stop_hardware_agents()
         # self.stop_sensor_agents()
         self.stop_data_recording()
+        if self._pool is not None:
+            self._pool.stop()
+
+    def load_distribution(self, horizon: float = 60.0) -> list:
+        """ Returns the number of events of all running handlers per second within a time horizon.
+
+        Parameters:
+            horizon : float, optional
+                Time horizon in seconds.
+
+        Returns:
+            list : Number of events due in second 0, 1, ... from now.
+        """
+        handlers = [agent.handler for agents in self._agents.values() for agent in agents]
+        return iot_scheduler.IotScheduler.distribution(handlers, horizon)
+
+    def health_report(self) -> dict:
+        """ Returns the state and the timing statistics of all agents.
+
+        Returns:
+            dict : Report with the members
+                "process_group" .. process group of the host,
+                "num_agents" ..... number of started agents,
+                "num_running" .... number of running agents,
+                "agents" ......... per element_id: agent category ("hardware", "sensors", "data_recorder"),
+                                   "is_running" and the timing statistics of the handler (see
+                                   iot_handler_base.IotHandlerBase.timing_statistics),
+                "pool" ........... counters of the agent pool (execution "pool" only, None otherwise).
+        """
+        agent_reports = dict()
+        for category, agents in self._agents.items():
+            for agent in agents:
+                agent_report = {'category': category, 'is_running': agent.is_running}
+                agent_report.update(agent.handler.timing_statistics)
+                agent_reports[getattr(agent.handler, 'element_id', agent.agent_id)] = agent_report
+        return {
+            'process_group': self._config.process_group,
+            'num_agents': len(agent_reports),
+            'num_running': sum(1 for agent_report in agent_reports.values() if agent_report['is_running']),
+            'agents': agent_reports,
+            'pool': None if self._pool is None else self._pool.statistics
+        }
+
+    @staticmethod
+    def host_ip_address() -> str:
+        """ Determines the IP address identifying the host in the configuration database: the first
+            non-loopback address of the host name, or the address of the interface used for the default
+            route.
+
+        Returns:
+            str : IP address of the host.
+        """
+        return [l for l in ([ip for ip in socket.gethostbyname_ex(socket.gethostname())[2]
+                if not ip.startswith("127.")][:1], [[(s.connect(('8.8.8.8', 53)),
+                s.getsockname()[0], s.close()) for s in [socket.socket(socket.AF_INET,
+                socket.SOCK_DGRAM)]][0][1]]) if l][0][0]
+
+    def _create_agent(self, handler: iot_handler_base.IotHandlerBase, logger: logging.Logger):
+        """ Creates the agent running a handler in a thread of its own, or on the worker threads of the
+            agent pool.
+
+        Parameters:
+            handler : iot_handler_base.IotHandlerBase
+                Handler to be run.
+            logger : logging.Logger
+                Logger to be used by the agent.
+
+        Returns:
+            iot_agent.IotAgent or iot_agent_pool.IotPooledAgent : The agent (not yet started).
+        """
+        if self._pool is not None:
+            return self._pool.create_agent(handler, logger)
+        return iot_agent.IotAgent(handler, logger)
+
+    def _set_timing(self, handler: iot_handler_base.IotHandlerBase) -> None:
+        """ Applies the phase strategy and the catch-up policy of the host to a handler. """
+        if handler is None:
+            return
+        handler.set_phase(self._phase_strategy)
+        handler.set_catch_up(*self._catch_up)
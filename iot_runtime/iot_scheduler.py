@@ -0,0 +1,327 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+from typing import Callable
+import concurrent.futures
+import heapq
+import inspect
+import itertools
+import logging
+import threading
+import time
+import iot_handler_base
+
+# pylint: disable=logging-fstring-interpolation
+
+class IotScheduler:
+    """ Process-wide scheduler dispatching the timer events of many handlers from one thread. The
+        deadlines of the handlers (IotHandlerBase.next_deadline_ns) are kept in a heap; the dispatcher
+        thread sleeps until the earliest deadline and then passes the handler's time_tick() to a small
+        pool of worker threads. A handler is put back into the heap with its new deadline only after its
+        time_tick() has returned, so a handler never runs concurrently with itself, and a slow handler
+        occupies one worker only.
+
+    Attributes:
+        _logger : logging.Logger
+            Logger to be used.
+        _clock : Callable
+            Monotonic clock returning nanoseconds; must be the clock used by the handlers.
+        _executor : concurrent.futures.ThreadPoolExecutor
+            Worker threads executing the time_tick() calls.
+        _heap : list
+            Entries (deadline_ns, sequence_no, handler) of the scheduled handlers.
+        _handlers : dict
+            Sequence number of the valid heap entry per registered handler (None while dispatched).
+        _running : set
+            Handlers whose time_tick() is currently executed by a worker thread.
+        _orphaned : set
+            Removed handlers to be stopped as soon as their current time_tick() has returned.
+        _cond : threading.Condition
+            Synchronizes the access to the heap; notified when the earliest deadline may have changed.
+        _thread : threading.Thread
+            The dispatcher thread.
+        _stats : dict
+            Scheduler counters (wakeups of the dispatcher thread, dispatched ticks, errors, longest tick).
+
+    Properties:
+        num_handlers : int
+            Getter for the number of registered handlers.
+        statistics : dict
+            Getter for the scheduler counters.
+        is_running : bool
+            Indicates whether or not the dispatcher thread is running.
+
+    Methods:
+        IotScheduler : None
+            Constructor.
+        add : None
+            Registers a handler and schedules its first events.
+        remove : bool
+            Unregisters a handler and stops it.
+        reschedule : None
+            Re-reads the next deadline of a handler, e.g. after its timers have been changed.
+        start : None
+            Starts the dispatcher thread.
+        stop : bool
+            Stops the dispatcher thread and all registered handlers.
+        load_distribution : list
+            Returns the number of events of the registered handlers per second within a time horizon.
+        distribution : list
+            Returns the number of events of a list of handlers per second within a time horizon.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, logger: logging.Logger, max_workers: int = 2, clock: Callable[[], int] = None):
+        """ Constructor.
+
+        Parameters:
+            logger : logging.Logger
+                Logger to be used.
+            max_workers : int, optional
+                Number of worker threads executing the time_tick() calls.
+            clock : Callable, optional
+                Monotonic clock returning nanoseconds; defaults to time.monotonic_ns.
+        """
+        self._logger = logger
+        self._clock = time.monotonic_ns if clock is None else clock
+        self._max_workers = max_workers if max_workers > 0 else 1
+        self._executor = None
+        self._heap = []
+        self._handlers = dict()
+        self._running = set()
+        self._orphaned = set()
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._started_ns = None
+        self._stats = {
+            'num_wakeups': 0,
+            'num_dispatches': 0,
+            'num_errors': 0,
+            'max_tick_duration': 0.0
+        }
+
+    @property
+    def num_handlers(self) -> int:
+        """ Getter for the number of registered handlers. """
+        return len(self._handlers)
+
+    @property
+    def statistics(self) -> dict:
+        """ Getter for the scheduler counters.
+
+        Returns:
+            dict : Copy of the counters ("num_wakeups", "num_dispatches", "num_errors",
+                   "max_tick_duration" in seconds), extended by "num_handlers", "num_running" and
+                   "wakeups_per_minute" (wakeups of the dispatcher and the worker threads per minute
+                   since start()).
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats['num_handlers'] = len(self._handlers)
+            stats['num_running'] = len(self._running)
+            started_ns = self._started_ns
+        elapsed_ns = 0 if started_ns is None else self._clock() - started_ns
+        stats['wakeups_per_minute'] = 0.0 if elapsed_ns <= 0 else \
+            (stats['num_wakeups'] + stats['num_dispatches']) * 60000000000 / elapsed_ns
+        return stats
+
+    @property
+    def is_running(self) -> bool:
+        """ Indicates whether or not the dispatcher thread is running. """
+        return self._thread is not None and self._thread.is_alive()
+
+    def add(self, handler: iot_handler_base.IotHandlerBase) -> None:
+        """ Registers a handler and schedules its first events (calls the handler's init_time()).
+
+        Parameters:
+            handler : iot_handler_base.IotHandlerBase
+                Handler to be scheduled.
+        """
+        handler.init_time()
+        with self._cond:
+            self._handlers[handler] = None
+            self._push(handler)
+        handler.set_wakeup_callback(lambda: self.reschedule(handler))
+
+    def remove(self, handler: iot_handler_base.IotHandlerBase, timeout: float = 3.0) -> bool:
+        """ Unregisters a handler and stops it. A time_tick() currently executed is not interrupted;
+            the handler is stopped after it has returned, so that stop() never runs concurrently with
+            time_tick().
+
+        Parameters:
+            handler : iot_handler_base.IotHandlerBase
+                Handler to be removed.
+            timeout : float, optional
+                Maximum time in seconds to wait for a time_tick() currently executed.
+
+        Returns:
+            bool : True if the handler has been stopped, False if its time_tick() is still executed (the
+                   handler is stopped as soon as it returns).
+        """
+        with self._cond:
+            if handler not in self._handlers:
+                return True
+            del self._handlers[handler]
+            handler.set_wakeup_callback(None)
+            if not self._cond.wait_for(lambda: handler not in self._running, timeout):
+                self._orphaned.add(handler)
+                return False
+        handler.stop()
+        return True
+
+    def reschedule(self, handler: iot_handler_base.IotHandlerBase) -> None:
+        """ Re-reads the next deadline of a handler, e.g. after its timers have been changed or when it
+            requests a wakeup (installed as wakeup callback of the handler). Has no effect while the
+            handler is dispatched; its deadline is read after time_tick() anyway.
+
+        Parameters:
+            handler : iot_handler_base.IotHandlerBase
+                Registered handler.
+        """
+        with self._cond:
+            if self._handlers.get(handler) is not None:
+                self._push(handler)
+
+    def start(self) -> None:
+        """ Starts the dispatcher thread. """
+        if self.is_running:
+            return
+        self._stopping = False
+        self._started_ns = self._clock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers = self._max_workers, thread_name_prefix = 'scheduler_worker')
+        self._thread = threading.Thread(target = self._dispatch_loop, name = 'scheduler', daemon = True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 3.0) -> bool:
+        """ Stops the dispatcher thread and all registered handlers.
+
+        Parameters:
+            timeout : float, optional
+                Maximum time in seconds to wait for the dispatcher thread.
+
+        Returns:
+            bool : True if the dispatcher thread has terminated, False otherwise.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            handlers = list(self._handlers)
+            self._handlers.clear()
+            self._heap.clear()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait = True)
+        for handler in handlers:
+            handler.set_wakeup_callback(None)
+            handler.stop()
+        return self._thread is None or not self._thread.is_alive()
+
+    def load_distribution(self, horizon: float = 60.0) -> list:
+        """ Returns the number of events of the registered handlers per second within a time horizon.
+
+        Parameters:
+            horizon : float, optional
+                Time horizon in seconds.
+
+        Returns:
+            list : Number of events due in second 0, 1, ... from now.
+        """
+        with self._cond:
+            handlers = list(self._handlers)
+        return IotScheduler.distribution(handlers, horizon)
+
+    @staticmethod
+    def distribution(handlers: list, horizon: float = 60.0) -> list:
+        """ Returns the number of events of a list of handlers per second within a time horizon. A peak
+            indicates handlers whose events are not spread over their intervals (see
+            IotHandlerBase.set_phase()).
+
+        Parameters:
+            handlers : list
+                Handlers (iot_handler_base.IotHandlerBase) whose events are counted.
+            horizon : float, optional
+                Time horizon in seconds.
+
+        Returns:
+            list : Number of events due in second 0, 1, ... from now.
+        """
+        num_seconds = max(int(horizon + 0.999999), 1)
+        load = [0] * num_seconds
+        for handler in handlers:
+            for event_time in handler.scheduled_events(horizon):
+                load[min(int(event_time), num_seconds - 1)] += 1
+        return load
+
+    def _push(self, handler: iot_handler_base.IotHandlerBase) -> None:
+        """ Puts a handler into the heap with its next deadline. Must be called while holding _cond. """
+        deadline_ns = handler.next_deadline_ns()
+        if deadline_ns is None:
+            self._handlers[handler] = None
+            return
+        sequence_no = next(self._sequence)
+        self._handlers[handler] = sequence_no
+        if len(self._heap) == 0 or deadline_ns < self._heap[0][0]:
+            self._cond.notify_all()
+        heapq.heappush(self._heap, (deadline_ns, sequence_no, handler))
+
+    def _dispatch_loop(self) -> None:
+        """ Main loop of the dispatcher thread. """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        self._logger.debug(f'{mth_name}: dispatcher thread started')
+        with self._cond:
+            while not self._stopping:
+                if len(self._heap) == 0:
+                    self._cond.wait()
+                    self._stats['num_wakeups'] += 1
+                    continue
+                deadline_ns, sequence_no, handler = self._heap[0]
+                wait_ns = deadline_ns - self._clock()
+                if wait_ns > 0:
+                    self._cond.wait(wait_ns / 1000000000)
+                    self._stats['num_wakeups'] += 1
+                    continue
+                heapq.heappop(self._heap)
+                if self._handlers.get(handler) != sequence_no:
+                    continue
+                self._handlers[handler] = None
+                self._running.add(handler)
+                self._stats['num_dispatches'] += 1
+                self._executor.submit(self._tick, handler)
+        self._logger.debug(f'{mth_name}: dispatcher thread stopped')
+
+    def _tick(self, handler: iot_handler_base.IotHandlerBase) -> None:
+        """ Executes the time_tick() of a handler in a worker thread and schedules its next deadline. """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        start_ns = self._clock()
+        try:
+            handler.time_tick()
+        except Exception as except_:                    # pylint: disable=broad-except
+            self._logger.error(f'{mth_name}: {handler.__class__.__name__}: {str(except_)}')
+            with self._cond:
+                self._stats['num_errors'] += 1
+        duration = (self._clock() - start_ns) / 1000000000
+        with self._cond:
+            self._running.discard(handler)
+            self._stats['max_tick_duration'] = max(self._stats['max_tick_duration'], duration)
+            orphaned = handler in self._orphaned
+            self._orphaned.discard(handler)
+            if handler in self._handlers and not self._stopping:
+                self._push(handler)
+            elif handler not in self._handlers:
+                self._cond.notify_all()
+        if orphaned:
+            handler.stop()
@@ -0,0 +1,394 @@
+"""
+    Copyright 2021 Walter Pachlinger (walter.pachlinger@gmail.com)
+
+    Licensed under the EUPL, Version 1.2 or - as soon they will be approved by the European
+    Commission - subsequent versions of the EUPL (the LICENSE). You may not use this work except
+    in compliance with the LICENSE. You may obtain a copy of the LICENSE at:
+
+        https://joinup.ec.europa.eu/software/page/eupl
+
+    Unless required by applicable law or agreed to in writing, software distributed under the
+    LICENSE is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+    either express or implied. See the LICENSE for the specific language governing permissions
+    and limitations under the LICENSE.
+"""
+from typing import Callable
+import argparse
+import inspect
+import json
+import logging
+import logging.config
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+import iot_config
+import iot_host
+
+# pylint: disable=logging-fstring-interpolation
+
+class IotSupervisor:
+    """ Runs every process group assigned to the host in a worker process of its own, so that the
+        handlers of a host can use more than one CPU core. Crashed worker processes are restarted with
+        an exponential backoff; the health reports of the workers (see iot_host.IotHost.health_report())
+        are collected and aggregated. Optionally, every worker process is pinned to a set of CPUs.
+
+        Command line: python -m iot_runtime.iot_supervisor <config_db> [--pin-cpus] [--execution pool] ...
+
+    Attributes:
+        min_backoff : float
+            Delay in seconds before the first restart of a crashed worker process.
+        max_backoff : float
+            Maximum delay in seconds between two restarts of a worker process.
+        stable_time : float
+            Run time in seconds after which a worker process counts as stable; the backoff of a stable
+            worker process starts at min_backoff again.
+        _sqlite_db_path : str
+            Path name of the SQLite database file containing the configuration settings.
+        _logger : logging.Logger
+            Logger to be used.
+        _process_groups : list
+            Process groups to be run (None: all process groups assigned to the host).
+        _worker_settings : dict
+            Settings passed to the worker processes (host_settings, recorder_db_path, report_interval).
+        _cpu_affinity : dict
+            CPUs per process group the worker processes are pinned to (None: no pinning).
+        _worker_target : Callable
+            Function executed by the worker processes.
+        _context : multiprocessing.context.BaseContext
+            Multiprocessing context ("spawn") creating the worker processes.
+        _report_queue : multiprocessing.Queue
+            Queue receiving the health reports of the worker processes.
+        _stop_event : multiprocessing.Event
+            Signals the worker processes to stop.
+        _workers : dict
+            State of the worker process per process group.
+
+    Properties:
+        process_groups : list
+            Getter for the supervised process groups.
+        health : dict
+            Getter for the aggregated health of all worker processes.
+
+    Methods:
+        IotSupervisor : None
+            Constructor.
+        start : None
+            Starts one worker process per process group.
+        supervise : None
+            Collects the health reports and restarts crashed worker processes.
+        stop : bool
+            Stops all worker processes.
+        run_worker : None
+            Runs the agents of one process group. Executed by the worker processes.
+        main : int
+            Command line entry point.
+    """
+    # pylint: disable=too-many-instance-attributes
+    min_backoff = 1.0
+    max_backoff = 60.0
+    stable_time = 300.0
+
+    def __init__(self, sqlite_db_path: str, logger: logging.Logger, process_groups: list = None,
+                 host_settings: dict = None, recorder_db_path: str = None, report_interval: float = 10.0,
+                 cpu_affinity = None, worker_target: Callable = None):
+        """ Constructor.
+
+        Parameters:
+            sqlite_db_path : str
+                Path name of the SQLite database file containing the configuration settings.
+            logger : logging.Logger
+                Logger to be used.
+            process_groups : list, optional
+                Process groups to be run; by default all process groups of the components assigned to
+                the host (iot_repository_host.IotHostAssignedComponent).
+            host_settings : dict, optional
+                Keyword arguments of iot_host.IotHost (phase_strategy, catch_up, execution, ...).
+            recorder_db_path : str, optional
+                If given, the worker process of the lowest process group also records the data topics
+                into this database (iot_host.IotHost.start_data_recording()).
+            report_interval : float, optional
+                Time in seconds between two health reports of a worker process.
+            cpu_affinity : dict or str, optional
+                CPUs per process group ({process_group: [cpu, ...]}) the worker processes are pinned to,
+                or "auto" to pin the worker processes to one CPU each, round robin. Ignored where the
+                operating system does not support os.sched_setaffinity().
+            worker_target : Callable, optional
+                Function executed by the worker processes, with the same parameters as run_worker();
+                defaults to run_worker().
+        """
+        # pylint: disable=too-many-arguments
+        self._sqlite_db_path = sqlite_db_path
+        self._logger = logger
+        self._process_groups = None if process_groups is None else sorted(set(process_groups))
+        self._worker_settings = {
+            'host_settings': dict() if host_settings is None else dict(host_settings),
+            'recorder_db_path': recorder_db_path,
+            'report_interval': report_interval
+        }
+        self._cpu_affinity = cpu_affinity
+        self._worker_target = IotSupervisor.run_worker if worker_target is None else worker_target
+        self._context = multiprocessing.get_context('spawn')
+        self._report_queue = None
+        self._stop_event = None
+        self._workers = dict()
+
+    @property
+    def process_groups(self) -> list:
+        """ Getter for the supervised process groups. """
+        if self._process_groups is None:
+            config = iot_config.IotConfiguration(iot_host.IotHost.host_ip_address(), self._sqlite_db_path)
+            self._process_groups = config.process_groups
+        return self._process_groups
+
+    @property
+    def health(self) -> dict:
+        """ Getter for the aggregated health of all worker processes.
+
+        Returns:
+            dict : Health with the members
+                "num_groups" ......... number of supervised process groups,
+                "num_running" ........ number of running worker processes,
+                "num_restarts" ....... number of restarts of all worker processes,
+                "num_agents" ......... number of agents reported by the worker processes,
+                "num_running_agents" . number of running agents reported by the worker processes,
+                "num_polling_events" . number of polling events of all handlers,
+                "num_missed_polls" ... number of missed polling deadlines of all handlers,
+                "max_lateness" ....... maximum delay in seconds of a polling event of any handler,
+                "groups" ............. per process group: "pid", "is_running", "num_restarts",
+                                       "last_exitcode", "report_age" (seconds since the last health
+                                       report, None before the first one) and the last health report.
+        """
+        now = time.monotonic()
+        groups = dict()
+        totals = {'num_agents': 0, 'num_running_agents': 0, 'num_polling_events': 0, 'num_missed_polls': 0,
+                  'max_lateness': 0.0}
+        for process_group, worker in self._workers.items():
+            report = worker['report']
+            groups[process_group] = {
+                'pid': worker['process'].pid if worker['process'] is not None else None,
+                'is_running': worker['process'] is not None and worker['process'].is_alive(),
+                'num_restarts': worker['num_restarts'],
+                'last_exitcode': worker['last_exitcode'],
+                'report_age': None if worker['report_time'] is None else now - worker['report_time'],
+                'report': report
+            }
+            if report is None:
+                continue
+            totals['num_agents'] += report['num_agents']
+            totals['num_running_agents'] += report['num_running']
+            for agent_report in report['agents'].values():
+                totals['num_polling_events'] += agent_report['num_polling_events']
+                totals['num_missed_polls'] += agent_report['num_missed_polls']
+                totals['max_lateness'] = max(totals['max_lateness'], agent_report['max_lateness'])
+        health = {
+            'num_groups': len(groups),
+            'num_running': sum(1 for group in groups.values() if group['is_running']),
+            'num_restarts': sum(group['num_restarts'] for group in groups.values())
+        }
+        health.update(totals)
+        health['groups'] = groups
+        return health
+
+    def start(self) -> None:
+        """ Starts one worker process per process group. """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        self._report_queue = self._context.Queue()
+        self._stop_event = self._context.Event()
+        cpu_affinity = self._cpu_affinity
+        if cpu_affinity == 'auto':
+            num_cpus = os.cpu_count() or 1
+            cpu_affinity = {process_group: [group_no % num_cpus]
+                            for group_no, process_group in enumerate(self.process_groups)}
+        for process_group in self.process_groups:
+            self._workers[process_group] = {
+                'process': None,
+                'cpus': None if cpu_affinity is None else cpu_affinity.get(process_group),
+                'start_time': None,
+                'restart_time': None,
+                'backoff': self.min_backoff,
+                'num_restarts': 0,
+                'last_exitcode': None,
+                'report': None,
+                'report_time': None
+            }
+            self._start_worker(process_group)
+        self._logger.info(f'{mth_name}: {len(self._workers)} worker processes started')
+
+    def supervise(self, timeout: float = 0.5) -> None:
+        """ Collects the health reports of the worker processes for up to timeout seconds, then restarts
+            crashed worker processes whose backoff delay has passed.
+
+        Parameters:
+            timeout : float, optional
+                Maximum time in seconds to wait for health reports.
+        """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        end_time = time.monotonic() + timeout
+        while True:
+            try:
+                process_group, report = self._report_queue.get(timeout = max(end_time - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if process_group in self._workers:
+                self._workers[process_group]['report'] = report
+                self._workers[process_group]['report_time'] = time.monotonic()
+        if self._stop_event.is_set():
+            return
+        now = time.monotonic()
+        for process_group, worker in self._workers.items():
+            process = worker['process']
+            if process is not None and not process.is_alive():
+                process.join()
+                worker['process'] = None
+                worker['last_exitcode'] = process.exitcode
+                if now - worker['start_time'] >= self.stable_time:
+                    worker['backoff'] = self.min_backoff
+                worker['restart_time'] = now + worker['backoff']
+                self._logger.error(f'{mth_name}: worker process of process group {process_group} terminated '
+                                   f'with exit code {process.exitcode}, restart in {worker["backoff"]:.1f} s')
+                worker['backoff'] = min(worker['backoff'] * 2, self.max_backoff)
+            if worker['process'] is None and worker['restart_time'] is not None and now >= worker['restart_time']:
+                worker['num_restarts'] += 1
+                self._start_worker(process_group)
+
+    def stop(self, timeout: float = 10.0) -> bool:
+        """ Stops all worker processes. Worker processes not terminating within the timeout are killed.
+
+        Parameters:
+            timeout : float, optional
+                Maximum time in seconds to wait for the worker processes.
+
+        Returns:
+            bool : True if all worker processes have stopped by themselves, False if at least one had to
+                   be terminated.
+        """
+        mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
+        if self._stop_event is None:
+            return True
+        self._stop_event.set()
+        end_time = time.monotonic() + timeout
+        all_stopped = True
+        for process_group, worker in self._workers.items():
+            process = worker['process']
+            if process is None:
+                continue
+            process.join(max(end_time - time.monotonic(), 0))
+            if process.is_alive():
+                self._logger.warning(f'{mth_name}: worker process of process group {process_group} terminated')
+                process.terminate()
+                process.join()
+                all_stopped = False
+            worker['last_exitcode'] = process.exitcode
+        self._report_queue.close()
+        self._report_queue.join_thread()
+        return all_stopped
+
+    def _start_worker(self, process_group: int) -> None:
+        """ Starts the worker process of a process group. """
+        worker = self._workers[process_group]
+        worker_settings = dict(self._worker_settings)
+        if worker_settings['recorder_db_path'] is not None and process_group != self.process_groups[0]:
+            worker_settings['recorder_db_path'] = None
+        process = self._context.Process(
+            target = IotSupervisor._worker_main, name = f'iot_worker_{process_group}', daemon = True,
+            args = (self._worker_target, worker['cpus'], self._sqlite_db_path, process_group, worker_settings,
+                    self._report_queue, self._stop_event))
+        process.start()
+        worker['process'] = process
+        worker['start_time'] = time.monotonic()
+        worker['restart_time'] = None
+
+    @staticmethod
+    def _worker_main(worker_target: Callable, cpus: list, *worker_args) -> None:
+        """ Entry point of the worker processes: pins the process to its CPUs, then runs the target. """
+        if cpus is not None and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        worker_target(*worker_args)
+
+    @staticmethod
+    def run_worker(sqlite_db_path: str, process_group: int, worker_settings: dict,
+                   report_queue: multiprocessing.Queue, stop_event: multiprocessing.Event) -> None:
+        """ Runs the agents of one process group until the stop event is set. Executed by the worker
+            processes.
+
+        Parameters:
+            sqlite_db_path : str
+                Path name of the SQLite database file containing the configuration settings.
+            process_group : int
+                Process group to be run.
+            worker_settings : dict
+                "host_settings" (keyword arguments of iot_host.IotHost), "recorder_db_path" and
+                "report_interval".
+            report_queue : multiprocessing.Queue
+                Queue receiving the health reports as tuple (process_group, report).
+            stop_event : multiprocessing.Event
+                Signals the worker process to stop.
+        """
+        host = iot_host.IotHost(sqlite_db_path, process_group, **worker_settings['host_settings'])
+        try:
+            host.start_agents()
+            if worker_settings['recorder_db_path'] is not None:
+                host.start_data_recording(worker_settings['recorder_db_path'])
+            while not stop_event.wait(worker_settings['report_interval']):
+                report_queue.put((process_group, host.health_report()))
+        finally:
+            host.stop_agents()
+
+    @staticmethod
+    def main(argv: list) -> int:
+        """ Command line entry point: runs and supervises the process groups of the host until SIGTERM
+            or SIGINT.
+
+        Parameters:
+            argv : list
+                Command line arguments (without the program name).
+
+        Returns:
+            int : Exit code (0: all worker processes stopped, 1: at least one worker process had to be
+                  terminated).
+        """
+        parser = argparse.ArgumentParser(description = "Runs every process group of the host in a worker process")
+        parser.add_argument("config_db", help = "configuration database")
+        parser.add_argument("--process-groups", type = int, nargs = "+", default = None,
+                            help = "process groups to be run (default: all groups assigned to the host)")
+        parser.add_argument("--recorder-db", default = None, help = "recorder database for the data topics")
+        parser.add_argument("--execution", choices = ['thread', 'pool'], default = 'thread')
+        parser.add_argument("--pool-workers", type = int, default = 4)
+        parser.add_argument("--phase-strategy", choices = ['minute', 'hash'], default = 'minute')
+        parser.add_argument("--catch-up", choices = ['skip', 'coalesce', 'backfill'], default = 'skip')
+        parser.add_argument("--pin-cpus", action = "store_true", help = "pin every worker process to one CPU")
+        parser.add_argument("--report-interval", type = float, default = 10.0)
+        parser.add_argument("--logger-config", default = None, help = "JSON file with the logging configuration")
+        args = parser.parse_args(argv)
+        if args.logger_config is not None:
+            with open(args.logger_config, "r") as config_fh:
+                logging.config.dictConfig(json.load(config_fh))
+        logger = logging.getLogger('IOT.SUPERVISOR')
+        supervisor = IotSupervisor(
+            args.config_db, logger, process_groups = args.process_groups,
+            host_settings = {'phase_strategy': args.phase_strategy, 'catch_up': args.catch_up,
+                             'execution': args.execution, 'pool_workers': args.pool_workers},
+            recorder_db_path = args.recorder_db, report_interval = args.report_interval,
+            cpu_affinity = 'auto' if args.pin_cpus else None)
+        stop_requested = []
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_requested.append(signum))
+        signal.signal(signal.SIGINT, lambda signum, frame: stop_requested.append(signum))
+        supervisor.start()
+        next_log_time = time.monotonic() + args.report_interval
+        while len(stop_requested) == 0:
+            supervisor.supervise()
+            if time.monotonic() >= next_log_time:
+                health = supervisor.health
+                logger.info(f'{health["num_running"]}/{health["num_groups"]} worker processes, '
+                            f'{health["num_running_agents"]}/{health["num_agents"]} agents running, '
+                            f'{health["num_restarts"]} restarts, {health["num_missed_polls"]} missed polls, '
+                            f'max lateness {health["max_lateness"]:.3f} s')
+                next_log_time += args.report_interval
+        return 0 if supervisor.stop() else 1
+
+if __name__ == "__main__":
+    sys.exit(IotSupervisor.main(sys.argv[1:]))
@@ -87,7 +87,7 @@ class IotSensor:
         m_res.msmt_value, m_res.msmt_unit = self.calculate_msmt_value(m_res.hw_value, m_res.hw_voltage)
         self._last_msmt_time = m_res.msmt_time
         self._last_msmt_value = m_res.msmt_value
-        self._logger.debug('{}: msmt_value = {:.2f} {}', mth_name, m_res.msmt_value, m_res.msmt_unit)
+        self._logger.debug('{}: msmt_value = {:.2f} {}'.format(mth_name, m_res.msmt_value, m_res.msmt_unit))
         return m_res
 
     def calculate_msmt_value(self, hw_value: int, hw_voltage: float = 0.0) -> tuple:
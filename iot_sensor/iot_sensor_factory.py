@@ -97,5 +97,6 @@ class IotSensorFactory:
         new_handler = iot_sensor_handler.IotSensorHandler(sensor, logger,
                                                           mqtt_data = mqtt_data,
                                                           mqtt_input = mqtt_input,
-                                                          mqtt_health = mqtt_health)
+                                                          mqtt_health = mqtt_health,
+                                                          device_channel = se_config.device_channel)
         return new_handler
@@ -18,6 +18,7 @@ import logging
 import wp_queueing
 import iot_handler_base
 import iot_msg_input
+import iot_msg_registry
 import iot_sensor_base
 
 
@@ -33,6 +34,10 @@ class IotSensorHandler(iot_handler_base.IotHandlerBase):
             Type of the sensor.
         _sensor : iot_sensor_base.IotSensor
             Reference to the controlled IOT sensor element.
+        _device_channel : int
+            Channel of the hardware device the sensor is connected to.
+        _batch_topic : str
+            Topic of the InputProbeBatch messages of the hardware device (None if not subscribed).
 
     Properties:
         sensor_id : str
@@ -48,11 +53,12 @@ class IotSensorHandler(iot_handler_base.IotHandlerBase):
         polling_timer_event : None
             Indicates that the polling timer has expired. Overloaded method from super() class.
         message : None
-            Handle an incoming message containing a hardware probe.
+            Handle an incoming message containing a hardware probe or a batch of hardware probes.
     """
+    # pylint: disable=too-many-arguments
     def __init__(self, sensor: iot_sensor_base.IotSensor, logger: logging.Logger,
                  mqtt_data: tuple, mqtt_input: tuple, mqtt_health: tuple = None,
-                 health_check_interval: int = 0):
+                 health_check_interval: int = 0, device_channel: int = None):
         """ Constructor.
 
         Parameters:
@@ -69,16 +75,27 @@ class IotSensorHandler(iot_handler_base.IotHandlerBase):
             mqtt_health : tuple, optional
                 MQTT broker information (broker session and topic) for publishing health check
                 messages.
+            health_check_interval : int, optional
+                Interval in seconds for health checking of the sensor.
+            device_channel : int, optional
+                Channel of the hardware device the sensor is connected to. If given and the input topic
+                is "<device_topic>/<device_channel>", the handler also subscribes to "<device_topic>"
+                and takes its probe from the InputProbeBatch messages published there.
         """
         mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
         self._sensor = sensor
+        self._device_channel = device_channel
+        self._batch_topic = None
         self.logger = logger
         self.logger.debug(f'{mth_name}: sensor_id="{self.element_id}", sensor_type="{self.element_type}"')
         super().__init__(1, health_check_interval if health_check_interval > 0 else 900,
                          mqtt_data = mqtt_data, mqtt_input = mqtt_input, mqtt_health = mqtt_health)
         if self.mqtt_input is not None:
-            self.mqtt_input[0].owner = self
             self.mqtt_input[0].topics = [(self.mqtt_input[1], 0)]
+            channel_suffix = f'/{device_channel}'
+            if device_channel is not None and self.mqtt_input[1].endswith(channel_suffix):
+                self._batch_topic = self.mqtt_input[1][:-len(channel_suffix)]
+                self.mqtt_input[0].topics.append((self._batch_topic, 0))
 
     @property
     def element_id(self) -> str:
@@ -100,31 +117,40 @@ class IotSensorHandler(iot_handler_base.IotHandlerBase):
             messages.
         """
         super().polling_timer_event()
-        self.mqtt_input[0].receive()
+        self.receive_messages()
 
     def message(self, msg: wp_queueing.QueueMessage) -> None:
-        """ Handle an incoming message containing a hardware probe.
+        """ Handle an incoming message containing a hardware probe or a batch of hardware probes.
 
         Parameters:
             msg : wp_queueing.QueueMessage
-                Message received from the message broker containing the digital input probe.
+                Message received from the message broker containing the digital input probe
+                (InputProbe) or the probes of all channels of the device (InputProbeBatch).
         """
         mth_name = "{}.{}()".format(self.__class__.__name__, inspect.currentframe().f_code.co_name)
         self.logger.debug(f'{mth_name}: "{str(msg)}"')
         if self.mqtt_data is None or self.mqtt_data[1] is None:
             return
-        if msg.msg_topic != self.mqtt_input[1]:
+        if msg.msg_topic == self.mqtt_input[1]:
+            expected_type = iot_msg_input.InputProbe
+        elif self._batch_topic is not None and msg.msg_topic == self._batch_topic:
+            expected_type = iot_msg_input.InputProbeBatch
+        else:
             self.logger.debug(f'{mth_name}: unexpected topic "{msg.msg_topic}"; expected "{self.mqtt_input[1]}"')
             return
-        probe = iot_msg_input.InputProbe()
         try:
-            probe.from_dict(msg.msg_payload)
+            probe = iot_msg_registry.IotMessageRegistry.decode(msg.msg_payload, expected_type)
         except TypeError as except_:
             self.logger.error(f'{mth_name}: {str(except_)}')
             return
         except ValueError as except_:
             self.logger.error(f'{mth_name}: {str(except_)}')
             return
+        if expected_type is iot_msg_input.InputProbeBatch:
+            probe = probe.probe(self._device_channel)
+            if probe is None:
+                self.logger.debug(f'{mth_name}: channel {self._device_channel} not contained in batch')
+                return
         # If the probe is too old, we discard it.
         probe_age = (datetime.now() - probe.probe_time).total_seconds()
         if probe_age > 10:
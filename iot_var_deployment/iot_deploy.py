@@ -13,6 +13,7 @@
     and limitations under the LICENSE.
 """
 import os
+import json
 import shutil
 from datetime import datetime
 import wp_repository
@@ -38,6 +39,7 @@ class IotDeployment:
         self._devices = []
         self._sensors = []
         self._process_group = None
+        self._recorder_settings = None
 
     def __enter__(self):
         """ Method that allows for using the class in "with" statements. """
@@ -65,6 +67,11 @@ class IotDeployment:
         """ Creates the recorder database from the given template. """
         shutil.copyfile(recorder_db_template, self._stat_db_path)
 
+    def recorder_settings(self, settings: dict):
+        """ Sets additional settings for the message recorders (e.g. {"partition_period": "day",
+            "partition_retention": 90}), to be written to the "msg_recorder" section of the config file. """
+        self._recorder_settings = settings
+
     def host_settings(self, host_name: str):
         """ Creates the host configuration in the configuration database. """
         host_config = [[self._target_host, host_name, self.now()]]
@@ -113,6 +120,8 @@ class IotDeployment:
                 config_fh.write(',\n\n"msg_recorder": {')
                 config_fh.write('\n  "start_recorder": 1')
                 config_fh.write(f',\n  "statistics_db_path": "{self._stat_db_name}"')
+                if self._recorder_settings is not None:
+                    config_fh.write(f',\n  "recorder_settings": {json.dumps(self._recorder_settings)}')
                 config_fh.write('\n}')
 
             config_fh.write(f',\n\n"process_group": {str(self._process_group)}')
@@ -0,0 +1,122 @@
+# pylint: disable=line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
+""" Benchmark: threads, memory and context switches of 200 simulated handlers run by one IotAgent
+    thread each (IotHost) versus asyncio tasks on one event loop with a bounded executor (IotAsyncHost).
+
+    Each handler polls once per second (phases spread by element_id) and publishes one message to a
+    simulated broker session taking 1 ms. Blocking handlers first "read" a device for 2 ms; IotAsyncHost
+    runs them in its executor. Non-blocking handlers (IotHandlerBase.blocking = False) do no I/O and run
+    inline on the event loop. Every scenario runs in a separate process, so that the memory figures do
+    not influence each other.
+
+    Usage: python bench_iot_async_host.py [--num-handlers N] [--duration SECONDS] [--max-workers N]
+"""
+import argparse
+import json
+import logging
+import resource
+import subprocess
+import sys
+import threading
+import time
+import wp_queueing
+import iot_agent
+import iot_handler_base
+import iot_async_runtime
+
+
+class SimulatedProducer:
+    def __init__(self):
+        self.num_published = 0
+        self._lock = threading.Lock()
+
+    def publish_single(self, msg):
+        time.sleep(0.001)
+        with self._lock:
+            self.num_published += 1
+
+
+class SimulatedHandler(iot_handler_base.IotHandlerBase):
+    def __init__(self, element_id: str, producer: SimulatedProducer, blocking: bool):
+        super().__init__(1, 0, mqtt_data = (producer, 'data/hw'))
+        self.element_id = element_id
+        self.blocking = blocking
+        self.num_events = 0
+        self.set_phase('hash')
+
+    def polling_timer_event(self):
+        if self.blocking:
+            time.sleep(0.002)
+        self.num_events += 1
+        self.mqtt_data[0].publish_single(wp_queueing.QueueMessage(f'{self.mqtt_data[1]}/{self.element_id}'))
+
+
+def rss_kb() -> int:
+    with open('/proc/self/status', 'r') as status_fh:
+        for line in status_fh:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_scenario(scenario: str, num_handlers: int, duration: float, max_workers: int, blocking: bool) -> dict:
+    logger = logging.getLogger("Bench.Host")
+    producer = SimulatedProducer()
+    handlers = [SimulatedHandler(f"DI.SIM.{handler_no:03d}", producer, blocking) for handler_no in range(num_handlers)]
+    runtime = None
+    rss_start = rss_kb()
+    if scenario == 'threads':
+        agents = [iot_agent.IotAgent(handler, logger) for handler in handlers]
+    else:
+        runtime = iot_async_runtime.IotAsyncRuntime(logger, max_workers)
+        agents = [runtime.create_agent(handler, logger) for handler in handlers]
+    for agent in agents:
+        agent.start()
+    time.sleep(1.0)
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    events_start = sum(handler.num_events for handler in handlers)
+    time.sleep(duration)
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+    result = {
+        'threads': threading.active_count(),
+        'rss_kb': rss_kb() - rss_start,
+        'ctx_switches': (usage_end.ru_nvcsw + usage_end.ru_nivcsw - usage_start.ru_nvcsw - usage_start.ru_nivcsw) / duration,
+        'cpu': (usage_end.ru_utime + usage_end.ru_stime - usage_start.ru_utime - usage_start.ru_stime) / duration,
+        'events': (sum(handler.num_events for handler in handlers) - events_start) / duration,
+        'max_lateness': max(handler.timing_statistics['max_lateness'] for handler in handlers)
+    }
+    for agent in agents:
+        agent.stop()
+    if runtime is not None:
+        runtime.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Thread-per-handler versus asyncio host benchmark")
+    parser.add_argument("--num-handlers", type = int, default = 200)
+    parser.add_argument("--duration", type = float, default = 10.0)
+    parser.add_argument("--max-workers", type = int, default = 4)
+    parser.add_argument("--scenario", choices = ['threads', 'async'], default = None)
+    parser.add_argument("--non-blocking", action = "store_true")
+    args = parser.parse_args()
+
+    if args.scenario is not None:
+        print(json.dumps(run_scenario(args.scenario, args.num_handlers, args.duration, args.max_workers, not args.non_blocking)))
+        return
+    for scenario, blocking, scenario_name in [
+            ('threads', True, "IotHost, blocking handlers"),
+            ('async', True, f"IotAsyncHost ({args.max_workers} workers), blocking"),
+            ('threads', False, "IotHost, non-blocking handlers"),
+            ('async', False, "IotAsyncHost, non-blocking (inline)")]:
+        output = subprocess.run([sys.executable, __file__, "--scenario", scenario, "--num-handlers", str(args.num_handlers),
+                                 "--duration", str(args.duration), "--max-workers", str(args.max_workers)]
+                                + ([] if blocking else ["--non-blocking"]),
+                                check = True, capture_output = True, text = True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{scenario_name:42s}: {result['threads']:4d} threads, {result['rss_kb'] / 1024:7.1f} MB RSS, "
+              f"{result['ctx_switches']:8.0f} ctx switches/s, {100 * result['cpu']:5.1f} % CPU, "
+              f"{result['events']:6.1f} events/s, max lateness {1000 * result['max_lateness']:6.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
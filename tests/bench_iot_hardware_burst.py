@@ -0,0 +1,88 @@
+# pylint: disable=line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
+""" Benchmark: sampling throughput and payload size of the burst mode, using a simulated ADS1115.
+
+    Compares reading the channels into one InputProbe object per sample (what polling does once per
+    interval) with the IotBurstSampler writing into its preallocated buffers, both as fast as the
+    simulated chip returns values. A paced run at the chip's data rate shows the achieved rate and the
+    CPU time of the process (the main thread sleeps meanwhile). Finally the payload of the paced run is
+    compared: one InputProbe message per sample versus one InputBurst message with and without raw
+    samples.
+
+    Usage: python bench_iot_hardware_burst.py [--duration SECONDS] [--data-rate N] [--channels N]
+"""
+import argparse
+import json
+import logging
+import math
+import time
+from datetime import datetime
+import iot_msg_input
+import iot_hardware_burst
+
+
+class SimulatedADS1115:
+    """ Analog signal of a pump motor: 50 Hz mains ripple on an offset, with a start current transient. """
+    def __init__(self):
+        self.num_reads = 0
+        self._start_ns = time.monotonic_ns()
+
+    def read(self, channel_no: int) -> int:
+        self.num_reads += 1
+        elapsed = (time.monotonic_ns() - self._start_ns) / 1e9
+        transient = 12000 * math.exp(-4 * (elapsed % 1.0))
+        return int(8000 + 1000 * channel_no + 1500 * math.sin(2 * math.pi * 50 * elapsed) + transient)
+
+
+def bench_probe_objects(duration: float, channel_nos: list) -> tuple:
+    device = SimulatedADS1115()
+    probes = []
+    end_ns = time.monotonic_ns() + int(duration * 1e9)
+    while time.monotonic_ns() < end_ns:
+        probe_time = datetime.now()
+        for channel_no in channel_nos:
+            value = device.read(channel_no)
+            probes.append(iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", probe_time, channel_no, value, value * 0.000125))
+    return len(probes) / duration, probes
+
+
+def bench_sampler(duration: float, channel_nos: list, data_rate: int) -> tuple:
+    device = SimulatedADS1115()
+    sampler = iot_hardware_burst.IotBurstSampler(device.read, channel_nos, logging.getLogger("Bench.Burst"),
+                                                 data_rate = data_rate, buffer_time = duration * 2)
+    sampler.start()
+    time.sleep(duration)
+    sampler.stop()
+    num_samples = sampler.statistics['num_samples_total']
+    start_time, end_time, columns, _ = sampler.drain()
+    return num_samples / duration, (start_time, end_time, columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Burst sampling benchmark")
+    parser.add_argument("--duration", type = float, default = 3.0)
+    parser.add_argument("--data-rate", type = int, default = 860)
+    parser.add_argument("--channels", type = int, default = 1)
+    args = parser.parse_args()
+    channel_nos = list(range(args.channels))
+
+    samples_per_sec, probes = bench_probe_objects(args.duration, channel_nos)
+    print(f"{'InputProbe object per sample, unpaced':45s}: {samples_per_sec:12.0f} samples/s")
+    samples_per_sec, _ = bench_sampler(args.duration, channel_nos, 0)
+    print(f"{'IotBurstSampler, unpaced':45s}: {samples_per_sec:12.0f} samples/s")
+    cpu_start = time.process_time()
+    samples_per_sec, (start_time, end_time, columns) = bench_sampler(args.duration, channel_nos, args.data_rate)
+    cpu_share = (time.process_time() - cpu_start) / args.duration
+    print(f"{f'IotBurstSampler, paced at {args.data_rate}/s':45s}: {samples_per_sec:12.0f} samples/s, {100 * cpu_share:5.1f} % CPU")
+
+    num_samples = sum(len(column) for column in columns)
+    probe_bytes = sum(len(json.dumps(probe.to_dict())) for probe in probes[:num_samples])
+    print(f"{f'payload of {num_samples} samples as InputProbe messages':45s}: {probe_bytes:12d} bytes")
+    for raw_samples in [False, True]:
+        burst = iot_msg_input.InputBurst.from_samples("ADS1115", "DI.ADS1115.01", start_time, end_time, args.data_rate,
+                                                      channel_nos, columns, 0, raw_samples)
+        scenario_name = f"InputBurst{' with raw samples' if raw_samples else ''}"
+        print(f"{scenario_name:45s}: {len(json.dumps(burst.to_dict())):12d} bytes")
+
+
+if __name__ == '__main__':
+    main()
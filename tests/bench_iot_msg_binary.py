@@ -0,0 +1,60 @@
+# pylint: disable=line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
+""" Benchmark: payload size and encode/decode throughput of the JSON wire format versus the binary codec.
+
+    The JSON path is to_dict() + json.dumps() on the sending side and json.loads() + registry decode on the
+    receiving side; the binary path is IotBinaryCodec.encode() and IotMessageRegistry.decode() of the bytes.
+
+    Usage: python bench_iot_msg_binary.py [--num-msgs N]
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+import iot_msg_binary
+import iot_msg_input
+import iot_msg_sensor
+import iot_msg_registry
+
+
+def create_messages() -> list:
+    msmt = iot_msg_sensor.SensorMsmt("S.KYES516.01", "KYES516", datetime.now())
+    msmt.hw_value = 12345
+    msmt.hw_voltage = 1.23
+    msmt.msmt_unit = "pct"
+    msmt.msmt_value = 45.6
+    health = iot_msg_input.InputHealth("ADS1115", "DI.ADS1115.01", 0)
+    health.last_probe_time = datetime.now()
+    health.num_probe_total = 100
+    health.num_probe_detail = [25, 25, 25, 25]
+    probes = [iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime.now(), channel_no, 12345, 1.23) for channel_no in range(4)]
+    return [("InputProbe", probes[0]), ("InputProbeBatch (4 channels)", iot_msg_input.InputProbeBatch.from_probes(probes)),
+            ("SensorMsmt", msmt), ("InputHealth", health)]
+
+
+def bench(function, arguments: list) -> float:
+    start_time = time.perf_counter()
+    for argument in arguments:
+        function(argument)
+    return len(arguments) / (time.perf_counter() - start_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "JSON versus binary wire format benchmark")
+    parser.add_argument("--num-msgs", type = int, default = 50000)
+    args = parser.parse_args()
+
+    decode = iot_msg_registry.IotMessageRegistry.decode
+    print(f"{'message':30s} {'JSON bytes':>10s} {'bin bytes':>10s} {'JSON enc/s':>12s} {'bin enc/s':>12s} {'JSON dec/s':>12s} {'bin dec/s':>12s}")
+    for msg_name, message in create_messages():
+        json_payload = json.dumps(message.to_dict()).encode('utf-8')
+        bin_payload = iot_msg_binary.IotBinaryCodec.encode(message)
+        messages = [message] * args.num_msgs
+        json_enc = bench(lambda msg: json.dumps(msg.to_dict()).encode('utf-8'), messages)
+        bin_enc = bench(iot_msg_binary.IotBinaryCodec.encode, messages)
+        json_dec = bench(lambda payload: decode(json.loads(payload)), [json_payload] * args.num_msgs)
+        bin_dec = bench(decode, [bin_payload] * args.num_msgs)
+        print(f"{msg_name:30s} {len(json_payload):10d} {len(bin_payload):10d} {json_enc:12.1f} {bin_enc:12.1f} {json_dec:12.1f} {bin_dec:12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# pylint: disable=line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
+""" Benchmark: decoding a list of payload dictionaries or JSON lines one message at a time
+    (IotMessageRegistry.decode) versus the vectorized IotBulkDecoder.
+
+    Usage: python bench_iot_msg_bulk.py [--num-msgs N]
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+import iot_msg_bulk
+import iot_msg_input
+import iot_msg_registry
+import iot_msg_sensor
+
+
+def create_payloads(num_msgs: int) -> dict:
+    start_time = datetime(2021, 7, 12, 10, 0, 0)
+    probes = [iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", start_time + timedelta(milliseconds = msg_no * 250),
+                                       msg_no % 4, 10000 + msg_no % 5000, 1.23).to_dict() for msg_no in range(num_msgs)]
+    msmts = []
+    for msg_no in range(num_msgs):
+        msmt = iot_msg_sensor.SensorMsmt("S.KYES516.01", "KYES516", start_time + timedelta(seconds = msg_no))
+        msmt.hw_value = 12345
+        msmt.msmt_unit = "pct"
+        msmt.msmt_value = 45.6
+        msmts.append(msmt.to_dict())
+    return {'InputProbe': probes, 'SensorMsmt': msmts}
+
+
+def bench_per_message(payloads: list) -> float:
+    start_time = time.perf_counter()
+    for payload in payloads:
+        iot_msg_registry.IotMessageRegistry.decode(payload)
+    return time.perf_counter() - start_time
+
+
+def bench_bulk(payloads: list, class_name: str) -> float:
+    start_time = time.perf_counter()
+    iot_msg_bulk.IotBulkDecoder.decode(payloads, class_name)
+    return time.perf_counter() - start_time
+
+
+def bench_json_lines_per_message(lines: list) -> float:
+    start_time = time.perf_counter()
+    for line in lines:
+        iot_msg_registry.IotMessageRegistry.decode(json.loads(line))
+    return time.perf_counter() - start_time
+
+
+def bench_json_lines_bulk(lines: list, class_name: str) -> float:
+    start_time = time.perf_counter()
+    iot_msg_bulk.IotBulkDecoder.decode_json_lines(lines, class_name)
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Bulk decoding benchmark")
+    parser.add_argument("--num-msgs", type = int, default = 50000)
+    args = parser.parse_args()
+
+    for class_name, payloads in create_payloads(args.num_msgs).items():
+        lines = [json.dumps(payload) for payload in payloads]
+        scenarios = [
+            ("dicts, per message", lambda: bench_per_message(payloads)),
+            ("dicts, IotBulkDecoder", lambda: bench_bulk(payloads, class_name)),
+            ("JSON lines, per message", lambda: bench_json_lines_per_message(lines)),
+            ("JSON lines, IotBulkDecoder", lambda: bench_json_lines_bulk(lines, class_name))]
+        for scenario_name, scenario in scenarios:
+            elapsed = min(scenario() for _ in range(3))
+            print(f"{class_name:12s} {scenario_name:28s}: {elapsed * 1000000 / args.num_msgs:6.2f} us/msg")
+
+
+if __name__ == '__main__':
+    main()
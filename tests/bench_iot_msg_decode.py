@@ -0,0 +1,76 @@
+# pylint: disable=line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
+""" Benchmark: decode throughput (messages per second) for a mixed stream of message payloads.
+
+    Compares the former if/elif chain on msg_payload['class'] with the dictionary lookup of the
+    IotMessageRegistry. The stream contains InputProbe, InputHealth and SensorMsmt payloads and
+    payloads of an unregistered class (recorded as generic messages).
+
+    Usage: python bench_iot_msg_decode.py [--num-msgs N]
+"""
+import argparse
+import time
+from datetime import datetime
+import iot_msg_input
+import iot_msg_sensor
+import iot_msg_registry
+import iot_stat_msg
+
+
+def create_payloads(num_msgs: int) -> list:
+    health = iot_msg_input.InputHealth("ADS1115", "DI.ADS1115.01", 0)
+    health.last_probe_time = datetime.now()
+    health.num_probe_total = 100
+    msmt = iot_msg_sensor.SensorMsmt("S.KYES516.01", "KYES516")
+    msmt.msmt_unit = "pct"
+    templates = [
+        iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime.now(), 0, 12345, 1.23).to_dict(),
+        iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime.now(), 1, 23456, 2.34).to_dict(),
+        msmt.to_dict(),
+        health.to_dict(),
+        {'class': 'Custom', 'value': 42}]
+    return [dict(templates[msg_no % len(templates)]) for msg_no in range(num_msgs)]
+
+
+def decode_if_chain(msg_payload: dict) -> object:
+    if 'class' in msg_payload:
+        if msg_payload['class'] == 'InputProbe':
+            conv_msg = iot_msg_input.InputProbe()
+            conv_msg.from_dict(msg_payload)
+            return iot_stat_msg.IotRecorderInputProbe("msg_id", conv_msg)
+        if msg_payload['class'] == 'InputHealth':
+            conv_msg = iot_msg_input.InputHealth()
+            conv_msg.from_dict(msg_payload)
+            return iot_stat_msg.IotRecorderInputHealth("msg_id", conv_msg)
+        if msg_payload['class'] == 'SensorMsmt':
+            conv_msg = iot_msg_sensor.SensorMsmt()
+            conv_msg.from_dict(msg_payload)
+            return iot_stat_msg.IotRecorderSensorMsg("msg_id", conv_msg)
+    return iot_stat_msg.IotRecorderGenericMsg("msg_id", msg_payload)
+
+
+def decode_registry(msg_payload: dict) -> object:
+    rec_type = iot_msg_registry.IotMessageRegistry.recorder_type(msg_payload.get('class'))
+    if rec_type is None:
+        return iot_stat_msg.IotRecorderGenericMsg("msg_id", msg_payload)
+    return rec_type("msg_id", iot_msg_registry.IotMessageRegistry.decode(msg_payload))
+
+
+def bench(decode, payloads: list) -> float:
+    start_time = time.perf_counter()
+    for msg_payload in payloads:
+        decode(msg_payload)
+    return len(payloads) / (time.perf_counter() - start_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Message decode throughput benchmark")
+    parser.add_argument("--num-msgs", type = int, default = 50000)
+    args = parser.parse_args()
+
+    payloads = create_payloads(args.num_msgs)
+    for scenario_name, decode in [("if/elif chain", decode_if_chain), ("IotMessageRegistry", decode_registry)]:
+        print(f"{scenario_name:25s}: {bench(decode, payloads):10.1f} msgs/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# pylint: disable=line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
+""" Benchmark: memory per message object (bytes per object, measured with tracemalloc).
+
+    For every message and recorder row class, N instances are created with __slots__ (the current
+    classes) and N dict-backed objects with the same attributes (the former layout). The attribute
+    values are shared between all instances, so only the per-object overhead is measured.
+
+    Usage: python bench_iot_msg_memory.py [--num-objs N]
+"""
+import argparse
+import tracemalloc
+from datetime import datetime
+import iot_msg_input
+import iot_msg_sensor
+import iot_msg_actor
+import iot_msg_output
+import iot_stat_msg
+
+
+class DictBacked:
+    pass
+
+
+def sample_objects() -> list:
+    probe = iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime.now(), 0, 12345, 1.23)
+    health = iot_msg_input.InputHealth("ADS1115", "DI.ADS1115.01", 0)
+    health.last_probe_time = datetime.now()
+    msmt = iot_msg_sensor.SensorMsmt("S.KYES516.01", "KYES516")
+    msmt.msmt_unit = "pct"
+    cmd = iot_msg_actor.ActorCommand("S.KYES516.01", "KYES516", datetime.now(), "ON", 10)
+    output = iot_msg_output.OutputData("A.RELAIS.01", "Relais", "0", datetime.now(), "ON")
+    msg_base = iot_stat_msg.IotRecorderMsg()
+    return [probe, health, msmt, cmd, output, msg_base,
+            iot_stat_msg.IotRecorderInputProbe("msg_id", probe),
+            iot_stat_msg.IotRecorderInputHealth("msg_id", health),
+            iot_stat_msg.IotRecorderSensorMsg("msg_id", msmt),
+            iot_stat_msg.IotRecorderGenericMsg("msg_id", {'class': 'Custom'})]
+
+
+def attribute_values(obj: object) -> dict:
+    values = dict()
+    for cls in type(obj).__mro__:
+        for attr in getattr(cls, '__slots__', ()):
+            if hasattr(obj, attr):
+                values[attr] = getattr(obj, attr)
+    return values
+
+
+def measure(create, num_objs: int) -> float:
+    tracemalloc.start()
+    start_size, _ = tracemalloc.get_traced_memory()
+    objs = [create() for _ in range(num_objs)]
+    end_size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objs
+    return (end_size - start_size) / num_objs
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Message object memory benchmark")
+    parser.add_argument("--num-objs", type = int, default = 100000)
+    args = parser.parse_args()
+
+    for sample in sample_objects():
+        values = attribute_values(sample)
+        slotted_type = type(sample)
+
+        def create_slotted():
+            obj = slotted_type.__new__(slotted_type)
+            for attr, value in values.items():
+                setattr(obj, attr, value)
+            return obj
+
+        def create_dict_backed():
+            obj = DictBacked()
+            for attr, value in values.items():
+                setattr(obj, attr, value)
+            return obj
+
+        slotted = measure(create_slotted, args.num_objs)
+        dict_backed = measure(create_dict_backed, args.num_objs)
+        print(f"{slotted_type.__name__:25s}: __slots__ {slotted:7.1f} bytes/obj, dict-backed {dict_backed:7.1f} bytes/obj")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# pylint: disable=line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
+""" Benchmark: recorder write throughput (messages per second) on a local temporary database.
+
+    Compares the former open-per-message path (two wp_repository.SQLiteRepository contexts per message)
+    with the IotRecorderWriter using one long-lived WAL connection, unbatched and batched.
+
+    Usage: python bench_iot_recorder.py [--num-msgs N]
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime
+import wp_repository
+import iot_msg_input
+import iot_stat_msg
+import iot_rec_writer
+
+DB_TEMPLATE = "../iot_recorder/iot_rec.sl3"
+
+
+def create_rows(num_msgs: int) -> list:
+    rows = []
+    for msg_no in range(num_msgs):
+        msg_base = iot_stat_msg.IotRecorderMsg()
+        msg_base.msg_id = str(uuid.uuid4())
+        msg_base.msg_topic = f"data/device/DI.ADS1115.01/{msg_no % 4}"
+        msg_base.msg_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+        msg_base.msg_class = "InputProbe"
+        probe = iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime.now(), msg_no % 4, 10000 + msg_no % 5000, 1.1)
+        rows.append((msg_base, iot_stat_msg.IotRecorderInputProbe(msg_base.msg_id, probe)))
+    return rows
+
+
+def bench_open_per_message(db_path: str, rows: list) -> float:
+    start_time = time.perf_counter()
+    for msg_base, rec_msg in rows:
+        with wp_repository.SQLiteRepository(iot_stat_msg.IotRecorderMsg, db_path) as repository:
+            repository.insert(msg_base)
+        with wp_repository.SQLiteRepository(type(rec_msg), db_path) as repository:
+            repository.insert(rec_msg)
+    return len(rows) / (time.perf_counter() - start_time)
+
+
+def bench_writer(db_path: str, rows: list, batch_size: int, synchronous: str) -> float:
+    logger = logging.getLogger("Bench.Recorder")
+    start_time = time.perf_counter()
+    writer = iot_rec_writer.IotRecorderWriter(db_path, logger, batch_size, synchronous = synchronous)
+    for msg_base, rec_msg in rows:
+        writer.add(msg_base)
+        writer.add(rec_msg)
+        if batch_size == 0:
+            writer.flush()
+    writer.close()
+    return len(rows) / (time.perf_counter() - start_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Recorder write throughput benchmark")
+    parser.add_argument("--num-msgs", type = int, default = 2000)
+    args = parser.parse_args()
+
+    rows = create_rows(args.num_msgs)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        scenarios = [
+            ("open per message (wp_repository)", lambda db_path: bench_open_per_message(db_path, rows)),
+            ("persistent WAL, unbatched, synchronous=FULL", lambda db_path: bench_writer(db_path, rows, 0, "FULL")),
+            ("persistent WAL, unbatched, synchronous=NORMAL", lambda db_path: bench_writer(db_path, rows, 0, "NORMAL")),
+            ("persistent WAL, batch_size=200, synchronous=NORMAL", lambda db_path: bench_writer(db_path, rows, 200, "NORMAL"))]
+        for scenario_no, (scenario_name, scenario) in enumerate(scenarios):
+            db_path = os.path.join(tmp_dir, f"iot_rec_bench_{scenario_no}.sl3")
+            shutil.copyfile(DB_TEMPLATE, db_path)
+            msgs_per_sec = scenario(db_path)
+            print(f"{scenario_name:55s}: {msgs_per_sec:10.1f} msgs/s")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors = True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# pylint: disable=line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
+""" Benchmark: recorder ingest cost per message (decoding, buffering and writing to a temporary database).
+
+    Compares the decoding path (registry decode into InputProbe/SensorMsmt/InputHealth objects, recorder
+    row objects, writer.add) with the payload view path (IotMessageView mapping the payload members to
+    the row columns, writer.add_values), for the dictionary payloads received from the MQTT broker.
+
+    Usage: python bench_iot_recorder_ingest.py [--num-msgs N]
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+import wp_queueing
+import iot_msg_input
+import iot_msg_sensor
+import iot_msg_registry
+import iot_msg_view
+import iot_stat_msg
+import iot_rec_writer
+
+DB_TEMPLATE = "../iot_recorder/iot_rec.sl3"
+
+
+def create_messages(num_msgs: int) -> list:
+    msmt = iot_msg_sensor.SensorMsmt("S.KYES516.01", "KYES516")
+    msmt.msmt_unit = "pct"
+    msmt.msmt_value = 45.6
+    health = iot_msg_input.InputHealth("ADS1115", "DI.ADS1115.01", 0)
+    health.last_probe_time = datetime.now()
+    templates = [iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime.now(), 0, 12345, 1.23).to_dict(),
+                 iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime.now(), 1, 23456, 2.34).to_dict(),
+                 msmt.to_dict(), health.to_dict()]
+    messages = []
+    for msg_no in range(num_msgs):
+        msg = wp_queueing.QueueMessage("data/device/DI.ADS1115.01")
+        msg.msg_payload = dict(templates[msg_no % len(templates)])
+        messages.append(msg)
+    return messages
+
+
+def ingest_decode(writer: iot_rec_writer.IotRecorderWriter, msg: wp_queueing.QueueMessage) -> None:
+    msg_base = iot_stat_msg.IotRecorderMsg(msg)
+    msg_base.msg_class = msg.msg_payload['class']
+    rec_type = iot_msg_registry.IotMessageRegistry.recorder_type(msg_base.msg_class)
+    writer.add(msg_base)
+    writer.add(rec_type(msg_base.msg_id, iot_msg_registry.IotMessageRegistry.decode(msg.msg_payload)))
+
+
+def ingest_view(writer: iot_rec_writer.IotRecorderWriter, msg: wp_queueing.QueueMessage) -> None:
+    msg_view = iot_msg_view.IotMessageView(msg.msg_payload)
+    rec_type = iot_msg_registry.IotMessageRegistry.recorder_type(msg_view.msg_class)
+    row = msg_view.row(rec_type.payload_columns)
+    store_date = datetime.now()
+    writer.add_values('iot_recorder_msg', (msg.msg_id, msg.msg_topic, msg.msg_timestamp, msg_view.msg_class, store_date))
+    writer.add_values(iot_rec_writer.RECORDER_TABLES[rec_type], (msg.msg_id,) + row + (store_date,))
+
+
+def bench(ingest, messages: list, db_path: str) -> tuple:
+    writer = iot_rec_writer.IotRecorderWriter(db_path, logging.getLogger("Bench.Recorder"), batch_size = 0)
+    start_time = time.perf_counter()
+    for msg in messages:
+        ingest(writer, msg)
+    ingest_time = time.perf_counter() - start_time
+    writer.close()
+    total_time = time.perf_counter() - start_time
+    return ingest_time / len(messages) * 1e6, total_time / len(messages) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Recorder ingest cost benchmark")
+    parser.add_argument("--num-msgs", type = int, default = 50000)
+    args = parser.parse_args()
+
+    messages = create_messages(args.num_msgs)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for scenario_no, (scenario_name, ingest) in enumerate([("decode into message objects", ingest_decode), ("payload view", ingest_view)]):
+            db_path = os.path.join(tmp_dir, f"iot_rec_bench_{scenario_no}.sl3")
+            shutil.copyfile(DB_TEMPLATE, db_path)
+            ingest_us, total_us = bench(ingest, messages, db_path)
+            print(f"{scenario_name:30s}: ingest {ingest_us:8.2f} us/msg, including write {total_us:8.2f} us/msg")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors = True)
+
+
+if __name__ == '__main__':
+    main()
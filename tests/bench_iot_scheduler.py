@@ -0,0 +1,87 @@
+# pylint: disable=line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
+""" Benchmark: thread wakeups per minute of one IotAgent thread per handler versus the central
+    IotScheduler, for handlers with polling intervals between 5 and 60 seconds.
+
+    An IotAgent thread wakes up once per due event of its handler (at least once per
+    IotAgent.max_wait_time); the scheduler wakes up its dispatcher thread and one worker thread per due
+    event.
+
+    Usage: python bench_iot_scheduler.py [--num-handlers N] [--duration SECONDS]
+"""
+import argparse
+import logging
+import random
+import threading
+import time
+import iot_agent
+import iot_handler_base
+import iot_scheduler
+
+
+class BenchHandler(iot_handler_base.IotHandlerBase):
+    def __init__(self, element_id: str, polling_interval: float):
+        super().__init__(polling_interval, 0)
+        self.element_id = element_id
+        self.num_ticks = 0
+        self.num_events = 0
+        self._lock = threading.Lock()
+
+    def init_time(self, now = None) -> None:
+        super().init_time(now)
+        # first event within the first interval instead of at the next full minute
+        self._next_polling_ns = self._clock() + random.randrange(self._polling_interval_ns)
+
+    def time_tick(self) -> None:
+        with self._lock:
+            self.num_ticks += 1
+        super().time_tick()
+
+    def polling_timer_event(self):
+        with self._lock:
+            self.num_events += 1
+
+
+def create_handlers(num_handlers: int) -> list:
+    random.seed(4711)
+    return [BenchHandler(f"H.{handler_no:03d}", random.choice([5, 10, 30, 60])) for handler_no in range(num_handlers)]
+
+
+def bench_agent_threads(num_handlers: int, duration: float) -> tuple:
+    handlers = create_handlers(num_handlers)
+    logger = logging.getLogger("Bench.Agent")
+    agents = [iot_agent.IotAgent(handler, logger) for handler in handlers]
+    for agent in agents:
+        agent.start()
+    time.sleep(duration)
+    for agent in agents:
+        agent.stop()
+    num_wakeups = sum(handler.num_ticks for handler in handlers)
+    return num_wakeups * 60 / duration, sum(handler.num_events for handler in handlers)
+
+
+def bench_scheduler(num_handlers: int, duration: float) -> tuple:
+    handlers = create_handlers(num_handlers)
+    scheduler = iot_scheduler.IotScheduler(logging.getLogger("Bench.Scheduler"), max_workers = 2)
+    for handler in handlers:
+        scheduler.add(handler)
+    scheduler.start()
+    time.sleep(duration)
+    stats = scheduler.statistics
+    scheduler.stop()
+    return stats['wakeups_per_minute'], sum(handler.num_events for handler in handlers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Scheduler wakeup benchmark")
+    parser.add_argument("--num-handlers", type = int, default = 30)
+    parser.add_argument("--duration", type = float, default = 30.0)
+    args = parser.parse_args()
+
+    for scenario_name, scenario in [("one IotAgent thread per handler", bench_agent_threads),
+                                    ("IotScheduler (2 workers)", bench_scheduler)]:
+        wakeups_per_minute, num_events = scenario(args.num_handlers, args.duration)
+        print(f"{scenario_name:35s}: {wakeups_per_minute:10.1f} wakeups/min, {num_events:6d} polling events")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# pylint: disable=line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
+""" Benchmark: per-message cost of decoding points in time.
+
+    Compares datetime.strptime() (as formerly used by all from_dict() methods) with the IotTimeCodec,
+    for a single point in time and for complete InputProbe.from_dict() calls. The epoch wire format
+    is measured as well.
+
+    Usage: python bench_iot_time_codec.py [--num-msgs N]
+"""
+import argparse
+import time
+from datetime import datetime
+import iot_msg_input
+import iot_time_codec
+
+
+def parse_strptime(value: str) -> datetime:
+    if value.find('.') < 0:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S.%f")
+
+
+def from_dict_strptime(msg_dict: dict) -> iot_msg_input.InputProbe:
+    probe = iot_msg_input.InputProbe()
+    probe.device_id = msg_dict['device_id']
+    probe.device_type = msg_dict['device_type']
+    probe.probe_time = parse_strptime(msg_dict['probe_time'])
+    probe.channel_no = msg_dict['channel_no']
+    probe.value = msg_dict['value']
+    probe.voltage = msg_dict['voltage']
+    return probe
+
+
+def from_dict_codec(msg_dict: dict) -> iot_msg_input.InputProbe:
+    probe = iot_msg_input.InputProbe()
+    probe.from_dict(msg_dict)
+    return probe
+
+
+def bench_us(func, values: list) -> float:
+    start_time = time.perf_counter()
+    for value in values:
+        func(value)
+    return (time.perf_counter() - start_time) * 1000000.0 / len(values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Timestamp decode benchmark")
+    parser.add_argument("--num-msgs", type = int, default = 100000)
+    args = parser.parse_args()
+
+    time_strs = [datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f") for _ in range(args.num_msgs)]
+    probe = iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime.now(), 0, 12345, 1.23)
+    str_dicts = [probe.to_dict() for _ in range(args.num_msgs)]
+    iot_time_codec.IotTimeCodec.set_wire_format("epoch")
+    epoch_dicts = [probe.to_dict() for _ in range(args.num_msgs)]
+    iot_time_codec.IotTimeCodec.set_wire_format("str")
+    scenarios = [
+        ("parse: strptime", parse_strptime, time_strs),
+        ("parse: IotTimeCodec", iot_time_codec.IotTimeCodec.parse, time_strs),
+        ("InputProbe.from_dict: strptime", from_dict_strptime, str_dicts),
+        ("InputProbe.from_dict: IotTimeCodec (str)", from_dict_codec, str_dicts),
+        ("InputProbe.from_dict: IotTimeCodec (epoch)", from_dict_codec, epoch_dicts)]
+    for scenario_name, func, values in scenarios:
+        print(f"{scenario_name:45s}: {bench_us(func, values):8.3f} us/msg")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,14 +3,24 @@
 import unittest
 import logging
 import logging.config
+import threading
 from datetime import datetime
 import time
+import os
+import sys
+import tempfile
 import iot_repository_broker
 import iot_repository_hardware
 import iot_hardware_factory
 import iot_hardware_input
 import iot_hardware_handler
 import iot_agent
+import iot_handler_base
+import iot_scheduler
+import iot_agent_pool
+import iot_async_runtime
+import iot_supervisor
+import wp_queueing
 
 LOGGER_CONFIG = {
         "version": 1,
@@ -77,6 +87,450 @@ class TestIotAgent(unittest.TestCase):
         time.sleep(3)
         self.assertFalse(agent.is_running)
 
+class SimulatedClock:
+    def __init__(self):
+        self.now_ns = 1000000000
+
+    def __call__(self) -> int:
+        return self.now_ns
+
+
+class EventRecorder(iot_handler_base.IotHandlerBase):
+    def __init__(self, polling_interval: float, health_check_interval: float, clock: SimulatedClock):
+        super().__init__(polling_interval, health_check_interval, clock = clock)
+        self.polling_times = []
+        self.health_times = []
+        self.event_infos = []
+        self.event_duration_ns = 0
+
+    def polling_timer_event(self):
+        super().polling_timer_event()
+        self.polling_times.append(self._clock())
+        self.event_infos.append((self.event_lateness, self.coalesced_events))
+        self._clock.now_ns += self.event_duration_ns
+
+    def health_timer_event(self):
+        super().health_timer_event()
+        self.health_times.append(self._clock())
+
+
+class TestIotHandlerBase(unittest.TestCase):
+    def test_01_zero_drift(self):
+        clock = SimulatedClock()
+        handler = EventRecorder(30, 900, clock)
+        handler.init_time(datetime(2021, 7, 12, 10, 0, 0))
+        start_ns = clock.now_ns
+        for _ in range(24 * 3600):
+            clock.now_ns += 1000000000
+            handler.time_tick()
+        first_ns = start_ns + 60 * 1000000000
+        self.assertEqual(handler.polling_times, [first_ns + event_no * 30 * 1000000000 for event_no in range(2879)])
+        self.assertEqual(len(handler.health_times), 96)
+        stats = handler.timing_statistics
+        self.assertEqual((stats['drift'], stats['max_lateness'], stats['num_missed_polls']), (0.0, 0.0, 0))
+
+    def test_02_jittered_ticks(self):
+        clock = SimulatedClock()
+        handler = EventRecorder(30, 0, clock)
+        handler.init_time(datetime(2021, 7, 12, 10, 0, 30, 500000))
+        start_ns = clock.now_ns
+        while clock.now_ns - start_ns < 24 * 3600 * 1000000000:
+            clock.now_ns += 1000300000
+            handler.time_tick()
+        stats = handler.timing_statistics
+        # a tick 0.3 ms longer than one second would add 26 s of drift per day if the remainders were lost
+        self.assertEqual(stats['num_polling_events'], (clock.now_ns - start_ns - 29500000000) // 30000000000 + 1)
+        self.assertLess(abs(stats['drift']), 1.0003)
+        self.assertLess(stats['max_lateness'], 1.0003)
+        self.assertEqual(handler.health_times, [])
+        handler = EventRecorder(0.25, 0, clock)
+        handler.init_time(datetime(2021, 7, 12, 10, 0, 59, 950000))
+        for _ in range(600):
+            clock.now_ns += 100000000
+            handler.time_tick()
+        self.assertEqual(len(handler.polling_times), 240)
+        self.assertEqual(handler.timing_statistics['num_missed_polls'], 0)
+
+    def test_04_phase_spread(self):
+        clock = SimulatedClock()
+        now = datetime(2021, 7, 12, 10, 0, 0, 500000)
+        handlers = [PhasedHandler(f'DI.ADS1115.{device_no:03d}', clock) for device_no in range(120)]
+        for handler in handlers:
+            handler.init_time(now)
+        self.assertEqual(iot_scheduler.IotScheduler.distribution(handlers, 60)[59], 120)
+        for handler in handlers:
+            handler.set_phase('hash')
+            handler.init_time(now)
+        load = iot_scheduler.IotScheduler.distribution(handlers, 60)
+        self.assertEqual(sum(load), 120)
+        self.assertLessEqual(max(load), 8)
+        self.assertGreaterEqual(len([count for count in load if count > 0]), 40)
+        handlers[0].set_phase('offset', 12.25)
+        handlers[0].init_time(now)
+        self.assertEqual(handlers[0].scheduled_events(60), [11.75])
+        with self.assertRaises(ValueError):
+            handlers[0].set_phase('offset')
+
+
+    def test_05_catch_up(self):
+        results = {}
+        for catch_up in ['skip', 'coalesce', 'backfill']:
+            clock = SimulatedClock()
+            handler = EventRecorder(10, 0, clock)
+            handler.set_catch_up(catch_up, max_backfill = 2)
+            handler.init_time(datetime(2021, 7, 12, 10, 0, 50))
+            clock.now_ns += 10 * 1000000000
+            handler.event_duration_ns = 35 * 1000000000
+            handler.time_tick()
+            handler.event_duration_ns = 2000000
+            handler.time_tick()
+            results[catch_up] = (handler.event_infos[1:], handler.timing_statistics)
+        self.assertEqual(results['skip'][0], [(5.0, 1)])
+        self.assertEqual(results['coalesce'][0], [(25.0, 3)])
+        self.assertEqual(results['backfill'][0], [(15.0, 1), (5.0, 1)])
+        counts = [(stats['num_missed_polls'], stats['num_coalesced'], stats['num_backfilled'], stats['num_polling_events'])
+                  for _, stats in results.values()]
+        self.assertEqual(counts, [(2, 0, 0, 2), (0, 2, 0, 2), (1, 0, 1, 3)])
+        # lateness is measured from the oldest missed deadline, whatever the policy
+        self.assertEqual([(stats['last_lateness'], stats['max_lateness']) for _, stats in results.values()],
+                         [(25.0, 25.0)] * 3)
+        stats = results['backfill'][1]
+        self.assertEqual((stats['mean_lateness'], stats['max_duration']), (12.5, 35.0))
+        self.assertEqual(stats['duration_histogram'], [0, 2, 0, 0, 0, 1])
+        with self.assertRaises(ValueError):
+            handler.set_catch_up('replay')
+
+
+class PhasedHandler(EventRecorder):
+    def __init__(self, element_id: str, clock: SimulatedClock):
+        super().__init__(60, 0, clock)
+        self._element_id = element_id
+
+    @property
+    def element_id(self) -> str:
+        return self._element_id
+
+
+class BusyHandler(iot_handler_base.IotHandlerBase):
+    def __init__(self, polling_interval: float, busy_time: float):
+        super().__init__(polling_interval, 0)
+        self.busy_time = busy_time
+        self.num_events = 0
+        self.num_active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def init_time(self, now: datetime = None) -> None:
+        super().init_time(now)
+        self._next_polling_ns = self._clock()
+
+    def polling_timer_event(self):
+        with self._lock:
+            self.num_active += 1
+            self.max_active = max(self.max_active, self.num_active)
+        time.sleep(self.busy_time)
+        with self._lock:
+            self.num_active -= 1
+            self.num_events += 1
+
+
+class WakeupHandler(BusyHandler):
+    def __init__(self, polling_interval: float):
+        super().__init__(polling_interval, 0)
+        self.element_id = "H.WAKEUP.01"
+        self.num_ticks = 0
+        self.num_wakeups = 0
+
+    def time_tick(self) -> None:
+        self.num_ticks += 1
+        super().time_tick()
+
+    def wakeup_event(self):
+        self.num_wakeups += 1
+
+
+class InputConsumer:
+    def __init__(self):
+        self.owner = None
+        self.topics = []
+        self.num_receives = 0
+
+    def receive(self):
+        self.num_receives += 1
+
+
+class InputHandler(iot_handler_base.IotHandlerBase):
+    def __init__(self, polling_interval: float):
+        super().__init__(polling_interval, 0, mqtt_input = (InputConsumer(), "test/input"))
+        self.element_id = "H.INPUT.01"
+        self.num_events = 0
+        self.num_ticks = 0
+        self.messages = []
+
+    def init_time(self, now: datetime = None) -> None:
+        super().init_time(now)
+        self._next_polling_ns = self._clock()
+
+    def time_tick(self) -> None:
+        self.num_ticks += 1
+        super().time_tick()
+
+    def polling_timer_event(self):
+        self.num_events += 1
+        self.receive_messages()
+
+    def message(self, msg):
+        self.messages.append((msg.msg_topic, threading.get_ident()))
+
+
+class TestIotAgentSleep(unittest.TestCase):
+    def test_01_deadline_sleep(self):
+        handler = WakeupHandler(60)
+        agent = iot_agent.IotAgent(handler, logging.getLogger("Test.IotAgent"))
+        agent.start()
+        time.sleep(0.2)
+        self.assertEqual((handler.num_events, handler.num_ticks), (1, 1))
+        handler.request_wakeup()
+        time.sleep(0.05)
+        self.assertEqual((handler.num_events, handler.num_wakeups, handler.num_ticks), (1, 1, 2))
+        start_time = time.perf_counter()
+        self.assertTrue(agent.stop())
+        self.assertLess(time.perf_counter() - start_time, 0.1)
+
+    def test_02_message_wakeup(self):
+        handler = InputHandler(60)
+        consumer = handler.mqtt_input[0]
+        self.assertIsInstance(consumer.owner, iot_handler_base.IotMessageRelay)
+        agent = iot_agent.IotAgent(handler, logging.getLogger("Test.IotAgent"))
+        agent.start()
+        time.sleep(0.2)
+        self.assertEqual((handler.num_events, handler.num_ticks, handler.messages), (1, 1, []))
+        network_thread = threading.Thread(target=consumer.owner.message,
+                                          args=(wp_queueing.QueueMessage("test/input"),))
+        network_thread.start()
+        network_thread.join()
+        time.sleep(0.05)
+        # processed by the agent thread in an extra tick, long before the next polling deadline
+        self.assertEqual((handler.num_events, handler.num_ticks), (1, 2))
+        self.assertEqual(len(handler.messages), 1)
+        self.assertEqual(handler.messages[0][0], "test/input")
+        self.assertNotIn(handler.messages[0][1], [network_thread.ident, threading.get_ident()])
+        self.assertGreater(handler.time_until_next_event(), 50)
+        self.assertTrue(agent.stop())
+
+
+class TestIotScheduler(unittest.TestCase):
+    def test_01_dispatch(self):
+        scheduler = iot_scheduler.IotScheduler(logging.getLogger("Test.IotScheduler"), max_workers = 3)
+        fast = BusyHandler(0.02, 0)
+        slow = BusyHandler(0.01, 0.05)
+        idle = WakeupHandler(60)
+        for handler in [fast, slow, idle]:
+            scheduler.add(handler)
+        scheduler.start()
+        time.sleep(0.5)
+        idle.request_wakeup()
+        scheduler.remove(fast)
+        time.sleep(0.05)
+        num_fast = fast.num_events
+        time.sleep(0.1)
+        self.assertTrue(scheduler.stop())
+        self.assertEqual(fast.num_events, num_fast)
+        self.assertGreater(num_fast, 15)
+        self.assertGreater(slow.num_events, 5)
+        self.assertEqual(slow.max_active, 1)
+        self.assertEqual((idle.num_events, idle.num_wakeups), (1, 1))
+        stats = scheduler.statistics
+        self.assertEqual(stats['num_errors'], 0)
+        self.assertGreaterEqual(stats['num_dispatches'], fast.num_events + slow.num_events + idle.num_events)
+        self.assertLess(stats['num_wakeups'], 2 * stats['num_dispatches'] + 5)
+
+
+class TestIotAgentPool(unittest.TestCase):
+    def test_01_pool(self):
+        logger = logging.getLogger("Test.IotAgentPool")
+        pool = iot_agent_pool.IotAgentPool(logger, max_workers = 2)
+        slow = BusyHandler(0.01, 0.2)
+        fast = [BusyHandler(0.02, 0.001) for _ in range(6)]
+        for handler_no, handler in enumerate([slow] + fast):
+            handler.element_id = f'H.{handler_no:02d}'
+        num_threads = threading.active_count()
+        agents = [pool.create_agent(handler, logger) for handler in [slow] + fast]
+        for agent in agents:
+            agent.start()
+        time.sleep(0.5)
+        # dispatcher thread and two workers, independent of the number of handlers
+        self.assertLessEqual(threading.active_count() - num_threads, 3)
+        self.assertTrue(all(agent.is_running for agent in agents))
+        # the slow handler never runs concurrently with itself and does not starve the others
+        self.assertEqual(slow.max_active, 1)
+        self.assertTrue(all(handler.num_events >= 10 for handler in fast))
+        time.sleep(0.05)
+        # stop() waits for the time_tick() of the slow handler
+        self.assertTrue(agents[0].stop())
+        self.assertEqual(slow.num_active, 0)
+        self.assertFalse(agents[0].is_running)
+        self.assertTrue(pool.stop())
+        self.assertFalse(any(agent.is_running for agent in agents))
+        stats = pool.statistics
+        self.assertEqual(stats['num_errors'], 0)
+        self.assertGreaterEqual(stats['max_tick_duration'], 0.2)
+
+
+class RecordingProducer:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.published = []
+        self.threads = set()
+
+    def publish_single(self, msg):
+        time.sleep(self.delay)
+        self.threads.add(threading.current_thread().name)
+        self.published.append(msg.msg_topic)
+
+
+class StalledProducer(RecordingProducer):
+    def __init__(self, released: threading.Event):
+        super().__init__(0)
+        self.released = released
+
+    def publish_single(self, msg):
+        self.released.wait()
+        super().publish_single(msg)
+
+
+class PublishingHandler(BusyHandler):
+    def __init__(self, element_id: str, polling_interval: float, producer: RecordingProducer):
+        super().__init__(polling_interval, 0.005)
+        self.element_id = element_id
+        self.mqtt_data = (producer, 'data/hw')
+
+    def polling_timer_event(self):
+        super().polling_timer_event()
+        self.mqtt_data[0].publish_single(wp_queueing.QueueMessage(f'{self.mqtt_data[1]}/{self.element_id}'))
+
+
+class InlineHandler(PublishingHandler):
+    blocking = False
+
+    def __init__(self, element_id: str, polling_interval: float, producer: RecordingProducer):
+        super().__init__(element_id, polling_interval, producer)
+        self.busy_time = 0
+        self.threads = set()
+
+    def polling_timer_event(self):
+        self.threads.add(threading.current_thread().name)
+        super().polling_timer_event()
+
+
+class TestIotAsyncRuntime(unittest.TestCase):
+    def test_01_agents(self):
+        logger = logging.getLogger("Test.IotAsyncRuntime")
+        runtime = iot_async_runtime.IotAsyncRuntime(logger, max_workers = 2)
+        producer = RecordingProducer(0.002)
+        handlers = [PublishingHandler(f'H.{handler_no:02d}', 0.05, producer) for handler_no in range(20)]
+        idle = WakeupHandler(60)
+        num_threads = threading.active_count()
+        agents = [runtime.create_agent(handler, logger) for handler in handlers + [idle]]
+        for agent in agents:
+            agent.start()
+        time.sleep(0.5)
+        idle.request_wakeup()
+        time.sleep(0.05)
+        # event loop thread, two workers and one publisher, independent of the number of handlers
+        self.assertLessEqual(threading.active_count() - num_threads, 4)
+        self.assertTrue(all(agent.stop() for agent in agents))
+        self.assertFalse(any(agent.is_running for agent in agents))
+        self.assertEqual((idle.num_events, idle.num_wakeups), (1, 1))
+        self.assertTrue(all(handler.num_events >= 2 and handler.max_active == 1 for handler in handlers))
+        # the handlers share one adapter; its drain job sends the queued messages in the publishing executor
+        self.assertIs(handlers[0].mqtt_data[0], handlers[1].mqtt_data[0])
+        runtime.stop(timeout = 5)
+        self.assertFalse(runtime.is_running)
+        self.assertEqual(len(producer.published), sum(handler.num_events for handler in handlers))
+        self.assertEqual(handlers[0].mqtt_data[0].statistics['num_dropped'], 0)
+        self.assertTrue(all(thread_name.startswith('async_publisher') for thread_name in producer.threads))
+
+    def test_02_stalled_broker(self):
+        logger = logging.getLogger("Test.IotAsyncRuntime")
+        runtime = iot_async_runtime.IotAsyncRuntime(logger, max_workers = 2)
+        broker_released = threading.Event()
+        producers = [StalledProducer(broker_released) for _ in range(4)]
+        handlers = [PublishingHandler(f'H.{handler_no:02d}', 0.02, producer) for handler_no, producer in enumerate(producers)]
+        agents = [runtime.create_agent(handler, logger) for handler in handlers]
+        for agent in agents:
+            agent.start()
+        time.sleep(0.3)
+        # the publisher is blocked by the broker, the workers keep executing the ticks
+        self.assertTrue(all(handler.num_events >= 5 for handler in handlers))
+        self.assertTrue(all(producer.published == [] for producer in producers))
+        broker_released.set()
+        self.assertTrue(all(agent.stop() for agent in agents))
+        runtime.stop(timeout = 5)
+        for handler, producer in zip(handlers, producers):
+            stats = handler.mqtt_data[0].statistics
+            self.assertEqual(len(producer.published), handler.num_events)
+            self.assertEqual((stats['num_queued'], stats['num_published']), (handler.num_events, handler.num_events))
+
+
+    def test_03_inline_handlers(self):
+        logger = logging.getLogger("Test.IotAsyncRuntime")
+        runtime = iot_async_runtime.IotAsyncRuntime(logger, max_workers = 2)
+        producer = RecordingProducer(0.002)
+        handlers = [InlineHandler(f'H.{handler_no:02d}', 0.02, producer) for handler_no in range(5)]
+        agents = [runtime.create_agent(handler, logger) for handler in handlers]
+        for agent in agents:
+            agent.start()
+        time.sleep(0.3)
+        self.assertTrue(all(agent.stop() for agent in agents))
+        # non-blocking handlers run on the event loop thread; no worker thread is started
+        self.assertTrue(all(handler.threads == {'async_runtime'} and handler.num_events >= 5 for handler in handlers))
+        self.assertFalse(any(thread.name.startswith('async_worker') for thread in threading.enumerate()))
+        runtime.stop(timeout = 5)
+        self.assertEqual(len(producer.published), sum(handler.num_events for handler in handlers))
+        self.assertTrue(all(thread_name.startswith('async_publisher') for thread_name in producer.threads))
+
+
+def crashing_worker(work_dir, process_group, worker_settings, report_queue, stop_event):
+    start_path = os.path.join(work_dir, f'starts_{process_group}')
+    with open(start_path, "a") as start_fh:
+        start_fh.write(f"{os.getpid()}\n")
+    with open(start_path, "r") as start_fh:
+        num_starts = len(start_fh.readlines())
+    if process_group == 1 and num_starts == 1:
+        sys.exit(3)
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else None
+    while not stop_event.wait(worker_settings['report_interval']):
+        agent_report = {'num_polling_events': 5, 'num_missed_polls': process_group, 'max_lateness': 0.01 * process_group}
+        report_queue.put((process_group, {'num_agents': 1, 'num_running': 1, 'cpus': cpus,
+                                          'agents': {f'H.{process_group}': agent_report}}))
+
+
+class TestIotSupervisor(unittest.TestCase):
+    def test_01_restart_and_health(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            supervisor = iot_supervisor.IotSupervisor(
+                work_dir, logging.getLogger("Test.IotSupervisor"), process_groups = [2, 1], report_interval = 0.05,
+                cpu_affinity = {1: [0], 2: [0]}, worker_target = crashing_worker)
+            supervisor.min_backoff = 0.2
+            supervisor.start()
+            end_time = time.monotonic() + 20
+            while time.monotonic() < end_time:
+                supervisor.supervise(0.1)
+                health = supervisor.health
+                if all(group['report'] is not None for group in health['groups'].values()):
+                    break
+            self.assertTrue(supervisor.stop())
+        self.assertEqual(supervisor.process_groups, [1, 2])
+        self.assertEqual((health['num_groups'], health['num_running'], health['num_restarts']), (2, 2, 1))
+        self.assertEqual((health['groups'][1]['num_restarts'], health['groups'][1]['last_exitcode']), (1, 3))
+        self.assertEqual((health['groups'][2]['num_restarts'], health['groups'][2]['last_exitcode']), (0, None))
+        self.assertEqual((health['num_agents'], health['num_running_agents']), (2, 2))
+        self.assertEqual((health['num_polling_events'], health['num_missed_polls']), (10, 3))
+        self.assertAlmostEqual(health['max_lateness'], 0.02)
+        if hasattr(os, 'sched_setaffinity'):
+            self.assertEqual(health['groups'][1]['report']['cpus'], [0])
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=5)
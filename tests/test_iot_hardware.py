@@ -9,9 +9,12 @@ import wp_queueing
 import iot_msg_input
 import iot_repository_broker
 import iot_repository_hardware
+import iot_hardware_burst
 import iot_hardware_input
 import iot_hardware_handler
 import iot_hardware_factory
+import iot_sensor_base
+import iot_sensor_handler
 
 LOGGER_CONFIG = {
         "version": 1,
@@ -105,5 +108,135 @@ class TestIotHardware(unittest.TestCase):
         handler.health_timer_event()
         time.sleep(2)
 
+class TestIotBurstSampler(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        logging.config.dictConfig(LOGGER_CONFIG)
+        self._logger = logging.getLogger('Test.Hardware')
+
+    def test_01_sampling(self):
+        read_counts = {0: 0, 3: 0}
+
+        def read_sample(channel_no: int) -> int:
+            read_counts[channel_no] += 1
+            return channel_no * 1000 + read_counts[channel_no] % 10
+
+        sampler = iot_hardware_burst.IotBurstSampler(read_sample, [0, 3], self._logger, data_rate = 400, buffer_time = 10)
+        sampler.start()
+        time.sleep(0.5)
+        first = sampler.burst('ADS1115', 'DI.ADS1115.01', raw_samples = True)
+        time.sleep(0.25)
+        self.assertTrue(sampler.stop())
+        second = sampler.burst('ADS1115', 'DI.ADS1115.01')
+        self.assertIsNone(sampler.burst('ADS1115', 'DI.ADS1115.01'))
+        # 400 conversions per second, shared by two channels
+        self.assertTrue(60 <= first.num_samples[0] <= 110, first.num_samples)
+        self.assertEqual(first.num_samples[0], first.num_samples[1])
+        self.assertEqual(first.num_samples[0] + second.num_samples[0], read_counts[0])
+        self.assertEqual((first.min_values, first.max_values), ([0, 3000], [9, 3009]))
+        samples = first.channel_samples(3)
+        self.assertEqual(list(samples[:12]), [3000 + sample_no % 10 for sample_no in range(1, 13)])
+        self.assertAlmostEqual(first.mean_values[1], sum(samples) / len(samples))
+        self.assertLess(first.start_time, first.end_time)
+        self.assertIsNone(second.samples)
+        self.assertEqual(sampler.statistics['num_samples_total'], read_counts[0] + read_counts[3])
+
+    def test_02_buffer_full(self):
+        sampler = iot_hardware_burst.IotBurstSampler(lambda channel_no: -channel_no, [1], self._logger, data_rate = 0, buffer_time = 0.1)
+        sampler.start()
+        time.sleep(0.2)
+        sampler.stop()
+        start_time, end_time, columns, num_dropped = sampler.drain()
+        self.assertLessEqual(start_time, end_time)
+        self.assertEqual(len(columns[0]), sampler.statistics['capacity'])
+        self.assertEqual(set(columns[0]), {-1})
+        self.assertGreater(num_dropped, 0)
+        with self.assertRaises(ValueError):
+            iot_hardware_input.IotInputDevice("test.01", self._logger).start_burst(860)
+
+
+class BurstDevice(iot_hardware_input.IotInputDevice):
+    def __init__(self, device_id: str, logger: logging.Logger):
+        super().__init__(device_id, logger)
+        self.data_rate = 0
+
+    def probe(self) -> list:
+        return [iot_msg_input.InputProbe(self.device_type, self.device_id, channel_no = channel_no, value = 12000 + channel_no,
+                                         voltage = 1.5) for channel_no in [0, 1]]
+
+    def start_burst(self, data_rate: int, buffer_time: float = 120.0) -> None:
+        self.data_rate = data_rate
+
+    def burst(self, raw_samples: bool = False) -> iot_msg_input.InputBurst:
+        now = datetime.now()
+        return iot_msg_input.InputBurst.from_samples(self.device_type, self.device_id, now, now, self.data_rate,
+                                                     [0, 1], [[12000, 12002], [100, 102]], raw_samples = raw_samples)
+
+
+class MessageBroker:
+    def __init__(self):
+        self.owner = None
+        self.topics = []
+        self.published = []
+
+    def receive(self):
+        pass
+
+    def publish_single(self, msg):
+        self.published.append(msg)
+
+
+def transfer(msg: wp_queueing.QueueMessage) -> wp_queueing.QueueMessage:
+    received = wp_queueing.QueueMessage(msg.msg_topic)
+    received.msg_payload = msg.msg_payload if isinstance(msg.msg_payload, bytes) else msg.msg_payload.to_dict()
+    return received
+
+
+class TestIotSensorBurst(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        logging.config.dictConfig(LOGGER_CONFIG)
+        cls._logger = logging.getLogger("Test")
+
+    def _sensor_handler(self, sensor_output: MessageBroker) -> iot_sensor_handler.IotSensorHandler:
+        sensor = iot_sensor_base.IotSensor("S.TEST.01", "Generic", self._logger)
+        return iot_sensor_handler.IotSensorHandler(sensor, self._logger, (sensor_output, "test/sensor"),
+                                                   (MessageBroker(), "test/input/DI.TEST.01/0"), device_channel = 0)
+
+    def test_01_burst_topic(self):
+        device_output = MessageBroker()
+        sensor_output = MessageBroker()
+        sensor_handler = self._sensor_handler(sensor_output)
+        subscribed = [topic for topic, _ in sensor_handler.mqtt_input[0].topics]
+        device_handler = iot_hardware_handler.IotInputDeviceHandler(BurstDevice("DI.TEST.01", self._logger), self._logger, 1,
+                                                                    (device_output, "test/input"), burst_rate = 250)
+        device_handler.init_time()
+        device_handler.polling_timer_event()
+        self.assertEqual([msg.msg_topic for msg in device_output.published], ["test/input/DI.TEST.01/burst"])
+        self.assertNotIn(device_output.published[0].msg_topic, subscribed)
+        # delivered to the sensor nevertheless (e.g. by a wildcard subscription), the burst is ignored
+        with self.assertNoLogs("Test", level = logging.ERROR):
+            sensor_handler.mqtt_input[0].owner.message(transfer(device_output.published[0]))
+            sensor_handler.receive_messages()
+        self.assertEqual(sensor_output.published, [])
+        device_handler.stop()
+
+    def test_02_batch_topic(self):
+        device_output = MessageBroker()
+        sensor_output = MessageBroker()
+        sensor_handler = self._sensor_handler(sensor_output)
+        subscribed = [topic for topic, _ in sensor_handler.mqtt_input[0].topics]
+        device_handler = iot_hardware_handler.IotInputDeviceHandler(BurstDevice("DI.TEST.01", self._logger), self._logger, 1,
+                                                                    (device_output, "test/input"), publish_batch = True)
+        device_handler.init_time()
+        device_handler.polling_timer_event()
+        self.assertEqual([msg.msg_topic for msg in device_output.published], ["test/input/DI.TEST.01"])
+        self.assertIn(device_output.published[0].msg_topic, subscribed)
+        sensor_handler.mqtt_input[0].owner.message(transfer(device_output.published[0]))
+        sensor_handler.receive_messages()
+        self.assertEqual([msmt.hw_value for msmt in sensor_output.published], [12000])
+        device_handler.stop()
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=5)
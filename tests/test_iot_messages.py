@@ -0,0 +1,333 @@
+# pylint: disable=line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
+
+import json
+import os
+import subprocess
+import sys
+import traceback
+import unittest
+from datetime import datetime
+import iot_msg_input
+import iot_msg_sensor
+import iot_msg_actor
+import iot_msg_output
+import iot_msg_binary
+import iot_msg_bulk
+import iot_msg_registry
+import iot_msg_schema
+import iot_msg_view
+import iot_stat_msg
+import iot_rec_schema
+import iot_time_codec
+
+
+class TestIotMessageRegistry(unittest.TestCase):
+    def test_01_registered_types(self):
+        registry = iot_msg_registry.IotMessageRegistry
+        self.assertIs(registry.message_type('InputProbe'), iot_msg_input.InputProbe)
+        self.assertIs(registry.message_type('InputHealth'), iot_msg_input.InputHealth)
+        self.assertIs(registry.message_type('SensorMsmt'), iot_msg_sensor.SensorMsmt)
+        self.assertIs(registry.message_type('ActorCommand'), iot_msg_actor.ActorCommand)
+        self.assertIs(registry.message_type('OutputData'), iot_msg_output.OutputData)
+        self.assertIs(registry.recorder_type('SensorMsmt'), iot_stat_msg.IotRecorderSensorMsg)
+        self.assertIsNone(registry.recorder_type('ActorCommand'))
+        self.assertIsNone(registry.message_type('Unknown'))
+
+    def test_02_decode(self):
+        probe = iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime(2021, 7, 12, 10, 0, 0, 500), 2, 12345, 1.23)
+        decoded = iot_msg_registry.IotMessageRegistry.decode(probe.to_dict())
+        self.assertIsInstance(decoded, iot_msg_input.InputProbe)
+        self.assertEqual(decoded.to_dict(), probe.to_dict())
+        decoded = iot_msg_registry.IotMessageRegistry.decode(probe.to_dict(), iot_msg_input.InputProbe)
+        self.assertEqual(decoded.channel_no, 2)
+
+    def test_03_decode_errors(self):
+        probe = iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime.now(), 0, 1, 0.1)
+        with self.assertRaises(ValueError):
+            iot_msg_registry.IotMessageRegistry.decode(probe.to_dict(), iot_msg_sensor.SensorMsmt)
+        with self.assertRaises(ValueError):
+            iot_msg_registry.IotMessageRegistry.decode({'class': 'Unknown'})
+        with self.assertRaises(TypeError):
+            iot_msg_registry.IotMessageRegistry.decode("InputProbe")
+
+    def test_04_input_probe_batch(self):
+        probe_time = datetime(2021, 7, 12, 10, 0, 0, 500)
+        probes = [iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", probe_time, channel_no, 1000 + channel_no, 0.5 * channel_no)
+                  for channel_no in range(4)]
+        batch = iot_msg_input.InputProbeBatch.from_probes(probes)
+        decoded = iot_msg_registry.IotMessageRegistry.decode(batch.to_dict(), iot_msg_input.InputProbeBatch)
+        self.assertEqual(decoded.to_dict(), batch.to_dict())
+        self.assertEqual([probe.to_dict() for probe in decoded.probes()], [probe.to_dict() for probe in probes])
+        self.assertEqual(decoded.probe(2).value, 1002)
+        self.assertIsNone(decoded.probe(7))
+        self.assertIsNone(iot_msg_input.InputProbeBatch.from_probes([]))
+        batch_dict = batch.to_dict()
+        batch_dict['values'] = [1, 2]
+        with self.assertRaises(ValueError):
+            iot_msg_registry.IotMessageRegistry.decode(batch_dict)
+
+    def test_05_input_burst(self):
+        columns = [[12000, 12004, 11990, 12001], [-5, -5, 32767, -32768]]
+        burst = iot_msg_input.InputBurst.from_samples("ADS1115", "DI.ADS1115.01", datetime(2021, 7, 12, 10, 0, 0),
+                                                      datetime(2021, 7, 12, 10, 0, 1), 860, [0, 2], columns, 3, True)
+        self.assertEqual((burst.min_values, burst.max_values, burst.num_samples), ([11990, -32768], [12004, 32767], [4, 4]))
+        self.assertAlmostEqual(burst.stddev_values[0], 5.261891294962297)
+        for encoded in [burst.to_dict(), iot_msg_binary.IotBinaryCodec.encode(burst)]:
+            decoded = iot_msg_registry.IotMessageRegistry.decode(encoded, iot_msg_input.InputBurst)
+            self.assertEqual(decoded.to_dict(), burst.to_dict())
+            self.assertEqual(list(decoded.channel_samples(2)), columns[1])
+        self.assertIsNone(decoded.channel_samples(1))
+        burst_dict = burst.to_dict()
+        burst_dict['samples'] = burst_dict['samples'][:1]
+        with self.assertRaises(ValueError):
+            iot_msg_registry.IotMessageRegistry.decode(burst_dict)
+
+    def test_06_input_health_timing(self):
+        health = iot_msg_input.InputHealth("ADS1115", "DI.ADS1115.01", 0, datetime(2021, 7, 12, 10, 0, 0))
+        self.assertIsNone(iot_msg_registry.IotMessageRegistry.decode(health.to_dict()).timing)
+        health.timing = {'num_missed_polls': 2, 'max_lateness': 15.0, 'duration_histogram': [0, 2, 0, 0, 0, 1]}
+        for encoded in [health.to_dict(), iot_msg_binary.IotBinaryCodec.encode(health)]:
+            self.assertEqual(iot_msg_registry.IotMessageRegistry.decode(encoded).timing, health.timing)
+
+
+
+class TestIotBinaryCodec(unittest.TestCase):
+    def test_01_round_trip(self):
+        msg_time = datetime(2021, 7, 12, 10, 30, 15, 123456)
+        msmt = iot_msg_sensor.SensorMsmt("S.KYES516.01", "KYES516", msg_time)
+        msmt.hw_value = 12345
+        msmt.hw_voltage = 1.23
+        msmt.msmt_unit = "pct"
+        msmt.msmt_value = 45.6
+        health = iot_msg_input.InputHealth("ADS1115", "DI.ADS1115.01", 0, msg_time)
+        health.num_probe_total = 12
+        messages = [iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", msg_time, 2, 12345, 1.23),
+                    iot_msg_input.InputProbeBatch("ADS1115", "DI.ADS1115.01", msg_time, [0, 1], [10, 11], [0.5, 0.6]),
+                    msmt, health,
+                    iot_msg_output.OutputData("A.RELAIS.01", "Relais", "0", msg_time, 1),
+                    iot_msg_actor.ActorCommand("S.KYES516.01", "KYES516", msg_time, {'state': 'on'}, 10)]
+        for message in messages:
+            payload = iot_msg_binary.IotBinaryCodec.encode(message)
+            self.assertTrue(iot_msg_binary.IotBinaryCodec.is_binary(payload))
+            self.assertEqual(iot_msg_binary.IotBinaryCodec.class_name(payload), type(message).__name__)
+            self.assertLess(len(payload), len(str(message.to_dict())))
+            decoded = iot_msg_registry.IotMessageRegistry.decode(payload, type(message))
+            self.assertEqual(decoded.to_dict(), message.to_dict())
+        self.assertIsNone(iot_msg_registry.IotMessageRegistry.decode(iot_msg_binary.IotBinaryCodec.encode(health)).last_probe_time)
+
+    def test_02_errors(self):
+        probe = iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime.now(), 2, 12345, 1.23)
+        payload = iot_msg_binary.IotBinaryCodec.encode(probe)
+        self.assertFalse(iot_msg_binary.IotBinaryCodec.is_binary(b'{"class": "InputProbe"}'))
+        self.assertFalse(iot_msg_binary.IotBinaryCodec.is_binary(probe.to_dict()))
+        with self.assertRaises(ValueError):
+            iot_msg_registry.IotMessageRegistry.decode(payload, iot_msg_sensor.SensorMsmt)
+        with self.assertRaises(ValueError):
+            iot_msg_binary.IotBinaryCodec.decode(payload[:-3])
+        with self.assertRaises(ValueError):
+            iot_msg_binary.IotBinaryCodec.decode(payload[:1] + bytes([iot_msg_binary.IotBinaryCodec.version + 1]) + payload[2:])
+        probe.value = "invalid"
+        with self.assertRaises(ValueError):
+            iot_msg_binary.IotBinaryCodec.encode(probe)
+
+
+@unittest.skipIf(iot_msg_bulk.np is None, "numpy is not installed")
+class TestIotBulkDecoder(unittest.TestCase):
+    def test_01_decode(self):
+        payloads = [iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime(2021, 7, 12, 10, 0, 0, row_no), row_no % 4, 1000 + row_no, 1.5).to_dict()
+                    for row_no in range(6)]
+        del payloads[1]['device_id']
+        payloads[2]['value'] = "high"
+        payloads[3]['probe_time'] = "12.07.2021"
+        del payloads[4]['voltage']
+        payloads.append(iot_msg_sensor.SensorMsmt("S.KY013.01", "KY013").to_dict())
+        probes, errors = iot_msg_bulk.IotBulkDecoder.decode(payloads, 'InputProbe')
+        self.assertEqual(probes.dtype.names, ('device_type', 'device_id', 'probe_time', 'channel_no', 'value', 'voltage'))
+        self.assertEqual(list(probes['value']), [1000, 1004, 1005])
+        self.assertEqual(list(probes['voltage']), [1.5, 0.0, 1.5])
+        self.assertEqual(probes['probe_time'][2], iot_msg_bulk.np.datetime64(datetime(2021, 7, 12, 10, 0, 0, 5)))
+        self.assertEqual(errors, [(1, 'missing mandatory element "device_id"'), (2, 'invalid value for "value"'),
+                                  (3, 'invalid value for "probe_time"'), (6, 'invalid dict class "SensorMsmt"')])
+
+    def test_02_json_lines(self):
+        msmt = iot_msg_sensor.SensorMsmt("S.KY013.01", "KY013", datetime(2021, 7, 12, 10, 0, 0))
+        msmt.msmt_value = 21.5
+        lines = [json.dumps(msmt.to_dict()), "", "{invalid", json.dumps({'msg_id': "1", 'msg_payload': msmt.to_dict()})]
+        msmts, errors = iot_msg_bulk.IotBulkDecoder.decode_json_lines(lines, 'SensorMsmt')
+        self.assertEqual(len(msmts), 2)
+        self.assertEqual(list(msmts['msmt_unit']), ["", ""])
+        self.assertEqual(list(msmts['msmt_value']), [21.5, 21.5])
+        self.assertEqual([row_no for row_no, _ in errors], [2])
+        iot_time_codec.IotTimeCodec.set_wire_format('epoch')
+        try:
+            msmts, errors = iot_msg_bulk.IotBulkDecoder.decode([msmt.to_dict()], 'SensorMsmt')
+        finally:
+            iot_time_codec.IotTimeCodec.set_wire_format('str')
+        self.assertEqual(msmts['msmt_time'][0], iot_msg_bulk.np.datetime64(msmt.msmt_time))
+
+    def test_03_without_numpy(self):
+        # numpy is optional: the package must import without it, only decoding fails
+        script = "\n".join([
+            "import sys",
+            "sys.modules['numpy'] = None",
+            "import iot_base",
+            "try:",
+            "    iot_base.IotBulkDecoder.decode([], 'InputProbe')",
+            "except ImportError:",
+            "    print('no numpy')"])
+        env = dict(os.environ, PYTHONPATH = os.pathsep.join(sys.path))
+        result = subprocess.run([sys.executable, "-c", script], env = env, capture_output = True, text = True, check = False)
+        self.assertEqual((result.returncode, result.stdout.strip()), (0, 'no numpy'), result.stderr)
+
+
+class TestIotMessageView(unittest.TestCase):
+    def test_01_lazy_access(self):
+        probe = iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime(2021, 7, 12, 10, 0, 0, 500), 2, 12345, 1.23)
+        msg_view = iot_msg_view.IotMessageView(probe.to_dict())
+        self.assertEqual(msg_view.msg_class, "InputProbe")
+        self.assertEqual(msg_view.value('channel_no'), 2)
+        self.assertEqual(msg_view.time_column('probe_time'), "2021-07-12 10:00:00.000500")
+        self.assertEqual(msg_view.time('probe_time'), datetime(2021, 7, 12, 10, 0, 0, 500))
+        self.assertEqual(msg_view.value('missing', False, 7), 7)
+        with self.assertRaises(ValueError):
+            msg_view.value('missing')
+        self.assertEqual(msg_view.decode().to_dict(), probe.to_dict())
+
+    def test_02_row(self):
+        probe_dict = iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime(2021, 7, 12, 10, 0, 0), 2, 12345).to_dict()
+        del probe_dict['voltage']
+        probe_dict['probe_time'] = "2021-07-12 10:00:00.5"
+        columns = iot_stat_msg.IotRecorderInputProbe.payload_columns
+        self.assertEqual(iot_msg_view.IotMessageView(probe_dict).row(columns),
+                         ("ADS1115", "DI.ADS1115.01", datetime(2021, 7, 12, 10, 0, 0, 500000), 2, 12345, 0.0))
+        # fixed layout strings are passed through unparsed; the recorder's epoch conversion rejects them
+        probe_dict['probe_time'] = "2021-13-12 10:00:00.000000"
+        row = iot_msg_view.IotMessageView(probe_dict).row(columns)
+        self.assertEqual(row[2], "2021-13-12 10:00:00.000000")
+        with self.assertRaises(ValueError):
+            iot_rec_schema.IotRecorderSchema.to_epoch_us(row[2])
+        # strings of the same length, but not in the fixed layout, are parsed (and rejected if invalid)
+        probe_dict['probe_time'] = "2021-07-12T10:00:00.000500"
+        self.assertEqual(iot_msg_view.IotMessageView(probe_dict).row(columns)[2], datetime(2021, 7, 12, 10, 0, 0, 500))
+        for invalid in ["2021-07-12 10:00:00 000500", "2021/07/12 10:00:00.000500", "2021-07-12 10:00:00.0005x0"]:
+            probe_dict['probe_time'] = invalid
+            with self.assertRaises(ValueError):
+                iot_msg_view.IotMessageView(probe_dict).row(columns)
+        with self.assertRaises(ValueError):
+            iot_msg_view.IotMessageView({'class': 'Unknown'})
+        with self.assertRaises(TypeError):
+            iot_msg_view.IotMessageView("InputProbe")
+
+
+class TestIotMessageSchema(unittest.TestCase):
+    def test_01_wire_format(self):
+        probe = iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime(2021, 7, 12, 10, 0, 0, 5), 2, 1234, 1.5)
+        self.assertEqual(list(probe.to_dict().items()), [
+            ('class', 'InputProbe'), ('device_type', 'ADS1115'), ('device_id', 'DI.ADS1115.01'),
+            ('probe_time', '2021-07-12 10:00:00.000005'), ('channel_no', 2), ('value', 1234), ('voltage', 1.5)])
+        output = iot_msg_output.OutputData("A.RELAIS.01", "Relais", "0", datetime(2021, 7, 12, 10, 0, 0), {'state': 1})
+        self.assertEqual(list(output.to_dict().keys()), ['class', 'component_type', 'component_id', 'output_time', 'output_port', 'output_data'])
+        self.assertEqual(output.to_dict()['output_data'], "{'state': 1}")
+        self.assertEqual([field.name for field in iot_msg_schema.IotMessageSchema.fields('SensorMsmt')],
+                         ['sensor_id', 'sensor_type', 'msmt_time', 'hw_value', 'hw_voltage', 'msmt_unit', 'msmt_value'])
+
+    def test_02_from_dict(self):
+        msg_dict = {'class': 'OutputData', 'component_type': 'Relais', 'component_id': 'A.RELAIS.01',
+                    'output_time': '2021-07-12 10:00:00.000000', 'output_data': 'on'}
+        output = iot_msg_output.OutputData()
+        output.from_dict(msg_dict)
+        self.assertIsNone(output.output_port)
+        cmd_dict = iot_msg_actor.ActorCommand("S.KYES516.01", "KYES516", datetime(2021, 7, 12), "on", 10).to_dict()
+        cmd_dict['cmd_duration'] = "20"
+        cmd = iot_msg_actor.ActorCommand()
+        cmd.from_dict(cmd_dict)
+        self.assertEqual(cmd.cmd_duration, 20)
+        del cmd_dict['sender_type']
+        with self.assertRaisesRegex(ValueError, 'ActorCommand.from_dict\\(\\): missing mandatory element "sender_type"'):
+            cmd.from_dict(cmd_dict)
+        with self.assertRaisesRegex(ValueError, 'invalid dict class "InputProbe"'):
+            output.from_dict(dict(msg_dict, **{'class': 'InputProbe'}))
+        with self.assertRaises(TypeError):
+            output.from_dict([])
+
+    def test_03_validate(self):
+        health = iot_msg_input.InputHealth("ADS1115", "DI.ADS1115.01", 0, datetime(2021, 7, 12))
+        health.validate()
+        health.num_probe_detail = [1, "2"]
+        with self.assertRaisesRegex(ValueError, 'InputHealth.validate\\(\\): .* "num_probe_detail"'):
+            health.validate()
+        msmt = iot_msg_sensor.SensorMsmt("S.KY013.01", "KY013", datetime(2021, 7, 12))
+        msmt.validate()
+        msmt.msmt_time = "2021-07-12"
+        with self.assertRaises(ValueError):
+            msmt.validate()
+        with self.assertRaises(ValueError):
+            iot_msg_schema.IotMessageField('value', 'decimal')
+
+    def test_04_generated_source(self):
+        for name in ['value", self.x, "', 'class', 'probe-time', None]:
+            with self.assertRaises(ValueError):
+                iot_msg_schema.IotMessageField(name, 'int')
+        with self.assertRaises(ValueError):
+            iot_msg_schema.IotMessageSchema.register(object, 'Bad Class', ())
+        # the generated code is visible in tracebacks
+        msmt = iot_msg_sensor.SensorMsmt("S.KY013.01", "KY013", datetime(2021, 7, 12))
+        msmt.msmt_time = "2021-07-12"
+        try:
+            msmt.validate()
+        except ValueError:
+            frame = traceback.extract_tb(sys.exc_info()[2])[-1]
+        self.assertEqual(frame.filename, '<IotMessageSchema SensorMsmt>')
+        self.assertIn('raise ValueError', frame.line)
+
+
+class TestIotTimeCodec(unittest.TestCase):
+    def tearDown(self):
+        iot_time_codec.IotTimeCodec.set_wire_format("str")
+        super().tearDown()
+
+    def test_01_parse(self):
+        parse = iot_time_codec.IotTimeCodec.parse
+        self.assertEqual(parse("2021-07-12 10:30:15.123456"), datetime(2021, 7, 12, 10, 30, 15, 123456))
+        self.assertEqual(parse("2021-07-12 10:30:15"), datetime(2021, 7, 12, 10, 30, 15))
+        self.assertEqual(parse("2021-07-12 10:30:15.1"), datetime(2021, 7, 12, 10, 30, 15, 100000))
+        self.assertEqual(parse("2021-07-12 10:30:15.12345"), datetime(2021, 7, 12, 10, 30, 15, 123450))
+        for invalid in ["2021-07-12", "2021/07/12 10:30:15", "2021-07-12 10:30:15.", "2021-07-12 10:30:15.1234567", "2021-07-12 10:30:15.12a"]:
+            with self.assertRaises(ValueError):
+                parse(invalid)
+
+    def test_02_format_round_trip(self):
+        for value in [datetime(2021, 7, 12, 10, 30, 15), datetime(2021, 7, 12, 10, 30, 15, 7)]:
+            formatted = iot_time_codec.IotTimeCodec.format(value)
+            self.assertEqual(formatted, value.strftime("%Y-%m-%d %H:%M:%S.%f"))
+            self.assertEqual(iot_time_codec.IotTimeCodec.parse(formatted), value)
+
+    def test_03_epoch_wire_format(self):
+        value = datetime(2021, 7, 12, 10, 30, 15, 250000)
+        msmt = iot_msg_sensor.SensorMsmt("S.KYES516.01", "KYES516", value)
+        msmt.msmt_unit = "pct"
+        iot_time_codec.IotTimeCodec.set_wire_format("epoch")
+        msg_dict = msmt.to_dict()
+        self.assertIsInstance(msg_dict['msmt_time'], float)
+        iot_time_codec.IotTimeCodec.set_wire_format("str")
+        decoded = iot_msg_sensor.SensorMsmt()
+        decoded.from_dict(msg_dict)
+        self.assertEqual(decoded.msmt_time, value)
+        with self.assertRaises(ValueError):
+            iot_time_codec.IotTimeCodec.set_wire_format("binary")
+
+    def test_04_actor_and_output(self):
+        cmd = iot_msg_actor.ActorCommand("S.KYES516.01", "KYES516", datetime(2021, 7, 12, 10, 0, 0), "on", 10)
+        cmd_dict = cmd.to_dict()
+        self.assertEqual(cmd_dict['cmd_time'], "2021-07-12 10:00:00.000000")
+        decoded_cmd = iot_msg_actor.ActorCommand()
+        decoded_cmd.from_dict(cmd_dict)
+        self.assertEqual(decoded_cmd.cmd_time, cmd.cmd_time)
+        output = iot_msg_output.OutputData("A.RELAIS.01", "Relais", "0", datetime(2021, 7, 12, 10, 0, 0, 123456), "on")
+        decoded_output = iot_msg_output.OutputData()
+        decoded_output.from_dict(output.to_dict())
+        self.assertEqual(decoded_output.output_time, output.output_time)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=5)
@@ -0,0 +1,630 @@
+# pylint: disable=line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+import unittest.mock
+import logging
+import uuid
+import wp_queueing
+from datetime import datetime, timedelta
+import iot_msg_input
+import iot_msg_sensor
+import iot_msg_binary
+import iot_stat_msg
+import iot_msg_recorder
+import iot_repository_broker
+import iot_rec_writer
+import iot_rec_pipeline
+import iot_rec_partition
+import iot_rec_schema
+import iot_rec_migrate
+import iot_rec_rollup
+import iot_rec_query
+import iot_rec_export
+
+DB_TEMPLATE = "../iot_recorder/iot_rec.sl3"
+
+
+class TestIotRecorderWriter(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self._logger = logging.getLogger("Test.IotRecorder")
+        self._tmp_dir = tempfile.mkdtemp()
+        self._db_path = os.path.join(self._tmp_dir, "iot_rec_test.sl3")
+        shutil.copyfile(DB_TEMPLATE, self._db_path)
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        super().tearDown()
+
+    def _count_rows(self, table_name: str) -> int:
+        db_conn = sqlite3.connect(self._db_path)
+        try:
+            return db_conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        finally:
+            db_conn.close()
+
+    @staticmethod
+    def _probe_rows(channel_no: int) -> tuple:
+        msg_base = iot_stat_msg.IotRecorderMsg()
+        msg_base.msg_id = str(uuid.uuid4())
+        msg_base.msg_topic = f"data/device/DI.ADS1115.01/{channel_no}"
+        msg_base.msg_timestamp = datetime.now()
+        msg_base.msg_class = "InputProbe"
+        probe = iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime.now(), channel_no, 12345, 1.23)
+        return msg_base, iot_stat_msg.IotRecorderInputProbe(msg_base.msg_id, probe)
+
+    def test_01_batch_threshold(self):
+        writer = iot_rec_writer.IotRecorderWriter(self._db_path, self._logger, batch_size = 6)
+        for channel_no in range(2):
+            for row in self._probe_rows(channel_no):
+                writer.add(row)
+        self.assertEqual(writer.num_pending, 4)
+        self.assertEqual(self._count_rows("iot_recorder_msg"), 0)
+        for row in self._probe_rows(2):
+            writer.add(row)
+        self.assertEqual(writer.num_pending, 0)
+        self.assertEqual(self._count_rows("iot_recorder_msg"), 3)
+        self.assertEqual(self._count_rows("iot_recorder_input_probe"), 3)
+        stats = writer.statistics
+        self.assertEqual(stats['num_flushes'], 1)
+        self.assertEqual(stats['last_batch_size'], 6)
+        self.assertEqual(stats['num_failed_rows'], 0)
+
+    def test_02_explicit_flush(self):
+        writer = iot_rec_writer.IotRecorderWriter(self._db_path, self._logger, batch_size = 1000)
+        for row in self._probe_rows(0):
+            writer.add(row)
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(self._count_rows("iot_recorder_input_probe"), 1)
+        self.assertEqual(writer.statistics['num_flushes'], 1)
+
+    def test_03_persistent_connection(self):
+        writer = iot_rec_writer.IotRecorderWriter(self._db_path, self._logger, batch_size = 0, synchronous = "NORMAL")
+        msmt = iot_msg_sensor.SensorMsmt("S.KYES516.01", "KYES516")
+        msmt.msmt_unit = "pct"
+        msmt.msmt_value = 42.0
+        writer.add(iot_stat_msg.IotRecorderSensorMsg(str(uuid.uuid4()), msmt))
+        self.assertEqual(writer.num_pending, 1)
+        self.assertEqual(writer.flush(), 1)
+        writer.close()
+        self.assertEqual(self._count_rows("iot_recorder_sensor_msmt"), 1)
+        db_conn = sqlite3.connect(self._db_path)
+        try:
+            self.assertEqual(db_conn.execute("PRAGMA journal_mode").fetchone()[0].lower(), "wal")
+        finally:
+            db_conn.close()
+
+    def test_04_invalid_synchronous(self):
+        writer = iot_rec_writer.IotRecorderWriter(self._db_path, self._logger, synchronous = "SOMETIMES")
+        for row in self._probe_rows(0):
+            writer.add(row)
+        with self.assertRaises(ValueError):
+            writer.flush()
+
+    def test_05_non_numeric_value(self):
+        writer = iot_rec_writer.IotRecorderWriter(self._db_path, self._logger, batch_size = 4, rollups = True)
+        for value in ["12", "high"]:
+            msg_base, probe_row = self._probe_rows(0)
+            probe_row.value = value
+            writer.add(msg_base)
+            writer.add(probe_row)
+        self.assertEqual(writer.num_pending, 0)
+        for row in self._probe_rows(1):
+            writer.add(row)
+        self.assertEqual(writer.flush(), 2)
+        writer.close()
+        self.assertEqual(self._count_rows("iot_recorder_input_probe"), 3)
+        self.assertEqual(writer.statistics['num_failed_rows'], 0)
+        db_conn = sqlite3.connect(self._db_path)
+        try:
+            rollup = db_conn.execute("SELECT channel_no, num_values, sum_value FROM iot_recorder_channel_rollup "
+                                     "WHERE granularity = 'day' ORDER BY channel_no").fetchall()
+        finally:
+            db_conn.close()
+        self.assertEqual(rollup, [(0, 1, 12.0), (1, 1, 12345.0)])
+
+    def test_06_duplicate_message(self):
+        writer = iot_rec_writer.IotRecorderWriter(self._db_path, self._logger, batch_size = 0, rollups = True)
+        rows = [self._probe_rows(channel_no) for channel_no in range(3)]
+        # a message delivered twice (MQTT QoS 1) within one batch
+        for msg_base, probe_row in rows + rows[:1]:
+            writer.add(msg_base)
+            writer.add(probe_row)
+        self.assertEqual(writer.flush(), 6)
+        writer.close()
+        self.assertEqual((self._count_rows("iot_recorder_msg"), self._count_rows("iot_recorder_input_probe")), (3, 3))
+        stats = writer.statistics
+        self.assertEqual((stats['num_failed_rows'], stats['num_skipped_rows']), (0, 2))
+        db_conn = sqlite3.connect(self._db_path)
+        try:
+            num_values = db_conn.execute("SELECT SUM(num_values) FROM iot_recorder_channel_rollup "
+                                         "WHERE granularity = 'day'").fetchone()[0]
+        finally:
+            db_conn.close()
+        self.assertEqual(num_values, 3)
+
+
+class TestIotRecorderSchema(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self._logger = logging.getLogger("Test.IotRecorder")
+        self._tmp_dir = tempfile.mkdtemp()
+        self._db_path = os.path.join(self._tmp_dir, "iot_rec_test.sl3")
+        shutil.copyfile(DB_TEMPLATE, self._db_path)
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        super().tearDown()
+
+    def test_01_epoch_conversion(self):
+        point_in_time = datetime(2021, 7, 12, 10, 30, 15, 123456)
+        epoch_us = iot_rec_schema.IotRecorderSchema.to_epoch_us(point_in_time)
+        self.assertIsInstance(epoch_us, int)
+        self.assertEqual(iot_rec_schema.IotRecorderSchema.from_epoch_us(epoch_us), point_in_time)
+        self.assertEqual(iot_rec_schema.IotRecorderSchema.to_epoch_us("2021-07-12 10:30:15.123456"), epoch_us)
+        self.assertEqual(iot_rec_schema.IotRecorderSchema.to_epoch_us("2021-07-12 10:30:15"), epoch_us - 123456)
+
+    def test_02_migrate(self):
+        writer = iot_rec_writer.IotRecorderWriter(self._db_path, self._logger, batch_size = 0)
+        for channel_no in range(3):
+            for row in TestIotRecorderWriter._probe_rows(channel_no):
+                writer.add(row)
+        writer.close()
+        self.assertEqual(iot_rec_migrate.IotRecorderMigration.main([self._db_path]), 0)
+        db_conn = sqlite3.connect(self._db_path)
+        try:
+            self.assertEqual(iot_rec_schema.IotRecorderSchema.schema_version(db_conn), 2)
+            rows = db_conn.execute("SELECT typeof(probe_time), typeof(store_date) FROM iot_recorder_input_probe").fetchall()
+            self.assertEqual(rows, [("integer", "integer")] * 3)
+            self.assertEqual(db_conn.execute("SELECT typeof(msg_timestamp) FROM iot_recorder_msg").fetchone()[0], "integer")
+            plan = db_conn.execute("EXPLAIN QUERY PLAN SELECT value FROM iot_recorder_input_probe "
+                                   "WHERE device_id = ? AND channel_no = ? AND probe_time BETWEEN ? AND ?",
+                                   ("DI.ADS1115.01", 0, 0, 1)).fetchall()
+            self.assertIn("iot_recorder_input_probe_channel_time", str(plan))
+        finally:
+            db_conn.close()
+        self.assertEqual(iot_rec_migrate.IotRecorderMigration.migrate_file(self._db_path), 0)
+
+    def test_03_writer_v2(self):
+        writer = iot_rec_writer.IotRecorderWriter(self._db_path, self._logger, batch_size = 0, schema_version = 2)
+        msmt = iot_msg_sensor.SensorMsmt("S.KYES516.01", "KYES516", datetime(2021, 7, 12, 10, 0, 0))
+        msmt.msmt_unit = "pct"
+        msmt.msmt_value = 42.0
+        writer.add(iot_stat_msg.IotRecorderSensorMsg(str(uuid.uuid4()), msmt))
+        self.assertEqual(writer.flush(), 1)
+        writer.close()
+        db_conn = sqlite3.connect(self._db_path)
+        try:
+            msmt_time = db_conn.execute("SELECT msmt_time FROM iot_recorder_sensor_msmt").fetchone()[0]
+        finally:
+            db_conn.close()
+        self.assertEqual(iot_rec_schema.IotRecorderSchema.from_epoch_us(msmt_time), datetime(2021, 7, 12, 10, 0, 0))
+
+    def test_04_rollups(self):
+        for schema_version in [1, 2]:
+            db_path = os.path.join(self._tmp_dir, f"iot_rec_rollup_{schema_version}.sl3")
+            shutil.copyfile(DB_TEMPLATE, db_path)
+            writer = iot_rec_writer.IotRecorderWriter(db_path, self._logger, batch_size = 0,
+                                                      schema_version = schema_version, rollups = True)
+            for msmt_no, msmt_value in enumerate([10.0, 20.0, 30.0, 40.0]):
+                msmt = iot_msg_sensor.SensorMsmt("S.KYES516.01", "KYES516", datetime(2021, 7, 12, 10, 59, 30) + timedelta(seconds = msmt_no * 10))
+                msmt.msmt_unit = "pct"
+                msmt.msmt_value = msmt_value
+                writer.add(iot_stat_msg.IotRecorderSensorMsg(str(uuid.uuid4()), msmt))
+                writer.flush()
+            writer.close()
+            db_conn = sqlite3.connect(db_path)
+            try:
+                query = ("SELECT granularity, num_values, min_value, max_value, sum_value, sumsq_value "
+                         "FROM iot_recorder_sensor_rollup WHERE sensor_id = ? ORDER BY granularity, bucket_start")
+                expected = [("day", 4, 10.0, 40.0, 100.0, 3000.0), ("hour", 3, 10.0, 30.0, 60.0, 1400.0),
+                            ("hour", 1, 40.0, 40.0, 40.0, 1600.0), ("minute", 3, 10.0, 30.0, 60.0, 1400.0),
+                            ("minute", 1, 40.0, 40.0, 40.0, 1600.0)]
+                self.assertEqual(db_conn.execute(query, ("S.KYES516.01",)).fetchall(), expected)
+                with db_conn:
+                    db_conn.execute("DELETE FROM iot_recorder_sensor_rollup")
+                self.assertEqual(iot_rec_rollup.IotRecorderRollup.rebuild(db_conn), 4)
+                self.assertEqual(db_conn.execute(query, ("S.KYES516.01",)).fetchall(), expected)
+            finally:
+                db_conn.close()
+
+
+
+@unittest.skipIf(iot_rec_query.np is None, "numpy is not installed")
+class TestIotRecorderQuery(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self._logger = logging.getLogger("Test.IotRecorder")
+        self._tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        super().tearDown()
+
+    def _create_db(self, schema_version: int) -> str:
+        db_path = os.path.join(self._tmp_dir, f"iot_rec_query_{schema_version}.sl3")
+        shutil.copyfile(DB_TEMPLATE, db_path)
+        writer = iot_rec_writer.IotRecorderWriter(db_path, self._logger, batch_size = 500, schema_version = schema_version)
+        start_time = datetime(2021, 7, 12, 10, 0, 0)
+        for probe_no in range(600):
+            probe = iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", start_time + timedelta(seconds = probe_no), probe_no % 2, probe_no, None)
+            writer.add(iot_stat_msg.IotRecorderInputProbe(str(uuid.uuid4()), probe))
+        writer.close()
+        return db_path
+
+    def test_01_channel_series(self):
+        for schema_version in [1, 2]:
+            query = iot_rec_query.IotRecorderQuery(self._create_db(schema_version), chunk_size = 100)
+            series = query.channel_series("DI.ADS1115.01", 0, datetime(2021, 7, 12, 10, 0, 0), datetime(2021, 7, 12, 10, 5, 0))
+            self.assertEqual(len(series['time']), 150)
+            self.assertEqual(series['hw_value'][:3].tolist(), [0, 2, 4])
+            self.assertTrue(iot_rec_query.np.isnan(series['voltage']).all())
+            expected_us = iot_rec_schema.IotRecorderSchema.to_epoch_us(datetime(2021, 7, 12, 10, 0, 2))
+            self.assertEqual(int(series['time'][1].astype('int64')), expected_us)
+
+    def test_02_resample(self):
+        query = iot_rec_query.IotRecorderQuery(self._create_db(2))
+        series = query.channel_series("DI.ADS1115.01", 1, datetime(2021, 7, 12, 10, 0, 0), datetime(2021, 7, 12, 10, 12, 0),
+                                      resample_interval = 60.0)
+        self.assertEqual(len(series['time']), 12)
+        self.assertEqual(series['count'].tolist(), [30] * 10 + [0, 0])
+        self.assertEqual(series['hw_value'][0], sum(range(1, 60, 2)) / 30)
+        self.assertTrue(iot_rec_query.np.isnan(series['hw_value'][10]))
+
+
+
+@unittest.skipIf(iot_rec_export.np is None, "numpy is not installed")
+class TestIotRecorderExport(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self._logger = logging.getLogger("Test.IotRecorder")
+        self._tmp_dir = tempfile.mkdtemp()
+        self._export_dir = os.path.join(self._tmp_dir, "export")
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        super().tearDown()
+
+    def _record(self, db_path: str, schema_version: int, store_date: datetime, num_probes: int) -> None:
+        writer = iot_rec_writer.IotRecorderWriter(db_path, self._logger, batch_size = 0, schema_version = schema_version)
+        for probe_no in range(num_probes):
+            device_id = f"DI.ADS1115.0{probe_no % 2}"
+            probe = iot_msg_input.InputProbe("ADS1115", device_id, store_date, 0, probe_no, 1.5)
+            rec_probe = iot_stat_msg.IotRecorderInputProbe(str(uuid.uuid4()), probe)
+            rec_probe.store_date = store_date + timedelta(microseconds = probe_no)
+            writer.add(rec_probe)
+        writer.close()
+
+    def _export(self, db_path: str, file_format: str, incremental: bool = True) -> dict:
+        return iot_rec_export.IotRecorderExport(db_path, self._export_dir, file_format = file_format, lag = 0).export(incremental)
+
+    def test_01_incremental_npz(self):
+        for schema_version in [1, 2]:
+            shutil.rmtree(self._export_dir, ignore_errors=True)
+            db_path = os.path.join(self._tmp_dir, f"iot_rec_export_{schema_version}.sl3")
+            shutil.copyfile(DB_TEMPLATE, db_path)
+            self._record(db_path, schema_version, datetime(2021, 7, 12, 10, 0, 0), 4)
+            self.assertEqual(self._export(db_path, "npz")['iot_recorder_input_probe'], 4)
+            device_dir = os.path.join(self._export_dir, "iot_recorder_input_probe", "day=2021-07-12", "device=DI.ADS1115.01")
+            file_names = os.listdir(device_dir)
+            self.assertEqual(len(file_names), 1)
+            with iot_rec_export.np.load(os.path.join(device_dir, file_names[0])) as arrays:
+                self.assertEqual(arrays['value'].tolist(), [1, 3])
+                self.assertEqual(arrays['probe_time'].dtype, iot_rec_export.np.dtype('datetime64[us]'))
+                self.assertEqual(int(arrays['probe_time'][0].astype('int64')),
+                                 iot_rec_schema.IotRecorderSchema.to_epoch_us(datetime(2021, 7, 12, 10, 0, 0)))
+            self.assertEqual(self._export(db_path, "npz")['iot_recorder_input_probe'], 0)
+            self._record(db_path, schema_version, datetime(2021, 7, 13, 8, 0, 0), 2)
+            self.assertEqual(self._export(db_path, "npz")['iot_recorder_input_probe'], 2)
+            self.assertTrue(os.path.isdir(os.path.join(self._export_dir, "iot_recorder_input_probe", "day=2021-07-13")))
+            self.assertEqual(self._export(db_path, "npz", incremental = False)['iot_recorder_input_probe'], 6)
+
+    @unittest.skipIf(iot_rec_export.pyarrow is None, "pyarrow is not installed")
+    def test_02_parquet(self):
+        db_path = os.path.join(self._tmp_dir, "iot_rec_export.sl3")
+        shutil.copyfile(DB_TEMPLATE, db_path)
+        self._record(db_path, 2, datetime(2021, 7, 12, 10, 0, 0), 4)
+        self.assertEqual(self._export(db_path, "parquet")['iot_recorder_input_probe'], 4)
+        table = iot_rec_export.pyarrow.parquet.read_table(os.path.join(self._export_dir, "iot_recorder_input_probe"))
+        self.assertEqual(table.num_rows, 4)
+        self.assertEqual(sorted(table.column('value').to_pylist()), [0, 1, 2, 3])
+
+    def test_03_failed_run(self):
+        db_path = os.path.join(self._tmp_dir, "iot_rec_export.sl3")
+        shutil.copyfile(DB_TEMPLATE, db_path)
+        self._record(db_path, 2, datetime(2021, 7, 12, 10, 0, 0), 4)
+        exporter = iot_rec_export.IotRecorderExport(db_path, self._export_dir, file_format = "npz", lag = 0)
+        with unittest.mock.patch.object(iot_rec_export.IotRecorderExport, '_db_paths',
+                                        side_effect = [[db_path]] * 3 + [OSError("disk full")]):
+            with self.assertRaises(OSError):
+                exporter.export()
+        self.assertEqual(os.listdir(self._export_dir), [])
+        self.assertEqual(exporter.export()['iot_recorder_input_probe'], 4)
+        probe_dir = os.path.join(self._export_dir, "iot_recorder_input_probe", "day=2021-07-12")
+        self.assertEqual(sum(len(file_names) for _, _, file_names in os.walk(probe_dir)), 2)
+        self.assertEqual(sorted(os.listdir(self._export_dir))[0], "_watermark.json")
+        # interrupted after saving the watermarks: the next run moves the staged files in
+        self._record(db_path, 2, datetime(2021, 7, 13, 8, 0, 0), 2)
+        with unittest.mock.patch.object(iot_rec_export.IotRecorderExport, '_publish_staging'):
+            self.assertEqual(exporter.export()['iot_recorder_input_probe'], 2)
+        self.assertFalse(os.path.isdir(os.path.join(self._export_dir, "iot_recorder_input_probe", "day=2021-07-13")))
+        self.assertEqual(exporter.export()['iot_recorder_input_probe'], 0)
+        self.assertTrue(os.path.isdir(os.path.join(self._export_dir, "iot_recorder_input_probe", "day=2021-07-13")))
+        self.assertFalse(any(entry.startswith("_staging-") for entry in os.listdir(self._export_dir)))
+
+
+class TestIotMessageRecorder(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self._logger = logging.getLogger("Test.IotRecorder")
+        self._tmp_dir = tempfile.mkdtemp()
+        self._db_path = os.path.join(self._tmp_dir, "iot_rec_test.sl3")
+        shutil.copyfile(DB_TEMPLATE, self._db_path)
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        super().tearDown()
+
+    def test_01_probe_batch(self):
+        broker_config = iot_repository_broker.IotMqttBrokerConfig()
+        broker_config.broker_id = "TestBroker"
+        recorder = iot_msg_recorder.IotMessageRecorder(broker_config, "data/device/#", self._db_path, self._logger)
+        probes = [iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime.now(), channel_no, 100 + channel_no, 1.1)
+                  for channel_no in range(4)]
+        msg = wp_queueing.QueueMessage("data/device/DI.ADS1115.01")
+        msg.msg_payload = iot_msg_input.InputProbeBatch.from_probes(probes).to_dict()
+        recorder.message(msg)
+        recorder.stop()
+        db_conn = sqlite3.connect(self._db_path)
+        try:
+            rows = db_conn.execute("SELECT m.msg_id, m.msg_class, p.channel_no, p.value FROM iot_recorder_msg m "
+                                   "JOIN iot_recorder_input_probe p ON p.msg_id = m.msg_id ORDER BY p.channel_no").fetchall()
+        finally:
+            db_conn.close()
+        self.assertEqual([(row[0], row[1], row[2], row[3]) for row in rows],
+                         [(f"{msg.msg_id}.{channel_no}", "InputProbeBatch", channel_no, 100 + channel_no) for channel_no in range(4)])
+
+    def test_02_binary_payload(self):
+        broker_config = iot_repository_broker.IotMqttBrokerConfig()
+        broker_config.broker_id = "TestBroker"
+        recorder = iot_msg_recorder.IotMessageRecorder(broker_config, "data/device/#", self._db_path, self._logger)
+        msmt = iot_msg_sensor.SensorMsmt("S.KYES516.01", "KYES516", datetime.now())
+        msmt.msmt_unit = "pct"
+        msmt.msmt_value = 45.6
+        for msg_payload in [iot_msg_binary.IotBinaryCodec.encode(msmt), msmt.to_dict(), b'\xa5\x01\xfe\x00\x00']:
+            msg = wp_queueing.QueueMessage("data/sensor/S.KYES516.01")
+            msg.msg_payload = msg_payload
+            recorder.message(msg)
+        recorder.stop()
+        db_conn = sqlite3.connect(self._db_path)
+        try:
+            self.assertEqual(db_conn.execute("SELECT COUNT(*), MIN(msmt_value) FROM iot_recorder_sensor_msmt").fetchone(), (2, 45.6))
+            self.assertEqual(db_conn.execute("SELECT msg_payload FROM iot_recorder_generic").fetchall(), [("a501fe0000",)])
+        finally:
+            db_conn.close()
+
+
+    def test_03_payload_view(self):
+        broker_config = iot_repository_broker.IotMqttBrokerConfig()
+        broker_config.broker_id = "TestBroker"
+        recorder = iot_msg_recorder.IotMessageRecorder(broker_config, "data/#", self._db_path, self._logger)
+        health = iot_msg_input.InputHealth("ADS1115", "DI.ADS1115.01", 0, datetime(2021, 7, 12, 10, 0, 0))
+        health.num_probe_detail = [1, 2]
+        health.timing = {'num_missed_polls': 2, 'max_lateness': 15.0, 'duration_histogram': [0, 2, 0, 0, 0, 1]}
+        probe = iot_msg_input.InputProbe("ADS1115", "DI.ADS1115.01", datetime(2021, 7, 12, 10, 0, 0, 250), 1, 123, 0.5)
+        for message in [health, probe]:
+            for msg_payload in [message.to_dict(), iot_msg_binary.IotBinaryCodec.encode(message)]:
+                msg = wp_queueing.QueueMessage("data/device/DI.ADS1115.01")
+                msg.msg_payload = msg_payload
+                recorder.message(msg)
+        recorder.stop()
+        db_conn = sqlite3.connect(self._db_path)
+        try:
+            for table_name in ["iot_recorder_input_health", "iot_recorder_input_probe"]:
+                rows = db_conn.execute(f"SELECT * FROM {table_name}").fetchall()
+                self.assertEqual(len(rows), 2)
+                self.assertEqual(rows[0][1:-1], rows[1][1:-1])
+            self.assertEqual(db_conn.execute("SELECT num_probe_detail, last_probe_time FROM iot_recorder_input_health").fetchone(), ("[1, 2]", None))
+            self.assertEqual(db_conn.execute("SELECT DISTINCT msg_class FROM iot_recorder_msg ORDER BY 1").fetchall(), [("InputHealth",), ("InputProbe",)])
+        finally:
+            db_conn.close()
+
+
+class TestIotRecorderPipeline(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self._logger = logging.getLogger("Test.IotRecorder")
+        self._tmp_dir = tempfile.mkdtemp()
+        self._processed = []
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        super().tearDown()
+
+    def _process_batch(self, msg_list: list) -> None:
+        self._processed.extend(msg_list)
+
+    @staticmethod
+    def _queue_message(msg_no: int) -> wp_queueing.QueueMessage:
+        msg = wp_queueing.QueueMessage(f"data/device/DI.ADS1115.01/{msg_no}")
+        msg.msg_payload = {'class': 'Test', 'msg_no': msg_no}
+        return msg
+
+    def test_01_drop_oldest(self):
+        pipeline = iot_rec_pipeline.IotRecorderPipeline(self._process_batch, self._logger, queue_size = 2, backpressure = "drop_oldest")
+        for msg_no in range(3):
+            self.assertTrue(pipeline.put(self._queue_message(msg_no)))
+        self.assertEqual(pipeline.queue_depth, 2)
+        self.assertEqual(pipeline.num_dropped, 1)
+        self.assertTrue(pipeline.stop())
+        self.assertEqual([msg.msg_payload['msg_no'] for msg in self._processed], [1, 2])
+
+    def test_02_spill(self):
+        spill_path = os.path.join(self._tmp_dir, "recorder.spill")
+        pipeline = iot_rec_pipeline.IotRecorderPipeline(self._process_batch, self._logger, queue_size = 1,
+                                                        backpressure = "spill", spill_path = spill_path)
+        for msg_no in range(3):
+            pipeline.put(self._queue_message(msg_no))
+        self.assertEqual(pipeline.num_spilled, 2)
+        self.assertTrue(os.path.exists(spill_path))
+        self.assertTrue(pipeline.stop())
+        self.assertEqual([msg.msg_payload['msg_no'] for msg in self._processed], [0, 1, 2])
+        self.assertFalse(os.path.exists(spill_path))
+
+    def test_03_writer_thread(self):
+        pipeline = iot_rec_pipeline.IotRecorderPipeline(self._process_batch, self._logger, queue_size = 10,
+                                                        backpressure = "block", batch_size = 5, flush_interval = 0.1)
+        pipeline.start()
+        self.assertTrue(pipeline.is_running)
+        for msg_no in range(50):
+            pipeline.put(self._queue_message(msg_no))
+        self.assertTrue(pipeline.stop())
+        self.assertEqual(len(self._processed), 50)
+        self.assertEqual(pipeline.statistics['num_dropped'], 0)
+
+    def test_04_spill_binary(self):
+        spill_path = os.path.join(self._tmp_dir, "recorder.spill")
+        pipeline = iot_rec_pipeline.IotRecorderPipeline(self._process_batch, self._logger, queue_size = 1,
+                                                        backpressure = "spill", spill_path = spill_path)
+        for msg_no in range(2):
+            msg = self._queue_message(msg_no)
+            msg.msg_payload = bytes([0xA5, msg_no, 0xFF])
+            pipeline.put(msg)
+        self.assertEqual(pipeline.num_spilled, 1)
+        self.assertTrue(pipeline.stop())
+        self.assertEqual(sorted(msg.msg_payload for msg in self._processed), [bytes([0xA5, 0, 0xFF]), bytes([0xA5, 1, 0xFF])])
+
+    def test_05_spill_work_file(self):
+        spill_path = os.path.join(self._tmp_dir, "recorder.spill")
+        pipeline = iot_rec_pipeline.IotRecorderPipeline(self._process_batch, self._logger, queue_size = 1,
+                                                        backpressure = "spill", spill_path = spill_path)
+        for msg_no in range(3):
+            pipeline.put(self._queue_message(msg_no))
+        # replay interrupted by a crash after the spill file has been renamed
+        os.replace(spill_path, f"{spill_path}.work")
+        pipeline = iot_rec_pipeline.IotRecorderPipeline(self._process_batch, self._logger, queue_size = 1,
+                                                        backpressure = "spill", spill_path = spill_path)
+        pipeline.put(self._queue_message(3))
+        pipeline.put(self._queue_message(4))
+        self.assertTrue(pipeline.stop())
+        # the work file first, then the current spill file, which received the new messages
+        self.assertEqual([msg.msg_payload['msg_no'] for msg in self._processed], [1, 2, 3, 4])
+        self.assertFalse(os.path.exists(spill_path))
+        self.assertFalse(os.path.exists(f"{spill_path}.work"))
+
+    def test_06_spill_order(self):
+        spill_path = os.path.join(self._tmp_dir, "recorder.spill")
+        pipeline = iot_rec_pipeline.IotRecorderPipeline(self._process_batch, self._logger, queue_size = 2,
+                                                        backpressure = "spill", spill_path = spill_path, batch_size = 1)
+        for msg_no in range(4):
+            pipeline.put(self._queue_message(msg_no))
+        # the writer takes a message from the queue; newer messages must not overtake the spilled ones
+        with pipeline._cond:
+            batch = pipeline._take_batch()
+        pipeline._process(batch)
+        pipeline.put(self._queue_message(4))
+        self.assertEqual(pipeline.num_spilled, 3)
+        self.assertTrue(pipeline.stop())
+        self.assertEqual([msg.msg_payload['msg_no'] for msg in self._processed], [0, 1, 2, 3, 4])
+
+    def test_07_block_without_writer(self):
+        pipeline = iot_rec_pipeline.IotRecorderPipeline(self._process_batch, self._logger, queue_size = 1, backpressure = "block")
+        pipeline.put(self._queue_message(0))
+        with self.assertRaises(RuntimeError):
+            pipeline.put(self._queue_message(1))
+        spill_path = os.path.join(self._tmp_dir, "recorder.spill")
+        pipeline = iot_rec_pipeline.IotRecorderPipeline(self._process_batch, self._logger, queue_size = 1,
+                                                        backpressure = "block", spill_path = spill_path)
+        pipeline.put(self._queue_message(2))
+        self.assertTrue(pipeline.put(self._queue_message(3)))
+        self.assertEqual((pipeline.num_spilled, pipeline.num_dropped), (1, 0))
+        self.assertTrue(pipeline.stop())
+        self.assertEqual([msg.msg_payload['msg_no'] for msg in self._processed], [2, 3])
+
+
+class TestIotRecorderPartitions(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self._tmp_dir = tempfile.mkdtemp()
+        self._base_path = os.path.join(self._tmp_dir, "iot_rec.sl3")
+        shutil.copyfile(DB_TEMPLATE, self._base_path)
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        super().tearDown()
+
+    def test_01_create_and_drop(self):
+        partitions = iot_rec_partition.IotRecorderPartitions(self._base_path, "day", self._base_path, retention = 3)
+        now = datetime(2021, 7, 12, 10, 0, 0)
+        for day_no in range(5):
+            db_path = partitions.create_partition(now - timedelta(days = day_no))
+            self.assertTrue(os.path.exists(db_path))
+        self.assertEqual(partitions.partition_path("20210712"), os.path.join(self._tmp_dir, "iot_rec.20210712.sl3"))
+        self.assertEqual(len(partitions.list_partitions()), 5)
+        dropped = partitions.drop_expired(now)
+        self.assertEqual(len(dropped), 2)
+        self.assertEqual([key for key, _ in partitions.list_partitions()], ["20210710", "20210711", "20210712"])
+        self.assertTrue(os.path.exists(self._base_path))
+
+    def test_02_query_range(self):
+        partitions = iot_rec_partition.IotRecorderPartitions(self._base_path, "month", self._base_path)
+        for month in [5, 6, 7]:
+            db_path = partitions.create_partition(datetime(2021, month, 1))
+            db_conn = sqlite3.connect(db_path)
+            with db_conn:
+                db_conn.execute("INSERT INTO iot_recorder_msg VALUES (?, ?, ?, ?, ?)",
+                                (str(uuid.uuid4()), "data/x", f"2021-{month:02d}-01 00:00:00", "Test", f"2021-{month:02d}-01 00:00:00"))
+            db_conn.close()
+        self.assertEqual(len(partitions.partitions_for_range(datetime(2021, 5, 3), datetime(2021, 5, 30))), 2)
+        rows = list(partitions.query("SELECT msg_timestamp FROM iot_recorder_msg WHERE msg_timestamp >= ?",
+                                     ("2021-06-01",), datetime(2021, 6, 1), datetime(2021, 7, 31)))
+        self.assertEqual(len(rows), 2)
+
+    def test_03_concurrent_create(self):
+        partitions = iot_rec_partition.IotRecorderPartitions(self._base_path, "day", self._base_path)
+        db_paths = []
+        threads = [threading.Thread(target = lambda: db_paths.append(partitions.create_partition(datetime(2021, 7, 12))))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(db_paths)), 1)
+        self.assertEqual(sorted(os.listdir(self._tmp_dir)), ["iot_rec.20210712.sl3", "iot_rec.sl3"])
+        db_conn = sqlite3.connect(db_paths[0])
+        self.assertEqual(db_conn.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+        db_conn.close()
+
+    def test_04_permissions_and_no_hard_links(self):
+        with sqlite3.connect(self._base_path) as db_conn:
+            db_conn.execute("INSERT INTO iot_recorder_msg VALUES ('1', 'data/x', '2021-07-12 00:00:00', 'Test', '2021-07-12 00:00:00')")
+        db_conn.close()
+        # without template, a partition is created from the table definitions, not from the live database
+        umask = os.umask(0o022)
+        os.umask(umask)
+        partitions = iot_rec_partition.IotRecorderPartitions(self._base_path, "day")
+        db_path = partitions.create_partition(datetime(2021, 7, 12))
+        self.assertEqual(os.stat(db_path).st_mode & 0o777, 0o666 & ~umask)
+        db_conn = sqlite3.connect(db_path)
+        self.assertEqual(db_conn.execute("SELECT COUNT(*) FROM iot_recorder_msg").fetchone()[0], 0)
+        db_conn.close()
+        template_path = os.path.join(self._tmp_dir, "template.sl3")
+        shutil.copyfile(DB_TEMPLATE, template_path)
+        os.chmod(template_path, 0o640)
+        partitions = iot_rec_partition.IotRecorderPartitions(self._base_path, "day", template_path)
+        # file systems without hard links (vfat)
+        with unittest.mock.patch.object(iot_rec_partition.os, "link", side_effect = PermissionError(1, "Operation not permitted")):
+            db_path = partitions.create_partition(datetime(2021, 7, 13))
+            self.assertEqual(partitions.create_partition(datetime(2021, 7, 13)), db_path)
+        self.assertEqual(os.stat(db_path).st_mode & 0o777, 0o640)
+        self.assertEqual(sorted(os.listdir(self._tmp_dir)), ["iot_rec.20210712.sl3", "iot_rec.20210713.sl3", "iot_rec.sl3", "template.sl3"])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=5)